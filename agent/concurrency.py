@@ -0,0 +1,155 @@
+import asyncio
+import os
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from loguru import logger
+
+# Ресурсы, по которым ядро считает PSI (доля времени, когда задачи ждут ресурс)
+PRESSURE_RESOURCES = ("cpu", "memory", "io")
+
+# /proc/pressure показывает давление на весь хост, файлы cgroup v2 — только на cgroup агента
+PROC_PRESSURE_DIR = "/proc/pressure"
+CGROUP_DIR = "/sys/fs/cgroup"
+
+def read_pressure(path: str) -> Optional[float]:
+    """Среднее за 10 секунд из строки «some» файла PSI, в процентах"""
+    try:
+        with open(path) as f:
+            for line in f:
+                if line.startswith("some "):
+                    fields = dict(item.split("=", 1) for item in line.split()[1:])
+                    return float(fields["avg10"])
+    except (OSError, ValueError, KeyError):
+        pass
+    return None
+
+def read_cgroup_memory_usage(cgroup_dir: str = CGROUP_DIR) -> Optional[float]:
+    """Доля лимита памяти cgroup агента, занятая сейчас (None без лимита или вне cgroup v2)"""
+    try:
+        with open(os.path.join(cgroup_dir, "memory.max")) as f:
+            limit = f.read().strip()
+        if limit == "max":
+            return None
+        with open(os.path.join(cgroup_dir, "memory.current")) as f:
+            return int(f.read().strip()) / int(limit)
+    except (OSError, ValueError, ZeroDivisionError):
+        return None
+
+def sample_pressure() -> Dict[str, Any]:
+    """Давление на CPU, память и ввод-вывод хоста; при недоступном /proc/pressure — cgroup агента"""
+    pressure: Dict[str, Optional[float]] = {}
+    source = None
+    for directory, name, suffix in ((PROC_PRESSURE_DIR, "psi", ""), (CGROUP_DIR, "cgroup", ".pressure")):
+        pressure = {
+            resource: read_pressure(os.path.join(directory, resource + suffix))
+            for resource in PRESSURE_RESOURCES
+        }
+        if any(value is not None for value in pressure.values()):
+            source = name
+            break
+    return {"source": source, "pressure": pressure, "memory_usage": read_cgroup_memory_usage()}
+
+class ConcurrencyController:
+    """Подбор числа параллельных сканирований по нагрузке хоста
+
+    Раз в interval секунд снимается давление на CPU, память и ввод-вывод (PSI).
+    Если какой-то ресурс выше порога, параллелизм уменьшается (вдвое при двойном превышении),
+    если все ресурсы ниже половины порога и в очереди ждут задания — увеличивается на 1.
+    Выполняющиеся сканирования не прерываются: уменьшение сказывается на запуске следующих.
+    """
+
+    def __init__(
+        self,
+        queue: Any,
+        minimum: int,
+        maximum: int,
+        thresholds: Dict[str, float],
+        memory_usage_high: float,
+        interval: float,
+        sampler: Callable[[], Dict[str, Any]] = sample_pressure,
+        on_change: Optional[Callable[[int, int, str], None]] = None
+    ):
+        self.queue = queue
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.thresholds = thresholds
+        self.memory_usage_high = memory_usage_high
+        self.interval = interval
+        self._sampler = sampler
+        self._on_change = on_change
+        self.sample: Dict[str, Any] = {"source": None, "pressure": {}, "memory_usage": None}
+        self.reason = "initial"
+        self.updated_at: Optional[datetime] = None
+        self.changed_at: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+        self.queue.set_concurrency(min(max(self.queue.concurrency, self.minimum), self.maximum))
+
+    def decide(self, sample: Dict[str, Any]) -> Tuple[int, str]:
+        """Новый параллелизм и причина решения по снимку нагрузки"""
+        current = self.queue.concurrency
+        if sample["source"] is None and sample["memory_usage"] is None:
+            return current, "no pressure data"
+
+        overloaded = []
+        severe = False
+        for resource, value in sample["pressure"].items():
+            threshold = self.thresholds[resource]
+            if value is not None and value >= threshold:
+                overloaded.append(f"{resource} pressure {value:.1f}%")
+                severe = severe or value >= 2 * threshold
+        memory_usage = sample["memory_usage"]
+        if memory_usage is not None and memory_usage >= self.memory_usage_high:
+            overloaded.append(f"memory usage {memory_usage:.0%}")
+
+        if overloaded:
+            target = current // 2 if severe else current - 1
+            return max(self.minimum, target), ", ".join(overloaded)
+
+        idle = all(
+            value is None or value < self.thresholds[resource] / 2
+            for resource, value in sample["pressure"].items()
+        )
+        if idle and self.queue.queued() and len(self.queue.running()) >= current:
+            return min(self.maximum, current + 1), "low pressure, scans waiting"
+        return current, "steady"
+
+    def update(self) -> None:
+        self.sample = self._sampler()
+        concurrency, self.reason = self.decide(self.sample)
+        self.updated_at = datetime.now()
+        previous = self.queue.concurrency
+        if concurrency != previous:
+            self.changed_at = self.updated_at
+            self.queue.set_concurrency(concurrency)
+            logger.info(f"Scan concurrency {previous} -> {concurrency}: {self.reason}")
+            if self._on_change:
+                self._on_change(previous, concurrency, self.reason)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                # Чтение /proc и /sys не блокирует цикл событий надолго: файлы виртуальные
+                self.update()
+            except Exception as e:
+                logger.error(f"Error adjusting scan concurrency: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "concurrency": self.queue.concurrency,
+            "min": self.minimum,
+            "max": self.maximum,
+            "reason": self.reason,
+            "source": self.sample["source"],
+            "pressure": self.sample["pressure"],
+            "memory_usage": self.sample["memory_usage"],
+            "thresholds": {**self.thresholds, "memory_usage": self.memory_usage_high},
+            "interval": self.interval,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None,
+            "changed_at": self.changed_at.isoformat() if self.changed_at else None,
+        }
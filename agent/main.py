@@ -1,16 +1,51 @@
 import os
+import hmac
 import uuid
 import json
+import gzip
+import time
+import shutil
 import asyncio
+import aiofiles
+from collections import deque
 import docker
-import subprocess
-from typing import Dict, List, Optional, Any
+from contextlib import asynccontextmanager, contextmanager
+from typing import Dict, List, Optional, Any, Tuple
 from pydantic import BaseModel
-from fastapi import FastAPI, HTTPException, BackgroundTasks
+from fastapi import Depends, FastAPI, HTTPException, Request, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from loguru import logger
 from enum import Enum
 from datetime import datetime
+from prometheus_client import Counter, Gauge, Histogram, generate_latest, CONTENT_TYPE_LATEST
+
+from concurrency import PRESSURE_RESOURCES, ConcurrencyController
+from prescan import PrescanWatcher, RepositoryFilter
+from remediation import (
+    FINISHED_STATUSES,
+    OperationStatus,
+    RemediationAction,
+    RemediationOperation,
+    check_image_override,
+    patch_container,
+    recreate_container,
+)
+from scan_queue import ScanJob, ScanPriority, ScanQueue
+from trivy_stages import StageTracker, read_lines
+
+# Компактный бинарный формат и zstd-сжатие необязательны:
+# без них агент отвечает JSON со сжатием gzip
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
 
 # Модели данных
 class ContainerInfo(BaseModel):
@@ -21,6 +56,8 @@ class ContainerInfo(BaseModel):
 
 class ScanRequest(BaseModel):
     container_id: str
+    scan_id: Optional[str] = None
+    priority: ScanPriority = ScanPriority.NORMAL
 
 class ScanStatus(str, Enum):
     PENDING = "pending"
@@ -30,45 +67,794 @@ class ScanStatus(str, Enum):
 
 class ScanResult(BaseModel):
     scan_id: str
-    container_id: str
+    # Пустой для сканирования образа без контейнера (POST /scan/batch)
+    container_id: Optional[str] = None
+    image: Optional[str] = None
     status: ScanStatus
     started_at: Optional[datetime] = None
     finished_at: Optional[datetime] = None
-    results: Optional[Dict[str, Any]] = None
+    result_size: Optional[int] = None
     error: Optional[str] = None
+    job_id: Optional[str] = None
+    queue_position: Optional[int] = None
+    # Текущий этап работы Trivy (db, image_fetch, layer_analysis, detection) и его процент выполнения
+    stage: Optional[str] = None
+    stage_percent: Optional[float] = None
+    stages: List[Dict[str, Any]] = []
+    trace_id: Optional[str] = None
+    spans: List[Dict[str, Any]] = []
+
+class BatchScanItem(BaseModel):
+    # Контейнер (ID, его начало или имя) или образ (тег, дайджест или ID)
+    container_id: Optional[str] = None
+    image: Optional[str] = None
+    scan_id: Optional[str] = None
+
+class BatchScanRequest(BaseModel):
+    items: List[BatchScanItem]
+    batch_id: Optional[str] = None
+    priority: ScanPriority = ScanPriority.NORMAL
+
+class BatchScanResult(BaseModel):
+    batch_id: str
+    # Сводный статус: pending/running, пока есть незавершенные сканирования, затем completed или error
+    status: ScanStatus
+    created_at: datetime
+    total: int
+    # Число запусков Trivy: сканирования одного образа объединяются
+    jobs: int
+    counts: Dict[str, int] = {}
+    items: List[ScanResult] = []
+
+class RemediationRequest(BaseModel):
+    action: RemediationAction = RemediationAction.RECREATE
+    # ID шага исправления на бэкенде: повторный запрос с тем же ID возвращает ту же операцию
+    operation_id: Optional[str] = None
+    # Другой тег или дайджест репозитория текущего образа для пересоздания;
+    # по умолчанию заново загружается тег текущего образа
+    image: Optional[str] = None
+    # Пакеты для обновления на месте (action=patch)
+    packages: List[str] = []
+    health_timeout: Optional[float] = None
+
+# Общий с бэкендом токен (Authorization: Bearer) для изменяющих запросов: постановка и отмена
+# сканирований, исправление контейнеров. Без токена исправление контейнеров отключено
+AGENT_API_TOKEN = os.getenv("AGENT_API_TOKEN", "")
+# Источники, которым браузер может читать ответы агента (через запятую); UI обращается только к бэкенду
+AGENT_CORS_ORIGINS = [origin.strip() for origin in os.getenv("AGENT_CORS_ORIGINS", "").split(",") if origin.strip()]
 
 # Настройки и переменные
 SCAN_CONCURRENCY = int(os.getenv("SCAN_CONCURRENCY", "2"))
-scan_semaphore = asyncio.Semaphore(SCAN_CONCURRENCY)
 scan_tasks: Dict[str, ScanResult] = {}
 
+# Пакетные сканирования: время создания и ID сканирований пакета
+SCAN_BATCH_MAX_ITEMS = int(os.getenv("SCAN_BATCH_MAX_ITEMS", "1000"))
+scan_batches: Dict[str, Tuple[datetime, List[str]]] = {}
+
+# Настройки формата ответов
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+ZSTD_LEVEL = int(os.getenv("ZSTD_LEVEL", "3"))
+
+# Поля верхнего уровня отчета Trivy и его секций, которые сохраняются при проекции
+REPORT_KEYS = ("SchemaVersion", "ArtifactName", "ArtifactType")
+RESULT_KEYS = ("Target", "Class", "Type")
+
+# Каталог для сырых результатов Trivy: агент отдает их как есть, не разбирая JSON
+RESULTS_DIR = os.getenv("RESULTS_DIR", "/tmp/aegis-results")
+RESULT_CHUNK_SIZE = 64 * 1024
+os.makedirs(RESULTS_DIR, exist_ok=True)
+# Очистка результатов раз в RESULT_SWEEP_INTERVAL секунд: сканирования, завершенные раньше чем
+# RESULT_TTL секунд назад, удаляются вместе с файлами (404); если файлы занимают больше
+# RESULTS_MAX_BYTES, файлы самых старых результатов удаляются раньше срока (410)
+RESULT_TTL = float(os.getenv("RESULT_TTL", "86400"))
+RESULTS_MAX_BYTES = int(os.getenv("RESULTS_MAX_BYTES", str(2 * 1024 ** 3)))
+RESULT_SWEEP_INTERVAL = float(os.getenv("RESULT_SWEEP_INTERVAL", "300"))
+
+# Трассировка: участки возвращаются бэкенду в статусе сканирования
+# и дополнительно могут писаться в локальный JSONL-файл
+TRACE_EXPORT_FILE = os.getenv("TRACE_EXPORT_FILE")
+
+# Интервал опроса пикового RSS процесса Trivy
+RSS_SAMPLE_INTERVAL = float(os.getenv("RSS_SAMPLE_INTERVAL", "0.5"))
+
+# Проверка здоровья после исправления: предельное время и время стабильной работы
+# для контейнеров без HEALTHCHECK
+REMEDIATION_HEALTH_TIMEOUT = float(os.getenv("REMEDIATION_HEALTH_TIMEOUT", "120"))
+REMEDIATION_STABLE_SECONDS = float(os.getenv("REMEDIATION_STABLE_SECONDS", "10"))
+remediation_operations: Dict[str, RemediationOperation] = {}
+remediation_tasks: Dict[str, asyncio.Task] = {}
+
+# Адаптивный параллелизм: SCAN_CONCURRENCY — начальное значение, дальше число параллельных
+# сканирований меняется в пределах [SCAN_CONCURRENCY_MIN, SCAN_CONCURRENCY_MAX] по давлению (PSI, %)
+# на CPU, память и ввод-вывод хоста и по занятой доле лимита памяти агента
+ADAPTIVE_CONCURRENCY = os.getenv("ADAPTIVE_CONCURRENCY", "true").lower() == "true"
+SCAN_CONCURRENCY_MIN = int(os.getenv("SCAN_CONCURRENCY_MIN", "1"))
+SCAN_CONCURRENCY_MAX = int(os.getenv("SCAN_CONCURRENCY_MAX", str(max(SCAN_CONCURRENCY, (os.cpu_count() or 2) // 2))))
+CONCURRENCY_PRESSURE_THRESHOLDS = {
+    "cpu": float(os.getenv("CONCURRENCY_CPU_PRESSURE", "40")),
+    "memory": float(os.getenv("CONCURRENCY_MEMORY_PRESSURE", "10")),
+    "io": float(os.getenv("CONCURRENCY_IO_PRESSURE", "30")),
+}
+CONCURRENCY_MEMORY_USAGE = float(os.getenv("CONCURRENCY_MEMORY_USAGE", "0.9"))
+CONCURRENCY_INTERVAL = float(os.getenv("CONCURRENCY_INTERVAL", "10"))
+
+# Приоритет процессов Trivy: nice для CPU и класс/уровень ionice для диска (2 — best-effort, 7 — низший)
+TRIVY_NICE = int(os.getenv("TRIVY_NICE", "10"))
+TRIVY_IONICE_CLASS = int(os.getenv("TRIVY_IONICE_CLASS", "2"))
+TRIVY_IONICE_LEVEL = int(os.getenv("TRIVY_IONICE_LEVEL", "7"))
+
+# Этапы определяются по строкам INFO журнала Trivy; загрузка образа и анализ слоев различаются
+# только в отладочном журнале (--debug). Он включается явно: Trivy пишет строку на каждый слой
+# и анализатор, и агент читает и разбирает весь этот поток (сотни строк и больше на образ).
+# В ошибку сканирования попадают последние TRIVY_ERROR_LINES строк журнала без отладочных
+TRIVY_DEBUG_LOG = os.getenv("TRIVY_DEBUG_LOG", "false").lower() == "true"
+TRIVY_ERROR_LINES = int(os.getenv("TRIVY_ERROR_LINES", "20"))
+
+# Фоновое сканирование новых образов по событиям Docker (загрузка образа, создание контейнера).
+# Репозитории фильтруются списками шаблонов через запятую (например, registry.local/*), частота
+# ограничена; результат отдается сканированиям того же образа в течение PRESCAN_RESULT_TTL секунд
+PRESCAN_ENABLED = os.getenv("PRESCAN_ENABLED", "false").lower() == "true"
+PRESCAN_ALLOW = [pattern.strip() for pattern in os.getenv("PRESCAN_ALLOW", "").split(",") if pattern.strip()]
+PRESCAN_DENY = [pattern.strip() for pattern in os.getenv("PRESCAN_DENY", "").split(",") if pattern.strip()]
+PRESCAN_RATE_PER_MINUTE = float(os.getenv("PRESCAN_RATE_PER_MINUTE", "6"))
+PRESCAN_MAX_PENDING = int(os.getenv("PRESCAN_MAX_PENDING", "100"))
+PRESCAN_RESULT_TTL = float(os.getenv("PRESCAN_RESULT_TTL", "86400"))
+# ID образа → ID его последнего фонового сканирования
+prescan_scans: Dict[str, str] = {}
+
+# Запуск: порт открывается сразу, Docker подключается в фоне с повторными попытками
+# (пауза растет до DOCKER_CONNECT_RETRY_MAX секунд); до подключения /health/ready отвечает 503
+DOCKER_CONNECT_RETRY_MAX = float(os.getenv("DOCKER_CONNECT_RETRY_MAX", "30"))
+READINESS_TIMEOUT = float(os.getenv("READINESS_TIMEOUT", "2"))
+
+# Метрики Prometheus
+SCAN_QUEUE_DEPTH = Gauge("aegis_agent_scan_queue_depth", "Scan jobs waiting in the queue")
+SCANS_RUNNING = Gauge("aegis_agent_scans_running", "Scan jobs currently running Trivy")
+SCAN_CONCURRENCY_LIMIT = Gauge("aegis_agent_scan_concurrency", "Maximum number of parallel scans")
+SCAN_WAIT_SECONDS = Histogram(
+    "aegis_agent_scan_wait_seconds",
+    "Time a scan waited in the queue",
+    buckets=(0.01, 0.1, 0.5, 1, 5, 15, 30, 60, 120, 300, 600, 1800),
+)
+TRIVY_DURATION_SECONDS = Histogram(
+    "aegis_agent_trivy_duration_seconds",
+    "Trivy wall time per scan",
+    ["status"],
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600),
+)
+TRIVY_STAGE_SECONDS = Histogram(
+    "aegis_agent_trivy_stage_seconds",
+    "Duration of Trivy stages (db, image_fetch, layer_analysis, detection)",
+    ["stage"],
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800),
+)
+TRIVY_PEAK_RSS_BYTES = Histogram(
+    "aegis_agent_trivy_peak_rss_bytes",
+    "Peak resident set size of the Trivy process per scan",
+    buckets=tuple(2 ** power * 1024 * 1024 for power in range(5, 14)),
+)
+SCAN_RESULT_BYTES = Histogram(
+    "aegis_agent_scan_result_bytes",
+    "Size of raw Trivy results per scan",
+    buckets=tuple(4 ** power * 1024 for power in range(0, 10)),
+)
+SCANS_TOTAL = Counter("aegis_agent_scans_total", "Finished scans", ["status"])
+SCANS_COALESCED = Counter(
+    "aegis_agent_scans_coalesced_total",
+    "Scan requests attached to a queued or running scan of the same image",
+)
+HTTP_REQUEST_DURATION_SECONDS = Histogram(
+    "aegis_agent_http_request_duration_seconds",
+    "Agent HTTP request latency",
+    ["method", "route", "status"],
+)
+REMEDIATION_OPERATIONS = Counter(
+    "aegis_agent_remediation_operations_total",
+    "Finished container remediation operations",
+    ["action", "status"],
+)
+REMEDIATION_STEP_SECONDS = Histogram(
+    "aegis_agent_remediation_step_seconds",
+    "Duration of remediation steps (pull, recreate, patch, health, rollback)",
+    ["step", "status"],
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 120, 300, 600, 1800),
+)
+PRESCAN_EVENTS = Counter(
+    "aegis_agent_prescan_events_total",
+    "Image events handled by the pre-scanner (queued, fresh, filtered, dropped, not_found, error)",
+    ["outcome"],
+)
+PRESCAN_REUSED = Counter(
+    "aegis_agent_prescan_reused_total",
+    "Scan requests answered with a ready pre-scan result",
+)
+HOST_PRESSURE = Gauge(
+    "aegis_agent_host_pressure",
+    "Share of time tasks waited for a resource over the last 10 seconds (PSI avg10, percent)",
+    ["resource"],
+)
+SCAN_CONCURRENCY_CHANGES = Counter(
+    "aegis_agent_scan_concurrency_changes_total",
+    "Adaptive scan concurrency adjustments",
+    ["direction"],
+)
+STARTUP_PHASE_SECONDS = Gauge(
+    "aegis_agent_startup_phase_seconds",
+    "Seconds from process start to the end of each startup phase (import, docker, ready)",
+    ["phase"],
+)
+
+def process_uptime() -> float:
+    """Секунды с запуска процесса (по /proc/self/stat), иначе с импорта модуля"""
+    try:
+        with open("/proc/self/stat") as f:
+            # Поле 22 (после имени процесса в скобках — 20-е) — время запуска в тиках с загрузки системы
+            started_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            return float(f.read().split()[0]) - started_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return time.perf_counter() - module_imported
+
+module_imported = time.perf_counter()
+
+# Состояние запуска: фазы с секундами от старта процесса и готовность к приему запросов
+startup_state: Dict[str, Any] = {"ready": False, "phases": {}}
+startup_tasks: List[asyncio.Task] = []
+
+def mark_phase(phase: str) -> None:
+    elapsed = round(process_uptime(), 3)
+    startup_state["phases"][phase] = elapsed
+    STARTUP_PHASE_SECONDS.labels(phase).set(elapsed)
+
+async def initialize():
+    """Подключение к Docker с повторными попытками и запуск наблюдателя за новыми образами"""
+    global docker_client
+    attempt = 0
+    delay = 0.5
+    while docker_client is None:
+        attempt += 1
+        try:
+            docker_client = await asyncio.to_thread(connect_docker)
+        except Exception as e:
+            logger.warning(f"Docker is not available (attempt {attempt}), retrying in {delay:.1f}s: {str(e)}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, DOCKER_CONNECT_RETRY_MAX)
+    mark_phase("docker")
+    
+    if PRESCAN_ENABLED:
+        prescan_watcher.start(docker_client)
+        logger.info(f"Pre-scanning new images (allow: {PRESCAN_ALLOW or 'all'}, deny: {PRESCAN_DENY or 'none'})")
+    mark_phase("ready")
+    startup_state["ready"] = True
+    logger.info(f"Agent ready in {startup_state['phases']['ready']:.2f}s (docker attempts: {attempt})")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Фоновые задачи агента; зависимости подключаются после открытия порта"""
+    mark_phase("import")
+    if ADAPTIVE_CONCURRENCY:
+        concurrency_controller.start()
+    removed = remove_orphaned_results()
+    if removed:
+        logger.info(f"Removed {removed} orphaned result files from {RESULTS_DIR}")
+    startup_tasks.append(asyncio.create_task(run_result_sweeper()))
+    if not AGENT_API_TOKEN:
+        logger.warning("AGENT_API_TOKEN is not set: scan requests are not authenticated, remediation is disabled")
+    startup_tasks.append(asyncio.create_task(initialize()))
+    yield
+    for task in startup_tasks:
+        task.cancel()
+
 # Инициализация FastAPI
-app = FastAPI(title="Aegis Sidecar Agent")
+app = FastAPI(title="Aegis Sidecar Agent", lifespan=lifespan)
 
-# CORS middleware
+# CORS middleware: только чтение, изменяющие запросы из браузера не разрешаются
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_origins=AGENT_CORS_ORIGINS,
+    allow_credentials=False,
+    allow_methods=["GET"],
 )
 
-# Инициализация клиента Docker
-if os.path.exists('/var/run/docker.sock'):
-    docker_client = docker.DockerClient(base_url='unix:///var/run/docker.sock')
-else:
-    docker_client = docker.from_env()
+@app.middleware("http")
+async def track_request_latency(request: Request, call_next):
+    """Учет латентности HTTP-запросов по шаблону маршрута"""
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        HTTP_REQUEST_DURATION_SECONDS.labels(
+            request.method,
+            route.path if route is not None else "unmatched",
+            str(status)
+        ).observe(time.perf_counter() - started)
+
+# Клиент Docker создается при запуске в фоне (initialize), а не при импорте модуля
+docker_client: Optional[docker.DockerClient] = None
+
+def connect_docker() -> docker.DockerClient:
+    """Подключение к Docker с проверкой, что демон отвечает"""
+    if os.path.exists('/var/run/docker.sock'):
+        client = docker.DockerClient(base_url='unix:///var/run/docker.sock')
+    else:
+        client = docker.from_env()
+    client.ping()
+    return client
+
+def require_token(request: Request) -> None:
+    """Проверка токена бэкенда для изменяющих запросов (если AGENT_API_TOKEN задан)"""
+    if not AGENT_API_TOKEN:
+        return
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.strip().encode(), AGENT_API_TOKEN.encode()):
+        raise HTTPException(status_code=401, detail="Invalid or missing agent token", headers={"WWW-Authenticate": "Bearer"})
+
+def get_docker() -> docker.DockerClient:
+    if docker_client is None:
+        raise HTTPException(status_code=503, detail="Docker is not connected yet")
+    return docker_client
+
+def _accepts(header: Optional[str], token: str) -> bool:
+    """Проверка, что значение разрешено заголовком Accept/Accept-Encoding (q=0 означает запрет)"""
+    if not header:
+        return False
+    for part in header.split(","):
+        value, _, params = part.partition(";")
+        if value.strip().lower() != token:
+            continue
+        params = params.strip().lower()
+        if params.startswith("q="):
+            try:
+                return float(params[2:]) > 0
+            except ValueError:
+                return True
+        return True
+    return False
+
+def encode_response(request: Request, payload: Any) -> Response:
+    """Кодирование ответа в msgpack или JSON и сжатие zstd/gzip согласно заголовкам запроса"""
+    data = jsonable_encoder(payload)
+    accept = request.headers.get("accept")
+    
+    if msgpack is not None and any(_accepts(accept, media_type) for media_type in MSGPACK_MEDIA_TYPES):
+        body = msgpack.packb(data, use_bin_type=True)
+        media_type = MSGPACK_MEDIA_TYPES[0]
+    else:
+        body = json.dumps(data, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        media_type = "application/json"
+    
+    headers = {"Vary": "Accept, Accept-Encoding"}
+    
+    # Небольшие ответы не сжимаем: накладные расходы больше выигрыша
+    if len(body) >= COMPRESSION_MIN_SIZE:
+        accept_encoding = request.headers.get("accept-encoding")
+        if zstandard is not None and _accepts(accept_encoding, "zstd"):
+            body = zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(body)
+            headers["Content-Encoding"] = "zstd"
+        elif _accepts(accept_encoding, "gzip"):
+            body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+            headers["Content-Encoding"] = "gzip"
+    
+    return Response(content=body, media_type=media_type, headers=headers)
+
+def build_projection(fields: str) -> Dict[str, Any]:
+    """Построение дерева проекции из списка полей через запятую.
+    
+    Поддерживаются вложенные пути через точку и '*' для любого ключа,
+    например: VulnerabilityID,Severity,CVSS.*.V3Score
+    """
+    tree: Dict[str, Any] = {}
+    for field in fields.split(","):
+        field = field.strip()
+        if not field:
+            continue
+        node = tree
+        parts = field.split(".")
+        for i, part in enumerate(parts):
+            if i == len(parts) - 1:
+                node[part] = None
+            else:
+                child = node.get(part)
+                if child is None:
+                    child = node[part] = {}
+                node = child
+    return tree
+
+def project_value(value: Any, tree: Optional[Dict[str, Any]]) -> Any:
+    """Применение дерева проекции к значению"""
+    if tree is None:
+        return value
+    if isinstance(value, list):
+        return [project_value(item, tree) for item in value]
+    if not isinstance(value, dict):
+        return value
+    
+    projected = {}
+    wildcard = tree.get("*", False)
+    for key, item in value.items():
+        if key in tree:
+            projected[key] = project_value(item, tree[key])
+        elif wildcard is not False:
+            projected[key] = project_value(item, wildcard)
+    return projected
+
+def project_results(results: Dict[str, Any], tree: Dict[str, Any]) -> Dict[str, Any]:
+    """Проекция отчета Trivy: метаданные, слои и лишние поля находок отбрасываются"""
+    projected = {key: results[key] for key in REPORT_KEYS if key in results}
+    projected["Results"] = []
+    
+    for result in results.get("Results") or []:
+        item = {key: result[key] for key in RESULT_KEYS if key in result}
+        if result.get("Vulnerabilities"):
+            item["Vulnerabilities"] = project_value(result["Vulnerabilities"], tree)
+        projected["Results"].append(item)
+    
+    return projected
+
+def parse_traceparent(header: Optional[str]) -> Tuple[Optional[str], Optional[str]]:
+    """Разбор заголовка W3C traceparent: (trace_id, parent_span_id)"""
+    if not header:
+        return None, None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None, None
+    return parts[1], parts[2]
+
+@contextmanager
+def trace_span(scan_id: str, name: str, parent_id: Optional[str] = None, **attributes: Any):
+    """Участок трассировки сканирования; сохраняется в записи сканирования"""
+    scan = scan_tasks[scan_id]
+    span = {
+        "trace_id": scan.trace_id,
+        "span_id": os.urandom(8).hex(),
+        "parent_id": parent_id,
+        "service": "aegis-agent",
+        "name": name,
+        "started_at": datetime.utcnow().isoformat() + "+00:00",
+        "duration_ms": None,
+        "status": "ok",
+        "attributes": {"scan_id": scan_id, **attributes},
+    }
+    started = time.perf_counter()
+    try:
+        yield span
+    except Exception as e:
+        span["status"] = "error"
+        span["attributes"]["error"] = str(e)
+        raise
+    finally:
+        span["duration_ms"] = (time.perf_counter() - started) * 1000
+        record_span(scan, span)
+
+def record_span(scan: ScanResult, span: Dict[str, Any]) -> None:
+    scan.spans.append(span)
+    if TRACE_EXPORT_FILE:
+        with open(TRACE_EXPORT_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps(span, ensure_ascii=False) + "\n")
+
+@contextmanager
+def job_span(job: ScanJob, name: str, **attributes: Any):
+    """Участок выполнения задания: копируется в трассу каждого привязанного к нему сканирования"""
+    attributes = {"job_id": job.job_id, **attributes}
+    status = "ok"
+    started_at = datetime.utcnow().isoformat() + "+00:00"
+    started = time.perf_counter()
+    try:
+        yield attributes
+    except Exception as e:
+        status = "error"
+        attributes["error"] = str(e)
+        raise
+    finally:
+        duration_ms = (time.perf_counter() - started) * 1000
+        for scan_id in job.scan_ids:
+            scan = scan_tasks[scan_id]
+            record_span(scan, {
+                "trace_id": scan.trace_id,
+                "span_id": os.urandom(8).hex(),
+                "parent_id": job.parents.get(scan_id),
+                "service": "aegis-agent",
+                "name": name,
+                "started_at": started_at,
+                "duration_ms": duration_ms,
+                "status": status,
+                "attributes": {"scan_id": scan_id, "coalesced": len(job.scan_ids) > 1, **attributes},
+            })
+
+def read_peak_rss(pid: int) -> int:
+    """Пиковый RSS процесса (VmHWM) в байтах, 0 если процесс уже завершился"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return 0
+
+async def sample_peak_rss(pid: int, peak: Dict[str, int]) -> None:
+    """Периодический опрос пикового RSS процесса до его завершения"""
+    while True:
+        peak["rss"] = max(peak["rss"], read_peak_rss(pid))
+        await asyncio.sleep(RSS_SAMPLE_INTERVAL)
+
+def result_path(scan_id: str, encoding: str = "identity") -> str:
+    """Путь к файлу результата сканирования в заданной кодировке"""
+    suffix = {"identity": "", "gzip": ".gz", "zstd": ".zst"}[encoding]
+    return os.path.join(RESULTS_DIR, f"{scan_id}.json{suffix}")
+
+def get_completed_result_path(scan_id: str) -> str:
+    """Путь к результату завершенного сканирования или HTTPException"""
+    if scan_id not in scan_tasks:
+        raise HTTPException(status_code=404, detail=f"Scan {scan_id} not found")
+    if scan_tasks[scan_id].status != ScanStatus.COMPLETED:
+        raise HTTPException(status_code=409, detail=f"Scan {scan_id} is not completed")
+    
+    path = result_path(scan_id)
+    if not os.path.exists(path):
+        raise HTTPException(status_code=410, detail=f"Result of scan {scan_id} is no longer available")
+    return path
+
+def remove_result_files(scan_id: str) -> None:
+    for encoding in ("identity", "gzip", "zstd"):
+        try:
+            os.remove(result_path(scan_id, encoding))
+        except FileNotFoundError:
+            pass
+
+def remove_orphaned_results() -> int:
+    """Удаление файлов результатов, которые не принадлежат известным сканированиям
+    
+    Состояние сканирований хранится в памяти, поэтому после перезапуска агента
+    все оставшиеся файлы (включая недописанные .tmp) — сироты.
+    """
+    removed = 0
+    for name in os.listdir(RESULTS_DIR):
+        scan_id = name.split(".json", 1)[0]
+        if scan_id in scan_tasks:
+            continue
+        try:
+            os.remove(os.path.join(RESULTS_DIR, name))
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+def stat_result_files(scan_ids: List[str]) -> Dict[str, List[Tuple[Tuple[int, int], int]]]:
+    """Файлы результатов сканирований: (устройство, inode) и размер каждого существующего файла"""
+    files: Dict[str, List[Tuple[Tuple[int, int], int]]] = {}
+    for scan_id in scan_ids:
+        for encoding in ("identity", "gzip", "zstd"):
+            try:
+                stat = os.stat(result_path(scan_id, encoding))
+            except FileNotFoundError:
+                continue
+            files.setdefault(scan_id, []).append(((stat.st_dev, stat.st_ino), stat.st_size))
+    return files
+
+def remove_results(scan_ids: List[str]) -> None:
+    for scan_id in scan_ids:
+        remove_result_files(scan_id)
+
+async def sweep_results(now: Optional[datetime] = None) -> Tuple[int, int]:
+    """Удаление устаревших сканирований и вытеснение файлов результатов сверх RESULTS_MAX_BYTES
+    
+    Словари состояния меняются только в цикле событий, вместе с обработчиками запросов;
+    в поток выносятся лишь обращения к файловой системе.
+    Возвращает число удаленных сканирований и число сканирований, у которых удалены только файлы.
+    """
+    now = now or datetime.now()
+    finished = sorted(
+        (scan for scan in scan_tasks.values() if scan.finished_at is not None and scan.status in (ScanStatus.COMPLETED, ScanStatus.ERROR)),
+        key=lambda scan: scan.finished_at
+    )
+    
+    # Сначала сканирование пропадает из состояния (404), затем удаляются его файлы
+    expired = [scan.scan_id for scan in finished if (now - scan.finished_at).total_seconds() > RESULT_TTL]
+    for scan_id in expired:
+        del scan_tasks[scan_id]
+    if expired:
+        for batch_id, (_, scan_ids) in list(scan_batches.items()):
+            if not any(scan_id in scan_tasks for scan_id in scan_ids):
+                del scan_batches[batch_id]
+        for image_id, scan_id in list(prescan_scans.items()):
+            if scan_id not in scan_tasks:
+                del prescan_scans[image_id]
+        await asyncio.to_thread(remove_results, expired)
+    
+    # Объем считается по inode: объединенные сканирования делят файлы через жесткие ссылки
+    remaining = [scan.scan_id for scan in finished[len(expired):]]
+    files = await asyncio.to_thread(stat_result_files, remaining)
+    owners = [(scan_id, files[scan_id]) for scan_id in remaining if scan_id in files]
+    sizes: Dict[Tuple[int, int], int] = {}
+    links: Dict[Tuple[int, int], int] = {}
+    for _, entries in owners:
+        for key, size in entries:
+            sizes[key] = size
+            links[key] = links.get(key, 0) + 1
+    
+    total = sum(sizes.values())
+    evicted = []
+    for scan_id, entries in owners:
+        if total <= RESULTS_MAX_BYTES:
+            break
+        evicted.append(scan_id)
+        for key, _ in entries:
+            links[key] -= 1
+            if links[key] == 0:
+                total -= sizes[key]
+    if evicted:
+        await asyncio.to_thread(remove_results, evicted)
+    return len(expired), len(evicted)
+
+async def run_result_sweeper() -> None:
+    """Фоновая очистка результатов каждые RESULT_SWEEP_INTERVAL секунд"""
+    while True:
+        await asyncio.sleep(RESULT_SWEEP_INTERVAL)
+        try:
+            expired, evicted = await sweep_results()
+            if expired or evicted:
+                logger.info(f"Result sweep: {expired} scans expired, {evicted} results evicted over size limit")
+        except Exception as e:
+            logger.error(f"Error sweeping scan results: {str(e)}")
+
+def load_result(path: str) -> Dict[str, Any]:
+    """Чтение и разбор файла результата (только для проекции и поиска отдельных находок)"""
+    with open(path, "rb") as f:
+        return json.loads(f.read())
+
+def compress_result_file(scan_id: str) -> None:
+    """Потоковое создание сжатых копий результата, чтобы не сжимать его при каждом запросе"""
+    encodings = ["gzip"] + (["zstd"] if zstandard is not None else [])
+    
+    for encoding in encodings:
+        target = result_path(scan_id, encoding)
+        tmp_target = f"{target}.tmp"
+        with open(result_path(scan_id), "rb") as src, open(tmp_target, "wb") as dst:
+            if encoding == "gzip":
+                with gzip.GzipFile(fileobj=dst, mode="wb", compresslevel=GZIP_LEVEL) as gz:
+                    shutil.copyfileobj(src, gz, RESULT_CHUNK_SIZE)
+            else:
+                zstandard.ZstdCompressor(level=ZSTD_LEVEL).copy_stream(src, dst)
+        os.replace(tmp_target, target)
+
+def link_result(source_scan_id: str, scan_id: str) -> None:
+    """Публикация результата объединенного сканирования под другим ID (жесткие ссылки, без копирования)"""
+    for encoding in ("identity", "gzip", "zstd"):
+        source = result_path(source_scan_id, encoding)
+        if not os.path.exists(source):
+            continue
+        target = result_path(scan_id, encoding)
+        if os.path.exists(target):
+            os.remove(target)
+        try:
+            os.link(source, target)
+        except OSError:
+            shutil.copyfile(source, target)
+
+def parse_range(range_header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Разбор заголовка Range с одним диапазоном байтов
+    
+    Неподдерживаемые и некорректные заголовки игнорируются (None),
+    для недостижимого диапазона возвращается ошибка 416.
+    """
+    unit, _, spec = range_header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    
+    start_str, _, end_str = spec.strip().partition("-")
+    try:
+        if start_str:
+            start = int(start_str)
+            end = int(end_str) if end_str else size - 1
+        else:
+            # Суффиксный диапазон: последние N байтов
+            length = int(end_str)
+            if length <= 0:
+                return None
+            start = max(size - length, 0)
+            end = size - 1
+    except ValueError:
+        return None
+    
+    if start >= size:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": f"bytes */{size}"})
+    if start > end:
+        return None
+    return start, min(end, size - 1)
+
+def result_file_response(request: Request, scan_id: str) -> Response:
+    """Отдача файла результата без разбора: ETag, If-None-Match, Range и готовые сжатые копии"""
+    accept_encoding = request.headers.get("accept-encoding")
+    encoding = "identity"
+    if zstandard is not None and _accepts(accept_encoding, "zstd") and os.path.exists(result_path(scan_id, "zstd")):
+        encoding = "zstd"
+    elif _accepts(accept_encoding, "gzip") and os.path.exists(result_path(scan_id, "gzip")):
+        encoding = "gzip"
+    
+    path = result_path(scan_id, encoding)
+    stat_result = os.stat(path)
+    etag = f'"{scan_id}-{encoding}-{stat_result.st_size}-{int(stat_result.st_mtime)}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Vary": "Accept-Encoding",
+        "Cache-Control": "private, max-age=86400, immutable",
+    }
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or etag in [tag.strip() for tag in if_none_match.split(",")]):
+        return Response(status_code=304, headers=headers)
+    
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if range_header and (not if_range or if_range.strip() == etag):
+        byte_range = parse_range(range_header, stat_result.st_size)
+    else:
+        byte_range = None
+    
+    if byte_range is not None:
+        start, end = byte_range
+        
+        async def iter_range():
+            async with aiofiles.open(path, "rb") as f:
+                await f.seek(start)
+                remaining = end - start + 1
+                while remaining > 0:
+                    chunk = await f.read(min(RESULT_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    yield chunk
+        
+        headers["Content-Range"] = f"bytes {start}-{end}/{stat_result.st_size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return StreamingResponse(iter_range(), status_code=206, media_type="application/json", headers=headers)
+    
+    # FileResponse отдает файл кусками и использует zero-copy send, если его поддерживает сервер
+    return FileResponse(path, media_type="application/json", headers=headers, stat_result=stat_result)
 
 @app.get("/")
 async def read_root():
     return {"status": "ok", "service": "Aegis Sidecar Agent"}
 
+@app.get("/metrics")
+async def metrics():
+    """Метрики агента в формате Prometheus"""
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+@app.get("/health/live")
+async def liveness():
+    """Процесс жив и обрабатывает запросы (Docker не проверяется)"""
+    return {"status": "ok"}
+
+@app.get("/health/ready")
+async def readiness():
+    """Готовность к трафику: Docker подключен и отвечает"""
+    status = {"ready": startup_state["ready"], "phases": startup_state["phases"]}
+    if not startup_state["ready"]:
+        return JSONResponse(status, status_code=503)
+    try:
+        await asyncio.wait_for(asyncio.to_thread(docker_client.ping), READINESS_TIMEOUT)
+    except Exception as e:
+        status.update(ready=False, error=f"docker: {str(e) or type(e).__name__}")
+        return JSONResponse(status, status_code=503)
+    return status
+
 @app.get("/containers", response_model=List[ContainerInfo])
-async def list_containers():
+async def list_containers(request: Request):
     """Получение списка всех контейнеров на хосте"""
+    client = get_docker()
     try:
-        containers = docker_client.containers.list(all=True)
+        containers = client.containers.list(all=True)
         result = []
         
         for container in containers:
@@ -82,46 +868,217 @@ async def list_containers():
                 )
             )
         
-        return result
+        return encode_response(request, result)
     except Exception as e:
         logger.error(f"Error listing containers: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error listing containers: {str(e)}")
 
-@app.post("/scan", response_model=ScanResult)
-async def start_scan(scan_request: ScanRequest, background_tasks: BackgroundTasks):
-    """Запуск сканирования контейнера Trivy"""
+def resolve_batch_items(client: docker.DockerClient, items: List[BatchScanItem]) -> List[Tuple[Optional[str], Optional[str], Optional[str]]]:
+    """Образы для элементов пакета: (ID контейнера, ключ задания, имя образа) или ошибка
+    
+    Контейнеры и образы хоста читаются двумя запросами к Docker на весь пакет
+    вместо containers.get на каждый контейнер.
+    """
+    containers = client.api.containers(all=True)
+    images = client.api.images()
+    tags = {
+        image["Id"]: [tag for tag in image.get("RepoTags") or [] if tag != "<none>:<none>"]
+        for image in images
+    }
+    by_ref: Dict[str, str] = {}
+    for image in images:
+        by_ref[image["Id"]] = image["Id"]
+        by_ref[image["Id"].split(":", 1)[-1][:12]] = image["Id"]
+        for ref in (image.get("RepoTags") or []) + (image.get("RepoDigests") or []):
+            by_ref[ref] = image["Id"]
+    by_name = {name.lstrip("/"): container for container in containers for name in container.get("Names") or []}
+    
+    resolved = []
+    for item in items:
+        if item.container_id:
+            container = by_name.get(item.container_id) or next(
+                (container for container in containers if container["Id"].startswith(item.container_id)), None
+            )
+            if container is None:
+                resolved.append((None, None, f"Container {item.container_id} not found"))
+                continue
+            image_id = container["ImageID"]
+            image_tags = tags.get(image_id)
+            resolved.append((container["Id"], image_id, image_tags[0] if image_tags else image_id))
+        elif item.image:
+            # Образа нет на хосте: Trivy загрузит его из реестра, задания объединяются по ссылке
+            image_id = by_ref.get(item.image, item.image)
+            resolved.append((None, image_id, item.image))
+        else:
+            resolved.append((None, None, "Either container_id or image is required"))
+    return resolved
+
+def get_batch_result(batch_id: str) -> BatchScanResult:
+    created_at, scan_ids = scan_batches[batch_id]
+    scans = []
+    counts: Dict[str, int] = {}
+    for scan_id in scan_ids:
+        # Устаревшие сканирования пакета уже удалены очисткой результатов
+        scan = scan_tasks.get(scan_id)
+        if scan is None:
+            continue
+        scan.queue_position = scan_queue.position(scan_id)
+        scans.append(scan)
+        counts[scan.status.value] = counts.get(scan.status.value, 0) + 1
+    
+    if counts.get(ScanStatus.PENDING.value, 0) == len(scans):
+        status = ScanStatus.PENDING
+    elif counts.get(ScanStatus.PENDING.value) or counts.get(ScanStatus.RUNNING.value):
+        status = ScanStatus.RUNNING
+    elif counts.get(ScanStatus.ERROR.value):
+        status = ScanStatus.ERROR
+    else:
+        status = ScanStatus.COMPLETED
+    return BatchScanResult(
+        batch_id=batch_id,
+        status=status,
+        created_at=created_at,
+        total=len(scans),
+        jobs=len({scan.job_id for scan in scans if scan.job_id}),
+        counts=counts,
+        items=scans
+    )
+
+@app.post("/scan/batch", response_model=BatchScanResult, dependencies=[Depends(require_token)])
+async def start_batch_scan(batch_request: BatchScanRequest, request: Request):
+    """Постановка в очередь сканирований многих контейнеров и образов одним запросом
+    
+    Элементы с одинаковым образом (по ID/дайджесту) объединяются в одно задание Trivy.
+    Каждый элемент получает свой ID сканирования, ошибки элементов не прерывают пакет.
+    """
+    if not batch_request.items:
+        raise HTTPException(status_code=400, detail="Batch has no items")
+    if len(batch_request.items) > SCAN_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Batch has more than {SCAN_BATCH_MAX_ITEMS} items")
+    batch_id = batch_request.batch_id or uuid.uuid4().hex
+    if batch_id in scan_batches:
+        # Повтор запроса (например, после таймаута) не ставит сканирования второй раз
+        return encode_response(request, get_batch_result(batch_id))
+    
+    trace_id, parent_id = parse_traceparent(request.headers.get("traceparent"))
+    trace_id = trace_id or os.urandom(16).hex()
+    client = get_docker()
     try:
-        # Проверяем существование контейнера
-        try:
-            container = docker_client.containers.get(scan_request.container_id)
-        except docker.errors.NotFound:
-            raise HTTPException(status_code=404, detail=f"Container {scan_request.container_id} not found")
-        
-        # Генерируем уникальный ID для сканирования
-        scan_id = str(uuid.uuid4())
+        resolved = await asyncio.to_thread(resolve_batch_items, client, batch_request.items)
+    except Exception as e:
+        logger.error(f"Error resolving batch {batch_id}: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error resolving batch: {str(e)}")
+    
+    # Все элементы ставятся в очередь без переключений цикла событий: пакет попадает в очередь целиком
+    scan_ids = []
+    now = datetime.now()
+    for item, (container_id, key, image_name) in zip(batch_request.items, resolved):
+        scan_id = item.scan_id or str(uuid.uuid4())
+        scan = ScanResult(
+            scan_id=scan_id,
+            container_id=container_id or item.container_id,
+            image=image_name if key else item.image,
+            status=ScanStatus.PENDING,
+            started_at=now,
+            trace_id=trace_id
+        )
+        scan_tasks[scan_id] = scan
+        scan_ids.append(scan_id)
+        if key is None:
+            scan.status = ScanStatus.ERROR
+            scan.error = image_name
+            scan.finished_at = now
+            SCANS_TOTAL.labels(scan.status.value).inc()
+            continue
         
-        # Определяем образ контейнера
-        image_name = container.image.tags[0] if container.image.tags else container.image.id
+        with trace_span(scan_id, "agent.start_scan", parent_id, batch_id=batch_id) as span:
+            if reuse_prescan(scan, key):
+                span["attributes"].update(image=image_name, prescan=True)
+                continue
+            job, coalesced = scan_queue.submit(
+                scan_id, key, image_name, priority=batch_request.priority, parent_id=span["span_id"]
+            )
+            span["attributes"].update(image=image_name, job_id=job.job_id, coalesced=coalesced)
+        if coalesced:
+            SCANS_COALESCED.inc()
+        scan.job_id = job.job_id
+        if job.started_at is not None:
+            scan.status = ScanStatus.RUNNING
+            apply_stages(job)
+    
+    scan_batches[batch_id] = (now, scan_ids)
+    result = get_batch_result(batch_id)
+    logger.info(f"Batch {batch_id}: {result.total} scans in {result.jobs} jobs, {result.counts}")
+    return encode_response(request, result)
+
+@app.get("/scan/batch/{batch_id}", response_model=BatchScanResult)
+async def get_batch_scan(batch_id: str, request: Request):
+    """Сводный статус пакета и статусы его сканирований"""
+    if batch_id not in scan_batches:
+        raise HTTPException(status_code=404, detail=f"Batch {batch_id} not found")
+    return encode_response(request, get_batch_result(batch_id))
+
+@app.post("/scan", response_model=ScanResult, dependencies=[Depends(require_token)])
+async def start_scan(scan_request: ScanRequest, request: Request):
+    """Постановка сканирования контейнера Trivy в очередь
+    
+    Если образ контейнера уже ждет в очереди или сканируется, запрос привязывается
+    к существующему заданию и получает тот же результат без повторного запуска Trivy.
+    """
+    try:
+        client = get_docker()
+        # Используем ID сканирования бэкенда, чтобы статус можно было запрашивать по нему
+        scan_id = scan_request.scan_id or str(uuid.uuid4())
+        trace_id, parent_id = parse_traceparent(request.headers.get("traceparent"))
         
         # Создаем запись о сканировании
         scan_result = ScanResult(
             scan_id=scan_id,
             container_id=scan_request.container_id,
             status=ScanStatus.PENDING,
-            started_at=datetime.now()
+            started_at=datetime.now(),
+            trace_id=trace_id or os.urandom(16).hex()
         )
-        
         scan_tasks[scan_id] = scan_result
         
-        # Запускаем сканирование в фоновом режиме
-        background_tasks.add_task(
-            perform_scan, 
-            scan_id=scan_id, 
-            image_name=image_name
-        )
+        try:
+            with trace_span(scan_id, "agent.start_scan", parent_id) as span:
+                # Проверяем существование контейнера
+                with trace_span(scan_id, "docker.get_container", span["span_id"]):
+                    try:
+                        container = client.containers.get(scan_request.container_id)
+                    except docker.errors.NotFound:
+                        raise HTTPException(status_code=404, detail=f"Container {scan_request.container_id} not found")
+                
+                # Определяем образ контейнера; задания объединяются по ID (дайджесту) образа
+                image_name = container.image.tags[0] if container.image.tags else container.image.id
+                if reuse_prescan(scan_result, container.image.id):
+                    span["attributes"].update(image=image_name, prescan=True)
+                    return scan_result
+                job, coalesced = scan_queue.submit(
+                    scan_id,
+                    container.image.id,
+                    image_name,
+                    priority=scan_request.priority,
+                    parent_id=span["span_id"]
+                )
+                span["attributes"].update(image=image_name, job_id=job.job_id, coalesced=coalesced)
+        except Exception:
+            del scan_tasks[scan_id]
+            raise
         
-        return scan_result
+        if coalesced:
+            SCANS_COALESCED.inc()
+            logger.info(f"Scan {scan_id} attached to job {job.job_id} for image {image_name}")
         
+        scan_result.job_id = job.job_id
+        scan_result.queue_position = scan_queue.position(scan_id)
+        if job.started_at is not None:
+            # Привязано к уже выполняющемуся заданию
+            scan_result.status = ScanStatus.RUNNING
+            apply_stages(job)
+        return scan_result
+    
     except HTTPException:
         raise
     except Exception as e:
@@ -129,64 +1086,439 @@ async def start_scan(scan_request: ScanRequest, background_tasks: BackgroundTask
         raise HTTPException(status_code=500, detail=f"Error starting scan: {str(e)}")
 
 @app.get("/scan/{scan_id}", response_model=ScanResult)
-async def get_scan_status(scan_id: str):
-    """Получение статуса и результатов сканирования"""
+async def get_scan_status(scan_id: str, request: Request):
+    """Получение статуса сканирования (результаты отдаются через /scan/{scan_id}/result)"""
+    if scan_id not in scan_tasks:
+        raise HTTPException(status_code=404, detail=f"Scan {scan_id} not found")
+    
+    scan_tasks[scan_id].queue_position = scan_queue.position(scan_id)
+    return encode_response(request, scan_tasks[scan_id])
+
+@app.delete("/scan/{scan_id}", response_model=ScanResult, dependencies=[Depends(require_token)])
+async def cancel_scan(scan_id: str, request: Request):
+    """Отмена сканирования
+    
+    Сканирование отвязывается от задания; если других сканирований у задания нет,
+    оно снимается с очереди, а запущенный процесс Trivy завершается.
+    """
     if scan_id not in scan_tasks:
         raise HTTPException(status_code=404, detail=f"Scan {scan_id} not found")
     
-    return scan_tasks[scan_id]
+    scan = scan_tasks[scan_id]
+    job = scan_queue.cancel(scan_id)
+    if job is None:
+        raise HTTPException(status_code=409, detail=f"Scan {scan_id} is already finished")
+    
+    scan.status = ScanStatus.ERROR
+    scan.error = "Scan cancelled"
+    scan.finished_at = datetime.now()
+    scan.queue_position = None
+    SCANS_TOTAL.labels("cancelled").inc()
+    logger.info(f"Scan {scan_id} cancelled (job {job.job_id}, {len(job.scan_ids)} scans still attached)")
+    
+    return encode_response(request, scan)
+
+@app.get("/queue")
+async def get_queue(request: Request):
+    """Состояние очереди сканирований: выполняющиеся и ожидающие задания"""
+    return encode_response(request, {
+        "concurrency": scan_queue.concurrency,
+        "running": [job.to_dict() for job in scan_queue.running()],
+        "queued": [
+            {**job.to_dict(), "position": position}
+            for position, job in enumerate(scan_queue.queued(), start=1)
+        ],
+    })
+
+@app.get("/concurrency")
+async def get_concurrency(request: Request):
+    """Текущее решение о параллелизме сканирований и нагрузка, по которой оно принято"""
+    return encode_response(request, {
+        "adaptive": ADAPTIVE_CONCURRENCY,
+        "running": len(scan_queue.running()),
+        "queued": len(scan_queue.queued()),
+        **concurrency_controller.to_dict(),
+    })
+
+@app.get("/prescan")
+async def get_prescan_state(request: Request):
+    """Фоновое сканирование новых образов: настройки, ожидающие события и последние решения"""
+    images = []
+    for image_id, scan_id in prescan_scans.items():
+        scan = scan_tasks.get(scan_id)
+        if scan is not None:
+            images.append({
+                "image_id": image_id,
+                "image": scan.image,
+                "scan_id": scan_id,
+                "status": scan.status,
+                "finished_at": scan.finished_at,
+            })
+    return encode_response(request, {
+        "enabled": PRESCAN_ENABLED,
+        "result_ttl": PRESCAN_RESULT_TTL,
+        "images": images,
+        **prescan_watcher.to_dict(),
+    })
+
+@app.get("/scan/{scan_id}/result")
+async def get_scan_result(scan_id: str, request: Request, fields: Optional[str] = None):
+    """Получение результатов сканирования
+    
+    Без параметра **fields** файл Trivy отдается как есть (с поддержкой ETag и Range).
+    С **fields** результат разбирается и возвращается проекция находок.
+    """
+    path = get_completed_result_path(scan_id)
+    
+    if fields:
+        results = await asyncio.to_thread(load_result, path)
+        return encode_response(request, project_results(results, build_projection(fields)))
+    
+    return result_file_response(request, scan_id)
+
+@app.get("/scan/{scan_id}/vulnerabilities/{vulnerability_id}")
+async def get_scan_vulnerability(
+    scan_id: str,
+    vulnerability_id: str,
+    request: Request,
+    pkg_name: Optional[str] = None,
+    installed_version: Optional[str] = None
+):
+    """Получение полных данных находки Trivy по ID уязвимости (и пакету)"""
+    path = get_completed_result_path(scan_id)
+    results = await asyncio.to_thread(load_result, path)
+    findings = []
+    for result in results.get("Results") or []:
+        for vuln in result.get("Vulnerabilities") or []:
+            if vuln.get("VulnerabilityID") != vulnerability_id:
+                continue
+            if pkg_name and vuln.get("PkgName") != pkg_name:
+                continue
+            if installed_version and vuln.get("InstalledVersion") != installed_version:
+                continue
+            findings.append(vuln)
+    
+    if not findings:
+        raise HTTPException(
+            status_code=404,
+            detail=f"Vulnerability {vulnerability_id} not found in scan {scan_id}"
+        )
+    
+    return encode_response(request, findings)
 
-async def perform_scan(scan_id: str, image_name: str):
-    """Выполнение сканирования с использованием Trivy"""
-    async with scan_semaphore:
+@app.post("/containers/{container_id}/remediate", dependencies=[Depends(require_token)])
+async def remediate_container(container_id: str, remediation_request: RemediationRequest, request: Request):
+    """Запуск исправления контейнера: загрузка образа и пересоздание либо обновление пакетов
+    
+    Операция выполняется в фоне, ее ход доступен через /remediation/{operation_id}.
+    Одновременно для контейнера выполняется не больше одной операции.
+    Доступно только с AGENT_API_TOKEN: операция пересоздает контейнер с его правами и томами.
+    """
+    if not AGENT_API_TOKEN:
+        raise HTTPException(status_code=403, detail="Remediation is disabled: AGENT_API_TOKEN is not set")
+    operation_id = remediation_request.operation_id
+    if operation_id and operation_id in remediation_operations:
+        return encode_response(request, remediation_operations[operation_id].to_dict())
+    
+    for operation in remediation_operations.values():
+        if operation.container_id == container_id and operation.status not in FINISHED_STATUSES:
+            raise HTTPException(
+                status_code=409,
+                detail=f"Container {container_id} is already being remediated ({operation.operation_id})"
+            )
+    
+    try:
+        container = get_docker().containers.get(container_id)
+    except docker.errors.NotFound:
+        raise HTTPException(status_code=404, detail=f"Container {container_id} not found")
+    if remediation_request.image and remediation_request.action == RemediationAction.RECREATE:
         try:
-            # Обновляем статус
-            scan_tasks[scan_id].status = ScanStatus.RUNNING
-            
-            # Подготавливаем команду Trivy
-            trivy_cmd = [
-                "trivy", 
-                "image", 
-                "--format", "json", 
-                "--quiet",
-                image_name
-            ]
-            
-            logger.info(f"Running Trivy scan for image {image_name}, scan_id: {scan_id}")
-            
-            # Запускаем Trivy и захватываем вывод
-            process = subprocess.Popen(
-                trivy_cmd, 
-                stdout=subprocess.PIPE, 
-                stderr=subprocess.PIPE
+            check_image_override(container, remediation_request.image)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    
+    operation = RemediationOperation(operation_id, container.id, remediation_request.action)
+    remediation_operations[operation.operation_id] = operation
+    remediation_tasks[operation.operation_id] = asyncio.create_task(run_remediation(operation, remediation_request))
+    return encode_response(request, operation.to_dict())
+
+@app.get("/remediation/{operation_id}")
+async def get_remediation(operation_id: str, request: Request):
+    """Статус операции исправления с временем каждого шага"""
+    if operation_id not in remediation_operations:
+        raise HTTPException(status_code=404, detail=f"Remediation {operation_id} not found")
+    return encode_response(request, remediation_operations[operation_id].to_dict())
+
+async def run_remediation(operation: RemediationOperation, remediation_request: RemediationRequest):
+    """Выполнение операции исправления в отдельном потоке (вызовы Docker SDK блокирующие)"""
+    operation.status = OperationStatus.RUNNING
+    operation.started_at = datetime.now()
+    health_timeout = remediation_request.health_timeout or REMEDIATION_HEALTH_TIMEOUT
+    try:
+        if operation.action == RemediationAction.PATCH:
+            await asyncio.to_thread(
+                patch_container,
+                docker_client,
+                operation,
+                remediation_request.packages,
+                health_timeout,
+                REMEDIATION_STABLE_SECONDS
             )
-            stdout, stderr = process.communicate()
-            
-            if process.returncode != 0:
-                logger.error(f"Trivy scan failed: {stderr.decode()}")
-                scan_tasks[scan_id].status = ScanStatus.ERROR
-                scan_tasks[scan_id].error = stderr.decode()
-            else:
-                # Парсим JSON-вывод Trivy
-                try:
-                    results = json.loads(stdout.decode())
-                    scan_tasks[scan_id].results = results
-                    scan_tasks[scan_id].status = ScanStatus.COMPLETED
-                except json.JSONDecodeError as e:
-                    logger.error(f"Error parsing Trivy output: {str(e)}")
-                    scan_tasks[scan_id].status = ScanStatus.ERROR
-                    scan_tasks[scan_id].error = f"Error parsing Trivy output: {str(e)}"
-            
-            # Обновляем время завершения
-            scan_tasks[scan_id].finished_at = datetime.now()
-            
-        except Exception as e:
-            logger.error(f"Error during scan execution: {str(e)}")
-            scan_tasks[scan_id].status = ScanStatus.ERROR
-            scan_tasks[scan_id].error = str(e)
-            scan_tasks[scan_id].finished_at = datetime.now()
+        else:
+            await asyncio.to_thread(
+                recreate_container,
+                docker_client,
+                operation,
+                remediation_request.image,
+                health_timeout,
+                REMEDIATION_STABLE_SECONDS
+            )
+        if operation.status == OperationStatus.RUNNING:
+            operation.status = OperationStatus.COMPLETED
+    except Exception as e:
+        logger.error(f"Error remediating container {operation.container_id}: {str(e)}")
+        operation.status = OperationStatus.ERROR
+        operation.error = str(e)
+    finally:
+        operation.finished_at = datetime.now()
+        remediation_tasks.pop(operation.operation_id, None)
+        REMEDIATION_OPERATIONS.labels(operation.action.value, operation.status.value).inc()
+        for step in operation.steps:
+            REMEDIATION_STEP_SECONDS.labels(step["name"], step["status"]).observe(step["duration_ms"] / 1000)
+        timings = ", ".join(f"{step['name']} {step['duration_ms']:.0f} ms" for step in operation.steps)
+        logger.info(
+            f"Remediation {operation.operation_id} of container {operation.container_id} "
+            f"finished: {operation.status.value} ({timings})"
+        )
+
+def low_priority_command(command: List[str]) -> List[str]:
+    """Команда с пониженным приоритетом CPU и ввода-вывода (nice и ionice заменяют себя командой, PID сохраняется)"""
+    prefix = []
+    if TRIVY_NICE and shutil.which("nice"):
+        prefix += ["nice", "-n", str(TRIVY_NICE)]
+    if TRIVY_IONICE_CLASS and shutil.which("ionice"):
+        prefix += ["ionice", "-c", str(TRIVY_IONICE_CLASS)]
+        if TRIVY_IONICE_CLASS == 2:
+            prefix += ["-n", str(TRIVY_IONICE_LEVEL)]
+    return prefix + command
+
+def submit_prescan(image_id: str, image_name: str) -> str:
+    """Постановка фонового сканирования образа в очередь с низким приоритетом"""
+    scan_id = f"prescan-{uuid.uuid4().hex}"
+    scan_tasks[scan_id] = ScanResult(
+        scan_id=scan_id,
+        image=image_name,
+        status=ScanStatus.PENDING,
+        started_at=datetime.now(),
+        trace_id=os.urandom(16).hex()
+    )
+    job, _ = scan_queue.submit(scan_id, image_id, image_name, priority=ScanPriority.LOW)
+    scan_tasks[scan_id].job_id = job.job_id
+    prescan_scans[image_id] = scan_id
+    logger.info(f"Pre-scan {scan_id} of new image {image_name} queued (job {job.job_id})")
+    return scan_id
+
+def find_prescan(image_id: str) -> Optional[ScanResult]:
+    """Фоновое сканирование образа, если оно еще выполняется или его результат не устарел"""
+    scan = scan_tasks.get(prescan_scans.get(image_id))
+    if scan is None or scan.status == ScanStatus.ERROR:
+        return None
+    if scan.status == ScanStatus.COMPLETED and (datetime.now() - scan.finished_at).total_seconds() > PRESCAN_RESULT_TTL:
+        return None
+    if scan.status == ScanStatus.COMPLETED and not os.path.exists(result_path(scan.scan_id)):
+        return None
+    return scan
+
+def reuse_prescan(scan: ScanResult, image_id: str) -> bool:
+    """Завершение сканирования готовым результатом фонового сканирования того же образа
+    
+    Если фоновое сканирование еще ждет или выполняется, новое сканирование привязывается
+    к его заданию обычным объединением в очереди (с повышением приоритета).
+    """
+    prescan = find_prescan(image_id)
+    if prescan is None or prescan.status != ScanStatus.COMPLETED:
+        return False
+    link_result(prescan.scan_id, scan.scan_id)
+    scan.status = ScanStatus.COMPLETED
+    scan.finished_at = datetime.now()
+    scan.result_size = prescan.result_size
+    scan.job_id = prescan.job_id
+    SCANS_TOTAL.labels(scan.status.value).inc()
+    PRESCAN_REUSED.inc()
+    logger.info(f"Scan {scan.scan_id} answered with pre-scan {prescan.scan_id} of image {prescan.image}")
+    return True
+
+def record_concurrency_change(previous: int, concurrency: int, reason: str) -> None:
+    SCAN_CONCURRENCY_CHANGES.labels("up" if concurrency > previous else "down").inc()
+
+def apply_stages(job: ScanJob) -> None:
+    """Этапы Trivy задания в статусе каждого привязанного к нему сканирования"""
+    if job.stages is None:
+        return
+    current = job.stages.current
+    stages = job.stages.to_list()
+    for scan_id in job.scan_ids:
+        scan = scan_tasks[scan_id]
+        scan.stage = current["name"] if current else None
+        scan.stage_percent = current["percent"] if current else None
+        scan.stages = stages
+
+async def run_scan_job(job: ScanJob):
+    """Выполнение задания сканирования с использованием Trivy"""
+    for scan_id in job.scan_ids:
+        # Ожидание в очереди считается отдельно для каждого сканирования
+        queued_at, queued = job.queued_at[scan_id]
+        wait_seconds = time.perf_counter() - queued
+        SCAN_WAIT_SECONDS.observe(wait_seconds)
+        record_span(scan_tasks[scan_id], {
+            "trace_id": scan_tasks[scan_id].trace_id,
+            "span_id": os.urandom(8).hex(),
+            "parent_id": job.parents.get(scan_id),
+            "service": "aegis-agent",
+            "name": "agent.queue_wait",
+            "started_at": queued_at.isoformat() + "+00:00",
+            "duration_ms": wait_seconds * 1000,
+            "status": "ok",
+            "attributes": {"scan_id": scan_id, "job_id": job.job_id},
+        })
+        scan_tasks[scan_id].status = ScanStatus.RUNNING
+    
+    peak = {"rss": 0}
+    trivy_seconds = None
+    status = ScanStatus.ERROR
+    error = None
+    tmp_output_path = os.path.join(RESULTS_DIR, f"job-{job.job_id}.json.tmp")
+    try:
+        # Подготавливаем команду Trivy: результат пишется сразу в файл
+        # Журнал и прогресс-бар Trivy (stderr) читаются построчно для отслеживания этапов
+        trivy_cmd = [
+            "trivy", 
+            "image", 
+            "--format", "json", 
+            "--output", tmp_output_path,
+            job.image_name
+        ]
+        if TRIVY_DEBUG_LOG:
+            trivy_cmd.insert(2, "--debug")
+        
+        # Задание могли отменить после выдачи из очереди, пока процесса Trivy еще нет
+        if job.cancelled:
+            logger.info(f"Job {job.job_id} was cancelled before Trivy started")
+            status = None
+            return
+        
+        logger.info(f"Running Trivy scan for image {job.image_name}, job {job.job_id}, scans: {job.scan_ids}")
+        
+        # Запускаем Trivy с пониженным приоритетом, не блокируя цикл событий;
+        # процесс сохраняется в задании для отмены
+        job.process = await asyncio.create_subprocess_exec(
+            *low_priority_command(trivy_cmd), 
+            stdout=asyncio.subprocess.DEVNULL, 
+            stderr=asyncio.subprocess.PIPE
+        )
+        # Отмена во время запуска процесса не могла его завершить
+        if job.cancelled:
+            job.process.kill()
+        trivy_started = time.perf_counter()
+        rss_sampler = asyncio.create_task(sample_peak_rss(job.process.pid, peak))
+        job.stages = StageTracker(on_change=lambda tracker: apply_stages(job))
+        log_tail = deque(maxlen=TRIVY_ERROR_LINES)
+        try:
+            with job_span(job, "trivy.run", image=job.image_name) as attributes:
+                job.stages.start()
+                async for line in read_lines(job.process.stderr):
+                    job.stages.feed(line)
+                    if "DEBUG" not in line and "%" not in line:
+                        log_tail.append(line)
+                await job.process.wait()
+                job.stages.finish()
+                attributes["exit_code"] = job.process.returncode
+                attributes["stages"] = job.stages.durations()
+        finally:
+            rss_sampler.cancel()
+            trivy_seconds = time.perf_counter() - trivy_started
+        
+        for stage, duration_ms in job.stages.durations().items():
+            TRIVY_STAGE_SECONDS.labels(stage).observe(duration_ms / 1000)
+        
+        if job.cancelled:
+            logger.info(f"Trivy scan for job {job.job_id} was cancelled")
+            status = None
+        elif job.process.returncode != 0:
+            error = "\n".join(log_tail)
+            logger.error(f"Trivy scan failed: {error}")
+        elif not os.path.exists(tmp_output_path):
+            logger.error(f"Trivy produced no output for job {job.job_id}")
+            error = "Trivy produced no output"
+        else:
+            # Результат не разбирается: файл публикуется атомарно и сжимается заранее
+            primary_scan_id = job.scan_ids[0]
+            os.replace(tmp_output_path, result_path(primary_scan_id))
+            with job_span(job, "agent.compress_result"):
+                await asyncio.to_thread(compress_result_file, primary_scan_id)
+            # Сканирования, привязанные к заданию, получают тот же результат
+            for scan_id in job.scan_ids[1:]:
+                link_result(primary_scan_id, scan_id)
+            status = ScanStatus.COMPLETED
+    
+    except Exception as e:
+        logger.error(f"Error during scan execution: {str(e)}")
+        error = str(e)
+    finally:
+        if os.path.exists(tmp_output_path):
+            os.remove(tmp_output_path)
+        
+        # Отмененные сканирования уже отвязаны от задания и получили свой статус
+        finished_at = datetime.now()
+        for scan_id in job.scan_ids:
+            scan = scan_tasks[scan_id]
+            scan.status = status or ScanStatus.ERROR
+            scan.error = error
+            scan.finished_at = finished_at
+            scan.stage = None
+            scan.stage_percent = None
+            if status == ScanStatus.COMPLETED:
+                scan.result_size = os.path.getsize(result_path(scan_id))
+            SCANS_TOTAL.labels(scan.status.value).inc()
+        
+        if status == ScanStatus.COMPLETED and job.scan_ids:
+            SCAN_RESULT_BYTES.observe(scan_tasks[job.scan_ids[0]].result_size)
+        job_status = status.value if status else "cancelled"
+        if trivy_seconds is not None:
+            TRIVY_DURATION_SECONDS.labels(job_status).observe(trivy_seconds)
+        if peak["rss"]:
+            TRIVY_PEAK_RSS_BYTES.observe(peak["rss"])
+
+scan_queue = ScanQueue(run_scan_job, SCAN_CONCURRENCY)
+concurrency_controller = ConcurrencyController(
+    scan_queue,
+    SCAN_CONCURRENCY_MIN,
+    SCAN_CONCURRENCY_MAX,
+    CONCURRENCY_PRESSURE_THRESHOLDS,
+    CONCURRENCY_MEMORY_USAGE,
+    CONCURRENCY_INTERVAL,
+    on_change=record_concurrency_change
+)
+prescan_watcher = PrescanWatcher(
+    submit_prescan,
+    lambda image_id: find_prescan(image_id) is not None,
+    RepositoryFilter(PRESCAN_ALLOW, PRESCAN_DENY),
+    PRESCAN_RATE_PER_MINUTE,
+    PRESCAN_MAX_PENDING,
+    on_outcome=lambda outcome: PRESCAN_EVENTS.labels(outcome).inc()
+)
+SCAN_QUEUE_DEPTH.set_function(lambda: len(scan_queue.queued()))
+SCANS_RUNNING.set_function(lambda: len(scan_queue.running()))
+SCAN_CONCURRENCY_LIMIT.set_function(lambda: scan_queue.concurrency)
+for resource in PRESSURE_RESOURCES:
+    HOST_PRESSURE.labels(resource).set_function(
+        lambda resource=resource: concurrency_controller.sample["pressure"].get(resource) or 0
+    )
 
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("SIDECAR_PORT", "5000"))
-    uvicorn.run("main:app", host="0.0.0.0", port=port, reload=True) 
+    # Перезагрузка при изменении кода — только для разработки (SIDECAR_RELOAD=true):
+    # она запускает отдельный процесс-наблюдатель и импортирует приложение дважды
+    reload = os.getenv("SIDECAR_RELOAD", "false").lower() == "true"
+    uvicorn.run("main:app" if reload else app, host="0.0.0.0", port=port, reload=reload) 
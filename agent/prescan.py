@@ -0,0 +1,177 @@
+import asyncio
+import fnmatch
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+import docker
+from loguru import logger
+
+# События Docker, после которых на хосте появляется новый образ или контейнер
+WATCHED_EVENTS = {"type": ["image", "container"], "event": ["pull", "create"]}
+
+def repository_of(image_name: str) -> str:
+    """Репозиторий образа без тега и дайджеста: registry.local:5000/app/web:1.2 → registry.local:5000/app/web"""
+    repository = image_name.split("@", 1)[0]
+    # Двоеточие после последнего '/' отделяет тег (до него может быть порт реестра)
+    head, _, last = repository.rpartition("/")
+    if ":" in last:
+        last = last.split(":", 1)[0]
+    return f"{head}/{last}" if head else last
+
+class RepositoryFilter:
+    """Списки разрешенных и запрещенных репозиториев (шаблоны fnmatch); запрет важнее разрешения"""
+
+    def __init__(self, allow: List[str], deny: List[str]):
+        self.allow = allow
+        self.deny = deny
+
+    def allows(self, image_name: str) -> bool:
+        repository = repository_of(image_name)
+        if any(fnmatch.fnmatchcase(repository, pattern) for pattern in self.deny):
+            return False
+        return not self.allow or any(fnmatch.fnmatchcase(repository, pattern) for pattern in self.allow)
+
+class TokenBucket:
+    """Ограничение частоты: rate_per_minute запусков в минуту, не больше burst подряд"""
+
+    def __init__(self, rate_per_minute: float, burst: int):
+        self.rate = rate_per_minute / 60
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+
+    def take(self) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+class PrescanWatcher:
+    """Фоновое сканирование образов, которые появились на хосте
+
+    Поток читает события Docker (загрузка образа, создание контейнера) и складывает ссылки
+    на образы в ограниченную очередь ожидания. Очередь разбирается с ограничением частоты:
+    образ разрешается в ID, и если свежего результата для него нет, сканирование
+    ставится в общую очередь агента функцией submit.
+    """
+
+    def __init__(
+        self,
+        submit: Callable[[str, str], str],
+        is_fresh: Callable[[str], bool],
+        repository_filter: RepositoryFilter,
+        rate_per_minute: float,
+        max_pending: int,
+        on_outcome: Optional[Callable[[str], None]] = None
+    ):
+        self.client: Optional[docker.DockerClient] = None
+        self._submit = submit
+        self._is_fresh = is_fresh
+        self.filter = repository_filter
+        self.bucket = TokenBucket(rate_per_minute, burst=max(1, int(rate_per_minute // 6)))
+        self.max_pending = max_pending
+        self._on_outcome = on_outcome
+        # Ссылка на образ → время события; повторные события для ожидающего образа не дублируются
+        self.pending: "OrderedDict[str, float]" = OrderedDict()
+        self.recent: List[Dict[str, Any]] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, client: docker.DockerClient) -> None:
+        """Запуск после подключения агента к Docker"""
+        if self._task is not None:
+            return
+        self.client = client
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._task = self._loop.create_task(self._drain())
+        threading.Thread(target=self._watch, name="prescan-events", daemon=True).start()
+
+    def _watch(self) -> None:
+        backoff = 1.0
+        while True:
+            try:
+                for event in self.client.events(decode=True, filters=WATCHED_EVENTS):
+                    backoff = 1.0
+                    image_name = self.image_of(event)
+                    if image_name:
+                        self._loop.call_soon_threadsafe(self.enqueue, image_name)
+            except Exception as e:
+                logger.error(f"Docker event stream for prescan failed, reconnecting in {backoff:.0f}s: {str(e)}")
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 60.0)
+
+    @staticmethod
+    def image_of(event: Dict[str, Any]) -> Optional[str]:
+        actor = event.get("Actor") or {}
+        if event.get("Type") == "image":
+            return actor.get("ID")
+        return (actor.get("Attributes") or {}).get("image") or event.get("from")
+
+    def enqueue(self, image_name: str) -> None:
+        if not self.filter.allows(image_name):
+            self._record(image_name, None, "filtered")
+            return
+        if image_name in self.pending:
+            return
+        if len(self.pending) >= self.max_pending:
+            # Самое старое событие вытесняется: образ все равно просканируют по запросу
+            dropped, _ = self.pending.popitem(last=False)
+            self._record(dropped, None, "dropped")
+        self.pending[image_name] = time.time()
+        self._wakeup.set()
+
+    async def _drain(self) -> None:
+        while True:
+            if not self.pending:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+            if not self.bucket.take():
+                await asyncio.sleep(1.0)
+                continue
+            image_name, _ = self.pending.popitem(last=False)
+            try:
+                await self._prescan(image_name)
+            except Exception as e:
+                logger.error(f"Error pre-scanning image {image_name}: {str(e)}")
+                self._record(image_name, None, "error")
+
+    async def _prescan(self, image_name: str) -> None:
+        try:
+            image = await asyncio.to_thread(self.client.images.get, image_name)
+        except docker.errors.ImageNotFound:
+            self._record(image_name, None, "not_found")
+            return
+        if self._is_fresh(image.id):
+            self._record(image_name, image.id, "fresh")
+            return
+        scan_id = self._submit(image.id, image.tags[0] if image.tags else image_name)
+        self._record(image_name, image.id, "queued", scan_id)
+
+    def _record(self, image_name: str, image_id: Optional[str], outcome: str, scan_id: Optional[str] = None) -> None:
+        if self._on_outcome:
+            self._on_outcome(outcome)
+        self.recent.append({
+            "image": image_name,
+            "image_id": image_id,
+            "outcome": outcome,
+            "scan_id": scan_id,
+            "at": datetime.now().isoformat(),
+        })
+        del self.recent[:-100]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "allow": self.filter.allow,
+            "deny": self.filter.deny,
+            "rate_per_minute": self.bucket.rate * 60,
+            "pending": list(self.pending),
+            "recent": list(reversed(self.recent)),
+        }
@@ -0,0 +1,329 @@
+import re
+import time
+import uuid
+from datetime import datetime
+from enum import Enum
+from typing import Any, Callable, Dict, List, Optional
+
+import docker
+from loguru import logger
+
+class RemediationAction(str, Enum):
+    # Загрузка обновленного образа и пересоздание контейнера с прежними настройками
+    RECREATE = "recreate"
+    # Обновление пакетов менеджером пакетов внутри работающего контейнера
+    PATCH = "patch"
+
+class OperationStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    ERROR = "error"
+    # Новый контейнер не прошел проверку здоровья, прежний контейнер восстановлен
+    ROLLED_BACK = "rolled_back"
+
+FINISHED_STATUSES = (OperationStatus.COMPLETED, OperationStatus.ERROR, OperationStatus.ROLLED_BACK)
+
+# Имена пакетов передаются менеджеру пакетов аргументами, но все равно проверяются
+PACKAGE_NAME_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9+._:@/-]*$")
+
+# Команды обновления пакетов по менеджеру пакетов образа (имена пакетов добавляются в конец)
+PATCH_COMMANDS = {
+    "apk": [["apk", "add", "--no-cache", "--upgrade"]],
+    "apt-get": [["apt-get", "update", "-q"], ["apt-get", "install", "-y", "-q", "--only-upgrade"]],
+    "dnf": [["dnf", "upgrade", "-y", "-q"]],
+    "yum": [["yum", "update", "-y", "-q"]],
+}
+
+class RemediationOperation:
+    """Исправление одного контейнера: шаги выполняются последовательно, время каждого сохраняется"""
+
+    def __init__(self, operation_id: Optional[str], container_id: str, action: RemediationAction):
+        self.operation_id = operation_id or uuid.uuid4().hex
+        self.container_id = container_id
+        self.action = action
+        self.status = OperationStatus.PENDING
+        self.created_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.image: Optional[str] = None
+        self.image_id_before: Optional[str] = None
+        self.image_id_after: Optional[str] = None
+        self.new_container_id: Optional[str] = None
+        # Простой: от остановки прежнего контейнера до запуска нового (без загрузки образа и проверки здоровья)
+        self.downtime_ms: Optional[float] = None
+        self.changed = False
+        self.message: Optional[str] = None
+        self.error: Optional[str] = None
+        self.steps: List[Dict[str, Any]] = []
+
+    def step(self, name: str, func: Callable[..., Any], *args: Any) -> Any:
+        """Выполнение шага с учетом времени и результата"""
+        step = {"name": name, "status": "ok", "duration_ms": None}
+        self.steps.append(step)
+        started = time.perf_counter()
+        try:
+            return func(*args)
+        except Exception as e:
+            step["status"] = "error"
+            step["error"] = str(e)
+            raise
+        finally:
+            step["duration_ms"] = (time.perf_counter() - started) * 1000
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "operation_id": self.operation_id,
+            "container_id": self.container_id,
+            "action": self.action.value,
+            "status": self.status.value,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "image": self.image,
+            "image_id_before": self.image_id_before,
+            "image_id_after": self.image_id_after,
+            "new_container_id": self.new_container_id,
+            "downtime_ms": self.downtime_ms,
+            "changed": self.changed,
+            "message": self.message,
+            "error": self.error,
+            "steps": list(self.steps),
+        }
+
+class HealthCheckError(Exception):
+    """Контейнер не стал здоровым после исправления"""
+
+def wait_healthy(client: docker.DockerClient, container_id: str, timeout: float, stable_seconds: float) -> str:
+    """Ожидание готовности контейнера после запуска
+
+    Если в образе задан HEALTHCHECK, ждем статуса healthy. Иначе контейнер считается
+    здоровым, если проработал stable_seconds без остановок и перезапусков.
+    """
+    deadline = time.monotonic() + timeout
+    container = client.containers.get(container_id)
+    restart_count = container.attrs.get("RestartCount", 0)
+    running_since: Optional[float] = None
+    while True:
+        container.reload()
+        state = container.attrs.get("State") or {}
+        health = (state.get("Health") or {}).get("Status")
+        if state.get("Status") in ("exited", "dead") or container.attrs.get("RestartCount", 0) != restart_count:
+            raise HealthCheckError(f"Container stopped after start (exit code {state.get('ExitCode')})")
+        if health == "unhealthy":
+            raise HealthCheckError("Container health check reports unhealthy")
+        if health == "healthy":
+            return "healthy"
+        if health is None and state.get("Status") == "running":
+            running_since = running_since or time.monotonic()
+            if time.monotonic() - running_since >= stable_seconds:
+                return "running"
+        if time.monotonic() > deadline:
+            raise HealthCheckError(f"Container did not become healthy within {timeout:.0f}s")
+        time.sleep(1)
+
+def image_repository(image: str) -> str:
+    """Репозиторий ссылки на образ без тега, дайджеста и префикса Docker Hub"""
+    repository = image.split("@", 1)[0]
+    # Двоеточие после последнего '/' отделяет тег (до него может быть порт реестра)
+    if ":" in repository.rsplit("/", 1)[-1]:
+        repository = repository.rsplit(":", 1)[0]
+    for prefix in ("docker.io/", "index.docker.io/", "library/"):
+        if repository.startswith(prefix):
+            repository = repository[len(prefix):]
+    return repository
+
+def check_image_override(container: Any, image: str) -> None:
+    """Образ для пересоздания может быть только другим тегом или дайджестом репозитория текущего образа
+
+    Иначе запрос мог бы запустить произвольный образ с настройками контейнера (томами, правами, сетью).
+    """
+    references = list(container.image.tags) + [container.attrs["Config"].get("Image") or ""]
+    repositories = {
+        image_repository(reference) for reference in references
+        if reference and not reference.startswith("sha256:")
+    }
+    if image.startswith("sha256:") or image_repository(image) not in repositories:
+        raise ValueError(
+            f"Image {image} is not a tag of the container repository ({', '.join(sorted(repositories)) or 'unknown'})"
+        )
+
+def pull_image(client: docker.DockerClient, image: str) -> str:
+    """Загрузка образа из реестра; возвращает ID загруженного образа"""
+    repository, tag = image, None
+    # Двоеточие после последнего '/' отделяет тег (до него может быть порт реестра)
+    if "@" not in image and ":" in image.rsplit("/", 1)[-1]:
+        repository, tag = image.rsplit(":", 1)
+    return client.images.pull(repository, tag=tag).id
+
+def _without_image_defaults(config: Dict[str, Any], image_config: Dict[str, Any]) -> Dict[str, Any]:
+    """Настройки контейнера без значений, унаследованных от прежнего образа
+
+    Иначе новый контейнер получил бы переменные окружения, команду и метки старой версии образа.
+    """
+    config = dict(config)
+    image_env = set(image_config.get("Env") or [])
+    config["Env"] = [item for item in config.get("Env") or [] if item not in image_env]
+    image_labels = image_config.get("Labels") or {}
+    config["Labels"] = {
+        key: value for key, value in (config.get("Labels") or {}).items()
+        if image_labels.get(key) != value
+    }
+    for key in ("Cmd", "Entrypoint", "WorkingDir", "User", "Healthcheck", "StopSignal", "Volumes"):
+        if config.get(key) == image_config.get(key):
+            config.pop(key, None)
+    return {key: value for key, value in config.items() if value is not None}
+
+def recreate_container(
+    client: docker.DockerClient,
+    operation: RemediationOperation,
+    image: Optional[str],
+    health_timeout: float,
+    stable_seconds: float
+) -> None:
+    """Пересоздание контейнера из обновленного образа с прежними настройками
+
+    Прежний контейнер переименовывается и останавливается, но удаляется только после того,
+    как новый прошел проверку здоровья; иначе он запускается снова (rolled_back).
+    """
+    container = client.containers.get(operation.container_id)
+    if image:
+        check_image_override(container, image)
+    operation.image = image or (container.image.tags[0] if container.image.tags else None)
+    if not operation.image:
+        raise ValueError("Container image has no tag to pull an update for")
+    operation.image_id_before = container.image.id
+    operation.image_id_after = operation.step("pull", pull_image, client, operation.image)
+    if operation.image_id_after == operation.image_id_before and not image:
+        operation.message = "Image is already up to date"
+        return
+
+    attrs = container.attrs
+    name = attrs["Name"].lstrip("/")
+    host_config = attrs["HostConfig"]
+    config = _without_image_defaults(attrs["Config"], container.image.attrs.get("Config") or {})
+    config.pop("Hostname", None)
+    config["Image"] = operation.image
+    config["HostConfig"] = host_config
+
+    # При создании указывается одна сеть, остальные подключаются после
+    networks = dict((attrs.get("NetworkSettings") or {}).get("Networks") or {})
+    network_mode = host_config.get("NetworkMode") or "default"
+    if network_mode in ("host", "none") or network_mode.startswith("container:"):
+        networks = {}
+    endpoints = {
+        network: {
+            "Aliases": [alias for alias in endpoint.get("Aliases") or [] if not container.id.startswith(alias)],
+            "IPAMConfig": endpoint.get("IPAMConfig"),
+            "Links": endpoint.get("Links"),
+        }
+        for network, endpoint in networks.items()
+    }
+    first_network = next(iter(endpoints), None)
+    if first_network is not None:
+        config["NetworkingConfig"] = {"EndpointsConfig": {first_network: endpoints[first_network]}}
+
+    backup_name = f"{name}-aegis-{operation.operation_id[:8]}"
+    stop_timeout = attrs["Config"].get("StopTimeout") or 10
+    new_container_id = None
+
+    def replace() -> None:
+        nonlocal new_container_id
+        client.api.rename(container.id, backup_name)
+        created = client.api.create_container_from_config(config, name=name)
+        # Созданный контейнер занимает исходное имя: откат должен удалить его при любой ошибке
+        new_container_id = created["Id"]
+        for network, endpoint in endpoints.items():
+            if network == first_network:
+                continue
+            ipam = endpoint.get("IPAMConfig") or {}
+            client.api.connect_container_to_network(
+                created["Id"],
+                network,
+                ipv4_address=ipam.get("IPv4Address"),
+                ipv6_address=ipam.get("IPv6Address"),
+                aliases=endpoint["Aliases"] or None,
+                links=endpoint["Links"]
+            )
+        # Порты и имена освобождаются только после остановки прежнего контейнера
+        stopped = time.perf_counter()
+        container.stop(timeout=stop_timeout)
+        client.api.start(created["Id"])
+        operation.downtime_ms = (time.perf_counter() - stopped) * 1000
+
+    try:
+        operation.step("recreate", replace)
+        operation.new_container_id = new_container_id
+        operation.step("health", wait_healthy, client, new_container_id, health_timeout, stable_seconds)
+    except Exception as e:
+        logger.error(f"Remediation of container {operation.container_id} failed, rolling back: {str(e)}")
+        operation.step("rollback", rollback_container, client, container, name, new_container_id)
+        operation.new_container_id = None
+        operation.status = OperationStatus.ROLLED_BACK
+        operation.error = str(e)
+        return
+
+    operation.step("cleanup", container.remove)
+    operation.changed = True
+    operation.message = f"Container recreated from {operation.image}"
+
+def rollback_container(
+    client: docker.DockerClient,
+    container: Any,
+    name: str,
+    new_container_id: Optional[str]
+) -> None:
+    """Удаление нового контейнера и возврат прежнего под исходным именем"""
+    if new_container_id:
+        try:
+            client.api.remove_container(new_container_id, force=True)
+        except docker.errors.NotFound:
+            pass
+    container.reload()
+    if container.name != name:
+        container.rename(name)
+    if container.status != "running":
+        container.start()
+
+def detect_package_manager(container: Any) -> str:
+    for manager in PATCH_COMMANDS:
+        exit_code, _ = container.exec_run(["sh", "-c", f"command -v {manager}"])
+        if exit_code == 0:
+            return manager
+    raise ValueError("No supported package manager found in container")
+
+def patch_container(
+    client: docker.DockerClient,
+    operation: RemediationOperation,
+    packages: List[str],
+    health_timeout: float,
+    stable_seconds: float
+) -> None:
+    """Обновление уязвимых пакетов в работающем контейнере без перезапуска
+
+    Исправление действует до пересоздания контейнера: образ при этом не меняется.
+    """
+    invalid = [package for package in packages if not PACKAGE_NAME_PATTERN.match(package)]
+    if invalid or not packages:
+        raise ValueError(f"Invalid package list: {', '.join(invalid) or 'empty'}")
+
+    container = client.containers.get(operation.container_id)
+    operation.image = container.image.tags[0] if container.image.tags else container.image.id
+    manager = operation.step("detect", detect_package_manager, container)
+
+    def upgrade() -> None:
+        commands = PATCH_COMMANDS[manager]
+        for i, command in enumerate(commands):
+            # Имена пакетов относятся только к последней команде (apt-get update их не принимает)
+            command = command + packages if i == len(commands) - 1 else command
+            exit_code, output = container.exec_run(command, user="root")
+            if exit_code != 0:
+                tail = output.decode(errors="replace")[-2000:]
+                raise RuntimeError(f"{' '.join(command[:2])} exited with {exit_code}: {tail}")
+
+    operation.step("patch", upgrade)
+    operation.step("health", wait_healthy, client, container.id, health_timeout, stable_seconds)
+    # Пакеты обновляются в работающем контейнере
+    operation.downtime_ms = 0.0
+    operation.changed = True
+    operation.message = f"Upgraded {len(packages)} packages with {manager}"
@@ -0,0 +1,198 @@
+import asyncio
+import heapq
+import itertools
+import time
+import uuid
+from datetime import datetime
+from enum import Enum
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from loguru import logger
+
+class ScanPriority(str, Enum):
+    HIGH = "high"
+    NORMAL = "normal"
+    LOW = "low"
+
+# Меньшее значение — раньше в очереди
+PRIORITY_ORDER = {ScanPriority.HIGH: 0, ScanPriority.NORMAL: 1, ScanPriority.LOW: 2}
+
+class ScanJob:
+    """Одно выполнение Trivy; к нему привязываются все сканирования одного образа"""
+
+    def __init__(self, key: str, image_name: str, priority: ScanPriority, seq: int):
+        self.job_id = uuid.uuid4().hex[:12]
+        self.key = key
+        self.image_name = image_name
+        self.priority = priority
+        self.seq = seq
+        self.scan_ids: List[str] = []
+        # Родительский участок трассировки и момент постановки в очередь для каждого сканирования
+        self.parents: Dict[str, Optional[str]] = {}
+        self.queued_at: Dict[str, Tuple[datetime, float]] = {}
+        self.enqueued_at = datetime.now()
+        self.started_at: Optional[datetime] = None
+        self.process: Optional[asyncio.subprocess.Process] = None
+        # Этапы работы Trivy (trivy_stages.StageTracker), пока задание выполняется
+        self.stages: Optional[Any] = None
+        self.cancelled = False
+
+    @property
+    def sort_key(self) -> Tuple[int, int]:
+        return PRIORITY_ORDER[self.priority], self.seq
+
+    def attach(self, scan_id: str, parent_id: Optional[str] = None) -> None:
+        self.scan_ids.append(scan_id)
+        self.parents[scan_id] = parent_id
+        self.queued_at[scan_id] = (datetime.utcnow(), time.perf_counter())
+
+    def detach(self, scan_id: str) -> None:
+        if scan_id in self.scan_ids:
+            self.scan_ids.remove(scan_id)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "image": self.image_name,
+            "image_id": self.key,
+            "priority": self.priority.value,
+            "scan_ids": list(self.scan_ids),
+            "enqueued_at": self.enqueued_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "pid": self.process.pid if self.process else None,
+            "stage": self.stages.current["name"] if self.stages and self.stages.current else None,
+        }
+
+class ScanQueue:
+    """Очередь сканирований с приоритетами, отменой и объединением запросов по образу
+
+    Запросы на сканирование образа, который уже ждет в очереди или сканируется,
+    привязываются к существующему заданию: Trivy запускается один раз.
+    """
+
+    def __init__(self, runner: Callable[[ScanJob], Awaitable[None]], concurrency: int):
+        self._runner = runner
+        self.concurrency = concurrency
+        self._heap: List[Tuple[int, int, ScanJob]] = []
+        self._seq = itertools.count()
+        # Активные (ожидающие и выполняющиеся) задания по ключу образа
+        self._jobs: Dict[str, ScanJob] = {}
+        self._by_scan: Dict[str, ScanJob] = {}
+        self._running: Dict[str, ScanJob] = {}
+        self._tasks: Set[asyncio.Task] = set()
+        self._changed: Optional[asyncio.Event] = None
+        self._dispatcher: Optional[asyncio.Task] = None
+
+    def submit(
+        self,
+        scan_id: str,
+        key: str,
+        image_name: str,
+        priority: ScanPriority = ScanPriority.NORMAL,
+        parent_id: Optional[str] = None
+    ) -> Tuple[ScanJob, bool]:
+        """Постановка сканирования в очередь; возвращает задание и признак объединения"""
+        job = self._jobs.get(key)
+        coalesced = job is not None
+        if job is None:
+            job = ScanJob(key, image_name, priority, next(self._seq))
+            self._jobs[key] = job
+            heapq.heappush(self._heap, (*job.sort_key, job))
+        elif job.started_at is None and PRIORITY_ORDER[priority] < PRIORITY_ORDER[job.priority]:
+            # Ожидающее задание поднимается до приоритета нового запроса, старая запись кучи устаревает
+            job.priority = priority
+            heapq.heappush(self._heap, (*job.sort_key, job))
+
+        job.attach(scan_id, parent_id)
+        self._by_scan[scan_id] = job
+        self._notify()
+        return job, coalesced
+
+    def cancel(self, scan_id: str) -> Optional[ScanJob]:
+        """Отмена сканирования; задание без сканирований снимается с очереди или Trivy завершается"""
+        job = self._by_scan.pop(scan_id, None)
+        if job is None:
+            return None
+
+        job.detach(scan_id)
+        if not job.scan_ids:
+            job.cancelled = True
+            if self._jobs.get(job.key) is job:
+                del self._jobs[job.key]
+            if job.process is not None and job.process.returncode is None:
+                job.process.kill()
+        self._notify()
+        return job
+
+    def get_job(self, scan_id: str) -> Optional[ScanJob]:
+        return self._by_scan.get(scan_id)
+
+    def queued(self) -> List[ScanJob]:
+        """Ожидающие задания в порядке запуска"""
+        return sorted(
+            (job for job in self._jobs.values() if job.started_at is None),
+            key=lambda job: job.sort_key
+        )
+
+    def running(self) -> List[ScanJob]:
+        return list(self._running.values())
+
+    def position(self, scan_id: str) -> Optional[int]:
+        """Позиция задания сканирования в очереди (с 1), None если оно уже выполняется"""
+        job = self._by_scan.get(scan_id)
+        if job is None or job.started_at is not None:
+            return None
+        return self.queued().index(job) + 1
+
+    def set_concurrency(self, concurrency: int) -> None:
+        """Смена числа параллельных заданий; при уменьшении выполняющиеся задания не прерываются"""
+        self.concurrency = concurrency
+        if self._changed is not None:
+            self._changed.set()
+
+    def _notify(self) -> None:
+        if self._changed is None:
+            self._changed = asyncio.Event()
+            self._dispatcher = asyncio.get_running_loop().create_task(self._dispatch())
+        self._changed.set()
+
+    def _pop(self) -> Optional[ScanJob]:
+        while self._heap:
+            priority, seq, job = heapq.heappop(self._heap)
+            # Пропускаем отмененные задания и записи, устаревшие после повышения приоритета
+            if job.cancelled or job.started_at is not None or (priority, seq) != job.sort_key:
+                continue
+            return job
+        return None
+
+    async def _dispatch(self) -> None:
+        while True:
+            self._changed.clear()
+            while len(self._running) < self.concurrency:
+                job = self._pop()
+                if job is None:
+                    break
+                job.started_at = datetime.now()
+                self._running[job.job_id] = job
+                # Ссылка на задачу хранится до ее завершения, иначе ее может собрать сборщик мусора
+                task = asyncio.create_task(self._run(job))
+                self._tasks.add(task)
+                task.add_done_callback(self._task_done)
+            await self._changed.wait()
+
+    def _task_done(self, task: asyncio.Task) -> None:
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:
+            logger.opt(exception=task.exception()).error("Scan job failed")
+
+    async def _run(self, job: ScanJob) -> None:
+        try:
+            await self._runner(job)
+        finally:
+            del self._running[job.job_id]
+            if self._jobs.get(job.key) is job:
+                del self._jobs[job.key]
+            for scan_id in job.scan_ids:
+                if self._by_scan.get(scan_id) is job:
+                    del self._by_scan[scan_id]
+            self._notify()
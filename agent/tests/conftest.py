@@ -0,0 +1,8 @@
+import os
+import sys
+import tempfile
+
+# Модули агента лежат в корне каталога agent
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# main создает каталог результатов при импорте: тестам нужен свой
+os.environ["RESULTS_DIR"] = tempfile.mkdtemp(prefix="aegis-results-")
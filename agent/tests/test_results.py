@@ -0,0 +1,196 @@
+import asyncio
+import json
+import os
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import main
+from main import ScanResult, ScanStatus, build_projection, parse_range, project_results
+
+REPORT = {
+    "SchemaVersion": 2,
+    "ArtifactName": "nginx:1.25",
+    "ArtifactType": "container_image",
+    "Metadata": {"ImageID": "sha256:abc", "DiffIDs": ["sha256:1", "sha256:2"]},
+    "Results": [
+        {
+            "Target": "nginx:1.25 (debian 12.1)",
+            "Class": "os-pkgs",
+            "Type": "debian",
+            "Packages": [{"Name": "openssl"}],
+            "Vulnerabilities": [
+                {
+                    "VulnerabilityID": "CVE-2023-0001",
+                    "PkgName": "openssl",
+                    "Severity": "HIGH",
+                    "Description": "long text",
+                    "CVSS": {"nvd": {"V3Score": 7.5, "V3Vector": "AV:N"}, "redhat": {"V3Score": 7.0}},
+                },
+            ],
+        },
+        {"Target": "app/package-lock.json", "Class": "lang-pkgs", "Type": "npm"},
+    ],
+}
+
+@pytest.fixture(autouse=True)
+def clean_state():
+    yield
+    for name in os.listdir(main.RESULTS_DIR):
+        os.remove(os.path.join(main.RESULTS_DIR, name))
+    main.scan_tasks.clear()
+    main.scan_batches.clear()
+    main.prescan_scans.clear()
+
+def add_completed_scan(scan_id, finished_at=None, body=None):
+    with open(main.result_path(scan_id), "wb") as f:
+        f.write(body if body is not None else json.dumps(REPORT).encode())
+    main.compress_result_file(scan_id)
+    main.scan_tasks[scan_id] = ScanResult(
+        scan_id=scan_id,
+        status=ScanStatus.COMPLETED,
+        finished_at=finished_at or datetime.now(),
+        result_size=os.path.getsize(main.result_path(scan_id)),
+    )
+
+@pytest.mark.parametrize("header, expected", [
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 999)),
+    ("bytes=900-5000", (900, 999)),
+    ("bytes=-100", (900, 999)),
+    ("bytes=-5000", (0, 999)),
+    ("BYTES = 10-20", (10, 20)),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, 1000) == expected
+
+@pytest.mark.parametrize("header", [
+    "items=0-10",
+    "bytes=0-10,20-30",
+    "bytes=abc-",
+    "bytes=-0",
+    "bytes=50-10",
+])
+def test_parse_range_ignores_unsupported_headers(header):
+    assert parse_range(header, 1000) is None
+
+def test_parse_range_rejects_unsatisfiable_start():
+    with pytest.raises(HTTPException) as error:
+        parse_range("bytes=1000-", 1000)
+    assert error.value.status_code == 416
+    assert error.value.headers["Content-Range"] == "bytes */1000"
+
+def test_build_projection():
+    assert build_projection("VulnerabilityID, Severity,,CVSS.*.V3Score,CVSS.nvd.V3Vector") == {
+        "VulnerabilityID": None,
+        "Severity": None,
+        "CVSS": {"*": {"V3Score": None}, "nvd": {"V3Vector": None}},
+    }
+
+def test_project_results_keeps_report_keys_and_selected_fields():
+    projected = project_results(REPORT, build_projection("VulnerabilityID,CVSS.*.V3Score"))
+    assert projected == {
+        "SchemaVersion": 2,
+        "ArtifactName": "nginx:1.25",
+        "ArtifactType": "container_image",
+        "Results": [
+            {
+                "Target": "nginx:1.25 (debian 12.1)",
+                "Class": "os-pkgs",
+                "Type": "debian",
+                "Vulnerabilities": [
+                    {"VulnerabilityID": "CVE-2023-0001", "CVSS": {"nvd": {"V3Score": 7.5}, "redhat": {"V3Score": 7.0}}},
+                ],
+            },
+            {"Target": "app/package-lock.json", "Class": "lang-pkgs", "Type": "npm"},
+        ],
+    }
+
+def test_result_endpoint_serves_ranges_and_revalidation():
+    body = json.dumps(REPORT).encode()
+    add_completed_scan("scan-1", body=body)
+    client = TestClient(main.app)
+
+    full = client.get("/scan/scan-1/result", headers={"Accept-Encoding": "identity"})
+    assert full.status_code == 200
+    assert full.content == body
+
+    partial = client.get("/scan/scan-1/result", headers={"Accept-Encoding": "identity", "Range": "bytes=0-9"})
+    assert partial.status_code == 206
+    assert partial.content == body[:10]
+    assert partial.headers["Content-Range"] == f"bytes 0-9/{len(body)}"
+
+    # If-Range с другим ETag: диапазон не применяется
+    stale = client.get(
+        "/scan/scan-1/result",
+        headers={"Accept-Encoding": "identity", "Range": "bytes=0-9", "If-Range": '"other"'},
+    )
+    assert stale.status_code == 200
+
+    revalidated = client.get(
+        "/scan/scan-1/result", headers={"Accept-Encoding": "identity", "If-None-Match": full.headers["ETag"]}
+    )
+    assert revalidated.status_code == 304
+
+    projected = client.get("/scan/scan-1/result", params={"fields": "VulnerabilityID"}, headers={"Accept": "application/json"})
+    assert projected.json()["Results"][0]["Vulnerabilities"] == [{"VulnerabilityID": "CVE-2023-0001"}]
+
+def test_result_endpoint_statuses():
+    client = TestClient(main.app)
+    assert client.get("/scan/missing/result").status_code == 404
+
+    main.scan_tasks["running"] = ScanResult(scan_id="running", status=ScanStatus.RUNNING)
+    assert client.get("/scan/running/result").status_code == 409
+
+    add_completed_scan("evicted")
+    main.remove_result_files("evicted")
+    assert client.get("/scan/evicted/result").status_code == 410
+
+def test_sweep_removes_expired_scans_with_their_files(monkeypatch):
+    monkeypatch.setattr(main, "RESULT_TTL", 3600)
+    now = datetime.now()
+    add_completed_scan("old", finished_at=now - timedelta(hours=2))
+    add_completed_scan("new", finished_at=now)
+    main.scan_batches["batch-old"] = (now, ["old"])
+    main.scan_batches["batch-mixed"] = (now, ["old", "new"])
+    main.prescan_scans["sha256:old"] = "old"
+    main.scan_tasks["pending"] = ScanResult(scan_id="pending", status=ScanStatus.PENDING)
+
+    assert asyncio.run(main.sweep_results(now)) == (1, 0)
+    assert set(main.scan_tasks) == {"new", "pending"}
+    assert not any(name.startswith("old.") for name in os.listdir(main.RESULTS_DIR))
+    assert set(main.scan_batches) == {"batch-mixed"}
+    assert main.get_batch_result("batch-mixed").total == 1
+    assert main.prescan_scans == {}
+
+def test_sweep_evicts_oldest_files_over_size_limit(monkeypatch):
+    now = datetime.now()
+    body = b"x" * 1000
+    for i, age in enumerate((30, 20, 10)):
+        add_completed_scan(f"scan-{i}", finished_at=now - timedelta(minutes=age), body=body)
+    # Объединенное сканирование делит файлы с scan-2 и не занимает места
+    main.link_result("scan-2", "scan-3")
+    main.scan_tasks["scan-3"] = ScanResult(scan_id="scan-3", status=ScanStatus.COMPLETED, finished_at=now)
+    compressed = sum(
+        os.path.getsize(main.result_path("scan-2", encoding))
+        for encoding in ("gzip", "zstd")
+        if os.path.exists(main.result_path("scan-2", encoding))
+    )
+    monkeypatch.setattr(main, "RESULTS_MAX_BYTES", 2 * (len(body) + compressed))
+
+    assert asyncio.run(main.sweep_results(now)) == (0, 1)
+    # Запись сканирования остается: результат отвечает 410, а не 404
+    assert "scan-0" in main.scan_tasks
+    assert not os.path.exists(main.result_path("scan-0"))
+    assert all(os.path.exists(main.result_path(scan_id)) for scan_id in ("scan-1", "scan-2", "scan-3"))
+
+def test_orphaned_results_are_removed():
+    add_completed_scan("known")
+    for name in ("orphan.json", "orphan.json.gz", "job-abc.json.tmp"):
+        with open(os.path.join(main.RESULTS_DIR, name), "wb") as f:
+            f.write(b"{}")
+
+    assert main.remove_orphaned_results() == 3
+    assert all(name.startswith("known.") for name in os.listdir(main.RESULTS_DIR))
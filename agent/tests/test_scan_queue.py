@@ -0,0 +1,195 @@
+import asyncio
+
+from scan_queue import ScanJob, ScanPriority, ScanQueue
+
+class Runner:
+    """Runner очереди: задание выполняется, пока его ключ не отпущен через release"""
+
+    def __init__(self):
+        self.started = []
+        self.gates = {}
+
+    async def __call__(self, job):
+        self.started.append(job)
+        await self.gate(job.key).wait()
+        if job.key.startswith("fail"):
+            raise RuntimeError("runner failed")
+
+    def gate(self, key):
+        return self.gates.setdefault(key, asyncio.Event())
+
+    def release(self, key):
+        self.gate(key).set()
+
+    @property
+    def keys(self):
+        return [job.key for job in self.started]
+
+async def settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+def test_jobs_start_by_priority_then_submission_order():
+    async def scenario():
+        runner = Runner()
+        queue = ScanQueue(runner, 1)
+        queue.submit("s0", "busy", "busy:1")
+        await settle()
+        queue.submit("s1", "low", "low:1", priority=ScanPriority.LOW)
+        queue.submit("s2", "normal-a", "a:1")
+        queue.submit("s3", "high", "high:1", priority=ScanPriority.HIGH)
+        queue.submit("s4", "normal-b", "b:1")
+        assert [job.key for job in queue.queued()] == ["high", "normal-a", "normal-b", "low"]
+        assert queue.position("s3") == 1
+        assert queue.position("s0") is None
+
+        for key in ("busy", "high", "normal-a", "normal-b", "low"):
+            runner.release(key)
+            await settle()
+        return runner.keys
+
+    assert asyncio.run(scenario()) == ["busy", "high", "normal-a", "normal-b", "low"]
+
+def test_scans_of_one_image_share_a_job():
+    async def scenario():
+        runner = Runner()
+        queue = ScanQueue(runner, 1)
+        job, coalesced = queue.submit("s1", "sha256:a", "nginx:1")
+        same_job, same_coalesced = queue.submit("s2", "sha256:a", "nginx:latest")
+        assert same_job is job
+        assert (coalesced, same_coalesced) == (False, True)
+
+        await settle()
+        # Задание уже выполняется: новое сканирование привязывается к нему же
+        running_job, running_coalesced = queue.submit("s3", "sha256:a", "nginx:1")
+        assert running_job is job and running_coalesced
+        runner.release("sha256:a")
+        await settle()
+        return runner.started, job
+
+    started, job = asyncio.run(scenario())
+    assert started == [job]
+    assert job.scan_ids == ["s1", "s2", "s3"]
+
+def test_coalescing_raises_priority_of_waiting_job():
+    async def scenario():
+        runner = Runner()
+        queue = ScanQueue(runner, 1)
+        queue.submit("s0", "busy", "busy:1")
+        await settle()
+        job, _ = queue.submit("s1", "img-low", "low:1", priority=ScanPriority.LOW)
+        queue.submit("s2", "img-normal", "normal:1")
+        queue.submit("s3", "img-low", "low:1", priority=ScanPriority.HIGH)
+        assert job.priority == ScanPriority.HIGH
+
+        for key in ("busy", "img-low", "img-normal"):
+            runner.release(key)
+            await settle()
+        return runner.keys
+
+    assert asyncio.run(scenario()) == ["busy", "img-low", "img-normal"]
+
+def test_cancelled_waiting_job_never_runs():
+    async def scenario():
+        runner = Runner()
+        queue = ScanQueue(runner, 1)
+        queue.submit("s0", "busy", "busy:1")
+        await settle()
+        job, _ = queue.submit("s1", "img", "img:1")
+        assert queue.cancel("s1") is job
+        assert job.cancelled
+        assert queue.get_job("s1") is None
+        assert queue.queued() == []
+        # Повторная отмена: сканирование уже не привязано к заданию
+        assert queue.cancel("s1") is None
+
+        runner.release("busy")
+        await settle()
+        return runner.keys
+
+    assert asyncio.run(scenario()) == ["busy"]
+
+def test_cancelling_one_coalesced_scan_keeps_the_job():
+    async def scenario():
+        queue = ScanQueue(Runner(), 1)
+        queue.submit("s0", "busy", "busy:1")
+        await settle()
+        job, _ = queue.submit("s1", "img", "img:1")
+        queue.submit("s2", "img", "img:1")
+        queue.cancel("s1")
+        return queue, job
+
+    queue, job = asyncio.run(scenario())
+    assert not job.cancelled
+    assert job.scan_ids == ["s2"]
+    assert queue.get_job("s2") is job
+
+def test_cancelling_running_job_kills_trivy():
+    class Process:
+        returncode = None
+        killed = False
+
+        def kill(self):
+            self.killed = True
+
+    async def scenario():
+        queue = ScanQueue(Runner(), 1)
+        job, _ = queue.submit("s1", "img", "img:1")
+        await settle()
+        job.process = Process()
+        queue.cancel("s1")
+        return job
+
+    job = asyncio.run(scenario())
+    assert job.cancelled
+    assert job.process.killed
+
+def test_concurrency_limits_running_jobs():
+    async def scenario():
+        runner = Runner()
+        queue = ScanQueue(runner, 2)
+        for i in range(4):
+            queue.submit(f"s{i}", f"img{i}", f"img{i}:1")
+        await settle()
+        running_before = len(queue.running())
+        queue.set_concurrency(3)
+        await settle()
+        return running_before, len(queue.running())
+
+    assert asyncio.run(scenario()) == (2, 3)
+
+def test_finished_and_failed_jobs_release_their_tasks():
+    async def scenario():
+        runner = Runner()
+        queue = ScanQueue(runner, 1)
+        queue.submit("s1", "fail", "fail:1")
+        queue.submit("s2", "img", "img:1")
+        await settle()
+        assert len(queue._tasks) == 1
+        runner.release("fail")
+        runner.release("img")
+        await settle()
+        return queue, runner.keys
+
+    queue, keys = asyncio.run(scenario())
+    # Ошибка одного задания не останавливает очередь
+    assert keys == ["fail", "img"]
+    assert queue._tasks == set()
+    assert queue.running() == []
+    assert queue.get_job("s1") is None and queue.get_job("s2") is None
+
+def test_job_cancelled_before_start_does_not_spawn_trivy(monkeypatch):
+    import main
+
+    spawned = []
+
+    async def create_subprocess_exec(*args, **kwargs):
+        spawned.append(args)
+        raise AssertionError("Trivy must not be started")
+
+    monkeypatch.setattr(main.asyncio, "create_subprocess_exec", create_subprocess_exec)
+    job = ScanJob("img", "img:1", ScanPriority.NORMAL, 0)
+    job.cancelled = True
+    asyncio.run(main.run_scan_job(job))
+    assert spawned == []
+    assert job.process is None
@@ -0,0 +1,110 @@
+import asyncio
+import re
+import time
+from datetime import datetime
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional
+
+# Этапы работы Trivy в порядке выполнения
+STAGES = ("db", "image_fetch", "layer_analysis", "detection")
+
+# Строки журнала Trivy, с которых начинается этап. Начало анализа слоев есть только
+# в журнале --debug, без него анализ слоев входит в этап image_fetch.
+# Первый этап (загрузка или обновление БД уязвимостей) начинается с запуска процесса
+STAGE_PATTERNS = (
+    ("detection", re.compile(r"Detected OS|Detecting .*vulnerabilities|Number of language-specific files", re.IGNORECASE)),
+    ("layer_analysis", re.compile(r"Missing (?:image |diff )?ID in cache|Analyzing|\[(?:walker|analyzer)\]", re.IGNORECASE)),
+    ("image_fetch", re.compile(r"scanning is enabled|Image ID|Diff IDs|Base Layers|Detected image|Saving image|docker daemon", re.IGNORECASE)),
+)
+
+# Процент выполнения из строки прогресс-бара (загрузка БД)
+PERCENT_PATTERN = re.compile(r"(\d{1,3}(?:\.\d+)?)\s?%")
+
+# Прогресс-бар перерисовывается через \r, журнал пишется строками через \n
+LINE_SEPARATOR = re.compile(r"[\r\n]")
+MAX_LINE_LENGTH = 64 * 1024
+
+async def read_lines(stream: asyncio.StreamReader) -> AsyncIterator[str]:
+    """Непустые строки потока stderr по мере их появления"""
+    buffer = ""
+    while True:
+        chunk = await stream.read(MAX_LINE_LENGTH)
+        if not chunk:
+            break
+        buffer += chunk.decode(errors="replace")
+        *lines, buffer = LINE_SEPARATOR.split(buffer)
+        if len(buffer) > MAX_LINE_LENGTH:
+            lines.append(buffer)
+            buffer = ""
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+class StageTracker:
+    """Этапы работы Trivy по его журналу: начало, длительность и процент выполнения
+
+    Этапы идут только вперед: строка более раннего этапа не возвращает к нему.
+    Этап заканчивается с началом следующего или с завершением процесса.
+    """
+
+    def __init__(self, on_change: Optional[Callable[["StageTracker"], None]] = None):
+        self.stages: List[Dict[str, Any]] = []
+        self._started = 0.0
+        self._on_change = on_change
+
+    @property
+    def current(self) -> Optional[Dict[str, Any]]:
+        if self.stages and self.stages[-1]["duration_ms"] is None:
+            return self.stages[-1]
+        return None
+
+    def start(self) -> None:
+        self._enter(STAGES[0])
+
+    def feed(self, line: str) -> None:
+        current = self.current
+        if current is None:
+            return
+        for stage, pattern in STAGE_PATTERNS:
+            if STAGES.index(stage) > STAGES.index(current["name"]) and pattern.search(line):
+                self._enter(stage)
+                return
+        match = PERCENT_PATTERN.search(line)
+        if match:
+            percent = min(100.0, float(match.group(1)))
+            if percent != current["percent"]:
+                current["percent"] = percent
+                self._changed()
+
+    def finish(self) -> None:
+        if self._close():
+            self._changed()
+
+    def durations(self) -> Dict[str, float]:
+        return {stage["name"]: stage["duration_ms"] for stage in self.stages if stage["duration_ms"] is not None}
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        return [dict(stage) for stage in self.stages]
+
+    def _enter(self, name: str) -> None:
+        self._close()
+        self._started = time.perf_counter()
+        self.stages.append({
+            "name": name,
+            "started_at": datetime.utcnow().isoformat() + "+00:00",
+            "duration_ms": None,
+            "percent": None,
+        })
+        self._changed()
+
+    def _close(self) -> bool:
+        current = self.current
+        if current is None:
+            return False
+        current["duration_ms"] = (time.perf_counter() - self._started) * 1000
+        return True
+
+    def _changed(self) -> None:
+        if self._on_change:
+            self._on_change(self)
@@ -1,24 +1,29 @@
 from fastapi import APIRouter
 
-from app.api.endpoints import hosts, containers, scan, vulnerabilities, remediation
+from app.api import hosts, containers, scan, remediation, retention, vulnerabilities, ws
+from app.api.endpoints import remediation as remediation_endpoints
 
 api_router = APIRouter()
 
+# Подключаем эндпоинты для управления контейнерами на конкретном хосте.
+# Роутер подключается раньше хостов, чтобы /hosts/stream не перехватывался маршрутом /hosts/{host_id}
+api_router.include_router(containers.router, prefix="/hosts", tags=["containers"])
+
 # Подключаем эндпоинты для управления хостами
 api_router.include_router(hosts.router, prefix="/hosts", tags=["hosts"])
 
-# Подключаем эндпоинты для управления контейнерами на конкретном хосте
-api_router.include_router(
-    containers.router,
-    prefix="/hosts/{host_id}/containers", 
-    tags=["containers"]
-)
-
 # Подключаем эндпоинты для сканирования
 api_router.include_router(scan.router, prefix="/scan", tags=["scan"])
 
-# Подключаем эндпоинты для уязвимостей
+# Подключаем поиск уязвимостей по всем сканированиям
 api_router.include_router(vulnerabilities.router, prefix="/vulnerabilities", tags=["vulnerabilities"])
 
-# Подключаем эндпоинты для исправления уязвимостей
-api_router.include_router(remediation.router, prefix="/remediation", tags=["remediation"]) 
+# Подключаем эндпоинты для исправления уязвимостей; /strategies отдает remediation_endpoints
+api_router.include_router(remediation_endpoints.router, prefix="/remediation", tags=["remediation"])
+api_router.include_router(remediation.router, prefix="/remediation", tags=["remediation"])
+
+# Подключаем эндпоинты политики хранения истории сканирований
+api_router.include_router(retention.router, prefix="/retention", tags=["retention"])
+
+# Подключаем WebSocket с ходом сканирований
+api_router.include_router(ws.router, tags=["scan"])
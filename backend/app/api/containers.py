@@ -1,10 +1,12 @@
+import json
 from typing import List
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from sse_starlette.sse import EventSourceResponse
-import asyncio
 from loguru import logger
 
+from app.core.events import event_bus
+from app.core.metrics import SSE_SUBSCRIBERS
 from app.db.base import get_db
 from app.schemas.container import Container
 from app.services.container_service import ContainerService
@@ -30,7 +32,7 @@ async def get_containers(
             containers_data = await ContainerService.get_containers_from_host(db_host)
             if containers_data:
                 # Синхронизируем контейнеры в БД
-                containers = ContainerService.sync_containers(db, host_id, containers_data)
+                containers = ContainerService.sync_and_publish(db, db_host, containers_data)
                 return containers
         except Exception as e:
             logger.error(f"Error refreshing containers for host {host_id}: {str(e)}")
@@ -42,37 +44,29 @@ async def get_containers(
 
 @router.get("/stream")
 async def stream_containers(
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    events: str = Query("container_update", description="Типы событий через запятую: container_update, scan_status, ingestion_completed, host_health")
 ):
-    """SSE-поток для получения обновлений о контейнерах в реальном времени"""
+    """SSE-поток для получения обновлений о контейнерах в реальном времени
+    
+    Контейнеры хостов опрашивает один процесс бэкенда (ContainerService.run_poller), изменения
+    приходят всем подписчикам через шину событий, сколько бы ни было подписчиков и воркеров.
+    Событие resync означает, что часть событий пропущена и состояние нужно перечитать.
+    """
+    types = [event_type.strip() for event_type in events.split(",") if event_type.strip()]
+    
     async def event_generator():
-        while True:
-            # Здесь будет логика для обновления контейнеров
-            # и отправки событий при изменениях
-            hosts = HostService.get_hosts(db)
-            
-            for host in hosts:
-                try:
-                    containers_data = await ContainerService.get_containers_from_host(host)
-                    if containers_data:
-                        # Синхронизируем контейнеры в БД
-                        containers = ContainerService.sync_containers(db, host.id, containers_data)
-                        # Отправляем обновление клиенту
-                        yield {
-                            "event": "container_update",
-                            "id": host.id,
-                            "data": {
-                                "host_id": host.id,
-                                "host_name": host.name,
-                                "updated_at": str(asyncio.get_event_loop().time()),
-                                "container_count": len(containers)
-                            }
-                        }
-                except Exception as e:
-                    logger.error(f"Error streaming containers for host {host.id}: {str(e)}")
-            
-            # Пауза между обновлениями
-            await asyncio.sleep(5)
+        SSE_SUBSCRIBERS.inc()
+        try:
+            with event_bus.subscribe(types) as subscription:
+                while True:
+                    event = await subscription.get()
+                    data = event["data"]
+                    yield {
+                        "event": event["type"],
+                        "id": data.get("host_id") if event["type"] in ("container_update", "host_health") else data.get("scan_id"),
+                        "data": json.dumps(data, default=str)
+                    }
+        finally:
+            SSE_SUBSCRIBERS.dec()
     
-    return EventSourceResponse(event_generator()) 
+    return EventSourceResponse(event_generator())
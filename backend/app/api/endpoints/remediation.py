@@ -1,10 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
 from sqlalchemy.orm import Session
-from typing import List, Optional
+from typing import Dict, List, Optional
 from pydantic import BaseModel
 
-from app.db.session import get_db
-from app.services.remediation_service import RemediationService
+from app.db.base import get_db
+from app.services.remediation_service import REMEDIATION_STRATEGIES, RemediationConflictError, RemediationService
 
 router = APIRouter()
 
@@ -18,34 +18,26 @@ class RemediationRequest(BaseModel):
     scan_id: str
     vulnerability_id: Optional[str] = None
     strategy: str  # hot-patch, rolling-update, restart
+    parallelism: Optional[int] = None  # по умолчанию REMEDIATION_PARALLELISM
 
 class DowntimeEstimate(BaseModel):
-    estimated_time: int  # в секундах
+    estimated_time: int  # в секундах, медиана (p50)
+    estimated_time_p95: int  # в секундах
     affected_containers: int
+    batches: int
+    parallelism: int
     strategy: str
+    # history — по измеренным длительностям, default — по estimated_time стратегии, mixed — частично
+    source: str
+    # Число контейнеров по уровню оценки: host, image, fleet, default
+    levels: Dict[str, int] = {}
 
 @router.get("/strategies", response_model=List[RemediationStrategy])
 async def get_remediation_strategies():
     """Получить список доступных стратегий для исправления уязвимостей"""
     return [
-        RemediationStrategy(
-            id="hot-patch",
-            name="Hot Patch",
-            description="Применение патча без перезапуска контейнера",
-            estimated_time=60  # 1 минута
-        ),
-        RemediationStrategy(
-            id="rolling-update",
-            name="Rolling Update",
-            description="Обновление контейнеров по одному, с минимизацией простоя",
-            estimated_time=180  # 3 минуты
-        ),
-        RemediationStrategy(
-            id="restart",
-            name="Restart",
-            description="Полная остановка и перезапуск контейнера с обновленным образом",
-            estimated_time=120  # 2 минуты
-        )
+        RemediationStrategy(id=strategy_id, **strategy)
+        for strategy_id, strategy in REMEDIATION_STRATEGIES.items()
     ]
 
 @router.post("/estimate", response_model=DowntimeEstimate)
@@ -53,41 +45,38 @@ async def estimate_downtime(
     request: RemediationRequest,
     db: Session = Depends(get_db)
 ):
-    """Оценить предполагаемое время простоя для выбранной стратегии исправления"""
-    remediation_service = RemediationService(db)
-    
-    # Получаем стратегию
-    strategies = await get_remediation_strategies()
-    strategy = next((s for s in strategies if s.id == request.strategy), None)
+    """Оценить предполагаемое время простоя для выбранной стратегии исправления
     
-    if not strategy:
+    Оценка строится по процентилям простоя контейнеров (от остановки до запуска нового), измеренного
+    агентами в прошлых исправлениях этой стратегии (тот же образ на том же хосте, образ на любом хосте,
+    весь парк); пока измерений
+    меньше TIMING_MIN_SAMPLES, используется estimated_time стратегии.
+    """
+    if request.strategy not in REMEDIATION_STRATEGIES:
         raise HTTPException(status_code=400, detail=f"Unknown strategy: {request.strategy}")
     
-    # Получаем количество затрагиваемых контейнеров
-    affected_containers = remediation_service.get_affected_containers_count(
-        scan_id=request.scan_id,
-        vulnerability_id=request.vulnerability_id
-    )
-    
-    # Получаем параметр parallelism из конфигурации
-    parallelism = remediation_service.get_parallelism()
-    
-    # Вычисляем общее время в зависимости от стратегии и параллелизма
-    batches = (affected_containers + parallelism - 1) // parallelism  # округление вверх
-    total_time = batches * strategy.estimated_time
+    try:
+        estimate = RemediationService(db).estimate_downtime(
+            scan_id=request.scan_id,
+            vulnerability_id=request.vulnerability_id,
+            strategy=request.strategy,
+            parallelism=request.parallelism
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
     
-    return DowntimeEstimate(
-        estimated_time=total_time,
-        affected_containers=affected_containers,
-        strategy=strategy.name
-    )
+    return DowntimeEstimate(**estimate)
 
 @router.post("/apply")
 async def apply_remediation(
     request: RemediationRequest,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
-    """Применить выбранную стратегию исправления уязвимостей"""
+    """Применить выбранную стратегию исправления уязвимостей
+    
+    Контейнеры исправляются в фоне партиями; ход — GET /remediation/executions/{execution_id}.
+    """
     remediation_service = RemediationService(db)
     
     # Проверяем, что стратегия существует
@@ -98,11 +87,18 @@ async def apply_remediation(
         raise HTTPException(status_code=400, detail=f"Unknown strategy: {request.strategy}")
     
     # Запускаем процесс исправления
-    result = remediation_service.apply_remediation(
-        scan_id=request.scan_id,
-        vulnerability_id=request.vulnerability_id,
-        strategy=request.strategy
-    )
+    try:
+        result = remediation_service.apply_remediation(
+            scan_id=request.scan_id,
+            vulnerability_id=request.vulnerability_id,
+            strategy=request.strategy,
+            parallelism=request.parallelism
+        )
+    except RemediationConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    background_tasks.add_task(RemediationService.run_execution, result["execution_id"])
     
     return {
         "success": True,
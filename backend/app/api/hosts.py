@@ -3,12 +3,21 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from loguru import logger
 
+from app.core.host_health import forget
 from app.db.base import get_db
-from app.schemas.host import Host, HostCreate, HostUpdate
+from app.models.models import Host as HostModel
+from app.schemas.host import Host, HostCreate, HostHealth, HostUpdate
+from app.services.host_health_service import HostHealthService
 from app.services.host_service import HostService
 
 router = APIRouter()
 
+def with_health(db_host: HostModel) -> Host:
+    """Хост с состоянием его агента по данным этого процесса"""
+    host = Host.model_validate(db_host)
+    host.health = HostHealth(**HostHealthService.get_health(db_host.id))
+    return host
+
 @router.get("/", response_model=List[Host])
 def get_hosts(
     skip: int = 0, 
@@ -17,7 +26,7 @@ def get_hosts(
 ):
     """Получение списка всех хостов"""
     hosts = HostService.get_hosts(db, skip=skip, limit=limit)
-    return hosts
+    return [with_health(db_host) for db_host in hosts]
 
 @router.post("/", response_model=Host)
 def create_host(
@@ -25,7 +34,7 @@ def create_host(
     db: Session = Depends(get_db)
 ):
     """Создание нового хоста"""
-    return HostService.create_host(db=db, host=host)
+    return with_health(HostService.create_host(db=db, host=host))
 
 @router.get("/{host_id}", response_model=Host)
 def get_host(
@@ -36,7 +45,7 @@ def get_host(
     db_host = HostService.get_host(db, host_id=host_id)
     if db_host is None:
         raise HTTPException(status_code=404, detail="Host not found")
-    return db_host
+    return with_health(db_host)
 
 @router.put("/{host_id}", response_model=Host)
 def update_host(
@@ -48,7 +57,7 @@ def update_host(
     db_host = HostService.update_host(db, host_id=host_id, host_update=host)
     if db_host is None:
         raise HTTPException(status_code=404, detail="Host not found")
-    return db_host
+    return with_health(db_host)
 
 @router.delete("/{host_id}", response_model=bool)
 def delete_host(
@@ -59,4 +68,5 @@ def delete_host(
     result = HostService.delete_host(db, host_id=host_id)
     if not result:
         raise HTTPException(status_code=404, detail="Host not found")
+    forget(host_id)
     return True 
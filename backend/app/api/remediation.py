@@ -1,51 +1,32 @@
-from typing import Dict, Any
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Dict, Any, List, Optional
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
 from sqlalchemy.orm import Session
 from loguru import logger
 from pydantic import BaseModel
 
 from app.db.base import get_db
 from app.models.models import Vulnerability
+from app.schemas.remediation import RemediationExecution, RemediationExecutionDetail, TimingStats
+from app.services.remediation_service import REMEDIATION_STRATEGIES, RemediationConflictError, RemediationService
+from app.services.timing_service import TimingService
 
 router = APIRouter()
 
 class RemediationRequest(BaseModel):
     vulnerability_id: str
     strategy_id: str
-    parallelism: int = 1
+    # Контейнеров в партии; по умолчанию REMEDIATION_PARALLELISM
+    parallelism: Optional[int] = None
 
 class RemediationResponse(BaseModel):
     success: bool
     message: str
     details: Dict[str, Any] = {}
 
-# Доступные стратегии исправления
-REMEDIATION_STRATEGIES = {
-    "hot-patch": {
-        "name": "Hot Patch",
-        "description": "Применение патча без перезапуска контейнера",
-        "estimated_time": 30,  # в секундах
-    },
-    "rolling-update": {
-        "name": "Rolling Update", 
-        "description": "Обновление контейнеров по одному",
-        "estimated_time": 120,  # в секундах
-    },
-    "restart": {
-        "name": "Restart",
-        "description": "Перезапуск контейнера с обновленным образом",
-        "estimated_time": 60,  # в секундах
-    },
-}
-
-@router.get("/strategies")
-async def get_remediation_strategies():
-    """Получение доступных стратегий исправления"""
-    return REMEDIATION_STRATEGIES
-
 @router.post("/", response_model=RemediationResponse)
 async def apply_remediation(
     request: RemediationRequest,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db)
 ):
     """
@@ -53,6 +34,9 @@ async def apply_remediation(
     - **vulnerability_id**: ID уязвимости
     - **strategy_id**: ID стратегии исправления
     - **parallelism**: Параллелизм (для стратегий с множественными контейнерами)
+    
+    Исправляются все контейнеры, затронутые уязвимостью, партиями по **parallelism**.
+    Ход исправления доступен через GET /remediation/executions/{execution_id}.
     """
     # Проверяем существование уязвимости
     vulnerability = db.query(Vulnerability).filter(Vulnerability.id == request.vulnerability_id).first()
@@ -68,17 +52,73 @@ async def apply_remediation(
     # Получаем данные скана и контейнера для этой уязвимости
     scan = vulnerability.scan
     
-    # Имитация применения стратегии (в реальной системе здесь будет логика применения)
     logger.info(f"Applying {strategy['name']} strategy to vulnerability {vulnerability.cve_id}")
+    try:
+        result = RemediationService(db).apply_remediation(
+            scan_id=scan.scan_id,
+            vulnerability_id=vulnerability.id,
+            strategy=request.strategy_id,
+            parallelism=request.parallelism
+        )
+    except RemediationConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    
+    background_tasks.add_task(RemediationService.run_execution, result["execution_id"])
     
-    # Возвращаем успешный результат
     return RemediationResponse(
         success=True,
-        message=f"Применена стратегия {strategy['name']} для уязвимости {vulnerability.cve_id}",
+        message=f"Запущена стратегия {strategy['name']} для уязвимости {vulnerability.cve_id}",
         details={
             "strategy": strategy["name"],
             "vulnerability": vulnerability.cve_id,
             "container_id": scan.container_id,
-            "host_id": scan.host_id
+            "host_id": scan.host_id,
+            "execution_id": result["execution_id"],
+            "containers": result["containers"],
+            "batches": result["batches"],
+            "parallelism": result["parallelism"]
         }
-    ) 
+    )
+
+@router.get("/executions", response_model=List[RemediationExecution])
+def get_remediation_executions(skip: int = 0, limit: int = 100, db: Session = Depends(get_db)):
+    """Журнал запусков исправления, новые первыми"""
+    return RemediationService(db).get_executions(skip, limit)
+
+@router.get("/executions/{execution_id}", response_model=RemediationExecutionDetail)
+def get_remediation_execution(execution_id: str, db: Session = Depends(get_db)):
+    """Запуск исправления: время каждой партии и журнал исправления каждого контейнера"""
+    execution = RemediationService(db).get_execution(execution_id)
+    if not execution:
+        raise HTTPException(status_code=404, detail="Remediation execution not found")
+    return execution
+
+@router.post("/executions/{execution_id}/abort", response_model=RemediationExecution)
+def abort_remediation_execution(execution_id: str, db: Session = Depends(get_db)):
+    """Остановка запуска: текущая партия дорабатывает, следующие не начинаются"""
+    try:
+        execution = RemediationService(db).request_abort(execution_id)
+    except RemediationConflictError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    if not execution:
+        raise HTTPException(status_code=404, detail="Remediation execution not found")
+    return execution
+
+@router.get("/timings", response_model=List[TimingStats])
+def get_timings(
+    kind: Optional[str] = None,
+    key: Optional[str] = None,
+    image: Optional[str] = None,
+    skip: int = 0,
+    limit: int = 100,
+    db: Session = Depends(get_db)
+):
+    """
+    Измеренные длительности, по которым строятся оценки
+    - **kind**: remediation (key — стратегия), scan (key — trivy) или scan_stage
+      (key — этап Trivy: db, image_fetch, layer_analysis, detection)
+    - **image**: образ контейнера
+    """
+    return TimingService.get_stats(db, kind, key, image, skip, limit)
@@ -0,0 +1,34 @@
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Response
+
+from app.schemas.retention import RetentionStatus
+from app.services.retention_service import RetentionService
+
+router = APIRouter()
+
+@router.get("/", response_model=RetentionStatus)
+def get_retention_status():
+    """Настройки политики хранения, ход текущего и итог последнего прогона"""
+    return RetentionService.get_status()
+
+@router.post("/run", response_model=RetentionStatus)
+def run_retention(
+    background_tasks: BackgroundTasks,
+    response: Response,
+    dry_run: bool = True
+):
+    """Внеочередной прогон политики хранения
+    
+    По умолчанию выполняется в режиме **dry_run**: объем работы возвращается в поле last.
+    Настоящий прогон запускается в фоне (202), его ход виден в GET /retention/ и в метриках aegis_retention_*.
+    """
+    if RetentionService.get_status().running:
+        raise HTTPException(status_code=409, detail="Retention run is already in progress")
+    
+    if dry_run:
+        if RetentionService.run_exclusive(dry_run=True) is None:
+            raise HTTPException(status_code=409, detail="Retention run is already in progress")
+        return RetentionService.get_status()
+    
+    background_tasks.add_task(RetentionService.run_exclusive, False)
+    response.status_code = 202
+    return RetentionService.get_status()
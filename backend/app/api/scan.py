@@ -1,18 +1,32 @@
-from typing import List, Optional
+from typing import Any, Dict, List, Optional, Tuple
 import csv
 import io
 import json
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Response, Query
-from fastapi.responses import StreamingResponse
+import httpx
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Request, Response, Query
 from sqlalchemy.orm import Session
 from loguru import logger
 
+from pydantic import TypeAdapter
+
+from app.core.cache import cached_response
+from app.core.config import settings
+from app.core.responses import render_json
 from app.db.base import get_db
-from app.schemas.scan import ScanRequest, ScanHistory, ScanResult, Vulnerability
-from app.services.scan_service import ScanService
+from app.schemas.scan import ScanBatch, ScanBatchRequest, ScanRequest, ScanHistory, ScanResult, ScanSeveritySummary, ScanTimings, Vulnerability, VulnerabilitySummary
+from app.services.scan_service import ScanService, TERMINAL_STATUSES
 
 router = APIRouter()
 
+# Проверка и сериализация списков уязвимостей за один проход pydantic-core
+VulnerabilityList = TypeAdapter(List[VulnerabilitySummary])
+
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    try:
+        return ScanService.parse_vulnerability_fields(fields)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
 @router.post("/", response_model=ScanHistory)
 async def start_scan(
     scan_request: ScanRequest,
@@ -25,84 +39,16 @@ async def start_scan(
         raise HTTPException(status_code=404, detail="Host or container not found")
     return db_scan
 
-@router.get("/{scan_id}", response_model=ScanResult)
-async def get_scan_status(
-    scan_id: str,
+@router.post("/batch", response_model=ScanBatch)
+async def start_batch_scan(
+    batch_request: ScanBatchRequest,
     db: Session = Depends(get_db)
 ):
-    """Получение статуса и результатов сканирования"""
-    # Проверяем статус сканирования на удаленном хосте
-    db_scan = await ScanService.check_scan_status(db, scan_id)
-    if db_scan is None:
-        raise HTTPException(status_code=404, detail="Scan not found")
-    
-    # Получаем уязвимости для этого сканирования
-    vulnerabilities = ScanService.get_vulnerabilities(db, scan_id=scan_id)
-    
-    # Создаем объект результата
-    result = ScanResult(
-        scan_id=db_scan.scan_id,
-        host_id=db_scan.host_id,
-        container_id=db_scan.container_id,
-        status=db_scan.status.value,
-        started_at=db_scan.started_at,
-        finished_at=db_scan.finished_at,
-        vulnerabilities=vulnerabilities
-    )
-    
-    return result
-
-@router.get("/{scan_id}/report")
-async def get_scan_report(
-    scan_id: str,
-    format: str = Query("json", regex="^(json|csv)$"),
-    db: Session = Depends(get_db)
-):
-    """
-    Скачивание отчета о сканировании в формате JSON или CSV
-    - **scan_id**: ID сканирования
-    - **format**: Формат отчета (json или csv)
-    """
-    # Получаем отчет
-    report = ScanService.get_scan_report(db, scan_id, format)
-    if not report:
-        raise HTTPException(status_code=404, detail="Scan report not found")
-    
-    # Формируем имя файла
-    filename = f"aegis-scan-report-{scan_id}"
-    
-    if format == "json":
-        # Возвращаем JSON
-        return Response(
-            content=json.dumps(report, indent=2, ensure_ascii=False),
-            media_type="application/json",
-            headers={"Content-Disposition": f"attachment; filename={filename}.json"}
-        )
-    else:
-        # Формируем CSV
-        output = io.StringIO()
-        writer = csv.writer(output)
-        
-        # Заголовки CSV
-        writer.writerow(["scan_id", "cve_id", "severity", "cvss", "description", "recommendation"])
-        
-        # Данные
-        for vuln in report["vulnerabilities"]:
-            writer.writerow([
-                report["scan_id"],
-                vuln["cve_id"],
-                vuln["severity"],
-                vuln["cvss"],
-                vuln["description"],
-                vuln["recommendation"]
-            ])
-        
-        # Возвращаем CSV
-        return StreamingResponse(
-            iter([output.getvalue()]),
-            media_type="text/csv",
-            headers={"Content-Disposition": f"attachment; filename={filename}.csv"}
-        )
+    """Запуск сканирований контейнеров хоста (всех или container_ids) одним запросом к агенту"""
+    batch = await ScanService.start_batch_scan(db, batch_request)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Host or containers not found")
+    return batch
 
 @router.get("/history", response_model=List[ScanHistory])
 def get_scan_history(
@@ -114,23 +60,198 @@ def get_scan_history(
     history = ScanService.get_scan_history(db, skip=skip, limit=limit)
     return history
 
-@router.get("/vulnerabilities", response_model=List[Vulnerability])
+@router.get("/vulnerabilities", response_model=List[VulnerabilitySummary])
 def get_vulnerabilities(
     scan_id: Optional[str] = None,
     host_id: Optional[str] = None,
     container_id: Optional[str] = None,
     skip: int = 0, 
     limit: int = 100, 
+    fields: Optional[str] = Query(None, description="Поля уязвимостей через запятую, например cve_id,severity,details"),
     db: Session = Depends(get_db)
 ):
-    """Получение списка уязвимостей с фильтрацией"""
+    """Получение списка уязвимостей с фильтрацией (без полных находок, если они не запрошены в fields)"""
+    selected = parse_fields(fields)
     vulnerabilities = ScanService.get_vulnerabilities(
         db, 
         scan_id=scan_id,
         host_id=host_id,
         container_id=container_id,
         skip=skip, 
-        limit=limit
+        limit=limit,
+        fields=selected
     )
-    return vulnerabilities 
- 
\ No newline at end of file
+    if selected:
+        return Response(
+            content=render_json(ScanService.project_vulnerabilities(vulnerabilities, selected)),
+            media_type="application/json"
+        )
+    return Response(
+        content=VulnerabilityList.dump_json(VulnerabilityList.validate_python(vulnerabilities, from_attributes=True)),
+        media_type="application/json"
+    )
+
+@router.get("/{scan_id}", response_model=ScanResult)
+async def get_scan_status(
+    scan_id: str,
+    request: Request,
+    fields: Optional[str] = Query(None, description="Поля уязвимостей через запятую, например cve_id,severity,details"),
+    db: Session = Depends(get_db)
+):
+    """Получение статуса и результатов сканирования
+    
+    Уязвимости возвращаются без полных находок Trivy; их можно запросить через **fields**
+    или по одной через /vulnerabilities/{vulnerability_id}/details.
+    Ход сканирования удобнее получать через WebSocket /ws, а этот запрос выполнять один раз после завершения.
+    """
+    selected = parse_fields(fields)
+    
+    if settings.SCAN_STATUS_POLL_ENABLED:
+        # Незавершенные сканирования опрашивает фоновое задание; давно не проверенное — проверяется сразу
+        db_scan = await ScanService.get_fresh_scan(db, scan_id)
+    else:
+        # Проверяем статус сканирования на удаленном хосте
+        db_scan = await ScanService.check_scan_status(db, scan_id)
+    if db_scan is None:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    
+    def build_result() -> bytes:
+        # Находки появляются только при завершении сканирования
+        vulnerabilities = []
+        if db_scan.status in TERMINAL_STATUSES:
+            vulnerabilities = ScanService.get_vulnerabilities(
+                db, scan_id=scan_id, limit=None, fields=selected, scanned_at=db_scan.started_at
+            )
+        
+        if selected:
+            result = ScanHistory.model_validate(db_scan).model_dump(mode="json")
+            result["vulnerabilities"] = ScanService.project_vulnerabilities(vulnerabilities, selected)
+            if db_scan.summary is not None:
+                result["summary"] = ScanSeveritySummary.model_validate(db_scan.summary).model_dump(mode="json")
+            return render_json(result)
+        
+        # Создаем объект результата
+        return ScanResult(
+            scan_id=db_scan.scan_id,
+            host_id=db_scan.host_id,
+            container_id=db_scan.container_id,
+            status=db_scan.status.value,
+            started_at=db_scan.started_at,
+            finished_at=db_scan.finished_at,
+            stage_durations=db_scan.stage_durations,
+            vulnerabilities=vulnerabilities,
+            summary=db_scan.summary
+        ).model_dump_json().encode()
+    
+    # Результаты завершенного сканирования не меняются: отдаем сериализованный ответ из кэша
+    if db_scan.status in TERMINAL_STATUSES:
+        return cached_response(
+            request,
+            "scan",
+            (scan_id, "result", ",".join(selected or ())),
+            lambda: (build_result(), "application/json", {})
+        )
+    
+    return Response(content=build_result(), media_type="application/json")
+
+@router.delete("/{scan_id}", response_model=ScanHistory)
+async def cancel_scan(
+    scan_id: str,
+    db: Session = Depends(get_db)
+):
+    """Отмена ожидающего или выполняющегося сканирования"""
+    try:
+        db_scan = await ScanService.cancel_scan(db, scan_id)
+    except httpx.HTTPError as e:
+        logger.error(f"Error cancelling scan {scan_id}: {str(e)}")
+        raise HTTPException(status_code=502, detail=f"Error cancelling scan on agent: {str(e)}")
+    if db_scan is None:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    return db_scan
+
+@router.get("/vulnerabilities/{vulnerability_id}/details", response_model=Vulnerability)
+async def get_vulnerability_details(
+    vulnerability_id: str,
+    db: Session = Depends(get_db)
+):
+    """Получение полных данных находки (загружаются с агента при первом открытии)"""
+    vulnerability = await ScanService.get_vulnerability_details(db, vulnerability_id)
+    if vulnerability is None:
+        raise HTTPException(status_code=404, detail="Vulnerability not found")
+    return vulnerability
+
+@router.get("/{scan_id}/timings", response_model=ScanTimings)
+def get_scan_timings(
+    scan_id: str,
+    db: Session = Depends(get_db)
+):
+    """Разбивка времени сканирования по этапам: БД, запросы к агенту, Docker, Trivy, сохранение"""
+    timings = ScanService.get_scan_timings(db, scan_id)
+    if timings is None:
+        raise HTTPException(status_code=404, detail="Scan not found")
+    return timings
+
+def render_report(report: Dict[str, Any], format: str) -> Tuple[bytes, str, Dict[str, str]]:
+    """Сериализация отчета: тело, тип содержимого и заголовки"""
+    # Формируем имя файла
+    filename = f"aegis-scan-report-{report['scan_id']}"
+    
+    if format == "json":
+        return (
+            json.dumps(report, indent=2, ensure_ascii=False).encode(),
+            "application/json",
+            {"Content-Disposition": f"attachment; filename={filename}.json"}
+        )
+    
+    # Формируем CSV
+    output = io.StringIO()
+    writer = csv.writer(output)
+    
+    # Заголовки CSV
+    writer.writerow(["scan_id", "cve_id", "severity", "cvss", "description", "recommendation"])
+    
+    # Данные
+    for vuln in report["vulnerabilities"]:
+        writer.writerow([
+            report["scan_id"],
+            vuln["cve_id"],
+            vuln["severity"],
+            vuln["cvss"],
+            vuln["description"],
+            vuln["recommendation"]
+        ])
+    
+    return (
+        output.getvalue().encode(),
+        "text/csv",
+        {"Content-Disposition": f"attachment; filename={filename}.csv"}
+    )
+
+@router.get("/{scan_id}/report")
+async def get_scan_report(
+    scan_id: str,
+    request: Request,
+    format: str = Query("json", regex="^(json|csv)$"),
+    db: Session = Depends(get_db)
+):
+    """
+    Скачивание отчета о сканировании в формате JSON или CSV
+    - **scan_id**: ID сканирования
+    - **format**: Формат отчета (json или csv)
+    """
+    db_scan = ScanService.get_scan_by_id(db, scan_id)
+    if db_scan is None:
+        raise HTTPException(status_code=404, detail="Scan report not found")
+    
+    def build_report() -> Tuple[bytes, str, Dict[str, str]]:
+        report = ScanService.get_scan_report(db, scan_id, format)
+        if not report:
+            raise HTTPException(status_code=404, detail="Scan report not found")
+        return render_report(report, format)
+    
+    # Отчет по завершенному сканированию не меняется и отдается из кэша
+    if db_scan.status in TERMINAL_STATUSES:
+        return cached_response(request, "report", (scan_id, "report", format), build_report)
+    
+    body, media_type, headers = build_report()
+    return Response(content=body, media_type=media_type, headers=headers)
@@ -0,0 +1,95 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from loguru import logger
+
+from app.db.base import get_db
+from app.schemas.scan import AffectedContainer, BlastRadius, VulnerabilitySearchHit, VulnerabilitySearchResponse, VulnerabilitySummary
+from app.services.exposure_service import ExposureService
+from app.services.scan_service import ScanService
+
+router = APIRouter()
+
+@router.get("/search", response_model=VulnerabilitySearchResponse)
+def search_vulnerabilities(
+    q: Optional[str] = Query(None, min_length=2, description="CVE, имя пакета или текст описания, например log4j"),
+    cve_id: Optional[str] = Query(None, description="Точный идентификатор CVE"),
+    package: Optional[str] = Query(None, description="Точное имя пакета"),
+    version: Optional[str] = Query(None, description="Установленная версия пакета"),
+    severity: Optional[str] = None,
+    host_id: Optional[str] = None,
+    container_id: Optional[str] = None,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=500),
+    db: Session = Depends(get_db)
+):
+    """Поиск находок по всем сканированиям с ранжированием и постраничным выводом"""
+    if not (q or cve_id or package):
+        raise HTTPException(status_code=400, detail="One of q, cve_id or package is required")
+    
+    try:
+        rows, has_more = ScanService.search_vulnerabilities(
+            db,
+            q=q,
+            cve_id=cve_id,
+            package=package,
+            version=version,
+            severity=severity,
+            host_id=host_id,
+            container_id=container_id,
+            skip=skip,
+            limit=limit
+        )
+    except OperationalError as e:
+        # Чаще всего statement_timeout: запрос слишком общий
+        logger.warning(f"Vulnerability search failed for q={q!r}: {str(e)}")
+        raise HTTPException(status_code=503, detail="Search is too broad, add filters and retry")
+    
+    items = [
+        VulnerabilitySearchHit(
+            **VulnerabilitySummary.model_validate(vulnerability).model_dump(),
+            host_id=host_id,
+            container_id=container_id,
+            scanned_at=vulnerability.scanned_at,
+            rank=rank
+        )
+        for vulnerability, host_id, container_id, rank in rows
+    ]
+    return VulnerabilitySearchResponse(items=items, skip=skip, limit=limit, has_more=has_more)
+
+@router.get("/{cve_id}/affected", response_model=BlastRadius)
+def get_affected_containers(
+    cve_id: str,
+    package: Optional[str] = Query(None, description="Только находки в этом пакете"),
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    db: Session = Depends(get_db)
+):
+    """Контейнеры, последнее сканирование которых содержит CVE (по обратному индексу, без обхода истории)"""
+    summary, rows, has_more = ExposureService.get_affected(db, cve_id, pkg_name=package, skip=skip, limit=limit)
+    items = [
+        AffectedContainer(
+            host_id=exposure.host_id,
+            host_name=host_name,
+            container_id=exposure.container_id,
+            container_name=container_name,
+            image=exposure.image,
+            pkg_name=exposure.pkg_name,
+            pkg_version=exposure.pkg_version,
+            fixed_version=exposure.fixed_version,
+            severity=exposure.severity,
+            scan_id=exposure.scan_id,
+            scanned_at=exposure.scanned_at
+        )
+        for exposure, host_name, container_name in rows
+    ]
+    return BlastRadius(
+        cve_id=cve_id.strip().upper(),
+        pkg_name=package,
+        items=items,
+        skip=skip,
+        limit=limit,
+        has_more=has_more,
+        **summary
+    )
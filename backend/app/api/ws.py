@@ -0,0 +1,181 @@
+import asyncio
+import json
+from typing import Any, Dict, Iterable, List, Optional, Set
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect
+from pydantic import ValidationError
+from loguru import logger
+
+from app.core.config import settings
+from app.core.events import RESYNC, event_bus
+from app.core.metrics import WEBSOCKET_CONNECTIONS
+from app.db.base import SessionLocal
+from app.models.models import ScanHistory, ScanStatus
+from app.schemas.scan import ScanSubscription
+from app.services.retention_service import RetentionService
+
+router = APIRouter()
+
+# События шины, которые пересылаются клиентам, и типы сообщений клиенту
+MESSAGE_TYPES = {
+    "scan_status": "status",
+    "scan_progress": "progress",
+    "ingestion_completed": "summary",
+}
+
+def split_ids(value: Optional[str]) -> Set[str]:
+    return {item.strip() for item in (value or "").split(",") if item.strip()}
+
+def to_message(event: Dict[str, Any]) -> Dict[str, Any]:
+    """Компактное сообщение клиенту из события шины"""
+    data = event["data"]
+    message = {"type": MESSAGE_TYPES[event["type"]], "scan_id": data.get("scan_id"), "host_id": data.get("host_id")}
+    if event["type"] == "scan_status":
+        message.update(status=data.get("status"), previous_status=data.get("previous_status"), finished_at=data.get("finished_at"))
+    elif event["type"] == "scan_progress":
+        message.update(stage=data.get("stage"), percent=data.get("percent"), queue_position=data.get("queue_position"))
+    else:
+        message.update(severity=data.get("severity"))
+    message["at"] = event["at"]
+    return message
+
+def status_message(db_scan: ScanHistory) -> Dict[str, Any]:
+    return {
+        "type": "status",
+        "scan_id": db_scan.scan_id,
+        "host_id": db_scan.host_id,
+        "status": db_scan.status.value,
+        "previous_status": None,
+        "finished_at": db_scan.finished_at.isoformat() if db_scan.finished_at else None,
+    }
+
+def load_snapshot(scan_ids: Iterable[str], host_ids: Iterable[str]) -> List[Dict[str, Any]]:
+    """Текущее состояние отслеживаемых сканирований: статус и сводка для завершенных
+    
+    Для хостов отдаются только незавершенные сканирования.
+    """
+    scan_ids, host_ids = list(scan_ids), list(host_ids)
+    messages = []
+    db = SessionLocal()
+    try:
+        scans = []
+        if scan_ids:
+            scans += db.query(ScanHistory).filter(ScanHistory.scan_id.in_(scan_ids)).all()
+            for scan_id in set(scan_ids) - {db_scan.scan_id for db_scan in scans}:
+                messages.append({"type": "error", "scan_id": scan_id, "detail": "Scan not found"})
+        if host_ids:
+            scans += db.query(ScanHistory).filter(
+                ScanHistory.host_id.in_(host_ids),
+                ScanHistory.status.in_([ScanStatus.PENDING, ScanStatus.RUNNING])
+            ).all()
+        
+        for db_scan in {db_scan.scan_id: db_scan for db_scan in scans}.values():
+            messages.append(status_message(db_scan))
+            if db_scan.status != ScanStatus.COMPLETED:
+                continue
+            # У сканирований, находки которых удалены политикой хранения, сводка сохранена отдельно
+            if db_scan.summary is not None:
+                severity = {
+                    level: getattr(db_scan.summary, level)
+                    for level in ("critical", "high", "medium", "low", "unknown", "total")
+                }
+            else:
+                severity = RetentionService.summarize(db, db_scan.scan_id, db_scan.started_at)
+            messages.append({"type": "summary", "scan_id": db_scan.scan_id, "host_id": db_scan.host_id, "severity": severity})
+    finally:
+        db.close()
+    return messages
+
+@router.websocket("/ws")
+async def scan_updates(websocket: WebSocket, scan_ids: Optional[str] = None, host_ids: Optional[str] = None):
+    """Ход сканирований в реальном времени
+    
+    Начальный набор сканирований и хостов задается параметрами scan_ids и host_ids (через запятую)
+    и меняется сообщениями {"action": "subscribe" | "unsubscribe", "scan_ids": [...], "host_ids": [...]}.
+    Клиент получает текущее состояние, затем сообщения status (смена статуса), progress
+    (этап: queued, этапы Trivy db, image_fetch, layer_analysis, detection с процентом выполнения,
+    fetching_results) и summary (количество находок по критичности).
+    После summary находки запрашиваются один раз через GET /scan/{scan_id}.
+    Сообщение resync означает, что часть событий пропущена: за ним следует текущее состояние.
+    """
+    await websocket.accept()
+    WEBSOCKET_CONNECTIONS.inc()
+    watched = {"scan_ids": split_ids(scan_ids), "host_ids": split_ids(host_ids)}
+    
+    def is_watched(message: Dict[str, Any]) -> bool:
+        return message["scan_id"] in watched["scan_ids"] or message["host_id"] in watched["host_ids"]
+    
+    async def send_snapshot(scan_ids: Iterable[str], host_ids: Iterable[str]) -> None:
+        for message in await asyncio.to_thread(load_snapshot, scan_ids, host_ids):
+            await websocket.send_json(message)
+    
+    async def handle(text: str) -> None:
+        try:
+            request = ScanSubscription.model_validate(json.loads(text))
+        except (ValueError, ValidationError) as e:
+            await websocket.send_json({"type": "error", "detail": f"Invalid message: {str(e)}"})
+            return
+        
+        added = {"scan_ids": set(request.scan_ids), "host_ids": set(request.host_ids)}
+        if request.action == "subscribe":
+            added = {key: ids - watched[key] for key, ids in added.items()}
+            if sum(len(watched[key] | added[key]) for key in watched) > settings.WS_MAX_SUBSCRIPTIONS:
+                await websocket.send_json({
+                    "type": "error",
+                    "detail": f"Too many subscriptions (max {settings.WS_MAX_SUBSCRIPTIONS})"
+                })
+                return
+            for key in watched:
+                watched[key] |= added[key]
+        else:
+            for key in watched:
+                watched[key] -= added[key]
+        
+        await websocket.send_json({
+            "type": "subscribed",
+            "scan_ids": sorted(watched["scan_ids"]),
+            "host_ids": sorted(watched["host_ids"]),
+        })
+        if request.action == "subscribe":
+            await send_snapshot(added["scan_ids"], added["host_ids"])
+    
+    receive: Optional[asyncio.Future] = None
+    event: Optional[asyncio.Future] = None
+    try:
+        if sum(len(ids) for ids in watched.values()) > settings.WS_MAX_SUBSCRIPTIONS:
+            await websocket.close(code=1008, reason="Too many subscriptions")
+            return
+        
+        # Подписка на шину до чтения состояния: события, случившиеся во время чтения, не теряются
+        with event_bus.subscribe(MESSAGE_TYPES) as subscription:
+            await websocket.send_json({
+                "type": "subscribed",
+                "scan_ids": sorted(watched["scan_ids"]),
+                "host_ids": sorted(watched["host_ids"]),
+            })
+            await send_snapshot(watched["scan_ids"], watched["host_ids"])
+            
+            receive = asyncio.ensure_future(websocket.receive_text())
+            event = asyncio.ensure_future(subscription.get())
+            while True:
+                done, _ = await asyncio.wait({receive, event}, return_when=asyncio.FIRST_COMPLETED)
+                if event in done:
+                    if event.result()["type"] == RESYNC:
+                        await websocket.send_json({"type": "resync"})
+                        await send_snapshot(watched["scan_ids"], watched["host_ids"])
+                    else:
+                        message = to_message(event.result())
+                        if is_watched(message):
+                            await websocket.send_json(message)
+                    event = asyncio.ensure_future(subscription.get())
+                if receive in done:
+                    await handle(receive.result())
+                    receive = asyncio.ensure_future(websocket.receive_text())
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(f"Error in scan updates WebSocket: {str(e)}")
+    finally:
+        for task in (receive, event):
+            if task is not None:
+                task.cancel()
+        WEBSOCKET_CONNECTIONS.dec()
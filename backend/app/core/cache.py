@@ -0,0 +1,134 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, Collection, Dict, Hashable, NamedTuple, Optional, Tuple, Union
+from fastapi import Request, Response
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.events import RESYNC, event_bus
+from app.core.metrics import RESPONSE_CACHE_BYTES, RESPONSE_CACHE_REQUESTS
+
+# Ответы по завершенным сканированиям меняются редко (догрузка данных находок, сжатие истории):
+# клиенты хранят их, но перед использованием проверяют ETag (304 без тела)
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+# Событие шины: ответы по этим сканированиям устарели во всех процессах
+CACHE_INVALIDATE = "cache_invalidate"
+# Число ID сканирований в одном событии (предел размера NOTIFY)
+INVALIDATE_BATCH_SIZE = 100
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    media_type: str
+    etag: str
+    headers: Dict[str, str]
+
+class ResponseCache:
+    """LRU-кэш сериализованных ответов с ограничением по суммарному размеру
+
+    Ключ — кортеж, первый элемент которого ID сканирования: по нему записи инвалидируются.
+    """
+
+    def __init__(self, max_bytes: int, max_entry_bytes: int):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.size = 0
+        self._entries: "OrderedDict[Tuple[Hashable, ...], CachedResponse]" = OrderedDict()
+        # Синхронные эндпоинты выполняются в пуле потоков
+        self._lock = threading.Lock()
+
+    def get(self, key: Tuple[Hashable, ...]) -> Optional[CachedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: Tuple[Hashable, ...], entry: CachedResponse) -> None:
+        if len(entry.body) > self.max_entry_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size -= len(previous.body)
+            self._entries[key] = entry
+            self.size += len(entry.body)
+            while self.size > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size -= len(evicted.body)
+            RESPONSE_CACHE_BYTES.set(self.size)
+
+    def invalidate(self, scan_id: str) -> None:
+        """Удаление всех ответов по сканированию (например, после догрузки данных находок)"""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == scan_id]:
+                self.size -= len(self._entries.pop(key).body)
+            RESPONSE_CACHE_BYTES.set(self.size)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+            RESPONSE_CACHE_BYTES.set(self.size)
+
+response_cache = ResponseCache(settings.RESPONSE_CACHE_MAX_BYTES, settings.RESPONSE_CACHE_MAX_ENTRY_BYTES)
+
+def invalidate_scans(db: Union[Session, Connection], scan_ids: Collection[str]) -> None:
+    """Удаление ответов по сканированиям в этом процессе и, после фиксации транзакции db, во всех остальных"""
+    scan_ids = list(scan_ids)
+    for scan_id in scan_ids:
+        response_cache.invalidate(scan_id)
+    for start in range(0, len(scan_ids), INVALIDATE_BATCH_SIZE):
+        event_bus.publish(db, CACHE_INVALIDATE, {"scan_ids": scan_ids[start:start + INVALIDATE_BATCH_SIZE]})
+
+async def run_invalidation_listener() -> None:
+    """Фоновое задание: удаление ответов, устаревших в других процессах
+    
+    Пропущенные события (resync) не восстановить, поэтому кэш процесса очищается целиком.
+    """
+    with event_bus.subscribe([CACHE_INVALIDATE]) as subscription:
+        while True:
+            event = await subscription.get()
+            if event["type"] == RESYNC:
+                response_cache.clear()
+            else:
+                for scan_id in event["data"].get("scan_ids", []):
+                    response_cache.invalidate(scan_id)
+
+def make_etag(body: bytes) -> str:
+    """Сильный ETag по содержимому ответа"""
+    return '"' + hashlib.sha256(body).hexdigest()[:32] + '"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Проверка заголовка If-None-Match (слабое сравнение, как требует RFC 9110)"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag in candidates
+
+def cached_response(
+    request: Request,
+    endpoint: str,
+    key: Tuple[Hashable, ...],
+    build: Callable[[], Tuple[bytes, str, Dict[str, str]]]
+) -> Response:
+    """Ответ из кэша (или 304), при промахе — сериализация через build и сохранение в кэш"""
+    entry = response_cache.get(key)
+    if entry is None:
+        RESPONSE_CACHE_REQUESTS.labels(endpoint, "miss").inc()
+        body, media_type, headers = build()
+        entry = CachedResponse(body, media_type, make_etag(body), headers)
+        response_cache.put(key, entry)
+    else:
+        RESPONSE_CACHE_REQUESTS.labels(endpoint, "hit").inc()
+
+    headers = {"ETag": entry.etag, "Cache-Control": REVALIDATE_CACHE_CONTROL}
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        RESPONSE_CACHE_REQUESTS.labels(endpoint, "not_modified").inc()
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=entry.body, media_type=entry.media_type, headers={**entry.headers, **headers})
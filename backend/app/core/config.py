@@ -29,10 +29,97 @@ class Settings(BaseSettings):
     
     # Настройки sidecar-агента
     SIDECAR_PORT: int = 5000
+    # Общий с агентами токен для изменяющих запросов (сканирование, исправление контейнеров)
+    AGENT_API_TOKEN: str = ""
     
     # Логирование
     LOG_LEVEL: str = "info"
     
+    # Трассировка: JSONL-файл и/или OTLP/HTTP-коллектор для экспорта участков
+    TRACE_EXPORT_FILE: Optional[str] = None
+    OTLP_ENDPOINT: Optional[str] = None
+    
+    # Кэш сериализованных ответов по завершенным сканированиям (в памяти процесса)
+    RESPONSE_CACHE_MAX_BYTES: int = 128 * 1024 * 1024
+    RESPONSE_CACHE_MAX_ENTRY_BYTES: int = 32 * 1024 * 1024
+    
+    # Хранение истории сканирований: последние RETENTION_KEEP_FULL_SCANS сканирований контейнера
+    # хранятся полностью, у более старых остается сводка по уровням критичности, а сканирования
+    # старше RETENTION_MAX_AGE_DAYS удаляются целиком (None — не удалять)
+    RETENTION_ENABLED: bool = False
+    RETENTION_DRY_RUN: bool = False
+    RETENTION_KEEP_FULL_SCANS: int = 5
+    RETENTION_MAX_AGE_DAYS: Optional[int] = None
+    RETENTION_INTERVAL_SECONDS: int = 3600
+    # Строк уязвимостей на одну транзакцию удаления и пауза между транзакциями
+    RETENTION_BATCH_SIZE: int = 5000
+    RETENTION_BATCH_PAUSE_SECONDS: float = 0.05
+    
+    # Предельное время запроса поиска по находкам
+    SEARCH_STATEMENT_TIMEOUT_MS: int = 5000
+    
+    # Секционирование scan_history и vulnerabilities по месяцам времени сканирования (только PostgreSQL).
+    # Включается на новой базе: существующие несекционированные таблицы не переносятся
+    PARTITIONING_ENABLED: bool = False
+    PARTITIONS_AHEAD: int = 2
+    PARTITION_MAINTENANCE_INTERVAL_SECONDS: int = 3600
+    
+    # Исправление уязвимостей: число контейнеров в одной партии, предельное время исправления
+    # одного контейнера (загрузка образа, пересоздание, проверка здоровья) и интервал опроса агента
+    REMEDIATION_PARALLELISM: int = 2
+    REMEDIATION_STEP_TIMEOUT_SECONDS: int = 900
+    REMEDIATION_POLL_INTERVAL_SECONDS: float = 2.0
+    # Исполнитель запуска отмечается раз в REMEDIATION_HEARTBEAT_SECONDS; запуск без исполнителя
+    # (блокировка свободна) и без отметки дольше REMEDIATION_STALE_SECONDS считается прерванным
+    REMEDIATION_HEARTBEAT_SECONDS: float = 10.0
+    REMEDIATION_STALE_SECONDS: float = 120.0
+    
+    # Оценки длительности по истории: минимум измерений, при котором процентили заменяют
+    # значения по умолчанию (сначала по образу и хосту, затем по образу, затем по всему парку)
+    TIMING_MIN_SAMPLES: int = 5
+    
+    # Запуск: схема обновляется миграциями Alembic; пока база недоступна, подключение
+    # повторяется с растущей паузой до STARTUP_RETRY_MAX_SECONDS, а /health/ready отвечает 503
+    MIGRATE_ON_STARTUP: bool = True
+    STARTUP_RETRY_MAX_SECONDS: float = 30.0
+    READINESS_TIMEOUT_SECONDS: float = 2.0
+    
+    # События между процессами (LISTEN/NOTIFY): канал, очередь одного подписчика и проверка
+    # соединения слушателя, если событий нет дольше EVENT_BUS_KEEPALIVE_SECONDS
+    EVENT_BUS_CHANNEL: str = "aegis_events"
+    EVENT_SUBSCRIBER_QUEUE_SIZE: int = 1000
+    EVENT_BUS_KEEPALIVE_SECONDS: float = 30.0
+    
+    # Опрос контейнеров хостов для потоков обновлений: его ведет один процесс из всех реплик
+    CONTAINER_POLL_ENABLED: bool = True
+    CONTAINER_POLL_INTERVAL_SECONDS: float = 5.0
+    CONTAINER_POLL_CONCURRENCY: int = 50
+    
+    # Опрос агентов по незавершенным сканированиям (тоже один процесс): статусы, этапы и сводки
+    # доходят до клиентов через WebSocket /ws, а GET /scan/{scan_id} читает статус из БД и сам
+    # проверяет у агента сканирование, которое процесс не проверял дольше интервала опроса.
+    # Каждый одновременный опрос занимает два соединения пула (сессия и блокировка опроса)
+    SCAN_STATUS_POLL_ENABLED: bool = True
+    SCAN_STATUS_POLL_INTERVAL_SECONDS: float = 2.0
+    SCAN_STATUS_POLL_CONCURRENCY: int = 4
+    
+    # Сколько сканирований и хостов может отслеживать одно соединение WebSocket
+    WS_MAX_SUBSCRIPTIONS: int = 500
+    
+    # Доступность агентов: проверки (GET /health/live) ведет один процесс, результаты получают все.
+    # Без проверок цепь каждого процесса ведут его собственные запросы.
+    # После HOST_FAILURE_THRESHOLD ошибок подряд запросы к агенту завершаются сразу, пробный
+    # запрос — через паузу от HOST_CIRCUIT_BACKOFF_SECONDS, растущую вдвое до максимума.
+    # Соединение с агентом устанавливается не дольше AGENT_CONNECT_TIMEOUT_SECONDS
+    HOST_PROBE_ENABLED: bool = True
+    HOST_PROBE_INTERVAL_SECONDS: float = 10.0
+    HOST_PROBE_TIMEOUT_SECONDS: float = 2.0
+    HOST_PROBE_CONCURRENCY: int = 50
+    HOST_FAILURE_THRESHOLD: int = 3
+    HOST_CIRCUIT_BACKOFF_SECONDS: float = 5.0
+    HOST_CIRCUIT_BACKOFF_MAX_SECONDS: float = 300.0
+    AGENT_CONNECT_TIMEOUT_SECONDS: float = 3.0
+    
     @property
     def SQLALCHEMY_DATABASE_URI(self) -> str:
         """Получение строки подключения к базе данных"""
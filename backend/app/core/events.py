@@ -0,0 +1,169 @@
+"""Шина событий между процессами бэкенда на PostgreSQL LISTEN/NOTIFY
+
+Событие публикуется в транзакции изменения (pg_notify) и доставляется при ее фиксации,
+а при откате не доставляется вовсе. Каждый процесс держит одно соединение с LISTEN
+и раздает события своим подписчикам (SSE, WebSocket), сколько бы их ни было: состояние,
+которое видят клиенты, одинаково на всех воркерах и репликах.
+
+NOTIFY не хранит события: пока соединение слушателя потеряно, события пропадают, поэтому
+после переподключения подписчики получают событие resync и перечитывают состояние из базы.
+"""
+import asyncio
+import json
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, Collection, Dict, Iterator, Optional, Set, Union
+from loguru import logger
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.metrics import EVENT_BUS_CONNECTED, EVENTS_DELIVERED, EVENTS_DROPPED, EVENTS_PUBLISHED
+
+# Предел размера payload у NOTIFY — 8000 байт
+MAX_PAYLOAD_BYTES = 7900
+
+# Событие для подписчиков, пропустивших события (переподключение слушателя или переполнение очереди)
+RESYNC = "resync"
+
+class Subscription:
+    """Очередь событий одного подписчика (только типы из types, если они заданы)"""
+
+    def __init__(self, types: Optional[Collection[str]], size: int):
+        self.types = set(types) if types else None
+        self.queue: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue(maxsize=size)
+
+    def accepts(self, event: Dict[str, Any]) -> bool:
+        return self.types is None or event["type"] in self.types or event["type"] == RESYNC
+
+    def put(self, event: Dict[str, Any]) -> None:
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Медленный подписчик не задерживает остальных: его очередь заменяется одним resync
+            EVENTS_DROPPED.inc(self.queue.qsize() + 1)
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(make_event(RESYNC, {"reason": "overflow"}))
+
+    async def get(self) -> Dict[str, Any]:
+        return await self.queue.get()
+
+def make_event(event_type: str, data: Dict[str, Any]) -> Dict[str, Any]:
+    return {"type": event_type, "data": data, "at": datetime.utcnow().isoformat()}
+
+def encode_event(event: Dict[str, Any]) -> str:
+    """JSON события; если он не помещается в NOTIFY, списки и словари заменяются признаком truncated"""
+    payload = json.dumps(event, default=str, separators=(",", ":"))
+    if len(payload.encode()) <= MAX_PAYLOAD_BYTES:
+        return payload
+    data = {key: value for key, value in event["data"].items() if not isinstance(value, (list, dict))}
+    return json.dumps({**event, "data": {**data, "truncated": True}}, default=str, separators=(",", ":"))
+
+class EventBus:
+    """Публикация событий в канал EVENT_BUS_CHANNEL и раздача полученных событий подписчикам процесса"""
+
+    def __init__(self, channel: str, queue_size: int):
+        self.channel = channel
+        self.queue_size = queue_size
+        self.subscriptions: Set[Subscription] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def publish(self, db: Union[Session, Connection], event_type: str, data: Dict[str, Any]) -> None:
+        """Публикация в текущей транзакции сессии или соединения: событие уйдет при commit (без commit)"""
+        payload = encode_event(make_event(event_type, data))
+        EVENTS_PUBLISHED.labels(event_type).inc()
+        dialect = db.get_bind().dialect if isinstance(db, Session) else db.dialect
+        if dialect.name == "postgresql":
+            db.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": self.channel, "payload": payload})
+        elif self._loop is not None:
+            # Без PostgreSQL события доставляются только подписчикам этого процесса
+            self._loop.call_soon_threadsafe(self._dispatch, payload)
+
+    @contextmanager
+    def subscribe(self, types: Optional[Collection[str]] = None) -> Iterator[Subscription]:
+        subscription = Subscription(types, self.queue_size)
+        self.subscriptions.add(subscription)
+        try:
+            yield subscription
+        finally:
+            self.subscriptions.discard(subscription)
+
+    def _dispatch(self, payload: str) -> None:
+        try:
+            event = json.loads(payload)
+        except ValueError:
+            logger.warning(f"Ignoring malformed event on channel {self.channel}: {payload[:200]}")
+            return
+        EVENTS_DELIVERED.labels(event.get("type", "unknown")).inc()
+        for subscription in list(self.subscriptions):
+            if subscription.accepts(event):
+                subscription.put(event)
+
+    def _listen(self, engine: Engine):
+        """Отдельное соединение вне пула (autocommit): LISTEN действует, пока оно открыто"""
+        connection = engine.raw_connection()
+        connection.detach()
+        connection.dbapi_connection.autocommit = True
+        with connection.dbapi_connection.cursor() as cursor:
+            cursor.execute(f'LISTEN "{self.channel}"')
+        return connection
+
+    async def run(self, engine: Engine) -> None:
+        """Фоновое задание: прием событий канала с переподключением при потере соединения"""
+        self._loop = asyncio.get_running_loop()
+        if engine.dialect.name != "postgresql":
+            return
+
+        delay = 0.5
+        connected_before = False
+        while True:
+            connection = None
+            try:
+                connection = await asyncio.to_thread(self._listen, engine)
+                EVENT_BUS_CONNECTED.set(1)
+                delay = 0.5
+                logger.info(f"Listening for events on channel {self.channel}")
+                if connected_before:
+                    self._dispatch(json.dumps(make_event(RESYNC, {"reason": "reconnect"})))
+                connected_before = True
+                await self._receive(connection)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Event listener error on channel {self.channel}, reconnecting in {delay:.1f}s: {str(e)}")
+            finally:
+                EVENT_BUS_CONNECTED.set(0)
+                if connection is not None:
+                    connection.close()
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 30.0)
+
+    @staticmethod
+    def _ping(driver_connection) -> None:
+        with driver_connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+
+    async def _receive(self, connection) -> None:
+        driver_connection = connection.dbapi_connection
+        readable = asyncio.Event()
+        fileno = driver_connection.fileno()
+        self._loop.add_reader(fileno, readable.set)
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(readable.wait(), settings.EVENT_BUS_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    # Без событий соединение проверяется запросом: обрыв без FIN иначе не заметить
+                    await asyncio.wait_for(
+                        asyncio.to_thread(self._ping, driver_connection), settings.EVENT_BUS_KEEPALIVE_SECONDS
+                    )
+                readable.clear()
+                driver_connection.poll()
+                while driver_connection.notifies:
+                    self._dispatch(driver_connection.notifies.pop(0).payload)
+        finally:
+            self._loop.remove_reader(fileno)
+
+event_bus = EventBus(settings.EVENT_BUS_CHANNEL, settings.EVENT_SUBSCRIBER_QUEUE_SIZE)
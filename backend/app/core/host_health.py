@@ -0,0 +1,132 @@
+"""Реестр доступности агентов хостов: circuit breaker на каждый хост
+
+После HOST_FAILURE_THRESHOLD ошибок подряд цепь хоста размыкается: запросы к его агенту
+сразу завершаются AgentUnavailableError, не дожидаясь таймаутов, и недоступные хосты
+не задерживают запросы к остальным. Раз в паузу, которая растет вдвое с каждой ошибкой
+(до HOST_CIRCUIT_BACKOFF_MAX_SECONDS), к агенту пропускается один пробный запрос;
+успешный ответ замыкает цепь.
+
+Реестр свой у каждого процесса. Проверки доступности (app.services.host_health_service)
+выполняет один процесс и рассылает их результаты событиями host_health всем процессам.
+Ошибки считаются из одного источника: пока проверки включены, только по их результатам
+(у всех процессов одинаковые счетчик и пауза), иначе — по запросам самого процесса.
+"""
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+import httpx
+
+from app.core.config import settings
+from app.core.metrics import AGENT_REQUESTS_REJECTED, HOST_CIRCUIT_STATE
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Значение метрики HOST_CIRCUIT_STATE для каждого состояния
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+class AgentUnavailableError(httpx.TransportError):
+    """Запрос к агенту не отправлялся: цепь хоста разомкнута"""
+
+class HostHealth:
+    """Состояние агента одного хоста: circuit breaker и результат последней проверки"""
+
+    def __init__(self, host_id: str):
+        self.host_id = host_id
+        self.state = CLOSED
+        self.failures = 0
+        self.backoff = 0.0
+        self.retry_at: Optional[float] = None
+        self.latency_ms: Optional[float] = None
+        self.checked_at: Optional[datetime] = None
+        self.error: Optional[str] = None
+
+    def allow(self) -> bool:
+        """Можно ли отправить запрос; при разомкнутой цепи — один пробный запрос за паузу"""
+        if self.state == CLOSED:
+            return True
+        now = time.monotonic()
+        if now < self.retry_at:
+            return False
+        # Следующий пробный запрос не раньше чем через паузу, даже если этот не завершится
+        self.retry_at = now + self.backoff
+        self._set_state(HALF_OPEN)
+        return True
+
+    def record_success(self, latency_ms: Optional[float] = None) -> None:
+        self.failures = 0
+        self.backoff = 0.0
+        self.retry_at = None
+        self.error = None
+        if latency_ms is not None:
+            self.latency_ms = latency_ms
+            self.checked_at = datetime.utcnow()
+        self._set_state(CLOSED)
+
+    def record_failure(self, error: str, checked: bool = False) -> None:
+        self.failures += 1
+        self.error = error
+        if checked:
+            self.latency_ms = None
+            self.checked_at = datetime.utcnow()
+        if self.failures >= settings.HOST_FAILURE_THRESHOLD:
+            self.backoff = min(
+                settings.HOST_CIRCUIT_BACKOFF_SECONDS * 2 ** (self.failures - settings.HOST_FAILURE_THRESHOLD),
+                settings.HOST_CIRCUIT_BACKOFF_MAX_SECONDS
+            )
+            self.retry_at = time.monotonic() + self.backoff
+            self._set_state(OPEN)
+
+    def due(self) -> bool:
+        """Пора ли проверять агент: при разомкнутой цепи — только после паузы"""
+        return self.state == CLOSED or time.monotonic() >= self.retry_at
+
+    def _set_state(self, state: str) -> None:
+        self.state = state
+        HOST_CIRCUIT_STATE.labels(self.host_id).set(STATE_VALUES[state])
+
+    def to_dict(self) -> Dict[str, Any]:
+        if self.checked_at is None and self.failures == 0:
+            status = "unknown"
+        elif self.state == CLOSED:
+            status = "healthy" if self.failures == 0 else "degraded"
+        else:
+            status = "unhealthy"
+        retry_in = max(0.0, self.retry_at - time.monotonic()) if self.retry_at is not None else None
+        return {
+            "status": status,
+            "circuit": self.state,
+            "latency_ms": self.latency_ms,
+            "checked_at": self.checked_at,
+            "consecutive_failures": self.failures,
+            "retry_in_seconds": retry_in,
+            "error": self.error,
+        }
+
+_registry: Dict[str, HostHealth] = {}
+
+def health_of(host_id: str) -> HostHealth:
+    health = _registry.get(host_id)
+    if health is None:
+        health = _registry[host_id] = HostHealth(host_id)
+    return health
+
+def ensure_available(host_id: str) -> None:
+    """Проверка перед запросом к агенту: AgentUnavailableError, если цепь хоста разомкнута"""
+    health = health_of(host_id)
+    if not health.allow():
+        AGENT_REQUESTS_REJECTED.labels(host_id).inc()
+        raise AgentUnavailableError(
+            f"Agent of host {host_id} is unavailable ({health.error}), "
+            f"next attempt in {health.to_dict()['retry_in_seconds']:.0f}s"
+        )
+
+def forget(host_id: str) -> None:
+    """Удаление хоста из реестра (хост удален)"""
+    if _registry.pop(host_id, None) is None:
+        return
+    try:
+        HOST_CIRCUIT_STATE.remove(host_id)
+    except KeyError:
+        pass
@@ -0,0 +1,190 @@
+import re
+from prometheus_client import Counter, Gauge, Histogram
+from prometheus_client.core import GaugeMetricFamily, REGISTRY
+
+# Латентность API бэкенда по шаблону маршрута
+HTTP_REQUEST_DURATION_SECONDS = Histogram(
+    "aegis_http_request_duration_seconds",
+    "Backend HTTP request latency",
+    ["method", "route", "status"],
+)
+
+# Латентность запросов к агентам по хостам
+AGENT_REQUEST_DURATION_SECONDS = Histogram(
+    "aegis_agent_request_duration_seconds",
+    "Latency of HTTP requests from the backend to sidecar agents",
+    ["host", "method", "path", "outcome"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60),
+)
+AGENT_RESPONSE_BYTES = Histogram(
+    "aegis_agent_response_bytes",
+    "Decoded size of agent responses",
+    ["path"],
+    buckets=tuple(4 ** power * 1024 for power in range(0, 10)),
+)
+
+# Доступность агентов (app.core.host_health)
+HOST_CIRCUIT_STATE = Gauge(
+    "aegis_host_circuit_state",
+    "Circuit breaker state of a host agent in this process (0 closed, 1 half-open, 2 open)",
+    ["host"],
+)
+AGENT_REQUESTS_REJECTED = Counter(
+    "aegis_agent_requests_rejected_total",
+    "Agent requests failed fast because the host circuit was open",
+    ["host"],
+)
+HOST_PROBES = Counter("aegis_host_probes_total", "Agent health probes by the leader process", ["outcome"])
+
+# Сохранение уязвимостей: скорость считается как rate(rows) / rate(seconds)
+INGESTED_VULNERABILITIES = Counter(
+    "aegis_ingested_vulnerabilities_total",
+    "Vulnerability rows stored from scan results",
+)
+INGESTION_DURATION_SECONDS = Histogram(
+    "aegis_ingestion_duration_seconds",
+    "Time spent storing vulnerabilities of one scan",
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120),
+)
+INGESTION_ROWS_PER_SECOND = Gauge(
+    "aegis_ingestion_rows_per_second",
+    "Throughput of the most recent vulnerability ingestion",
+)
+
+# Проверки статуса сканирований: upstream — опрос агента, coalesced — ожидание опроса
+# другого запроса этого процесса, locked — сканирование опрашивает другой процесс
+SCAN_STATUS_CHECKS = Counter(
+    "aegis_scan_status_checks_total",
+    "Scan status checks by how they were served",
+    ["outcome"],
+)
+
+# Кэш сериализованных ответов по завершенным сканированиям
+RESPONSE_CACHE_REQUESTS = Counter(
+    "aegis_response_cache_requests_total",
+    "Cacheable responses by cache outcome",
+    ["endpoint", "outcome"],
+)
+RESPONSE_CACHE_BYTES = Gauge("aegis_response_cache_bytes", "Size of cached response bodies")
+
+# Политика хранения истории сканирований
+RETENTION_RUNS = Counter(
+    "aegis_retention_runs_total",
+    "Retention runs by outcome",
+    ["mode", "outcome"],
+)
+RETENTION_DURATION_SECONDS = Histogram(
+    "aegis_retention_duration_seconds",
+    "Duration of one retention run",
+    buckets=(0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600),
+)
+RETENTION_SCANS = Counter(
+    "aegis_retention_scans_total",
+    "Scans processed by the retention job",
+    ["action"],
+)
+RETENTION_DELETED_ROWS = Counter(
+    "aegis_retention_deleted_rows_total",
+    "Rows deleted by the retention job",
+    ["table"],
+)
+RETENTION_PENDING_SCANS = Gauge(
+    "aegis_retention_pending_scans",
+    "Scans left to compact or delete in the current retention run",
+    ["action"],
+)
+RETENTION_LAST_SUCCESS = Gauge(
+    "aegis_retention_last_success_timestamp_seconds",
+    "Unix time of the last successful retention run",
+)
+
+# Исправление уязвимостей партиями контейнеров
+REMEDIATION_EXECUTIONS = Counter(
+    "aegis_remediation_executions_total",
+    "Finished remediation executions",
+    ["strategy", "outcome"],
+)
+REMEDIATION_BATCH_DURATION_SECONDS = Histogram(
+    "aegis_remediation_batch_duration_seconds",
+    "Duration of one remediation batch (slowest container in the batch)",
+    ["strategy"],
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600),
+)
+REMEDIATION_CONTAINER_DURATION_SECONDS = Histogram(
+    "aegis_remediation_container_duration_seconds",
+    "Duration of remediating one container",
+    ["action", "outcome"],
+    buckets=(1, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600),
+)
+REMEDIATION_RUNNING = Gauge("aegis_remediation_running", "Remediation executions running in this process")
+
+# Запуск процесса: время от старта процесса до конца каждой фазы (import, database, migrations, ready)
+STARTUP_PHASE_SECONDS = Gauge(
+    "aegis_startup_phase_seconds",
+    "Seconds from process start to the end of each startup phase",
+    ["phase"],
+)
+
+# Подписчики SSE-потока контейнеров
+SSE_SUBSCRIBERS = Gauge("aegis_sse_subscribers", "Open SSE container stream connections")
+
+# Шина событий между процессами (LISTEN/NOTIFY)
+EVENTS_PUBLISHED = Counter("aegis_events_published_total", "Events published by this process", ["type"])
+EVENTS_DELIVERED = Counter("aegis_events_delivered_total", "Events received by this process", ["type"])
+EVENTS_DROPPED = Counter(
+    "aegis_events_dropped_total",
+    "Events dropped because a subscriber queue was full",
+)
+EVENT_BUS_CONNECTED = Gauge("aegis_event_bus_connected", "Whether the event listener connection is open")
+CONTAINER_POLLS = Counter(
+    "aegis_container_polls_total",
+    "Container polls of hosts by the leader process",
+    ["outcome"],
+)
+SCAN_STATUS_POLLS = Counter(
+    "aegis_scan_status_polls_total",
+    "Status polls of unfinished scans by the leader process",
+    ["outcome"],
+)
+WEBSOCKET_CONNECTIONS = Gauge(
+    "aegis_websocket_connections",
+    "Open WebSocket connections of scan progress subscribers",
+)
+LEADER_JOBS = Gauge(
+    "aegis_leader_job",
+    "Whether this process runs a job that only one backend process runs (container poller, scan status poller)",
+    ["job"],
+)
+
+# Идентификаторы в путях запросов к агентам заменяются, чтобы не раздувать число серий
+_ID_PATTERN = re.compile(r"/(?:[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}|[0-9a-f]{12,64})(?=/|$)")
+_CVE_PATTERN = re.compile(r"/vulnerabilities/[^/]+")
+
+def normalize_agent_path(path: str) -> str:
+    """Приведение пути запроса к агенту к шаблону без идентификаторов"""
+    path = _ID_PATTERN.sub("/{id}", path)
+    return _CVE_PATTERN.sub("/vulnerabilities/{vulnerability_id}", path)
+
+class DatabasePoolCollector:
+    """Сборщик метрик пулов соединений SQLAlchemy"""
+
+    def collect(self):
+        from app.db import base, session
+
+        pools = {"base": base.engine.pool, "session": session.engine.pool}
+        metrics = {
+            "size": GaugeMetricFamily("aegis_db_pool_size", "Configured pool size", labels=["pool"]),
+            "checked_out": GaugeMetricFamily("aegis_db_pool_checked_out", "Connections in use", labels=["pool"]),
+            "checked_in": GaugeMetricFamily("aegis_db_pool_checked_in", "Idle connections in the pool", labels=["pool"]),
+            "overflow": GaugeMetricFamily("aegis_db_pool_overflow", "Connections above the pool size", labels=["pool"]),
+        }
+
+        for name, pool in pools.items():
+            # Не у всех реализаций пула есть эти методы (например, NullPool)
+            for metric, method in (("size", "size"), ("checked_out", "checkedout"), ("checked_in", "checkedin"), ("overflow", "overflow")):
+                if hasattr(pool, method):
+                    metrics[metric].add_metric([name], getattr(pool, method)())
+
+        yield from metrics.values()
+
+REGISTRY.register(DatabasePoolCollector())
@@ -0,0 +1,18 @@
+import json
+from typing import Any
+from fastapi.responses import JSONResponse, ORJSONResponse
+
+# orjson необязателен: без него используется стандартный json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Класс ответа по умолчанию для приложения
+DefaultJSONResponse = ORJSONResponse if orjson is not None else JSONResponse
+
+def render_json(value: Any) -> bytes:
+    """Сериализация в компактный JSON (orjson, если он установлен)"""
+    if orjson is not None:
+        return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"), default=str).encode()
@@ -0,0 +1,187 @@
+import json
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional
+import httpx
+from loguru import logger
+
+from app.core.config import settings
+
+SERVICE_NAME = "aegis-backend"
+
+class Span:
+    """Участок трассировки с временем начала, длительностью и атрибутами"""
+
+    def __init__(
+        self,
+        name: str,
+        trace_id: Optional[str] = None,
+        parent_id: Optional[str] = None,
+        attributes: Optional[Dict[str, Any]] = None,
+        service: str = SERVICE_NAME
+    ):
+        self.name = name
+        self.trace_id = trace_id or os.urandom(16).hex()
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent_id
+        self.service = service
+        self.attributes: Dict[str, Any] = dict(attributes or {})
+        self.status = "ok"
+        self.started_at = datetime.now(timezone.utc)
+        self._started = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def finish(self) -> None:
+        self.duration_ms = (time.perf_counter() - self._started) * 1000
+
+    def traceparent(self) -> str:
+        """Заголовок W3C traceparent для передачи контекста агенту"""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "service": self.service,
+            "name": self.name,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+_recorded_spans: ContextVar[Optional[List[Span]]] = ContextVar("recorded_spans", default=None)
+
+def parse_traceparent(header: Optional[str]) -> Optional[Dict[str, str]]:
+    """Разбор заголовка W3C traceparent"""
+    if not header:
+        return None
+    parts = header.strip().split("-")
+    if len(parts) != 4 or len(parts[1]) != 32 or len(parts[2]) != 16:
+        return None
+    return {"trace_id": parts[1], "parent_id": parts[2]}
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+@contextmanager
+def start_span(
+    name: str,
+    attributes: Optional[Dict[str, Any]] = None,
+    trace_id: Optional[str] = None,
+    parent_id: Optional[str] = None
+) -> Iterator[Span]:
+    """Открытие участка трассировки; без явного родителя используется текущий участок"""
+    parent = _current_span.get()
+    if trace_id is None and parent is not None:
+        trace_id, parent_id = parent.trace_id, parent.span_id
+
+    span = Span(name, trace_id=trace_id, parent_id=parent_id, attributes=attributes)
+    token = _current_span.set(span)
+    try:
+        yield span
+    except Exception as e:
+        span.status = "error"
+        span.set_attribute("error", str(e))
+        raise
+    finally:
+        _current_span.reset(token)
+        span.finish()
+        _finish(span)
+
+@contextmanager
+def record_spans() -> Iterator[List[Span]]:
+    """Сбор всех завершенных внутри блока участков (например, для сохранения в БД)"""
+    spans: List[Span] = []
+    token = _recorded_spans.set(spans)
+    try:
+        yield spans
+    finally:
+        _recorded_spans.reset(token)
+
+def _finish(span: Span) -> None:
+    recorded = _recorded_spans.get()
+    if recorded is not None:
+        recorded.append(span)
+    exporter.export(span.to_dict())
+
+class SpanExporter:
+    """Экспорт участков в JSONL-файл и/или OTLP/HTTP-коллектор (в фоне, пачками)"""
+
+    def __init__(self, file_path: Optional[str], otlp_endpoint: Optional[str], flush_interval: float = 5.0):
+        self.file_path = file_path
+        self.otlp_endpoint = otlp_endpoint.rstrip("/") if otlp_endpoint else None
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=10000)
+        self._file_lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+
+    def export(self, span: Dict[str, Any]) -> None:
+        if self.file_path:
+            with self._file_lock, open(self.file_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(span, ensure_ascii=False) + "\n")
+
+        if self.otlp_endpoint:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="otlp-exporter", daemon=True)
+                self._worker.start()
+            try:
+                self._queue.put_nowait(span)
+            except queue.Full:
+                logger.warning("Trace export queue is full, dropping span")
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.flush_interval)
+            batch = []
+            while not self._queue.empty() and len(batch) < 1000:
+                batch.append(self._queue.get_nowait())
+            if not batch:
+                continue
+            try:
+                httpx.post(f"{self.otlp_endpoint}/v1/traces", json=to_otlp(batch), timeout=5.0)
+            except Exception as e:
+                logger.warning(f"Error exporting {len(batch)} spans to {self.otlp_endpoint}: {str(e)}")
+
+def to_otlp(spans: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Преобразование участков в формат OTLP/JSON (группировка по сервисам)"""
+    by_service: Dict[str, List[Dict[str, Any]]] = {}
+    for span in spans:
+        started = datetime.fromisoformat(span["started_at"])
+        start_ns = int(started.timestamp() * 1e9)
+        by_service.setdefault(span["service"], []).append({
+            "traceId": span["trace_id"],
+            "spanId": span["span_id"],
+            "parentSpanId": span.get("parent_id") or "",
+            "name": span["name"],
+            "kind": 1,
+            "startTimeUnixNano": str(start_ns),
+            "endTimeUnixNano": str(start_ns + int((span.get("duration_ms") or 0) * 1e6)),
+            "attributes": [
+                {"key": key, "value": {"stringValue": str(value)}}
+                for key, value in (span.get("attributes") or {}).items()
+            ],
+            "status": {"code": 2 if span.get("status") == "error" else 1},
+        })
+
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service}}]},
+                "scopeSpans": [{"scope": {"name": "aegis"}, "spans": service_spans}],
+            }
+            for service, service_spans in by_service.items()
+        ]
+    }
+
+exporter = SpanExporter(settings.TRACE_EXPORT_FILE, settings.OTLP_ENDPOINT)
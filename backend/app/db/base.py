@@ -1,6 +1,8 @@
-from sqlalchemy import create_engine
+from contextlib import contextmanager
+from typing import Iterator
+from sqlalchemy import create_engine, text
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
 
 from app.core.config import settings
 
@@ -19,4 +21,25 @@ def get_db():
     try:
         yield db
     finally:
-        db.close() 
+        db.close()
+
+@contextmanager
+def try_advisory_lock(db: Session, key: str) -> Iterator[bool]:
+    """Межпроцессная блокировка по ключу (advisory lock PostgreSQL)
+    
+    Блокировка не ждет: если ее держит другой процесс, возвращается False.
+    В других СУБД блокировка считается всегда полученной.
+    """
+    if db.get_bind().dialect.name != "postgresql":
+        yield True
+        return
+    
+    params = {"key": key}
+    # Отдельное соединение в autocommit: блокировка уровня сессии не зависит от транзакций запроса
+    with db.get_bind().connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        acquired = conn.execute(text("SELECT pg_try_advisory_lock(hashtext(:key))"), params).scalar()
+        try:
+            yield bool(acquired)
+        finally:
+            if acquired:
+                conn.execute(text("SELECT pg_advisory_unlock(hashtext(:key))"), params)
@@ -0,0 +1,92 @@
+"""Индексы поиска по находкам
+
+Обычные индексы (CVE, пакет и версия) описаны в моделях и создаются вместе с таблицами.
+Триграммные GIN-индексы для поиска по подстроке в описании и имени пакета требуют расширения
+pg_trgm и создаются отдельно. В существующих базах недостающие индексы строятся в фоне
+(CREATE INDEX CONCURRENTLY), не блокируя запись находок.
+"""
+import asyncio
+import time
+from typing import List, Tuple
+from loguru import logger
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateIndex
+
+from app.db.base import try_advisory_lock
+from app.models.models import Vulnerability
+
+# Имя индекса, таблица и колонка для триграммного поиска (ILIKE '%...%')
+TRIGRAM_INDEXES: Tuple[Tuple[str, str, str], ...] = (
+    ("ix_vulnerabilities_description_trgm", "vulnerabilities", "description"),
+    ("ix_vulnerabilities_pkg_name_trgm", "vulnerabilities", "pkg_name"),
+)
+
+def enable_trigram(conn: Connection) -> bool:
+    """Подключение расширения pg_trgm; False, если его нет на сервере или не хватает прав"""
+    try:
+        conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        return True
+    except Exception as e:
+        logger.warning(f"pg_trgm is not available, substring search will not be indexed: {str(e)}")
+        return False
+
+def search_indexes(conn: Connection, trigram: bool) -> List[Tuple[str, str, str]]:
+    """Индексы поиска: имя, таблица и оператор CREATE INDEX"""
+    indexes = [
+        (index.name, index.table.name, str(CreateIndex(index).compile(dialect=conn.dialect)))
+        for index in Vulnerability.__table__.indexes
+    ]
+    if trigram:
+        indexes.extend(
+            (name, table, f"CREATE INDEX {name} ON {table} USING gin ({column} gin_trgm_ops)")
+            for name, table, column in TRIGRAM_INDEXES
+        )
+    return indexes
+
+def ensure_search_indexes(engine: Engine) -> List[str]:
+    """Создание недостающих индексов поиска; возвращает имена построенных индексов"""
+    if engine.dialect.name != "postgresql":
+        return []
+    
+    built = []
+    with Session(bind=engine) as db, try_advisory_lock(db, "search-indexes") as acquired:
+        if not acquired:
+            # Индексы уже строит другой процесс
+            return []
+        
+        # CONCURRENTLY нельзя выполнять внутри транзакции
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            trigram = enable_trigram(conn)
+            for name, table, statement in search_indexes(conn, trigram):
+                state = conn.execute(text(
+                    "SELECT i.indisvalid FROM pg_index i WHERE i.indexrelid = to_regclass(:name)"
+                ), {"name": name}).scalar()
+                if state:
+                    continue
+                
+                # У секционированной таблицы индекс строится обычным образом (CONCURRENTLY не поддерживается)
+                partitioned = conn.execute(text(
+                    "SELECT relkind = 'p' FROM pg_class WHERE oid = to_regclass(:table)"
+                ), {"table": table}).scalar()
+                if state is False:
+                    # Недостроенный индекс после прерванного CONCURRENTLY
+                    conn.execute(text(f"DROP INDEX {'' if partitioned else 'CONCURRENTLY '}{name}"))
+                if not partitioned:
+                    statement = statement.replace("CREATE INDEX", "CREATE INDEX CONCURRENTLY", 1)
+                
+                started = time.perf_counter()
+                logger.info(f"Building index {name} on {table}")
+                conn.execute(text(statement))
+                logger.info(f"Index {name} built in {time.perf_counter() - started:.1f}s")
+                built.append(name)
+    
+    return built
+
+async def build_search_indexes(engine: Engine) -> None:
+    """Фоновое построение индексов поиска при запуске"""
+    try:
+        await asyncio.to_thread(ensure_search_indexes, engine)
+    except Exception as e:
+        logger.error(f"Search index build failed: {str(e)}")
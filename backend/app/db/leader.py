@@ -0,0 +1,35 @@
+"""Задания, которые из всех воркеров и реплик бэкенда выполняет один процесс
+
+Ведущий процесс — владелец advisory-блокировки задания; он держит ее, пока работает.
+Остальные пытаются занять блокировку раз в интервал и подхватывают задание, если ведущий остановился.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable
+from loguru import logger
+
+from app.core.metrics import LEADER_JOBS
+from app.db.base import SessionLocal, try_advisory_lock
+
+async def run_as_leader(job: str, interval: float, tick: Callable[[], Awaitable[Any]]) -> None:
+    """Фоновое задание: tick каждые interval секунд, пока процесс — ведущий для job"""
+    while True:
+        db = SessionLocal()
+        try:
+            with try_advisory_lock(db, job) as acquired:
+                if acquired:
+                    logger.info(f"This process runs {job}")
+                    LEADER_JOBS.labels(job).set(1)
+                    while True:
+                        started = asyncio.get_running_loop().time()
+                        try:
+                            await tick()
+                        except Exception as e:
+                            logger.error(f"Error in {job}: {str(e)}")
+                        elapsed = asyncio.get_running_loop().time() - started
+                        await asyncio.sleep(max(0.0, interval - elapsed))
+        except Exception as e:
+            logger.error(f"Leader election error for {job}: {str(e)}")
+        finally:
+            LEADER_JOBS.labels(job).set(0)
+            db.close()
+        await asyncio.sleep(interval)
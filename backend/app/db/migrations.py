@@ -0,0 +1,76 @@
+"""Обновление схемы базы миграциями Alembic (backend/migrations)
+
+Миграции выполняются при запуске бэкенда (MIGRATE_ON_STARTUP) или вручную: `alembic upgrade head`.
+Несколько реплик, запущенных одновременно, не мешают друг другу: миграции идут под
+advisory-блокировкой, остальные реплики ждут ее и находят схему обновленной.
+"""
+import os
+from contextlib import contextmanager
+from typing import Iterator, Optional
+from alembic import command
+from alembic.config import Config
+from alembic.runtime.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from loguru import logger
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection, Engine
+
+from app.core.config import settings
+from app.db.partitioning import ensure_partitions
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+MIGRATIONS_LOCK = "aegis-migrations"
+
+def alembic_config(connection: Optional[Connection] = None) -> Config:
+    config = Config(os.path.join(BACKEND_DIR, "alembic.ini"))
+    config.set_main_option("script_location", os.path.join(BACKEND_DIR, "migrations"))
+    if connection is not None:
+        config.attributes["connection"] = connection
+    return config
+
+def current_revision(engine: Engine) -> Optional[str]:
+    with engine.connect() as conn:
+        return MigrationContext.configure(conn).get_current_revision()
+
+def head_revision() -> str:
+    return ScriptDirectory.from_config(alembic_config()).get_current_head()
+
+@contextmanager
+def _migrations_lock(engine: Engine) -> Iterator[None]:
+    """Блокирующая advisory-блокировка на время миграций (на отдельном соединении)"""
+    if engine.dialect.name != "postgresql":
+        yield
+        return
+    
+    params = {"key": MIGRATIONS_LOCK}
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("SELECT pg_advisory_lock(hashtext(:key))"), params)
+        try:
+            yield
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(hashtext(:key))"), params)
+
+def run_migrations(engine: Engine) -> None:
+    """Обновление схемы до последней ревизии
+    
+    Если схема уже последняя, запуск ограничивается одним чтением alembic_version.
+    База без alembic_version, но с таблицами — созданная прежними версиями через create_all:
+    базовая ревизия дополняет ее недостающими таблицами и колонками.
+    """
+    head = head_revision()
+    if current_revision(engine) == head:
+        logger.info(f"Database schema is up to date (revision {head})")
+        return
+    
+    with _migrations_lock(engine):
+        # Пока ждали блокировку, схему могла обновить другая реплика
+        revision = current_revision(engine)
+        if revision is None and inspect(engine).has_table("hosts"):
+            logger.info("Adopting schema created without migrations")
+        with engine.begin() as conn:
+            command.upgrade(alembic_config(conn), "head")
+    
+    if settings.PARTITIONING_ENABLED:
+        ensure_partitions(engine)
+    logger.info(f"Database schema migrated from {revision or 'empty'} to {head}")
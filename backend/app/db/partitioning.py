@@ -0,0 +1,130 @@
+"""Секционирование истории сканирований и уязвимостей по времени сканирования (PostgreSQL)
+
+При PARTITIONING_ENABLED базовая миграция (0001) создает таблицы scan_history и vulnerabilities
+секционированными по месяцам: scan_history — по started_at, vulnerabilities — по scanned_at (копия
+времени сканирования). Первичные ключи включают ключ секционирования, а находки ссылаются на
+сканирование составным внешним ключом (scan_id, scanned_at). Секции создаются заранее
+фоновым заданием, устаревшие удаляются целиком (DROP TABLE) вместо построчного DELETE.
+"""
+import asyncio
+import re
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from loguru import logger
+from sqlalchemy import text, true
+from sqlalchemy.engine import Connection, Engine
+
+from app.core.config import settings
+from app.models.models import ScanSpan, ScanSummary, Vulnerability
+
+# Секционированные таблицы и их ключ секционирования
+PARTITIONED_TABLES: Dict[str, str] = {
+    "scan_history": "started_at",
+    "vulnerabilities": "scanned_at",
+}
+
+# Таблицы, которые ссылаются на сканирования без внешнего ключа и чистятся перед удалением секции
+SCAN_SIDE_TABLES = (ScanSpan.__table__, ScanSummary.__table__)
+
+def month_start(moment: date) -> date:
+    return date(moment.year, moment.month, 1)
+
+def add_months(moment: date, months: int) -> date:
+    month = moment.month - 1 + months
+    return date(moment.year + month // 12, month % 12 + 1, 1)
+
+def partition_name(table: str, start: date) -> str:
+    return f"{table}_p{start:%Y_%m}"
+
+def vulnerability_partition_filter(scanned_at: Optional[datetime]):
+    """Условие на время сканирования, по которому PostgreSQL отсекает лишние секции уязвимостей"""
+    if not settings.PARTITIONING_ENABLED or scanned_at is None:
+        return true()
+    return Vulnerability.scanned_at == scanned_at
+
+def _relkind(conn: Connection, table: str) -> Optional[str]:
+    """Тип отношения в pg_class: 'p' — секционированная таблица, 'r' — обычная"""
+    return conn.execute(
+        text("SELECT relkind FROM pg_class WHERE oid = to_regclass(:name)"), {"name": table}
+    ).scalar()
+
+def list_partitions(conn: Connection, table: str) -> List[Tuple[str, date]]:
+    """Секции таблицы, созданные этим модулем, с началом их диапазона"""
+    names = conn.execute(text(
+        "SELECT child.relname FROM pg_inherits "
+        "JOIN pg_class parent ON parent.oid = pg_inherits.inhparent "
+        "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE parent.relname = :table"
+    ), {"table": table}).scalars().all()
+    
+    pattern = re.compile(rf"^{table}_p(\d{{4}})_(\d{{2}})$")
+    partitions = []
+    for name in names:
+        match = pattern.match(name)
+        if match:
+            partitions.append((name, date(int(match[1]), int(match[2]), 1)))
+    return sorted(partitions, key=lambda partition: partition[1])
+
+def ensure_partitions(engine: Engine, today: Optional[date] = None) -> List[str]:
+    """Создание секций текущего месяца и PARTITIONS_AHEAD следующих; возвращает созданные"""
+    current = month_start(today or datetime.utcnow().date())
+    created = []
+    with engine.begin() as conn:
+        for table in PARTITIONED_TABLES:
+            for offset in range(settings.PARTITIONS_AHEAD + 1):
+                start = add_months(current, offset)
+                name = partition_name(table, start)
+                # Проверка заранее: CREATE TABLE ... PARTITION OF блокирует родительскую таблицу
+                if _relkind(conn, name) is not None:
+                    continue
+                conn.execute(text(
+                    f"CREATE TABLE {name} PARTITION OF {table} "
+                    f"FOR VALUES FROM ('{start.isoformat()}') TO ('{add_months(start, 1).isoformat()}')"
+                ))
+                created.append(name)
+    
+    if created:
+        logger.info(f"Created partitions: {', '.join(created)}")
+    return created
+
+def expired_partitions(engine: Engine, max_age_days: int, now: Optional[datetime] = None) -> List[Tuple[date, int]]:
+    """Месяцы, все сканирования которых старше max_age_days, и число сканирований в каждом"""
+    cutoff = ((now or datetime.utcnow()) - timedelta(days=max_age_days)).date()
+    expired = []
+    with engine.connect() as conn:
+        for name, start in list_partitions(conn, "scan_history"):
+            if add_months(start, 1) > cutoff:
+                break
+            scans = conn.execute(text(f"SELECT count(*) FROM {name}")).scalar()
+            expired.append((start, scans))
+    return expired
+
+def drop_partition(engine: Engine, start: date) -> List[str]:
+    """Удаление месяца истории: сначала секция находок, затем секция сканирований
+    
+    Возвращает ID удаленных сканирований. Записи без внешнего ключа (участки трассировки,
+    сводки) удаляются по списку сканирований секции.
+    """
+    scans_partition = partition_name("scan_history", start)
+    with engine.begin() as conn:
+        # Удаление секции ненадолго блокирует родительскую таблицу: не ждем дольше lock_timeout
+        conn.execute(text("SET LOCAL lock_timeout = '5s'"))
+        scan_ids = conn.execute(text(f"SELECT scan_id FROM {scans_partition}")).scalars().all()
+        for table in SCAN_SIDE_TABLES:
+            conn.execute(text(f"DELETE FROM {table.name} WHERE scan_id IN (SELECT scan_id FROM {scans_partition})"))
+        conn.execute(text(f"DROP TABLE IF EXISTS {partition_name('vulnerabilities', start)}"))
+        # На секцию сканирований ссылается внешний ключ находок: сначала ее нужно отсоединить
+        conn.execute(text(f"ALTER TABLE scan_history DETACH PARTITION {scans_partition}"))
+        conn.execute(text(f"DROP TABLE {scans_partition}"))
+    
+    logger.info(f"Dropped partitions for {start:%Y-%m} ({len(scan_ids)} scans)")
+    return scan_ids
+
+async def maintain_partitions(engine: Engine) -> None:
+    """Фоновое задание: создание секций наперед каждые PARTITION_MAINTENANCE_INTERVAL_SECONDS"""
+    while True:
+        try:
+            await asyncio.to_thread(ensure_partitions, engine)
+        except Exception as e:
+            logger.error(f"Partition maintenance error: {str(e)}")
+        await asyncio.sleep(settings.PARTITION_MAINTENANCE_INTERVAL_SECONDS)
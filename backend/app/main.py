@@ -1,13 +1,32 @@
+import asyncio
 import os
-from fastapi import FastAPI
+import time
+from contextlib import asynccontextmanager
+from typing import Dict
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from loguru import logger
 import logging
+from prometheus_client import generate_latest, CONTENT_TYPE_LATEST
+from sqlalchemy import text
 
 from app.api.api import api_router
+from app.core.cache import run_invalidation_listener
 from app.core.config import settings
-from app.db.base import Base, engine
+from app.core.events import event_bus
+from app.core.metrics import HTTP_REQUEST_DURATION_SECONDS, STARTUP_PHASE_SECONDS
+from app.core.responses import DefaultJSONResponse
+from app.db.base import engine
+from app.db.indexes import build_search_indexes
+from app.db.migrations import run_migrations
+from app.db.partitioning import maintain_partitions
+from app.services.container_service import ContainerService
+from app.services.exposure_service import ExposureService
+from app.services.host_health_service import HostHealthService
+from app.services.remediation_service import RemediationService
+from app.services.retention_service import RetentionService
+from app.services.scan_service import ScanService
 
 # Настройка логирования
 class InterceptHandler(logging.Handler):
@@ -24,8 +43,99 @@ logger.add(lambda msg: print(msg, end=""), level=log_level)
 # Перехват всех логов стандартной библиотеки logging
 logging.basicConfig(handlers=[InterceptHandler()], level=0)
 
-# Создание таблиц в базе данных при запуске
-Base.metadata.create_all(bind=engine)
+def process_uptime() -> float:
+    """Секунды с запуска процесса (по /proc/self/stat), иначе с импорта модуля"""
+    try:
+        with open("/proc/self/stat") as f:
+            # Поле 22 (после имени процесса в скобках — 20-е) — время запуска в тиках с загрузки системы
+            started_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            return float(f.read().split()[0]) - started_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return time.perf_counter() - module_imported
+
+module_imported = time.perf_counter()
+
+# Состояние запуска: фазы с секундами от старта процесса, готовность к приему запросов
+startup_state: Dict[str, object] = {"ready": False, "error": None, "phases": {}}
+
+# Фоновые задания процесса (ссылка нужна, чтобы задачи не собрал сборщик мусора)
+background_jobs = []
+
+def mark_phase(phase: str) -> None:
+    elapsed = round(process_uptime(), 3)
+    startup_state["phases"][phase] = elapsed
+    STARTUP_PHASE_SECONDS.labels(phase).set(elapsed)
+
+def check_database() -> None:
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+
+async def wait_for_database() -> int:
+    """Ожидание базы с растущей паузой (до STARTUP_RETRY_MAX_SECONDS); возвращает число попыток"""
+    attempt = 0
+    delay = 0.5
+    while True:
+        attempt += 1
+        try:
+            await asyncio.to_thread(check_database)
+            return attempt
+        except Exception as e:
+            logger.warning(f"Database is not available (attempt {attempt}), retrying in {delay:.1f}s: {str(e)}")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, settings.STARTUP_RETRY_MAX_SECONDS)
+
+async def initialize():
+    """Инициализация после открытия порта: ожидание базы, миграции, фоновые задания
+    
+    Процесс уже отвечает на /health/live, а /health/ready возвращает 503, пока эта задача не завершится.
+    """
+    try:
+        attempts = await wait_for_database()
+        mark_phase("database")
+        if settings.MIGRATE_ON_STARTUP:
+            await asyncio.to_thread(run_migrations, engine)
+        mark_phase("migrations")
+        await start_background_jobs()
+        mark_phase("ready")
+        startup_state["ready"] = True
+        logger.info(
+            f"Backend ready in {startup_state['phases']['ready']:.2f}s "
+            f"(database attempts: {attempts}, phases: {startup_state['phases']})"
+        )
+    except Exception as e:
+        startup_state["error"] = str(e)
+        logger.exception(f"Backend initialization failed: {str(e)}")
+
+async def start_background_jobs():
+    """Запуск фоновых заданий: шина событий, проверки агентов, опрос контейнеров, индексы поиска и CVE, секции и хранение истории"""
+    background_jobs.append(asyncio.create_task(event_bus.run(engine)))
+    # Запуски исправления, исполнитель которых остановился, больше никто не продолжит
+    background_jobs.append(asyncio.create_task(RemediationService.run_reaper()))
+    background_jobs.append(asyncio.create_task(HostHealthService.run_listener()))
+    background_jobs.append(asyncio.create_task(run_invalidation_listener()))
+    if settings.HOST_PROBE_ENABLED:
+        background_jobs.append(asyncio.create_task(HostHealthService.run_prober()))
+    if settings.CONTAINER_POLL_ENABLED:
+        background_jobs.append(asyncio.create_task(ContainerService.run_poller()))
+    if settings.SCAN_STATUS_POLL_ENABLED:
+        background_jobs.append(asyncio.create_task(ScanService.run_status_poller()))
+    background_jobs.append(asyncio.create_task(build_search_indexes(engine)))
+    background_jobs.append(asyncio.create_task(ExposureService.build_on_startup()))
+    if settings.PARTITIONING_ENABLED:
+        background_jobs.append(asyncio.create_task(maintain_partitions(engine)))
+    if settings.RETENTION_ENABLED:
+        background_jobs.append(asyncio.create_task(RetentionService.run_periodically()))
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Порт открывается сразу, зависимости инициализируются в фоне с повторными попытками"""
+    mark_phase("import")
+    background_jobs.append(asyncio.create_task(initialize()))
+    yield
+    for job in background_jobs:
+        job.cancel()
+    await asyncio.gather(*background_jobs, return_exceptions=True)
 
 # Инициализация FastAPI
 app = FastAPI(
@@ -35,6 +145,8 @@ app = FastAPI(
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
     docs_url="/docs",
     redoc_url="/redoc",
+    default_response_class=DefaultJSONResponse,
+    lifespan=lifespan,
 )
 
 # Настройка CORS
@@ -46,6 +158,52 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+@app.middleware("http")
+async def track_request_latency(request: Request, call_next):
+    """Учет латентности HTTP-запросов по шаблону маршрута"""
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        HTTP_REQUEST_DURATION_SECONDS.labels(
+            request.method,
+            route.path if route is not None else "unmatched",
+            str(status)
+        ).observe(time.perf_counter() - started)
+
+@app.get("/health")
+def health_check():
+    """Эндпоинт для проверки состояния сервиса"""
+    return {"status": "ok", "service": settings.PROJECT_NAME}
+
+@app.get("/health/live")
+def liveness():
+    """Процесс жив и обрабатывает запросы (зависимости не проверяются)"""
+    return {"status": "ok"}
+
+@app.get("/health/ready")
+async def readiness():
+    """Готовность к трафику: инициализация завершена и база отвечает"""
+    status = {"ready": startup_state["ready"], "phases": startup_state["phases"]}
+    if not startup_state["ready"]:
+        status["error"] = startup_state["error"]
+        return DefaultJSONResponse(status, status_code=503)
+    try:
+        await asyncio.wait_for(asyncio.to_thread(check_database), settings.READINESS_TIMEOUT_SECONDS)
+    except Exception as e:
+        status.update(ready=False, error=f"database: {str(e) or type(e).__name__}")
+        return DefaultJSONResponse(status, status_code=503)
+    return status
+
+@app.get("/metrics")
+def metrics():
+    """Метрики бэкенда в формате Prometheus"""
+    return Response(content=generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
 # Подключение API роутеров
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
@@ -54,15 +212,12 @@ frontend_path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__f
 if os.path.exists(frontend_path):
     app.mount("/", StaticFiles(directory=frontend_path, html=True), name="static")
 
-@app.get("/health")
-def health_check():
-    """Эндпоинт для проверки состояния сервиса"""
-    return {"status": "ok", "service": settings.PROJECT_NAME}
-
 if __name__ == "__main__":
     import uvicorn
+    # Перезагрузка при изменении файлов — только для разработки (DEBUG): она запускает
+    # отдельный процесс-наблюдатель и заметно замедляет запуск
     uvicorn.run(
-        "main:app",
+        "app.main:app" if settings.DEBUG else app,
         host=settings.BACKEND_HOST,
         port=settings.BACKEND_PORT,
         reload=settings.DEBUG
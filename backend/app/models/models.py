@@ -1,23 +1,31 @@
 import uuid
-from sqlalchemy import Column, String, Integer, DateTime, ForeignKey, Text, JSON, Enum
-from sqlalchemy.orm import relationship
+from sqlalchemy import Boolean, Column, String, Integer, Float, DateTime, ForeignKey, ForeignKeyConstraint, Index, Text, JSON, Enum
+from sqlalchemy.orm import column_property, deferred, relationship
 from sqlalchemy.sql import func
 import enum
 
 from app.db.base import Base
 
-class ContainerStatus(enum.Enum):
+class ContainerStatus(str, enum.Enum):
     IDLE = "idle"
     SCANNING = "scanning"
     SCANNED = "scanned" 
     ERROR = "error"
 
-class ScanStatus(enum.Enum):
+class ScanStatus(str, enum.Enum):
     PENDING = "pending"
     RUNNING = "running"
     COMPLETED = "completed"
     ERROR = "error"
 
+class RemediationStatus(str, enum.Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    ABORTED = "aborted"
+    SKIPPED = "skipped"
+
 class Host(Base):
     """Модель для хранения информации о хостах Docker"""
     __tablename__ = "hosts"
@@ -30,7 +38,7 @@ class Host(Base):
     
     # Связи
     containers = relationship("Container", back_populates="host", cascade="all, delete-orphan")
-    scan_history = relationship("ScanHistory", back_populates="host", cascade="all, delete-orphan")
+    scan_history = relationship("ScanHistory", back_populates="host", cascade="all, delete-orphan", overlaps="container,scan_history")
     
     def __repr__(self):
         return f"<Host {self.name} ({self.address})>"
@@ -47,7 +55,9 @@ class Container(Base):
     
     # Связи
     host = relationship("Host", back_populates="containers")
-    scan_history = relationship("ScanHistory", back_populates="container", cascade="all, delete-orphan")
+    scan_history = relationship("ScanHistory", back_populates="container", cascade="all, delete-orphan", overlaps="host,scan_history")
+    # Строки обратного индекса удаляет база (ON DELETE CASCADE), без загрузки в сессию
+    exposures = relationship("CveExposure", cascade="all, delete-orphan", passive_deletes=True)
     
     def __repr__(self):
         return f"<Container {self.name} ({self.container_id[:12]})>"
@@ -55,18 +65,36 @@ class Container(Base):
 class ScanHistory(Base):
     """Модель для хранения истории сканирования"""
     __tablename__ = "scan_history"
+    __table_args__ = (
+        # Первичный ключ контейнера составной, поэтому и ссылка на него составная
+        ForeignKeyConstraint(
+            ["container_id", "host_id"],
+            ["containers.container_id", "containers.host_id"]
+        ),
+    )
     
     scan_id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
     host_id = Column(String(36), ForeignKey("hosts.id"), nullable=False)
-    container_id = Column(String(100), ForeignKey("containers.container_id"), nullable=False)
+    container_id = Column(String(100), nullable=False)
     started_at = Column(DateTime, server_default=func.now())
     finished_at = Column(DateTime, nullable=True)
-    status = Column(Enum(ScanStatus), nullable=False, default=ScanStatus.PENDING)
+    # Прежний статус загружается и при присваивании после commit: повторная запись
+    # того же статуса не считается изменением и не публикует событие scan_status
+    status = column_property(Column(Enum(ScanStatus), nullable=False, default=ScanStatus.PENDING), active_history=True)
+    # Длительность этапов работы Trivy в мс (db, image_fetch, layer_analysis, detection) по данным агента
+    stage_durations = Column(JSON, nullable=True)
     
     # Связи
-    host = relationship("Host", back_populates="scan_history")
-    container = relationship("Container", back_populates="scan_history")
+    host = relationship("Host", back_populates="scan_history", overlaps="container,scan_history")
+    container = relationship("Container", back_populates="scan_history", overlaps="host,scan_history")
     vulnerabilities = relationship("Vulnerability", back_populates="scan", cascade="all, delete-orphan")
+    summary = relationship(
+        "ScanSummary",
+        back_populates="scan",
+        uselist=False,
+        cascade="all, delete-orphan",
+        primaryjoin="ScanHistory.scan_id == foreign(ScanSummary.scan_id)"
+    )
     
     def __repr__(self):
         return f"<ScanHistory {self.scan_id[:8]} ({self.status.value})>"
@@ -74,18 +102,183 @@ class ScanHistory(Base):
 class Vulnerability(Base):
     """Модель для хранения информации об уязвимостях"""
     __tablename__ = "vulnerabilities"
+    __table_args__ = (
+        # Поиск по пакету и версии; подстрочный поиск — триграммные индексы (app.db.indexes)
+        Index("ix_vulnerabilities_pkg", "pkg_name", "pkg_version"),
+    )
     
     id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    scan_id = Column(String(36), ForeignKey("scan_history.scan_id"), nullable=False)
-    cve_id = Column(String(50), nullable=False)
+    # Индекс нужен выборкам по сканированию и пакетному удалению старых находок
+    scan_id = Column(String(36), ForeignKey("scan_history.scan_id"), nullable=False, index=True)
+    cve_id = Column(String(50), nullable=False, index=True)
     cvss = Column(String(10), nullable=True)
     severity = Column(String(20), nullable=True)
     description = Column(Text, nullable=True)
     recommendation = Column(Text, nullable=True)
-    details = Column(JSON, nullable=True)
+    # Пакет и версии из находки Trivy (PkgName, InstalledVersion, FixedVersion)
+    pkg_name = Column(Text, nullable=True)
+    pkg_version = Column(Text, nullable=True)
+    fixed_version = Column(Text, nullable=True)
+    # Время сканирования (копия ScanHistory.started_at): ключ секционирования таблицы
+    scanned_at = Column(DateTime, nullable=True)
+    # Полная находка Trivy: большая и нужна редко, поэтому загружается только по требованию
+    details = deferred(Column(JSON, nullable=True))
     
     # Связи
     scan = relationship("ScanHistory", back_populates="vulnerabilities")
     
     def __repr__(self):
-        return f"<Vulnerability {self.cve_id} ({self.severity})>" 
+        return f"<Vulnerability {self.cve_id} ({self.severity})>"
+
+class ScanSummary(Base):
+    """Модель для хранения сводки уязвимостей сканирования, находки которого удалены политикой хранения"""
+    __tablename__ = "scan_summaries"
+    
+    # Без внешнего ключа: при секционировании по времени scan_id сам по себе не уникален (см. app.db.partitioning)
+    scan_id = Column(String(36), primary_key=True)
+    critical = Column(Integer, nullable=False, default=0)
+    high = Column(Integer, nullable=False, default=0)
+    medium = Column(Integer, nullable=False, default=0)
+    low = Column(Integer, nullable=False, default=0)
+    unknown = Column(Integer, nullable=False, default=0)
+    total = Column(Integer, nullable=False, default=0)
+    compacted_at = Column(DateTime, server_default=func.now())
+    
+    # Связи
+    scan = relationship("ScanHistory", back_populates="summary", primaryjoin="ScanHistory.scan_id == foreign(ScanSummary.scan_id)")
+    
+    def __repr__(self):
+        return f"<ScanSummary {self.scan_id[:8]} ({self.total})>"
+
+class CveExposure(Base):
+    """Обратный индекс CVE → контейнеры по последнему завершенному сканированию каждого контейнера"""
+    __tablename__ = "cve_exposures"
+    __table_args__ = (
+        ForeignKeyConstraint(
+            ["container_id", "host_id"],
+            ["containers.container_id", "containers.host_id"],
+            ondelete="CASCADE"
+        ),
+        Index("ix_cve_exposures_cve", "cve_id", "pkg_name"),
+        Index("ix_cve_exposures_pkg", "pkg_name"),
+    )
+    
+    host_id = Column(String(36), primary_key=True)
+    container_id = Column(String(100), primary_key=True)
+    cve_id = Column(String(50), primary_key=True)
+    # Пустая строка, если Trivy не указал пакет (колонка входит в первичный ключ)
+    pkg_name = Column(Text, primary_key=True, default="")
+    image = Column(String(255), nullable=False)
+    pkg_version = Column(Text, nullable=True)
+    fixed_version = Column(Text, nullable=True)
+    severity = Column(String(20), nullable=True)
+    # Без внешнего ключа: индекс не зависит от хранения и секционирования истории
+    scan_id = Column(String(36), nullable=False)
+    scanned_at = Column(DateTime, nullable=True)
+    
+    def __repr__(self):
+        return f"<CveExposure {self.cve_id} ({self.container_id[:12]})>"
+
+class ScanSpan(Base):
+    """Модель для хранения участков трассировки сканирования (бэкенд и агент)"""
+    __tablename__ = "scan_spans"
+    
+    span_id = Column(String(16), primary_key=True)
+    trace_id = Column(String(32), nullable=False, index=True)
+    parent_id = Column(String(16), nullable=True)
+    # Без внешнего ключа: участки пишутся и для сканирований, которые не удалось создать на агенте
+    scan_id = Column(String(36), nullable=False, index=True)
+    service = Column(String(50), nullable=False)
+    name = Column(String(100), nullable=False)
+    started_at = Column(DateTime(timezone=True), nullable=False)
+    duration_ms = Column(Float, nullable=True)
+    status = Column(String(20), nullable=False, default="ok")
+    attributes = Column(JSON, nullable=True)
+    
+    def __repr__(self):
+        return f"<ScanSpan {self.name} ({self.duration_ms} ms)>"
+
+class RemediationExecution(Base):
+    """Модель для хранения запуска исправления уязвимостей (партии контейнеров)"""
+    __tablename__ = "remediation_executions"
+    
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    strategy = Column(String(50), nullable=False)
+    # Без внешних ключей: журнал исправлений хранится дольше истории сканирований
+    scan_id = Column(String(36), nullable=True)
+    vulnerability_id = Column(String(36), nullable=True)
+    cve_id = Column(String(50), nullable=True)
+    parallelism = Column(Integer, nullable=False)
+    status = Column(Enum(RemediationStatus), nullable=False, default=RemediationStatus.PENDING)
+    total = Column(Integer, nullable=False, default=0)
+    # Остановка запрашивается через API, исполнитель проверяет флаг перед каждой партией
+    abort_requested = Column(Boolean, nullable=False, default=False)
+    created_at = Column(DateTime, server_default=func.now())
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    # Исполнитель обновляет отметку, пока выполняет запуск (время базы, как и created_at)
+    heartbeat_at = Column(DateTime, nullable=True)
+    error = Column(Text, nullable=True)
+    
+    # Связи
+    steps = relationship(
+        "RemediationStep",
+        back_populates="execution",
+        cascade="all, delete-orphan",
+        order_by="RemediationStep.batch"
+    )
+    
+    def __repr__(self):
+        return f"<RemediationExecution {self.id[:8]} ({self.status.value})>"
+
+class RemediationStep(Base):
+    """Модель для хранения исправления одного контейнера в рамках запуска"""
+    __tablename__ = "remediation_steps"
+    
+    # Используется и как ID операции на агенте
+    id = Column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    execution_id = Column(String(36), ForeignKey("remediation_executions.id", ondelete="CASCADE"), nullable=False, index=True)
+    batch = Column(Integer, nullable=False)
+    # Без внешнего ключа на контейнер: после пересоздания у контейнера другой ID
+    host_id = Column(String(36), nullable=False)
+    container_id = Column(String(100), nullable=False)
+    container_name = Column(String(255), nullable=True)
+    image = Column(String(255), nullable=True)
+    action = Column(String(20), nullable=False)
+    packages = Column(JSON, nullable=True)
+    status = Column(Enum(RemediationStatus), nullable=False, default=RemediationStatus.PENDING)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    duration_ms = Column(Float, nullable=True)
+    new_container_id = Column(String(100), nullable=True)
+    message = Column(Text, nullable=True)
+    # Время шагов на агенте: загрузка образа, пересоздание, проверка здоровья, откат
+    timings = Column(JSON, nullable=True)
+    
+    # Связи
+    execution = relationship("RemediationExecution", back_populates="steps")
+    
+    def __repr__(self):
+        return f"<RemediationStep {self.container_id[:12]} ({self.status.value})>"
+
+class TimingBucket(Base):
+    """Модель для хранения гистограмм длительности сканирований и исправлений
+    
+    Одна строка — одна корзина гистограммы для вида операции, ключа (стратегия исправления
+    или сканер), образа и хоста. Новое измерение увеличивает счетчик одной строки,
+    а гистограммы разных хостов и образов складываются суммированием по корзинам.
+    """
+    __tablename__ = "timing_buckets"
+    
+    kind = Column(String(20), primary_key=True)
+    key = Column(String(50), primary_key=True)
+    image = Column(String(255), primary_key=True)
+    # Без внешнего ключа: статистика переживает удаление хоста
+    host_id = Column(String(36), primary_key=True)
+    bucket = Column(Integer, primary_key=True)
+    count = Column(Integer, nullable=False, default=0)
+    total_ms = Column(Float, nullable=False, default=0)
+    updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
+    
+    def __repr__(self):
+        return f"<TimingBucket {self.kind}/{self.key} {self.image} #{self.bucket} ({self.count})>"
@@ -1,3 +1,4 @@
+from datetime import datetime
 from typing import Optional
 from pydantic import BaseModel, Field, validator
 
@@ -19,9 +20,20 @@ class HostUpdate(BaseModel):
     port: Optional[int] = Field(default=None, ge=1, le=65535)
     description: Optional[str] = None
 
+# Schema for agent health of a host as seen by this backend process
+class HostHealth(BaseModel):
+    status: str  # unknown, healthy, degraded, unhealthy
+    circuit: str  # closed, open, half_open
+    latency_ms: Optional[float] = None
+    checked_at: Optional[datetime] = None
+    consecutive_failures: int = 0
+    retry_in_seconds: Optional[float] = None
+    error: Optional[str] = None
+
 # Schema for host in response
 class Host(HostBase):
     id: str
+    health: Optional[HostHealth] = None
     
     class Config:
         from_attributes = True 
@@ -0,0 +1,82 @@
+from datetime import datetime
+from enum import Enum
+from typing import Any, Dict, List, Optional
+from pydantic import BaseModel
+
+# Enum for remediation execution and step status
+class RemediationStatus(str, Enum):
+    PENDING = "pending"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+    ABORTED = "aborted"
+    SKIPPED = "skipped"
+
+# Schema for remediation of one container
+class RemediationStep(BaseModel):
+    id: str
+    batch: int
+    host_id: str
+    container_id: str
+    container_name: Optional[str] = None
+    image: Optional[str] = None
+    action: str
+    packages: Optional[List[str]] = None
+    status: RemediationStatus
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    duration_ms: Optional[float] = None
+    new_container_id: Optional[str] = None
+    message: Optional[str] = None
+    timings: Optional[List[Dict[str, Any]]] = None
+    
+    class Config:
+        from_attributes = True
+
+# Schema for timing of one batch of containers
+class RemediationBatch(BaseModel):
+    batch: int
+    status: RemediationStatus
+    containers: int
+    succeeded: int
+    failed: int
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    duration_ms: Optional[float] = None
+
+# Schema for remediation execution
+class RemediationExecution(BaseModel):
+    id: str
+    strategy: str
+    scan_id: Optional[str] = None
+    vulnerability_id: Optional[str] = None
+    cve_id: Optional[str] = None
+    parallelism: int
+    status: RemediationStatus
+    total: int
+    abort_requested: bool = False
+    created_at: Optional[datetime] = None
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = None
+    
+    class Config:
+        from_attributes = True
+
+# Schema for remediation execution with its batches and per-container log
+class RemediationExecutionDetail(RemediationExecution):
+    succeeded: int = 0
+    failed: int = 0
+    batches: List[RemediationBatch] = []
+    steps: List[RemediationStep] = []
+
+# Schema for measured durations of one operation kind on one image
+class TimingStats(BaseModel):
+    kind: str
+    key: str
+    image: str
+    count: int
+    mean_ms: Optional[float] = None
+    p50_ms: Optional[float] = None
+    p95_ms: Optional[float] = None
+    updated_at: Optional[datetime] = None
@@ -0,0 +1,34 @@
+from datetime import datetime
+from typing import List, Optional
+from pydantic import BaseModel
+
+# Schema for retention settings in effect
+class RetentionPolicy(BaseModel):
+    enabled: bool
+    dry_run: bool
+    keep_full_scans: int
+    max_age_days: Optional[int] = None
+    interval_seconds: int
+    batch_size: int
+
+# Schema for the result of one retention run (planned numbers when dry_run is set)
+class RetentionReport(BaseModel):
+    dry_run: bool
+    started_at: datetime
+    finished_at: Optional[datetime] = None
+    scans_to_compact: int = 0
+    scans_to_delete: int = 0
+    compacted_scans: int = 0
+    deleted_scans: int = 0
+    deleted_vulnerabilities: int = 0
+    deleted_spans: int = 0
+    # Секции scan_history (и одноименные секции vulnerabilities), удаляемые целиком
+    dropped_partitions: List[str] = []
+    error: Optional[str] = None
+
+# Schema for retention job state
+class RetentionStatus(BaseModel):
+    policy: RetentionPolicy
+    running: bool
+    current: Optional[RetentionReport] = None
+    last: Optional[RetentionReport] = None
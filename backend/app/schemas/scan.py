@@ -1,6 +1,6 @@
 from datetime import datetime
 from enum import Enum
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Literal
 from pydantic import BaseModel
 
 # Enum for scan status
@@ -10,10 +10,24 @@ class ScanStatus(str, Enum):
     COMPLETED = "completed"
     ERROR = "error"
 
+# Enum for scan priority in the agent queue
+class ScanPriority(str, Enum):
+    HIGH = "high"
+    NORMAL = "normal"
+    LOW = "low"
+
 # Schema for requesting a scan
 class ScanRequest(BaseModel):
     host_id: str
     container_id: str
+    priority: ScanPriority = ScanPriority.NORMAL
+
+# Schema for requesting scans of many containers on one host
+class ScanBatchRequest(BaseModel):
+    host_id: str
+    # All containers of the host when omitted
+    container_ids: Optional[List[str]] = None
+    priority: ScanPriority = ScanPriority.NORMAL
 
 # Schema for scan result
 class ScanBase(BaseModel):
@@ -26,10 +40,17 @@ class ScanBase(BaseModel):
 # Schema for scan history in response
 class ScanHistory(ScanBase):
     finished_at: Optional[datetime] = None
+    stage_durations: Optional[Dict[str, float]] = None
     
     class Config:
         from_attributes = True
 
+# Schema for scans started by one batch request
+class ScanBatch(BaseModel):
+    batch_id: str
+    host_id: str
+    scans: List[ScanHistory] = []
+
 # Schema for vulnerability
 class VulnerabilityBase(BaseModel):
     cve_id: str
@@ -37,6 +58,9 @@ class VulnerabilityBase(BaseModel):
     severity: Optional[str] = None
     description: Optional[str] = None
     recommendation: Optional[str] = None
+    pkg_name: Optional[str] = None
+    pkg_version: Optional[str] = None
+    fixed_version: Optional[str] = None
     details: Optional[Dict[str, Any]] = None
 
 # Schema for creating a new vulnerability
@@ -51,9 +75,85 @@ class Vulnerability(VulnerabilityBase):
     class Config:
         from_attributes = True
 
+# Schema for vulnerability in list responses (without the raw Trivy finding)
+class VulnerabilitySummary(BaseModel):
+    id: str
+    scan_id: str
+    cve_id: str
+    cvss: Optional[str] = None
+    severity: Optional[str] = None
+    description: Optional[str] = None
+    recommendation: Optional[str] = None
+    pkg_name: Optional[str] = None
+    pkg_version: Optional[str] = None
+    fixed_version: Optional[str] = None
+    
+    class Config:
+        from_attributes = True
+
+# Schema for a vulnerability search hit with the scanned container
+class VulnerabilitySearchHit(VulnerabilitySummary):
+    host_id: str
+    container_id: str
+    scanned_at: Optional[datetime] = None
+    rank: int
+
+# Schema for a page of vulnerability search results
+class VulnerabilitySearchResponse(BaseModel):
+    items: List[VulnerabilitySearchHit] = []
+    skip: int
+    limit: int
+    has_more: bool
+
+# Schema for a container whose latest scan contains a CVE
+class AffectedContainer(BaseModel):
+    host_id: str
+    host_name: str
+    container_id: str
+    container_name: str
+    image: str
+    pkg_name: str
+    pkg_version: Optional[str] = None
+    fixed_version: Optional[str] = None
+    severity: Optional[str] = None
+    scan_id: str
+    scanned_at: Optional[datetime] = None
+
+# Schema for the fleet-wide blast radius of a CVE
+class BlastRadius(BaseModel):
+    cve_id: str
+    pkg_name: Optional[str] = None
+    containers: int
+    hosts: int
+    images: int
+    items: List[AffectedContainer] = []
+    skip: int
+    limit: int
+    has_more: bool
+
+# Schema for severity counts of a scan whose findings were removed by retention
+class ScanSeveritySummary(BaseModel):
+    critical: int = 0
+    high: int = 0
+    medium: int = 0
+    low: int = 0
+    unknown: int = 0
+    total: int = 0
+    compacted_at: Optional[datetime] = None
+    
+    class Config:
+        from_attributes = True
+
+# Schema for a message of a WebSocket client changing the set of watched scans and hosts
+class ScanSubscription(BaseModel):
+    action: Literal["subscribe", "unsubscribe"]
+    scan_ids: List[str] = []
+    host_ids: List[str] = []
+
 # Schema for full scan result with vulnerabilities
 class ScanResult(ScanHistory):
-    vulnerabilities: List[Vulnerability] = []
+    vulnerabilities: List[VulnerabilitySummary] = []
+    summary: Optional[ScanSeveritySummary] = None
     
     class Config:
         from_attributes = True
@@ -70,4 +170,28 @@ class ScanHistoryResponse(ScanHistory):
     pass
 
 class VulnerabilityResponse(Vulnerability):
-    pass 
+    pass
+
+# Schema for trace span of a scan
+class ScanSpan(BaseModel):
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str] = None
+    service: str
+    name: str
+    started_at: datetime
+    duration_ms: Optional[float] = None
+    status: str = "ok"
+    attributes: Optional[Dict[str, Any]] = None
+    
+    class Config:
+        from_attributes = True
+
+# Schema for per-scan timing breakdown
+class ScanTimings(BaseModel):
+    scan_id: str
+    trace_id: Optional[str] = None
+    total_ms: Optional[float] = None
+    breakdown: Dict[str, float] = {}
+    stages: Dict[str, float] = {}
+    spans: List[ScanSpan] = []
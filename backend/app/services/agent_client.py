@@ -0,0 +1,152 @@
+import json
+import time
+from typing import Any, Dict
+import httpx
+from loguru import logger
+
+from app.core.config import settings
+from app.core.host_health import ensure_available, health_of
+from app.core.metrics import AGENT_REQUEST_DURATION_SECONDS, AGENT_RESPONSE_BYTES, normalize_agent_path
+from app.core.tracing import start_span
+from app.models.models import Host
+
+# Компактный бинарный формат и zstd-сжатие необязательны:
+# без них клиент запрашивает JSON со сжатием gzip
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+MSGPACK_MEDIA_TYPES = ("application/msgpack", "application/x-msgpack")
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+class AgentClient:
+    """Клиент для обращения к API sidecar-агентов"""
+
+    @staticmethod
+    def base_url(host: Host) -> str:
+        """Базовый URL агента на хосте"""
+        return f"http://{host.address}:{host.port}"
+
+    @staticmethod
+    def default_headers() -> Dict[str, str]:
+        """Заголовки согласования формата (предпочитаем msgpack и zstd, если они доступны) и токен агента"""
+        if msgpack is not None:
+            accept = f"{MSGPACK_MEDIA_TYPES[0]}, application/json;q=0.9"
+        else:
+            accept = "application/json"
+        accept_encoding = "zstd, gzip" if zstandard is not None else "gzip"
+        headers = {"Accept": accept, "Accept-Encoding": accept_encoding}
+        if settings.AGENT_API_TOKEN:
+            headers["Authorization"] = f"Bearer {settings.AGENT_API_TOKEN}"
+        return headers
+
+    @staticmethod
+    async def request(
+        host: Host,
+        method: str,
+        path: str,
+        timeout: float = 10.0,
+        probe: bool = False,
+        **kwargs: Any
+    ) -> httpx.Response:
+        """Выполнение запроса к агенту с согласованием формата ответа
+
+        Если цепь хоста разомкнута (app.core.host_health), запрос не отправляется: сразу
+        выбрасывается AgentUnavailableError (httpx.TransportError). Проверки доступности (probe)
+        отправляются всегда. Цепь ведут результаты проверок (события host_health); только если
+        проверки выключены, ее ведут сами запросы: ответ не с 5xx замыкает цепь, ошибка соединения
+        учитывается в ней.
+        """
+        if not probe:
+            ensure_available(host.id)
+        track = not probe and not settings.HOST_PROBE_ENABLED
+        headers = AgentClient.default_headers()
+        headers.update(kwargs.pop("headers", None) or {})
+
+        started = time.perf_counter()
+        outcome = "error"
+        with start_span(f"agent {method} {normalize_agent_path(path)}", {"host_id": host.id}) as span:
+            # Передаем контекст трассировки агенту
+            headers["traceparent"] = span.traceparent()
+            try:
+                async with httpx.AsyncClient() as client:
+                    response = await client.request(
+                        method,
+                        f"{AgentClient.base_url(host)}{path}",
+                        headers=headers,
+                        timeout=httpx.Timeout(timeout, connect=min(timeout, settings.AGENT_CONNECT_TIMEOUT_SECONDS)),
+                        **kwargs
+                    )
+                    outcome = str(response.status_code)
+                    # 5xx — агент отвечает, но запрос не выполнен: это не подтверждает его работу
+                    if track and response.status_code < 500:
+                        health_of(host.id).record_success()
+                    span.set_attribute("http.status_code", response.status_code)
+                    response.raise_for_status()
+                    return response
+            except (httpx.ConnectError, httpx.ConnectTimeout) as e:
+                # Агент не принимает соединения; долгий ответ (ReadTimeout) выявляют проверки доступности
+                outcome = "timeout" if isinstance(e, httpx.TimeoutException) else "error"
+                if track:
+                    health_of(host.id).record_failure(str(e) or type(e).__name__)
+                raise
+            except httpx.TimeoutException:
+                outcome = "timeout"
+                raise
+            finally:
+                AGENT_REQUEST_DURATION_SECONDS.labels(
+                    host.id,
+                    method,
+                    normalize_agent_path(path),
+                    outcome
+                ).observe(time.perf_counter() - started)
+
+    @staticmethod
+    def decode(response: httpx.Response) -> Any:
+        """Декодирование тела ответа агента (msgpack или JSON, zstd или gzip)"""
+        content = response.content
+
+        # httpx сам распаковывает gzip; zstd поддерживается не во всех версиях,
+        # поэтому распаковываем его вручную, если тело еще сжато
+        content_encoding = response.headers.get("content-encoding", "").lower()
+        if "zstd" in content_encoding and content[:4] == ZSTD_MAGIC:
+            if zstandard is None:
+                raise ValueError("Agent responded with zstd, but zstandard is not installed")
+            content = zstandard.ZstdDecompressor().decompressobj().decompress(content)
+
+        content_type = response.headers.get("content-type", "").split(";")[0].strip().lower()
+        if content_type in MSGPACK_MEDIA_TYPES:
+            if msgpack is None:
+                raise ValueError("Agent responded with msgpack, but msgpack is not installed")
+            return msgpack.unpackb(content, raw=False)
+
+        return json.loads(content)
+
+    @staticmethod
+    async def get(host: Host, path: str, timeout: float = 10.0, **kwargs: Any) -> Any:
+        """GET-запрос к агенту с декодированием ответа"""
+        response = await AgentClient.request(host, "GET", path, timeout=timeout, **kwargs)
+        AGENT_RESPONSE_BYTES.labels(normalize_agent_path(path)).observe(len(response.content))
+        logger.debug(
+            f"Agent {host.name} responded {path} with {len(response.content)} bytes "
+            f"({response.headers.get('content-type')}, {response.headers.get('content-encoding', 'identity')})"
+        )
+        return AgentClient.decode(response)
+
+    @staticmethod
+    async def post(host: Host, path: str, timeout: float = 30.0, **kwargs: Any) -> Any:
+        """POST-запрос к агенту с декодированием ответа"""
+        response = await AgentClient.request(host, "POST", path, timeout=timeout, **kwargs)
+        return AgentClient.decode(response)
+
+    @staticmethod
+    async def delete(host: Host, path: str, timeout: float = 10.0, **kwargs: Any) -> Any:
+        """DELETE-запрос к агенту с декодированием ответа"""
+        response = await AgentClient.request(host, "DELETE", path, timeout=timeout, **kwargs)
+        return AgentClient.decode(response)
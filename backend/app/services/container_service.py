@@ -1,23 +1,30 @@
+import asyncio
+from datetime import datetime
 from typing import List, Optional, Dict, Any
 import httpx
 from sqlalchemy.orm import Session
 from loguru import logger
 
 from app.core.config import settings
+from app.core.events import event_bus
+from app.core.host_health import AgentUnavailableError, health_of
+from app.core.metrics import CONTAINER_POLLS
+from app.db.base import SessionLocal
+from app.db.leader import run_as_leader
 from app.models.models import Container, Host, ContainerStatus
 from app.schemas.container import ContainerCreate
+from app.services.agent_client import AgentClient
 
 class ContainerService:
     @staticmethod
     async def get_containers_from_host(host: Host) -> List[Dict[str, Any]]:
         """Получение списка контейнеров с удаленного хоста через его API"""
         try:
-            async with httpx.AsyncClient() as client:
-                url = f"http://{host.address}:{host.port}/containers"
-                logger.info(f"Fetching containers from host {host.name} at {url}")
-                response = await client.get(url, timeout=10.0)
-                response.raise_for_status()
-                return response.json()
+            logger.info(f"Fetching containers from host {host.name} at {AgentClient.base_url(host)}")
+            return await AgentClient.get(host, "/containers", timeout=10.0)
+        except AgentUnavailableError as e:
+            logger.warning(f"Skipping containers of {host.name}: {str(e)}")
+            return []
         except httpx.HTTPError as e:
             logger.error(f"HTTP error fetching containers from {host.name}: {str(e)}")
             return []
@@ -102,4 +109,79 @@ class ContainerService:
         db.commit()
         db.refresh(db_container)
         logger.info(f"Updated container status: {container_id} to {status.value}")
-        return db_container 
+        return db_container
+    
+    @staticmethod
+    def diff_containers(current: Dict[str, Container], containers_data: List[Dict[str, Any]]) -> Dict[str, List[str]]:
+        """Изменения контейнеров хоста относительно базы: добавленные, удаленные и измененные (имя, образ)"""
+        reported = {container_data["id"]: container_data for container_data in containers_data}
+        return {
+            "added": [container_id for container_id in reported if container_id not in current],
+            "removed": [container_id for container_id in current if container_id not in reported],
+            "changed": [
+                container_id for container_id, container_data in reported.items()
+                if container_id in current and (
+                    current[container_id].name != container_data["name"]
+                    or current[container_id].image != container_data["image"]
+                )
+            ],
+        }
+    
+    @staticmethod
+    def sync_and_publish(db: Session, host: Host, containers_data: List[Dict[str, Any]]) -> List[Container]:
+        """Синхронизация контейнеров хоста и публикация события container_update с изменениями"""
+        current = {c.container_id: c for c in ContainerService.get_containers_by_host(db, host.id)}
+        diff = ContainerService.diff_containers(current, containers_data)
+        containers = ContainerService.sync_containers(db, host.id, containers_data)
+        event_bus.publish(db, "container_update", {
+            "host_id": host.id,
+            "host_name": host.name,
+            "updated_at": datetime.utcnow().isoformat(),
+            "container_count": len(containers),
+            **diff,
+        })
+        db.commit()
+        return containers
+    
+    @staticmethod
+    async def poll_hosts() -> int:
+        """Один обход всех хостов: запросы к агентам параллельно, запись в базу по очереди"""
+        db = SessionLocal()
+        try:
+            hosts = db.query(Host).all()
+            # Недоступные агенты не опрашиваются до следующей проверки доступности
+            available = [host for host in hosts if health_of(host.id).due()]
+            CONTAINER_POLLS.labels("skipped").inc(len(hosts) - len(available))
+            hosts = available
+            semaphore = asyncio.Semaphore(settings.CONTAINER_POLL_CONCURRENCY)
+            
+            async def fetch(host: Host) -> List[Dict[str, Any]]:
+                async with semaphore:
+                    return await ContainerService.get_containers_from_host(host)
+            
+            results = await asyncio.gather(*(fetch(host) for host in hosts))
+            polled = 0
+            for host, containers_data in zip(hosts, results):
+                # Пустой ответ — ошибка запроса к агенту: контейнеры хоста не удаляются
+                if not containers_data:
+                    CONTAINER_POLLS.labels("error").inc()
+                    continue
+                try:
+                    ContainerService.sync_and_publish(db, host, containers_data)
+                    CONTAINER_POLLS.labels("ok").inc()
+                    polled += 1
+                except Exception as e:
+                    db.rollback()
+                    CONTAINER_POLLS.labels("error").inc()
+                    logger.error(f"Error syncing containers for host {host.id}: {str(e)}")
+            return polled
+        finally:
+            db.close()
+    
+    @staticmethod
+    async def run_poller() -> None:
+        """Фоновое задание: опрос контейнеров всех хостов каждые CONTAINER_POLL_INTERVAL_SECONDS
+        
+        Опрашивает один процесс из всех воркеров и реплик, остальные получают изменения событиями.
+        """
+        await run_as_leader("container-poller", settings.CONTAINER_POLL_INTERVAL_SECONDS, ContainerService.poll_hosts)
@@ -0,0 +1,159 @@
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from loguru import logger
+from sqlalchemy import delete, distinct, func, insert, literal, select, tuple_
+from sqlalchemy.orm import Session
+
+from app.db.base import SessionLocal, try_advisory_lock
+from app.db.partitioning import vulnerability_partition_filter
+from app.models.models import Container, CveExposure, Host, ScanHistory, Vulnerability, ScanStatus as ModelScanStatus
+
+class ExposureService:
+    """Сервис обратного индекса CVE → контейнеры
+    
+    Для каждого контейнера хранятся уязвимости его последнего завершенного сканирования,
+    поэтому вопрос «кого затрагивает CVE» решается по индексу без обхода истории.
+    """
+    
+    @staticmethod
+    def refresh_container(db: Session, db_scan: ScanHistory) -> Optional[int]:
+        """Замена строк контейнера уязвимостями сканирования db_scan (без commit)
+        
+        Возвращает число строк или None, если сканирование не последнее или контейнер удален.
+        """
+        # Блокировка строки контейнера: одновременно завершившиеся сканирования обновляют индекс по очереди
+        container = db.query(Container).filter(
+            Container.container_id == db_scan.container_id,
+            Container.host_id == db_scan.host_id
+        ).with_for_update().first()
+        if container is None:
+            return None
+        
+        newer = db.query(ScanHistory.scan_id).filter(
+            ScanHistory.host_id == db_scan.host_id,
+            ScanHistory.container_id == db_scan.container_id,
+            ScanHistory.status == ModelScanStatus.COMPLETED,
+            ScanHistory.started_at > db_scan.started_at
+        ).first()
+        if newer is not None:
+            # Результаты старого сканирования пришли позже нового: индекс уже актуален
+            return None
+        
+        db.execute(delete(CveExposure).where(
+            CveExposure.host_id == db_scan.host_id,
+            CveExposure.container_id == db_scan.container_id
+        ))
+        
+        # Одна строка на пару (CVE, пакет), даже если пакет найден в образе несколько раз
+        pkg_name = func.coalesce(Vulnerability.pkg_name, "")
+        rows = select(
+            literal(db_scan.host_id),
+            literal(db_scan.container_id),
+            Vulnerability.cve_id,
+            pkg_name,
+            literal(container.image),
+            Vulnerability.pkg_version,
+            Vulnerability.fixed_version,
+            Vulnerability.severity,
+            Vulnerability.scan_id,
+            Vulnerability.scanned_at
+        ).where(
+            Vulnerability.scan_id == db_scan.scan_id,
+            vulnerability_partition_filter(db_scan.started_at)
+        ).distinct(Vulnerability.cve_id, pkg_name).order_by(Vulnerability.cve_id, pkg_name, Vulnerability.pkg_version)
+        
+        result = db.execute(insert(CveExposure).from_select([
+            "host_id", "container_id", "cve_id", "pkg_name", "image", "pkg_version",
+            "fixed_version", "severity", "scan_id", "scanned_at"
+        ], rows))
+        return result.rowcount
+    
+    @staticmethod
+    def get_affected(
+        db: Session,
+        cve_id: str,
+        pkg_name: Optional[str] = None,
+        skip: int = 0,
+        limit: int = 100
+    ) -> Tuple[Dict[str, int], List[Any], bool]:
+        """Контейнеры, последнее сканирование которых содержит CVE: счетчики, страница строк и has_more"""
+        conditions = [CveExposure.cve_id == cve_id.strip().upper()]
+        if pkg_name is not None:
+            conditions.append(CveExposure.pkg_name == pkg_name)
+        
+        counts = db.query(
+            func.count(distinct(tuple_(CveExposure.host_id, CveExposure.container_id))),
+            func.count(distinct(CveExposure.host_id)),
+            func.count(distinct(CveExposure.image))
+        ).filter(*conditions).one()
+        
+        query = db.query(CveExposure, Host.name, Container.name).join(Host, Host.id == CveExposure.host_id)
+        query = query.join(Container, (Container.host_id == CveExposure.host_id) & (Container.container_id == CveExposure.container_id))
+        query = query.filter(*conditions).order_by(CveExposure.host_id, CveExposure.container_id, CveExposure.pkg_name)
+        rows = query.offset(skip).limit(limit + 1).all()
+        
+        summary = {"containers": counts[0], "hosts": counts[1], "images": counts[2]}
+        return summary, rows[:limit], len(rows) > limit
+    
+    @staticmethod
+    def count_containers(db: Session, cve_ids: Any, pkg_name: Optional[str] = None) -> int:
+        """Число контейнеров, затронутых любой из CVE (список или подзапрос)"""
+        query = db.query(func.count(distinct(tuple_(CveExposure.host_id, CveExposure.container_id))))
+        query = query.filter(CveExposure.cve_id.in_(cve_ids))
+        if pkg_name is not None:
+            query = query.filter(CveExposure.pkg_name == pkg_name)
+        return query.scalar() or 0
+    
+    @staticmethod
+    def get_containers(db: Session, cve_ids: Any, pkg_name: Optional[str] = None) -> List[Any]:
+        """Строки (host_id, container_id, пакет, имя и образ контейнера) для контейнеров, затронутых любой из CVE"""
+        query = db.query(
+            CveExposure.host_id,
+            CveExposure.container_id,
+            CveExposure.pkg_name,
+            Container.name,
+            Container.image
+        ).join(Container, (Container.host_id == CveExposure.host_id) & (Container.container_id == CveExposure.container_id))
+        query = query.filter(CveExposure.cve_id.in_(cve_ids))
+        if pkg_name is not None:
+            query = query.filter(CveExposure.pkg_name == pkg_name)
+        return query.order_by(CveExposure.host_id, Container.name, CveExposure.pkg_name).all()
+    
+    @staticmethod
+    def rebuild(db: Session) -> int:
+        """Построение индекса по последнему завершенному сканированию каждого контейнера"""
+        query = db.query(ScanHistory).filter(ScanHistory.status == ModelScanStatus.COMPLETED)
+        query = query.distinct(ScanHistory.host_id, ScanHistory.container_id)
+        latest = query.order_by(ScanHistory.host_id, ScanHistory.container_id, ScanHistory.started_at.desc()).all()
+        
+        rows = 0
+        for db_scan in latest:
+            # Короткая транзакция на контейнер: сканирования других контейнеров не ждут перестроения
+            rows += ExposureService.refresh_container(db, db_scan) or 0
+            db.commit()
+        return rows
+    
+    @staticmethod
+    def rebuild_if_empty() -> None:
+        """Первичное заполнение индекса в существующей базе (один процесс, под advisory lock)"""
+        db = SessionLocal()
+        try:
+            with try_advisory_lock(db, "cve-exposures-rebuild") as acquired:
+                if not acquired or db.query(CveExposure.cve_id).first() is not None:
+                    return
+                if db.query(ScanHistory.scan_id).filter(ScanHistory.status == ModelScanStatus.COMPLETED).first() is None:
+                    return
+                
+                started = time.perf_counter()
+                rows = ExposureService.rebuild(db)
+                logger.info(f"Built CVE exposure index: {rows} rows in {time.perf_counter() - started:.1f}s")
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error building CVE exposure index: {str(e)}")
+        finally:
+            db.close()
+    
+    @staticmethod
+    async def build_on_startup() -> None:
+        await asyncio.to_thread(ExposureService.rebuild_if_empty)
@@ -0,0 +1,91 @@
+import asyncio
+import time
+from typing import Any, Dict, List
+from loguru import logger
+
+from app.core.config import settings
+from app.core.events import event_bus
+from app.core.host_health import CLOSED, health_of
+from app.core.metrics import HOST_PROBES
+from app.db.base import SessionLocal
+from app.db.leader import run_as_leader
+from app.models.models import Host
+from app.services.agent_client import AgentClient
+
+class HostHealthService:
+    """Проверки доступности агентов хостов
+    
+    Агенты проверяет один процесс (GET /health/live с коротким таймаутом), результаты расходятся
+    событиями host_health и применяются к реестру доступности (app.core.host_health) каждого процесса.
+    """
+    
+    @staticmethod
+    def get_health(host_id: str) -> Dict[str, Any]:
+        """Состояние агента хоста в этом процессе"""
+        return health_of(host_id).to_dict()
+    
+    @staticmethod
+    async def probe(host: Host) -> Dict[str, Any]:
+        """Одна проверка агента: задержка ответа или ошибка"""
+        started = time.perf_counter()
+        try:
+            await AgentClient.get(host, "/health/live", timeout=settings.HOST_PROBE_TIMEOUT_SECONDS, probe=True)
+            HOST_PROBES.labels("ok").inc()
+            return {"host_id": host.id, "ok": True, "latency_ms": (time.perf_counter() - started) * 1000, "error": None}
+        except Exception as e:
+            HOST_PROBES.labels("error").inc()
+            return {"host_id": host.id, "ok": False, "latency_ms": None, "error": str(e) or type(e).__name__}
+    
+    @staticmethod
+    async def probe_hosts() -> int:
+        """Проверка агентов всех хостов; хосты с разомкнутой цепью — только после паузы"""
+        db = SessionLocal()
+        try:
+            hosts = [host for host in db.query(Host).all() if health_of(host.id).due()]
+        finally:
+            db.close()
+        
+        semaphore = asyncio.Semaphore(settings.HOST_PROBE_CONCURRENCY)
+        
+        async def probe(host: Host) -> Dict[str, Any]:
+            async with semaphore:
+                return await HostHealthService.probe(host)
+        
+        results: List[Dict[str, Any]] = await asyncio.gather(*(probe(host) for host in hosts))
+        
+        db = SessionLocal()
+        try:
+            for result in results:
+                event_bus.publish(db, "host_health", result)
+            db.commit()
+        finally:
+            db.close()
+        return len(results)
+    
+    @staticmethod
+    def apply(data: Dict[str, Any]) -> None:
+        """Применение результата проверки к реестру доступности процесса"""
+        health = health_of(data["host_id"])
+        was_open = health.state != CLOSED
+        if data["ok"]:
+            health.record_success(data["latency_ms"])
+            if was_open:
+                logger.info(f"Agent of host {data['host_id']} is available again")
+        else:
+            health.record_failure(data["error"], checked=True)
+            if not was_open and health.state != CLOSED:
+                logger.warning(f"Agent of host {data['host_id']} is unavailable: {data['error']}")
+    
+    @staticmethod
+    async def run_listener() -> None:
+        """Фоновое задание: прием результатов проверок от ведущего процесса"""
+        with event_bus.subscribe(["host_health"]) as subscription:
+            while True:
+                event = await subscription.get()
+                if event["type"] == "host_health":
+                    HostHealthService.apply(event["data"])
+    
+    @staticmethod
+    async def run_prober() -> None:
+        """Фоновое задание: проверка агентов каждые HOST_PROBE_INTERVAL_SECONDS (один процесс из всех)"""
+        await run_as_leader("host-prober", settings.HOST_PROBE_INTERVAL_SECONDS, HostHealthService.probe_hosts)
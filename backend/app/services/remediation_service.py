@@ -1,18 +1,83 @@
+from sqlalchemy import delete, func, select
 from sqlalchemy.orm import Session
-import os
-from typing import Optional, Dict, Any, List
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Optional, Dict, Any, List, Tuple
+import httpx
+from loguru import logger
 
-from app.models.models import ScanHistory, Vulnerability, Container
+from app.core.config import settings
+from app.core.metrics import (
+    REMEDIATION_BATCH_DURATION_SECONDS,
+    REMEDIATION_CONTAINER_DURATION_SECONDS,
+    REMEDIATION_EXECUTIONS,
+    REMEDIATION_RUNNING,
+)
+from app.db.base import SessionLocal, try_advisory_lock
+from app.db.leader import run_as_leader
+from app.db.partitioning import vulnerability_partition_filter
+from app.models.models import (
+    ScanHistory,
+    Vulnerability,
+    Container,
+    CveExposure,
+    Host,
+    RemediationExecution,
+    RemediationStep,
+    RemediationStatus,
+)
+from app.services.agent_client import AgentClient
+from app.services.exposure_service import ExposureService
+from app.services.timing_service import REMEDIATION_KIND, TimingService
+
+# Стратегии исправления. estimated_time (в секундах) — оценка для одного контейнера,
+# пока по стратегии не накоплено TIMING_MIN_SAMPLES измерений
+REMEDIATION_STRATEGIES = {
+    "hot-patch": {
+        "name": "Hot Patch",
+        "description": "Применение патча без перезапуска контейнера",
+        "estimated_time": 60,
+    },
+    "rolling-update": {
+        "name": "Rolling Update",
+        "description": "Обновление контейнеров по одному, с минимизацией простоя",
+        "estimated_time": 180,
+    },
+    "restart": {
+        "name": "Restart",
+        "description": "Полная остановка и перезапуск контейнера с обновленным образом",
+        "estimated_time": 120,
+    },
+}
+
+# Действие агента для каждой стратегии: пересоздание из обновленного образа или обновление пакетов на месте
+STRATEGY_ACTIONS = {
+    "hot-patch": "patch",
+    "rolling-update": "recreate",
+    "restart": "recreate",
+}
+
+ACTIVE_STATUSES = (RemediationStatus.PENDING, RemediationStatus.RUNNING)
+
+class RemediationConflictError(ValueError):
+    """Контейнеры уже исправляются другим запуском"""
 
 class RemediationService:
     def __init__(self, db: Session):
         self.db = db
-        self._parallelism = int(os.getenv("REMEDIATION_PARALLELISM", "2"))
+        self._parallelism = settings.REMEDIATION_PARALLELISM
     
     def get_parallelism(self) -> int:
         """Получить параметр параллелизма для применения исправлений"""
         return self._parallelism
     
+    def get_batch_size(self, strategy: str, parallelism: Optional[int] = None) -> int:
+        """Число контейнеров в одной партии: rolling-update обновляет контейнеры по одному"""
+        if strategy == "rolling-update":
+            return 1
+        return max(parallelism or self._parallelism, 1)
+    
     def get_affected_containers_count(
         self, 
         scan_id: str, 
@@ -21,6 +86,9 @@ class RemediationService:
         """
         Получить количество контейнеров, затрагиваемых конкретной уязвимостью или 
         всеми уязвимостями в сканировании
+        
+        Контейнеры считаются по обратному индексу CVE → контейнеры (последние сканирования
+        всего парка). Контейнер самого сканирования учитывается всегда.
         """
         # Если указан ID уязвимости, считаем контейнеры, затронутые только этой уязвимостью
         if vulnerability_id:
@@ -31,9 +99,13 @@ class RemediationService:
             
             if not vulnerability:
                 return 0
-                
-            # Для простоты считаем, что это один контейнер
-            return 1
+            
+            affected = ExposureService.count_containers(
+                self.db,
+                [vulnerability.cve_id],
+                pkg_name=vulnerability.pkg_name or ""
+            )
+            return max(affected, 1)
         else:
             # Если ID уязвимости не указан, считаем все контейнеры, затронутые сканированием
             scan = self.db.query(ScanHistory).filter(
@@ -42,25 +114,68 @@ class RemediationService:
             
             if not scan:
                 return 0
-                
-            # Для простоты считаем, что это один контейнер
-            # В реальном приложении здесь должна быть логика агрегации уязвимых контейнеров
-            return 1
+            
+            # Контейнеры парка, в последнем сканировании которых есть хотя бы одна CVE этого сканирования
+            affected = ExposureService.count_containers(self.db, self._scan_cve_ids(scan))
+            return max(affected, 1)
     
-    def apply_remediation(
-        self, 
-        scan_id: str, 
-        vulnerability_id: Optional[str] = None,
-        strategy: str = "restart"
-    ) -> Dict[str, Any]:
+    def _scan_cve_ids(self, scan: ScanHistory) -> Any:
+        """Подзапрос идентификаторов CVE, найденных сканированием"""
+        cve_ids = self.db.query(Vulnerability.cve_id).filter(
+            Vulnerability.scan_id == scan.scan_id,
+            vulnerability_partition_filter(scan.started_at)
+        ).distinct().subquery()
+        return select(cve_ids.c.cve_id)
+    
+    def get_targets(
+        self,
+        scan: ScanHistory,
+        container: Container,
+        vulnerability: Optional[Vulnerability] = None
+    ) -> List[Dict[str, Any]]:
         """
-        Применить стратегию исправления к уязвимости или всем уязвимостям в сканировании
+        Контейнеры для исправления с уязвимыми пакетами каждого
         
-        Стратегии:
-        - hot-patch: применение патча без перезапуска
-        - rolling-update: обновление контейнеров по одному
-        - restart: остановка и перезапуск с обновленным образом
+        Те же контейнеры, что учитываются в get_affected_containers_count. Если индекс
+        не знает ни одного (например, CVE уже исправлена), исправляется контейнер сканирования.
         """
+        if vulnerability is not None:
+            rows = ExposureService.get_containers(self.db, [vulnerability.cve_id], pkg_name=vulnerability.pkg_name or "")
+        else:
+            rows = ExposureService.get_containers(self.db, self._scan_cve_ids(scan))
+        
+        targets: Dict[Any, Dict[str, Any]] = {}
+        for host_id, container_id, pkg_name, name, image in rows:
+            target = targets.setdefault((host_id, container_id), {
+                "host_id": host_id,
+                "container_id": container_id,
+                "container_name": name,
+                "image": image,
+                "packages": []
+            })
+            if pkg_name and pkg_name not in target["packages"]:
+                target["packages"].append(pkg_name)
+        
+        if targets:
+            return list(targets.values())
+        
+        query = self.db.query(Vulnerability.pkg_name).filter(
+            Vulnerability.scan_id == scan.scan_id,
+            vulnerability_partition_filter(scan.started_at),
+            Vulnerability.pkg_name.isnot(None)
+        )
+        if vulnerability is not None:
+            query = query.filter(Vulnerability.id == vulnerability.id)
+        return [{
+            "host_id": container.host_id,
+            "container_id": container.container_id,
+            "container_name": container.name,
+            "image": container.image,
+            "packages": sorted(row[0] for row in query.distinct())
+        }]
+    
+    def _get_scope(self, scan_id: str, vulnerability_id: Optional[str] = None) -> Tuple[ScanHistory, Container, Optional[Vulnerability]]:
+        """Сканирование, его контейнер и уязвимость, по которым выбираются контейнеры для исправления"""
         # Находим сканирование
         scan = self.db.query(ScanHistory).filter(
             ScanHistory.scan_id == scan_id
@@ -78,6 +193,145 @@ class RemediationService:
         if not container:
             raise ValueError(f"Container {scan.container_id} not found")
         
+        vulnerability = None
+        if vulnerability_id:
+            vulnerability = self.db.query(Vulnerability).filter(
+                Vulnerability.id == vulnerability_id,
+                Vulnerability.scan_id == scan_id
+            ).first()
+            
+            if not vulnerability:
+                raise ValueError(f"Vulnerability {vulnerability_id} not found in scan {scan_id}")
+        
+        return scan, container, vulnerability
+    
+    def estimate_downtime(
+        self,
+        scan_id: str,
+        vulnerability_id: Optional[str] = None,
+        strategy: str = "restart",
+        parallelism: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Оценка простоя при исправлении (p50 и p95) для тех же партий, что создаст apply_remediation
+        
+        Для каждого контейнера берутся процентили простоя (от остановки до запуска нового контейнера,
+        без загрузки образа) в прошлых исправлениях этой стратегии: по образу на его хосте,
+        по образу на всех хостах или по всему парку, а без истории — estimated_time стратегии.
+        Простой партии — простой ее самого долгого контейнера.
+        """
+        if strategy not in STRATEGY_ACTIONS:
+            raise ValueError(f"Unknown strategy: {strategy}")
+        
+        scan, container, vulnerability = self._get_scope(scan_id, vulnerability_id)
+        targets = self.get_targets(scan, container, vulnerability)
+        batch_size = self.get_batch_size(strategy, parallelism)
+        histograms = TimingService.get_histograms(
+            self.db, REMEDIATION_KIND, strategy, {target["image"] for target in targets}
+        )
+        default_ms = REMEDIATION_STRATEGIES[strategy]["estimated_time"] * 1000
+        
+        p50_ms = p95_ms = 0.0
+        levels: Dict[str, int] = {}
+        for start in range(0, len(targets), batch_size):
+            batch_p50 = batch_p95 = 0.0
+            for target in targets[start:start + batch_size]:
+                stats, level = TimingService.estimate(histograms, target["image"], target["host_id"])
+                levels[level] = levels.get(level, 0) + 1
+                batch_p50 = max(batch_p50, stats["p50_ms"] if stats else default_ms)
+                batch_p95 = max(batch_p95, stats["p95_ms"] if stats else default_ms)
+            p50_ms += batch_p50
+            p95_ms += batch_p95
+        
+        if "default" not in levels:
+            source = "history"
+        elif len(levels) == 1:
+            source = "default"
+        else:
+            source = "mixed"
+        
+        return {
+            "estimated_time": round(p50_ms / 1000),
+            "estimated_time_p95": round(p95_ms / 1000),
+            "affected_containers": len(targets),
+            "batches": (len(targets) + batch_size - 1) // batch_size,
+            "parallelism": batch_size,
+            "strategy": REMEDIATION_STRATEGIES[strategy]["name"],
+            "source": source,
+            "levels": levels
+        }
+    
+    def apply_remediation(
+        self, 
+        scan_id: str, 
+        vulnerability_id: Optional[str] = None,
+        strategy: str = "restart",
+        parallelism: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Применить стратегию исправления к уязвимости или всем уязвимостям в сканировании
+        
+        Стратегии:
+        - hot-patch: применение патча без перезапуска
+        - rolling-update: обновление контейнеров по одному
+        - restart: остановка и перезапуск с обновленным образом
+        
+        Создает запуск исправления: затронутые контейнеры разбиваются на партии по parallelism.
+        Сам запуск выполняет run_execution (в фоне).
+        """
+        if strategy not in STRATEGY_ACTIONS:
+            raise ValueError(f"Unknown strategy: {strategy}")
+        
+        scan, container, vulnerability = self._get_scope(scan_id, vulnerability_id)
+        
+        targets = self.get_targets(scan, container, vulnerability)
+        
+        # Один контейнер не исправляется двумя запусками одновременно
+        busy = self.db.query(RemediationStep.container_id).join(RemediationExecution).filter(
+            RemediationExecution.status.in_(ACTIVE_STATUSES),
+            RemediationStep.status.in_(ACTIVE_STATUSES),
+            RemediationStep.container_id.in_([target["container_id"] for target in targets])
+        ).first()
+        if busy:
+            raise RemediationConflictError(f"Container {busy[0]} is already being remediated")
+        
+        action = STRATEGY_ACTIONS[strategy]
+        batch_size = self.get_batch_size(strategy, parallelism)
+        execution = RemediationExecution(
+            strategy=strategy,
+            scan_id=scan_id,
+            vulnerability_id=vulnerability_id,
+            cve_id=vulnerability.cve_id if vulnerability else None,
+            parallelism=batch_size,
+            status=RemediationStatus.PENDING,
+            total=len(targets)
+        )
+        for i, target in enumerate(targets):
+            step = RemediationStep(
+                batch=i // batch_size + 1,
+                host_id=target["host_id"],
+                container_id=target["container_id"],
+                container_name=target["container_name"],
+                image=target["image"],
+                action=action,
+                packages=target["packages"] if action == "patch" else None,
+                status=RemediationStatus.PENDING
+            )
+            if action == "patch" and not target["packages"]:
+                # Обновить на месте можно только пакеты, которые известны Trivy
+                step.status = RemediationStatus.SKIPPED
+                step.message = "No package to upgrade in place"
+            execution.steps.append(step)
+        
+        self.db.add(execution)
+        self.db.commit()
+        
+        batches = (len(targets) + batch_size - 1) // batch_size
+        logger.info(
+            f"Created remediation {execution.id}: {strategy} for {len(targets)} containers "
+            f"in {batches} batches of {batch_size}"
+        )
+        
         # Собираем данные для отчета
         result = {
             "scan_id": scan_id,
@@ -85,24 +339,327 @@ class RemediationService:
             "container_name": container.name,
             "strategy": strategy,
             "status": "scheduled",
-            "message": f"Remediation using {strategy} strategy has been scheduled"
+            "message": f"Remediation using {strategy} strategy has been scheduled",
+            "execution_id": execution.id,
+            "containers": len(targets),
+            "batches": batches,
+            "parallelism": batch_size
         }
         
         # Добавляем информацию о конкретной уязвимости, если указана
-        if vulnerability_id:
-            vulnerability = self.db.query(Vulnerability).filter(
-                Vulnerability.id == vulnerability_id,
-                Vulnerability.scan_id == scan_id
-            ).first()
+        if vulnerability:
+            result["vulnerability"] = {
+                "id": vulnerability.id,
+                "cve_id": vulnerability.cve_id,
+                "severity": vulnerability.severity
+            }
+        
+        return result
+    
+    def get_executions(self, skip: int = 0, limit: int = 100) -> List[RemediationExecution]:
+        """Журнал запусков исправления, новые первыми"""
+        query = self.db.query(RemediationExecution).order_by(RemediationExecution.created_at.desc())
+        return query.offset(skip).limit(limit).all()
+    
+    def get_execution(self, execution_id: str) -> Optional[Dict[str, Any]]:
+        """Запуск исправления с партиями и исправлением каждого контейнера"""
+        execution = self.db.query(RemediationExecution).filter(RemediationExecution.id == execution_id).first()
+        if not execution:
+            return None
+        
+        succeeded = sum(1 for step in execution.steps if step.status == RemediationStatus.COMPLETED)
+        failed = sum(1 for step in execution.steps if step.status == RemediationStatus.FAILED)
+        return {
+            **{column.name: getattr(execution, column.name) for column in RemediationExecution.__table__.columns},
+            "succeeded": succeeded,
+            "failed": failed,
+            "batches": self.summarize_batches(execution.steps),
+            "steps": execution.steps
+        }
+    
+    @staticmethod
+    def summarize_batches(steps: List[RemediationStep]) -> List[Dict[str, Any]]:
+        """Время и итог каждой партии по записям контейнеров"""
+        batches: Dict[int, List[RemediationStep]] = {}
+        for step in steps:
+            batches.setdefault(step.batch, []).append(step)
+        
+        summary = []
+        for batch, batch_steps in sorted(batches.items()):
+            statuses = {step.status for step in batch_steps}
+            started = [step.started_at for step in batch_steps if step.started_at]
+            finished = [step.finished_at for step in batch_steps if step.finished_at]
+            if RemediationStatus.FAILED in statuses:
+                status = RemediationStatus.FAILED
+            elif statuses & set(ACTIVE_STATUSES):
+                status = RemediationStatus.RUNNING if started else RemediationStatus.PENDING
+            elif statuses == {RemediationStatus.SKIPPED}:
+                status = RemediationStatus.SKIPPED
+            else:
+                status = RemediationStatus.COMPLETED
+            
+            done = status not in ACTIVE_STATUSES and started and finished
+            summary.append({
+                "batch": batch,
+                "status": status,
+                "containers": len(batch_steps),
+                "succeeded": sum(1 for step in batch_steps if step.status == RemediationStatus.COMPLETED),
+                "failed": sum(1 for step in batch_steps if step.status == RemediationStatus.FAILED),
+                "started_at": min(started) if started else None,
+                "finished_at": max(finished) if done else None,
+                "duration_ms": (max(finished) - min(started)).total_seconds() * 1000 if done else None
+            })
+        return summary
+    
+    def request_abort(self, execution_id: str) -> Optional[RemediationExecution]:
+        """Остановка запуска перед следующей партией (контейнеры текущей партии дорабатывают)"""
+        execution = self.db.query(RemediationExecution).filter(RemediationExecution.id == execution_id).first()
+        if not execution:
+            return None
+        if execution.status not in ACTIVE_STATUSES:
+            raise RemediationConflictError(f"Remediation {execution_id} is already {execution.status.value}")
+        
+        execution.abort_requested = True
+        self.db.commit()
+        logger.info(f"Abort requested for remediation {execution_id}")
+        return execution
+    
+    @staticmethod
+    async def run_execution(execution_id: str) -> None:
+        """Выполнение запуска: партии контейнеров по очереди, следующая — только если все исправлены
+        
+        Запуск выполняется одним процессом (advisory lock) и останавливается на первой партии с ошибкой:
+        оставшиеся контейнеры помечаются skipped.
+        """
+        db = SessionLocal()
+        try:
+            with try_advisory_lock(db, f"remediation:{execution_id}") as acquired:
+                if not acquired:
+                    return
+                
+                execution = db.query(RemediationExecution).filter(RemediationExecution.id == execution_id).first()
+                if execution is None or execution.status != RemediationStatus.PENDING:
+                    return
+                
+                REMEDIATION_RUNNING.inc()
+                heartbeat = asyncio.create_task(RemediationService._heartbeat(execution_id))
+                try:
+                    await RemediationService._run_batches(db, execution)
+                finally:
+                    heartbeat.cancel()
+                    REMEDIATION_RUNNING.dec()
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error running remediation {execution_id}: {str(e)}")
+            RemediationService._finish(db, execution_id, RemediationStatus.FAILED, str(e))
+        finally:
+            db.close()
+    
+    @staticmethod
+    async def _heartbeat(execution_id: str) -> None:
+        """Отметка жизни исполнителя, пока запуск выполняется (отдельная сессия: основная занята партией)"""
+        while True:
+            try:
+                await asyncio.to_thread(RemediationService._touch, execution_id)
+            except Exception as e:
+                logger.warning(f"Error updating heartbeat of remediation {execution_id}: {str(e)}")
+            await asyncio.sleep(settings.REMEDIATION_HEARTBEAT_SECONDS)
+    
+    @staticmethod
+    def _touch(execution_id: str) -> None:
+        db = SessionLocal()
+        try:
+            db.query(RemediationExecution).filter(RemediationExecution.id == execution_id).update(
+                {RemediationExecution.heartbeat_at: func.now()}, synchronize_session=False
+            )
+            db.commit()
+        finally:
+            db.close()
+    
+    @staticmethod
+    async def _run_batches(db: Session, execution: RemediationExecution) -> None:
+        execution.status = RemediationStatus.RUNNING
+        execution.started_at = datetime.utcnow()
+        db.commit()
+        
+        host_ids = {step.host_id for step in execution.steps}
+        hosts = {host.id: host for host in db.query(Host).filter(Host.id.in_(host_ids))}
+        batches = sorted({step.batch for step in execution.steps if step.status == RemediationStatus.PENDING})
+        
+        outcome = RemediationStatus.COMPLETED
+        error = None
+        for number, batch in enumerate(batches, start=1):
+            db.refresh(execution, ["abort_requested"])
+            if execution.abort_requested:
+                outcome = RemediationStatus.ABORTED
+                error = "Aborted by request"
+                break
             
-            if vulnerability:
-                result["vulnerability"] = {
-                    "id": vulnerability.id,
-                    "cve_id": vulnerability.cve_id,
-                    "severity": vulnerability.severity
-                }
+            steps = [step for step in execution.steps if step.batch == batch and step.status == RemediationStatus.PENDING]
+            for step in steps:
+                step.status = RemediationStatus.RUNNING
+                step.started_at = datetime.utcnow()
+            db.commit()
+            
+            started = time.perf_counter()
+            downtimes = await asyncio.gather(
+                *(RemediationService._run_step(hosts.get(step.host_id), step) for step in steps)
+            )
+            batch_seconds = time.perf_counter() - started
+            REMEDIATION_BATCH_DURATION_SECONDS.labels(execution.strategy).observe(batch_seconds)
+            
+            for step, downtime_ms in zip(steps, downtimes):
+                if step.status != RemediationStatus.COMPLETED:
+                    continue
+                # Простой контейнера по данным агента для оценок следующих запусков
+                # (нет, если контейнер не менялся: образ уже был актуален)
+                if downtime_ms is not None:
+                    TimingService.record(
+                        db, REMEDIATION_KIND, execution.strategy, step.image, step.host_id, downtime_ms
+                    )
+                # Пересозданные контейнеры больше не существуют: убираем их из индекса затронутых CVE
+                if step.new_container_id:
+                    db.execute(delete(CveExposure).where(
+                        CveExposure.host_id == step.host_id,
+                        CveExposure.container_id == step.container_id
+                    ))
+            db.commit()
+            
+            failed = [step for step in steps if step.status == RemediationStatus.FAILED]
+            logger.info(
+                f"Remediation {execution.id}: batch {number}/{len(batches)} finished in {batch_seconds:.1f}s "
+                f"({len(steps) - len(failed)} ok, {len(failed)} failed)"
+            )
+            if failed:
+                outcome = RemediationStatus.FAILED
+                error = f"Batch {batch} failed: {failed[0].container_name or failed[0].container_id}: {failed[0].message}"
+                break
+        
+        RemediationService._finish(db, execution.id, outcome, error)
+    
+    @staticmethod
+    async def _run_step(host: Optional[Host], step: RemediationStep) -> Optional[float]:
+        """Исправление одного контейнера агентом его хоста: запуск операции и опрос до завершения
+        
+        Возвращает простой контейнера в мс, измеренный агентом (None, если он неизвестен).
+        """
+        started = time.perf_counter()
+        downtime_ms = None
+        try:
+            if host is None:
+                raise ValueError(f"Host {step.host_id} not found")
+            
+            operation = await AgentClient.post(
+                host,
+                f"/containers/{step.container_id}/remediate",
+                json={"action": step.action, "operation_id": step.id, "packages": step.packages or []}
+            )
+            deadline = time.monotonic() + settings.REMEDIATION_STEP_TIMEOUT_SECONDS
+            while operation["status"] in ("pending", "running"):
+                if time.monotonic() > deadline:
+                    raise TimeoutError(
+                        f"Remediation did not finish within {settings.REMEDIATION_STEP_TIMEOUT_SECONDS}s"
+                    )
+                await asyncio.sleep(settings.REMEDIATION_POLL_INTERVAL_SECONDS)
+                try:
+                    operation = await AgentClient.get(host, f"/remediation/{step.id}")
+                except httpx.TransportError as e:
+                    # Кратковременная недоступность агента не прерывает исправление: ждем до deadline
+                    logger.warning(f"Error polling remediation {step.id} on {host.name}: {str(e)}")
+            
+            step.timings = operation.get("steps")
+            step.image = operation.get("image") or step.image
+            step.new_container_id = operation.get("new_container_id")
+            if operation["status"] == "completed":
+                step.status = RemediationStatus.COMPLETED
+                step.message = operation.get("message")
+                if operation.get("changed"):
+                    downtime_ms = operation.get("downtime_ms")
+            else:
+                step.status = RemediationStatus.FAILED
+                step.message = operation.get("error") or operation["status"]
+                if operation["status"] == "rolled_back":
+                    step.message = f"Rolled back: {step.message}"
+        except Exception as e:
+            logger.error(f"Error remediating container {step.container_id}: {str(e)}")
+            step.status = RemediationStatus.FAILED
+            step.message = str(e)
+        finally:
+            step.finished_at = datetime.utcnow()
+            step.duration_ms = (time.perf_counter() - started) * 1000
+            REMEDIATION_CONTAINER_DURATION_SECONDS.labels(step.action, step.status.value).observe(
+                step.duration_ms / 1000
+            )
+        return downtime_ms
+    
+    @staticmethod
+    def _finish(db: Session, execution_id: str, status: RemediationStatus, error: Optional[str] = None) -> None:
+        """Завершение запуска: необработанные контейнеры помечаются skipped"""
+        execution = db.query(RemediationExecution).filter(RemediationExecution.id == execution_id).first()
+        if execution is None:
+            return
         
-        # В реальном приложении здесь должен быть код для выполнения действий
-        # по исправлению уязвимостей с использованием выбранной стратегии
+        for step in execution.steps:
+            if step.status == RemediationStatus.PENDING:
+                step.status = RemediationStatus.SKIPPED
+            elif step.status == RemediationStatus.RUNNING:
+                # Исход на агенте неизвестен (запуск прерван)
+                step.status = RemediationStatus.FAILED
+                step.message = step.message or "Interrupted, check the container state"
         
-        return result 
+        execution.status = status
+        execution.error = error
+        execution.finished_at = datetime.utcnow()
+        db.commit()
+        REMEDIATION_EXECUTIONS.labels(execution.strategy, status.value).inc()
+        logger.info(f"Remediation {execution_id} finished: {status.value}" + (f" ({error})" if error else ""))
+    
+    @staticmethod
+    def fail_interrupted() -> int:
+        """Завершение запусков, исполнитель которых остановился; возвращает их число
+        
+        Запуск прерван, если его блокировку никто не держит и исполнитель не отмечался дольше
+        REMEDIATION_STALE_SECONDS (у не начатого запуска — с создания): только что созданный
+        запуск процесс, создавший его, может еще не успеть заблокировать.
+        """
+        db = SessionLocal()
+        finished = 0
+        try:
+            stale_before = func.now() - timedelta(seconds=settings.REMEDIATION_STALE_SECONDS)
+            last_seen = func.coalesce(RemediationExecution.heartbeat_at, RemediationExecution.created_at)
+            executions = db.query(RemediationExecution.id).filter(
+                RemediationExecution.status.in_(ACTIVE_STATUSES),
+                last_seen < stale_before
+            ).all()
+            for (execution_id,) in executions:
+                # Запуск, который держит блокировку, выполняется другим процессом
+                with try_advisory_lock(db, f"remediation:{execution_id}") as acquired:
+                    if not acquired:
+                        continue
+                    # Исполнитель мог закончить или отметиться, пока мы брали блокировку
+                    still_stale = db.query(RemediationExecution.id).filter(
+                        RemediationExecution.id == execution_id,
+                        RemediationExecution.status.in_(ACTIVE_STATUSES),
+                        last_seen < stale_before
+                    ).first()
+                    db.rollback()
+                    if still_stale:
+                        RemediationService._finish(
+                            db, execution_id, RemediationStatus.FAILED, "Interrupted: the backend process running it stopped"
+                        )
+                        finished += 1
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Error finishing interrupted remediations: {str(e)}")
+        finally:
+            db.close()
+        return finished
+    
+    @staticmethod
+    async def run_reaper() -> None:
+        """Фоновое задание: завершение прерванных запусков (выполняет один процесс из всех)"""
+        await run_as_leader(
+            "remediation-reaper",
+            settings.REMEDIATION_STALE_SECONDS / 2,
+            lambda: asyncio.to_thread(RemediationService.fail_interrupted)
+        )
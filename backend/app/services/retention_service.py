@@ -0,0 +1,283 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from loguru import logger
+from sqlalchemy import delete, exists, func, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+
+from app.core.cache import invalidate_scans
+from app.core.config import settings
+from app.core.metrics import (
+    RETENTION_DELETED_ROWS,
+    RETENTION_DURATION_SECONDS,
+    RETENTION_LAST_SUCCESS,
+    RETENTION_PENDING_SCANS,
+    RETENTION_RUNS,
+    RETENTION_SCANS,
+)
+from app.db.base import SessionLocal, try_advisory_lock
+from app.db.partitioning import drop_partition, expired_partitions, partition_name, vulnerability_partition_filter
+from app.models.models import ScanHistory, ScanSpan, ScanSummary, Vulnerability
+from app.schemas.retention import RetentionPolicy, RetentionReport, RetentionStatus
+from app.services.scan_service import SEVERITY_LEVELS, TERMINAL_STATUSES
+
+# Состояние задания в этом процессе: текущий и последний прогон
+_state: Dict[str, Optional[RetentionReport]] = {"current": None, "last": None}
+
+class RetentionService:
+    """Сервис для хранения истории сканирований
+    
+    Последние сканирования каждого контейнера хранятся полностью, у более старых находки
+    заменяются сводкой по уровням критичности, а устаревшие удаляются целиком. Удаление идет
+    короткими транзакциями, чтобы не держать блокировки на таблице уязвимостей.
+    """
+    
+    @staticmethod
+    def get_policy() -> RetentionPolicy:
+        return RetentionPolicy(
+            enabled=settings.RETENTION_ENABLED,
+            dry_run=settings.RETENTION_DRY_RUN,
+            keep_full_scans=settings.RETENTION_KEEP_FULL_SCANS,
+            max_age_days=settings.RETENTION_MAX_AGE_DAYS,
+            interval_seconds=settings.RETENTION_INTERVAL_SECONDS,
+            batch_size=settings.RETENTION_BATCH_SIZE
+        )
+    
+    @staticmethod
+    def get_status() -> RetentionStatus:
+        return RetentionStatus(
+            policy=RetentionService.get_policy(),
+            running=_state["current"] is not None,
+            current=_state["current"],
+            last=_state["last"]
+        )
+    
+    @staticmethod
+    def find_candidates(db: Session, keep_full: int, max_age_days: Optional[int]) -> Tuple[List[Any], List[Any]]:
+        """Поиск сканирований для сжатия и удаления (от старых к новым): строки (scan_id, started_at)
+        
+        Учитываются только завершенные сканирования; последние keep_full сканирований
+        каждого контейнера не трогаются независимо от возраста.
+        """
+        ranked = select(
+            ScanHistory.scan_id,
+            ScanHistory.started_at,
+            func.row_number().over(
+                partition_by=(ScanHistory.host_id, ScanHistory.container_id),
+                order_by=(ScanHistory.started_at.desc(), ScanHistory.scan_id.desc())
+            ).label("position")
+        ).where(ScanHistory.status.in_(TERMINAL_STATUSES)).subquery()
+        
+        outdated = ranked.c.position > keep_full
+        # Сжатие, прерванное на середине, продолжается: сводка уже есть, но часть находок осталась
+        not_compacted = ~exists().where(ScanSummary.scan_id == ranked.c.scan_id)
+        has_findings = exists().where(Vulnerability.scan_id == ranked.c.scan_id)
+        compact_query = select(ranked.c.scan_id, ranked.c.started_at).where(outdated, not_compacted | has_findings)
+        
+        to_delete = []
+        if max_age_days is not None:
+            expired = ranked.c.started_at < datetime.utcnow() - timedelta(days=max_age_days)
+            to_delete = db.execute(
+                select(ranked.c.scan_id, ranked.c.started_at).where(outdated, expired).order_by(ranked.c.started_at)
+            ).all()
+            compact_query = compact_query.where(~expired)
+        
+        to_compact = db.execute(compact_query.order_by(ranked.c.started_at)).all()
+        
+        return list(to_compact), list(to_delete)
+    
+    @staticmethod
+    def summarize(db: Session, scan_id: str, scanned_at: Optional[datetime] = None) -> Dict[str, int]:
+        """Количество находок сканирования по уровням критичности"""
+        severity = func.lower(func.coalesce(Vulnerability.severity, ""))
+        rows = db.query(severity, func.count()).filter(
+            Vulnerability.scan_id == scan_id, vulnerability_partition_filter(scanned_at)
+        ).group_by(severity).all()
+        
+        counts = {level: 0 for level in SEVERITY_LEVELS}
+        counts["unknown"] = 0
+        for level, count in rows:
+            counts[level if level in SEVERITY_LEVELS else "unknown"] += count
+        counts["total"] = sum(counts.values())
+        return counts
+    
+    @staticmethod
+    def delete_vulnerabilities(
+        db: Session,
+        scan_id: str,
+        batch_size: int,
+        pause: float,
+        scanned_at: Optional[datetime] = None
+    ) -> int:
+        """Удаление находок сканирования пачками, каждая пачка — отдельная транзакция"""
+        partition = vulnerability_partition_filter(scanned_at)
+        deleted = 0
+        while True:
+            batch = select(Vulnerability.id).where(Vulnerability.scan_id == scan_id, partition).limit(batch_size)
+            result = db.execute(
+                delete(Vulnerability)
+                .where(Vulnerability.id.in_(batch), partition)
+                .execution_options(synchronize_session=False)
+            )
+            db.commit()
+            deleted += result.rowcount
+            RETENTION_DELETED_ROWS.labels("vulnerabilities").inc(result.rowcount)
+            if result.rowcount < batch_size:
+                return deleted
+            time.sleep(pause)
+    
+    @staticmethod
+    def compact_scan(db: Session, scan_id: str, scanned_at: datetime, batch_size: int, pause: float) -> int:
+        """Замена находок сканирования сводкой; возвращает число удаленных находок"""
+        if db.get(ScanSummary, scan_id) is None:
+            # Сводка сохраняется до удаления находок: прерванное сжатие можно продолжить
+            db.add(ScanSummary(scan_id=scan_id, **RetentionService.summarize(db, scan_id, scanned_at)))
+            db.commit()
+        
+        deleted = RetentionService.delete_vulnerabilities(db, scan_id, batch_size, pause, scanned_at)
+        invalidate_scans(db, [scan_id])
+        db.commit()
+        return deleted
+    
+    @staticmethod
+    def delete_scan(db: Session, scan_id: str, scanned_at: datetime, batch_size: int, pause: float) -> Tuple[int, int]:
+        """Удаление сканирования целиком; возвращает число удаленных находок и участков трассировки"""
+        vulnerabilities = RetentionService.delete_vulnerabilities(db, scan_id, batch_size, pause, scanned_at)
+        
+        spans = db.execute(delete(ScanSpan).where(ScanSpan.scan_id == scan_id)).rowcount
+        db.execute(delete(ScanSummary).where(ScanSummary.scan_id == scan_id))
+        db.execute(delete(ScanHistory).where(ScanHistory.scan_id == scan_id))
+        invalidate_scans(db, [scan_id])
+        db.commit()
+        
+        RETENTION_DELETED_ROWS.labels("scan_spans").inc(spans)
+        RETENTION_DELETED_ROWS.labels("scan_history").inc()
+        return vulnerabilities, spans
+    
+    @staticmethod
+    def drop_partitions(db: Session, report: RetentionReport, max_age_days: int, dry_run: bool) -> None:
+        """Удаление месяцев истории, все сканирования которых старше max_age_days"""
+        engine = db.get_bind()
+        expired = expired_partitions(engine, max_age_days)
+        report.scans_to_delete = sum(scans for _, scans in expired)
+        report.dropped_partitions = [partition_name("scan_history", start) for start, _ in expired]
+        if dry_run:
+            return
+        
+        # Открытая транзакция сессии держит блокировку таблиц и не дала бы удалить секцию
+        db.commit()
+        RETENTION_PENDING_SCANS.labels("delete").set(report.scans_to_delete)
+        for start, _ in expired:
+            try:
+                scan_ids = drop_partition(engine, start)
+            except OperationalError as e:
+                # Например, lock_timeout из-за долгого запроса: секция будет удалена следующим прогоном
+                logger.warning(f"Could not drop partitions for {start:%Y-%m}: {str(e)}")
+                continue
+            with engine.begin() as conn:
+                invalidate_scans(conn, scan_ids)
+            report.deleted_scans += len(scan_ids)
+            RETENTION_SCANS.labels("deleted").inc(len(scan_ids))
+            RETENTION_DELETED_ROWS.labels("partitions").inc()
+            RETENTION_PENDING_SCANS.labels("delete").dec(len(scan_ids))
+    
+    @staticmethod
+    def run(db: Session, dry_run: bool = False) -> RetentionReport:
+        """Один прогон политики хранения; в режиме dry_run только подсчитывается объем работы"""
+        mode = "dry_run" if dry_run else "apply"
+        batch_size = settings.RETENTION_BATCH_SIZE
+        pause = settings.RETENTION_BATCH_PAUSE_SECONDS
+        report = RetentionReport(dry_run=dry_run, started_at=datetime.utcnow())
+        _state["current"] = report
+        started = time.perf_counter()
+        
+        try:
+            max_age_days = settings.RETENTION_MAX_AGE_DAYS
+            # При секционировании устаревшие сканирования удаляются вместе с секцией, а не построчно
+            by_partition = settings.PARTITIONING_ENABLED and max_age_days is not None
+            if by_partition:
+                RetentionService.drop_partitions(db, report, max_age_days, dry_run)
+            
+            to_compact, to_delete = RetentionService.find_candidates(
+                db, settings.RETENTION_KEEP_FULL_SCANS, None if by_partition else max_age_days
+            )
+            report.scans_to_compact = len(to_compact)
+            report.scans_to_delete += len(to_delete)
+            
+            if dry_run:
+                candidates = [scan_id for scan_id, _ in to_compact + to_delete]
+                report.deleted_vulnerabilities = db.query(func.count(Vulnerability.id)).filter(
+                    Vulnerability.scan_id.in_(candidates)
+                ).scalar() if candidates else 0
+                report.deleted_spans = db.query(func.count(ScanSpan.span_id)).filter(
+                    ScanSpan.scan_id.in_([scan_id for scan_id, _ in to_delete])
+                ).scalar() if to_delete else 0
+            else:
+                RETENTION_PENDING_SCANS.labels("delete").set(len(to_delete))
+                for scan_id, scanned_at in to_delete:
+                    vulnerabilities, spans = RetentionService.delete_scan(db, scan_id, scanned_at, batch_size, pause)
+                    report.deleted_scans += 1
+                    report.deleted_vulnerabilities += vulnerabilities
+                    report.deleted_spans += spans
+                    RETENTION_SCANS.labels("deleted").inc()
+                    RETENTION_PENDING_SCANS.labels("delete").dec()
+                
+                RETENTION_PENDING_SCANS.labels("compact").set(len(to_compact))
+                for scan_id, scanned_at in to_compact:
+                    report.deleted_vulnerabilities += RetentionService.compact_scan(
+                        db, scan_id, scanned_at, batch_size, pause
+                    )
+                    report.compacted_scans += 1
+                    RETENTION_SCANS.labels("compacted").inc()
+                    RETENTION_PENDING_SCANS.labels("compact").dec()
+            
+            RETENTION_RUNS.labels(mode, "success").inc()
+            RETENTION_LAST_SUCCESS.set(time.time())
+            logger.info(
+                f"Retention run ({mode}) finished: {report.scans_to_compact} scans to compact, "
+                f"{report.scans_to_delete} to delete, {report.deleted_vulnerabilities} vulnerabilities removed"
+            )
+        except Exception as e:
+            db.rollback()
+            report.error = str(e)
+            RETENTION_RUNS.labels(mode, "error").inc()
+            logger.error(f"Retention run ({mode}) failed: {str(e)}")
+        finally:
+            RETENTION_PENDING_SCANS.labels("delete").set(0)
+            RETENTION_PENDING_SCANS.labels("compact").set(0)
+            RETENTION_DURATION_SECONDS.observe(time.perf_counter() - started)
+            report.finished_at = datetime.utcnow()
+            _state["current"] = None
+            _state["last"] = report
+        
+        return report
+    
+    @staticmethod
+    def run_exclusive(dry_run: bool = False) -> Optional[RetentionReport]:
+        """Прогон в отдельной сессии; None, если прогон уже идет в этом или другом процессе"""
+        if _state["current"] is not None:
+            return None
+        
+        db = SessionLocal()
+        try:
+            with try_advisory_lock(db, "retention") as acquired:
+                if not acquired:
+                    return None
+                return RetentionService.run(db, dry_run=dry_run)
+        finally:
+            db.close()
+    
+    @staticmethod
+    async def run_periodically() -> None:
+        """Фоновое задание: прогон политики хранения каждые RETENTION_INTERVAL_SECONDS"""
+        logger.info(f"Retention job started: {RetentionService.get_policy().model_dump()}")
+        while True:
+            try:
+                report = await asyncio.to_thread(RetentionService.run_exclusive, settings.RETENTION_DRY_RUN)
+                if report is None:
+                    RETENTION_RUNS.labels("dry_run" if settings.RETENTION_DRY_RUN else "apply", "skipped").inc()
+            except Exception as e:
+                logger.error(f"Retention job error: {str(e)}")
+            await asyncio.sleep(settings.RETENTION_INTERVAL_SECONDS)
@@ -1,14 +1,104 @@
+import re
 import uuid
 import json
-from typing import List, Optional, Dict, Any
+import time
+import asyncio
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Dict, Any, Sequence, Tuple
 import httpx
-from sqlalchemy.orm import Session
+from sqlalchemy import case, event, inspect, literal, or_, text
+from sqlalchemy.orm import Session, load_only
 from loguru import logger
 from datetime import datetime
 
-from app.models.models import ScanHistory, Vulnerability, Host, Container, ScanStatus as ModelScanStatus, ContainerStatus
-from app.schemas.scan import ScanRequest
+from app.core.cache import invalidate_scans
+from app.core.config import settings
+from app.core.events import event_bus
+from app.core.metrics import (
+    INGESTED_VULNERABILITIES,
+    INGESTION_DURATION_SECONDS,
+    INGESTION_ROWS_PER_SECOND,
+    SCAN_STATUS_CHECKS,
+    SCAN_STATUS_POLLS,
+)
+from app.core.tracing import current_span, exporter, record_spans, start_span
+from app.db.base import SessionLocal, try_advisory_lock
+from app.db.leader import run_as_leader
+from app.db.partitioning import vulnerability_partition_filter
+from app.models.models import ScanHistory, ScanSpan, Vulnerability, Host, Container, ScanStatus as ModelScanStatus, ContainerStatus
+from app.schemas.scan import ScanBatchRequest, ScanRequest
+from app.services.agent_client import AgentClient
 from app.services.container_service import ContainerService
+from app.services.exposure_service import ExposureService
+from app.services.timing_service import TimingService
+
+# Поля находок Trivy, которые используются при сохранении уязвимостей.
+# Агент возвращает только их, полные данные запрашиваются при открытии находки
+INGEST_FIELDS = (
+    "VulnerabilityID",
+    "PkgName",
+    "PkgID",
+    "InstalledVersion",
+    "FixedVersion",
+    "Severity",
+    "Title",
+    "Description",
+    "PrimaryURL",
+    "References",
+    "CVSS.*.V3Score",
+)
+
+# Источник оценки CVSS, которому отдается предпочтение
+PREFERRED_CVSS_SOURCE = "nvd"
+
+TERMINAL_STATUSES = (ModelScanStatus.COMPLETED, ModelScanStatus.ERROR)
+
+# Уровни критичности в сводке; все прочие значения считаются unknown
+SEVERITY_LEVELS = ("critical", "high", "medium", "low")
+
+# Запрос поиска, который целиком является идентификатором уязвимости (CVE, GHSA и т.п.)
+CVE_ID_PATTERN = re.compile(r"^(CVE-\d{4}-\d{4,}|GHSA(-[0-9a-z]{4}){3})$", re.IGNORECASE)
+
+# Поля уязвимостей, доступные для проекции через параметр fields=
+VULNERABILITY_FIELDS = (
+    "id", "scan_id", "cve_id", "cvss", "severity", "description", "recommendation",
+    "pkg_name", "pkg_version", "fixed_version", "details"
+)
+
+# Опросы агента, выполняющиеся в этом процессе: параллельные проверки статуса
+# одного сканирования ждут завершения одного опроса вместо собственного
+_status_polls: Dict[str, "asyncio.Future[None]"] = {}
+
+# Время (time.monotonic) последней проверки незавершенного сканирования у агента этим процессом
+# или попытки, при которой его опрашивал другой процесс
+_status_checked: Dict[str, float] = {}
+
+# Последний опубликованный этап каждого незавершенного сканирования (этап, позиция в очереди, процент):
+# событие scan_progress публикуется только при изменении
+_last_progress: Dict[str, Tuple[str, Optional[int], Optional[float]]] = {}
+
+@event.listens_for(Session, "after_flush")
+def publish_scan_status_changes(session: Session, flush_context) -> None:
+    """Событие scan_status для каждого сканирования, статус которого записан при flush
+    
+    Событие уходит вместе с фиксацией транзакции, поэтому подписчики на всех процессах
+    видят только сохраненные статусы, где бы в коде они ни менялись.
+    """
+    for instance in list(session.new) + list(session.dirty):
+        if not isinstance(instance, ScanHistory):
+            continue
+        history = inspect(instance).attrs.status.history
+        if not history.added:
+            continue
+        previous = history.deleted[0] if history.deleted else None
+        event_bus.publish(session.connection(), "scan_status", {
+            "scan_id": instance.scan_id,
+            "host_id": instance.host_id,
+            "container_id": instance.container_id,
+            "status": instance.status.value if instance.status else None,
+            "previous_status": previous.value if previous else None,
+            "finished_at": instance.finished_at,
+        })
 
 class ScanService:
     @staticmethod
@@ -28,17 +118,29 @@ class ScanService:
         host_id: Optional[str] = None,
         container_id: Optional[str] = None,
         skip: int = 0, 
-        limit: int = 100
+        limit: Optional[int] = 100,
+        fields: Optional[Sequence[str]] = None,
+        scanned_at: Optional[datetime] = None
     ) -> List[Vulnerability]:
-        """Получение уязвимостей с фильтрацией"""
+        """Получение уязвимостей с фильтрацией
+        
+        По умолчанию полная находка (details) не загружается; fields ограничивает загружаемые колонки.
+        Время сканирования scanned_at (если известно) позволяет читать только его секцию таблицы.
+        """
         query = db.query(Vulnerability)
+        if fields:
+            query = query.options(load_only(*(getattr(Vulnerability, field) for field in fields)))
         
         if scan_id:
-            query = query.filter(Vulnerability.scan_id == scan_id)
+            query = query.filter(Vulnerability.scan_id == scan_id, vulnerability_partition_filter(scanned_at))
         
         if host_id or container_id:
             # Присоединяем таблицу сканирований для фильтрации по host_id и container_id
-            query = query.join(ScanHistory, ScanHistory.scan_id == Vulnerability.scan_id)
+            join_on = ScanHistory.scan_id == Vulnerability.scan_id
+            if settings.PARTITIONING_ENABLED:
+                # Соединение по ключу секционирования: секции соединяются попарно
+                join_on &= ScanHistory.started_at == Vulnerability.scanned_at
+            query = query.join(ScanHistory, join_on)
             
             if host_id:
                 query = query.filter(ScanHistory.host_id == host_id)
@@ -48,9 +150,113 @@ class ScanService:
         
         return query.offset(skip).limit(limit).all()
     
+    @staticmethod
+    def parse_vulnerability_fields(fields: Optional[str]) -> Optional[List[str]]:
+        """Разбор параметра fields= (через запятую); ValueError при неизвестном поле"""
+        if not fields:
+            return None
+        selected = list(dict.fromkeys(field.strip() for field in fields.split(",") if field.strip()))
+        unknown = set(selected) - set(VULNERABILITY_FIELDS)
+        if unknown:
+            raise ValueError(f"Unknown vulnerability fields: {', '.join(sorted(unknown))}")
+        return selected
+    
+    @staticmethod
+    def project_vulnerabilities(vulnerabilities: List[Vulnerability], fields: Sequence[str]) -> List[Dict[str, Any]]:
+        """Проекция уязвимостей на выбранные поля"""
+        return [{field: getattr(vuln, field) for field in fields} for vuln in vulnerabilities]
+    
+    @staticmethod
+    def search_vulnerabilities(
+        db: Session,
+        q: Optional[str] = None,
+        cve_id: Optional[str] = None,
+        package: Optional[str] = None,
+        version: Optional[str] = None,
+        severity: Optional[str] = None,
+        host_id: Optional[str] = None,
+        container_id: Optional[str] = None,
+        skip: int = 0,
+        limit: int = 50
+    ) -> Tuple[List[Any], bool]:
+        """Поиск находок по CVE, пакету и тексту описания
+        
+        Точное совпадение CVE ранжируется выше точного совпадения пакета, затем идут совпадения
+        по подстроке в имени пакета и в описании; внутри ранга — сначала новые сканирования.
+        Возвращает строки (Vulnerability, host_id, container_id, rank) и признак следующей страницы.
+        """
+        columns = [getattr(Vulnerability, field) for field in VULNERABILITY_FIELDS[:-1]] + [Vulnerability.scanned_at]
+        rank = literal(1)
+        conditions = []
+        
+        if q and CVE_ID_PATTERN.match(q.strip()):
+            # Идентификатор CVE ищется только точно, по индексу
+            conditions.append(Vulnerability.cve_id == q.strip().upper())
+            rank = literal(4)
+        elif q:
+            term = q.strip()
+            pattern = "%" + term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+            # Каждое условие обслуживается своим индексом (btree по CVE и пакету, триграммы по подстроке)
+            exact_cve = Vulnerability.cve_id == term.upper()
+            exact_package = Vulnerability.pkg_name == term
+            package_match = Vulnerability.pkg_name.ilike(pattern, escape="\\")
+            conditions.append(or_(
+                exact_cve,
+                exact_package,
+                package_match,
+                Vulnerability.description.ilike(pattern, escape="\\")
+            ))
+            rank = case((exact_cve, 4), (exact_package, 3), (package_match, 2), else_=1)
+        
+        if cve_id:
+            conditions.append(Vulnerability.cve_id == cve_id.strip().upper())
+        if package:
+            conditions.append(Vulnerability.pkg_name == package.strip())
+        if version:
+            conditions.append(Vulnerability.pkg_version == version.strip())
+        if severity:
+            conditions.append(Vulnerability.severity == severity.strip().upper())
+        if host_id:
+            conditions.append(ScanHistory.host_id == host_id)
+        if container_id:
+            conditions.append(ScanHistory.container_id == container_id)
+        
+        join_on = ScanHistory.scan_id == Vulnerability.scan_id
+        if settings.PARTITIONING_ENABLED:
+            join_on &= ScanHistory.started_at == Vulnerability.scanned_at
+        
+        if db.get_bind().dialect.name == "postgresql":
+            # Ограничение времени поиска: слишком общий запрос не должен нагружать базу
+            db.execute(
+                text("SELECT set_config('statement_timeout', :timeout, true)"),
+                {"timeout": str(settings.SEARCH_STATEMENT_TIMEOUT_MS)}
+            )
+        
+        query = db.query(Vulnerability, ScanHistory.host_id, ScanHistory.container_id, rank.label("rank"))
+        query = query.options(load_only(*columns)).join(ScanHistory, join_on).filter(*conditions)
+        query = query.order_by(rank.desc(), Vulnerability.scanned_at.desc().nullslast(), Vulnerability.id)
+        
+        # Лишняя строка показывает, есть ли следующая страница, без подсчета всех совпадений
+        rows = query.offset(skip).limit(limit + 1).all()
+        return rows[:limit], len(rows) > limit
+    
     @staticmethod
     async def start_scan(db: Session, scan_request: ScanRequest) -> Optional[ScanHistory]:
         """Запуск нового сканирования"""
+        attributes = {"host_id": scan_request.host_id, "container_id": scan_request.container_id}
+        with record_spans() as spans:
+            with start_span("scan.start", attributes) as span:
+                db_scan = await ScanService._start_scan(db, scan_request)
+                if db_scan is not None:
+                    span.set_attribute("scan_id", db_scan.scan_id)
+        
+        if db_scan is not None:
+            ScanService.save_spans(db, db_scan.scan_id, [span.to_dict() for span in spans])
+        return db_scan
+    
+    @staticmethod
+    async def _start_scan(db: Session, scan_request: ScanRequest) -> Optional[ScanHistory]:
+        """Создание записи сканирования и запуск сканирования на агенте"""
         # Проверяем, существует ли хост
         host = db.query(Host).filter(Host.id == scan_request.host_id).first()
         if not host:
@@ -88,24 +294,24 @@ class ScanService:
         
         # Запускаем сканирование на хосте
         try:
-            async with httpx.AsyncClient() as client:
-                url = f"http://{host.address}:{host.port}/scan"
-                logger.info(f"Starting scan for container {container.container_id} on host {host.name}")
-                
-                response = await client.post(
-                    url,
-                    json={"container_id": container.container_id},
-                    timeout=30.0
-                )
-                response.raise_for_status()
-                sidecar_scan_result = response.json()
-                
-                # Обновляем статус сканирования
-                db_scan.status = ModelScanStatus[sidecar_scan_result["status"].upper()]
-                db.commit()
-                db.refresh(db_scan)
-                
-                return db_scan
+            logger.info(f"Starting scan for container {container.container_id} on host {host.name}")
+            sidecar_scan_result = await AgentClient.post(
+                host,
+                "/scan",
+                json={
+                    "container_id": container.container_id,
+                    "scan_id": scan_id,
+                    "priority": scan_request.priority.value
+                },
+                timeout=30.0
+            )
+            
+            # Обновляем статус сканирования
+            db_scan.status = ModelScanStatus[sidecar_scan_result["status"].upper()]
+            db.commit()
+            db.refresh(db_scan)
+            
+            return db_scan
         except httpx.HTTPError as e:
             logger.error(f"HTTP error starting scan on {host.name}: {str(e)}")
             db_scan.status = ModelScanStatus.ERROR
@@ -135,6 +341,80 @@ class ScanService:
             
             return db_scan
     
+    @staticmethod
+    async def start_batch_scan(db: Session, batch_request: ScanBatchRequest) -> Optional[Dict[str, Any]]:
+        """Запуск сканирований многих контейнеров хоста одним запросом к агенту (POST /scan/batch)
+        
+        Агент объединяет контейнеры с одинаковым образом в одно задание Trivy. Агенты без
+        пакетного API получают запросы по одному контейнеру.
+        """
+        host = db.query(Host).filter(Host.id == batch_request.host_id).first()
+        if not host:
+            logger.error(f"Host not found: {batch_request.host_id}")
+            return None
+        
+        query = db.query(Container).filter(Container.host_id == host.id)
+        if batch_request.container_ids is not None:
+            query = query.filter(Container.container_id.in_(batch_request.container_ids))
+        containers = query.all()
+        if not containers:
+            return None
+        
+        batch_id = uuid.uuid4().hex
+        db_scans = {}
+        for container in containers:
+            db_scan = ScanHistory(
+                scan_id=str(uuid.uuid4()),
+                host_id=host.id,
+                container_id=container.container_id,
+                status=ModelScanStatus.PENDING
+            )
+            db.add(db_scan)
+            db_scans[db_scan.scan_id] = db_scan
+            container.status = ContainerStatus.SCANNING
+        db.commit()
+        
+        items = [
+            {"container_id": db_scan.container_id, "scan_id": scan_id}
+            for scan_id, db_scan in db_scans.items()
+        ]
+        statuses: Dict[str, str] = {}
+        try:
+            logger.info(f"Starting batch {batch_id} of {len(items)} scans on host {host.name}")
+            result = await AgentClient.post(
+                host,
+                "/scan/batch",
+                json={"batch_id": batch_id, "priority": batch_request.priority.value, "items": items},
+                timeout=60.0
+            )
+            statuses = {item["scan_id"]: item["status"] for item in result["items"]}
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code not in (404, 405):
+                logger.error(f"HTTP error starting batch {batch_id} on {host.name}: {str(e)}")
+            else:
+                # Агент старой версии: сканирования запускаются по одному
+                for item in items:
+                    try:
+                        result = await AgentClient.post(
+                            host, "/scan", json={**item, "priority": batch_request.priority.value}, timeout=30.0
+                        )
+                        statuses[item["scan_id"]] = result["status"]
+                    except Exception as item_error:
+                        logger.error(f"Error starting scan {item['scan_id']} on {host.name}: {str(item_error)}")
+        except Exception as e:
+            logger.error(f"Error starting batch {batch_id} on {host.name}: {str(e)}")
+        
+        # Сканирования, которые агент не принял, завершаются с ошибкой
+        containers_by_id = {container.container_id: container for container in containers}
+        for scan_id, db_scan in db_scans.items():
+            db_scan.status = ModelScanStatus[statuses.get(scan_id, "error").upper()]
+            if db_scan.status == ModelScanStatus.ERROR:
+                db_scan.finished_at = datetime.now()
+                containers_by_id[db_scan.container_id].status = ContainerStatus.ERROR
+        db.commit()
+        
+        return {"batch_id": batch_id, "host_id": host.id, "scans": list(db_scans.values())}
+    
     @staticmethod
     async def check_scan_status(db: Session, scan_id: str) -> Optional[ScanHistory]:
         """Проверка статуса сканирования и обработка результатов"""
@@ -144,9 +424,163 @@ class ScanService:
             return None
         
         # Если сканирование уже завершено или произошла ошибка, просто возвращаем его
-        if db_scan.status in [ModelScanStatus.COMPLETED, ModelScanStatus.ERROR]:
+        if db_scan.status in TERMINAL_STATUSES:
+            _status_checked.pop(scan_id, None)
+            return db_scan
+        
+        # Опрос этого сканирования уже выполняется в процессе: ждем его и читаем сохраненный результат
+        poll = _status_polls.get(scan_id)
+        if poll is not None:
+            SCAN_STATUS_CHECKS.labels("coalesced").inc()
+            # Возвращаем соединение в пул на время ожидания: ведущему опросу оно может понадобиться
+            db.commit()
+            await asyncio.shield(poll)
+            db.refresh(db_scan)
             return db_scan
         
+        poll = asyncio.get_running_loop().create_future()
+        _status_polls[scan_id] = poll
+        try:
+            with ScanService._poll_lock(db, scan_id) as acquired:
+                if not acquired:
+                    # Сканирование опрашивает другой процесс бэкенда, отдаем состояние из БД
+                    SCAN_STATUS_CHECKS.labels("locked").inc()
+                    db.refresh(db_scan)
+                    return db_scan
+                
+                SCAN_STATUS_CHECKS.labels("upstream").inc()
+                
+                # Продолжаем трассировку, начатую при запуске сканирования
+                root = ScanService.get_trace_root(db, scan_id)
+                with record_spans() as spans:
+                    with start_span(
+                        "scan.check_status",
+                        {"scan_id": scan_id},
+                        trace_id=root.trace_id if root else None,
+                        parent_id=root.span_id if root else None
+                    ):
+                        db_scan = await ScanService._poll_scan_status(db, db_scan)
+        finally:
+            _status_checked[scan_id] = time.monotonic()
+            del _status_polls[scan_id]
+            poll.set_result(None)
+        
+        # Участки опросов сохраняются только при завершении, чтобы частые опросы не раздували таблицу
+        if db_scan.status in TERMINAL_STATUSES:
+            _status_checked.pop(scan_id, None)
+            ScanService.save_spans(db, scan_id, [span.to_dict() for span in spans])
+        return db_scan
+    
+    @staticmethod
+    async def get_fresh_scan(db: Session, scan_id: str) -> Optional[ScanHistory]:
+        """Сканирование с фоновым опросом статусов: из БД, а незавершенное, которое этот процесс
+        не проверял дольше SCAN_STATUS_POLL_INTERVAL_SECONDS, — с проверкой у агента (check_scan_status)
+        
+        Фоновый опрос ведет один процесс, поэтому на остальных статус из БД мог устареть на интервал
+        опроса и больше (ведущий процесс сменился, агент долго отвечает).
+        """
+        db_scan = ScanService.get_scan_by_id(db, scan_id)
+        if db_scan is None or db_scan.status in TERMINAL_STATUSES:
+            return db_scan
+        checked = _status_checked.get(scan_id)
+        if checked is not None and time.monotonic() - checked < settings.SCAN_STATUS_POLL_INTERVAL_SECONDS:
+            SCAN_STATUS_CHECKS.labels("fresh").inc()
+            return db_scan
+        return await ScanService.check_scan_status(db, scan_id)
+    
+    @staticmethod
+    @contextmanager
+    def _poll_lock(db: Session, scan_id: str) -> Iterator[bool]:
+        """Межпроцессная блокировка опроса сканирования: если его опрашивает другой процесс, возвращается False"""
+        with try_advisory_lock(db, f"scan-poll:{scan_id}") as acquired:
+            yield acquired
+    
+    @staticmethod
+    def _claim_completion(db: Session, db_scan: ScanHistory) -> bool:
+        """Блокировка строки сканирования перед сохранением результатов
+        
+        Возвращает False, если сканирование уже переведено в завершенный статус
+        (результаты сохранил другой запрос). Блокировка снимается при commit.
+        """
+        locked = db.query(ScanHistory).filter(
+            ScanHistory.scan_id == db_scan.scan_id
+        ).with_for_update().populate_existing().first()
+        return locked is not None and locked.status not in TERMINAL_STATUSES
+    
+    @staticmethod
+    def publish_progress(
+        db: Session,
+        db_scan: ScanHistory,
+        stage: str,
+        queue_position: Optional[int] = None,
+        percent: Optional[float] = None
+    ) -> None:
+        """Событие scan_progress (уходит при commit), если этап, процент или позиция в очереди изменились"""
+        progress = (stage, queue_position, percent)
+        if _last_progress.get(db_scan.scan_id) == progress:
+            return
+        _last_progress[db_scan.scan_id] = progress
+        event_bus.publish(db, "scan_progress", {
+            "scan_id": db_scan.scan_id,
+            "host_id": db_scan.host_id,
+            "stage": stage,
+            "percent": percent,
+            "queue_position": queue_position,
+        })
+    
+    @staticmethod
+    def stage_durations(sidecar_scan_result: Dict[str, Any]) -> Optional[Dict[str, float]]:
+        """Длительность завершенных этапов Trivy (мс) из статуса сканирования агента"""
+        durations = {
+            stage["name"]: stage["duration_ms"]
+            for stage in sidecar_scan_result.get("stages") or []
+            if stage.get("duration_ms") is not None
+        }
+        return durations or None
+    
+    @staticmethod
+    async def poll_active_scans() -> None:
+        """Опрос агентов по всем незавершенным сканированиям (не больше SCAN_STATUS_POLL_CONCURRENCY одновременно)"""
+        db = SessionLocal()
+        try:
+            scan_ids = [
+                scan_id for scan_id, in db.query(ScanHistory.scan_id).filter(
+                    ScanHistory.status.in_([ModelScanStatus.PENDING, ModelScanStatus.RUNNING])
+                ).all()
+            ]
+        finally:
+            db.close()
+        
+        semaphore = asyncio.Semaphore(settings.SCAN_STATUS_POLL_CONCURRENCY)
+        
+        async def poll(scan_id: str) -> None:
+            async with semaphore:
+                scan_db = SessionLocal()
+                try:
+                    await ScanService.check_scan_status(scan_db, scan_id)
+                    SCAN_STATUS_POLLS.labels("ok").inc()
+                except Exception as e:
+                    SCAN_STATUS_POLLS.labels("error").inc()
+                    logger.error(f"Error polling status of scan {scan_id}: {str(e)}")
+                finally:
+                    scan_db.close()
+        
+        await asyncio.gather(*(poll(scan_id) for scan_id in scan_ids))
+    
+    @staticmethod
+    async def run_status_poller() -> None:
+        """Фоновое задание: опрос незавершенных сканирований каждые SCAN_STATUS_POLL_INTERVAL_SECONDS
+        
+        Опрашивает один процесс из всех воркеров и реплик; переходы статусов, этапы и сводки
+        результатов доходят до клиентов событиями, и клиентам не нужно опрашивать GET /scan/{scan_id}.
+        """
+        await run_as_leader("scan-status-poller", settings.SCAN_STATUS_POLL_INTERVAL_SECONDS, ScanService.poll_active_scans)
+    
+    @staticmethod
+    async def _poll_scan_status(db: Session, db_scan: ScanHistory) -> ScanHistory:
+        """Запрос статуса сканирования у агента и загрузка результатов при завершении"""
+        scan_id = db_scan.scan_id
+        
         # Получаем хост и контейнер
         host = db.query(Host).filter(Host.id == db_scan.host_id).first()
         if not host:
@@ -157,47 +591,104 @@ class ScanService:
         
         # Запрашиваем статус сканирования с хоста
         try:
-            async with httpx.AsyncClient() as client:
-                url = f"http://{host.address}:{host.port}/scan/{scan_id}"
-                logger.info(f"Checking scan status for scan {scan_id} on host {host.name}")
+            logger.info(f"Checking scan status for scan {scan_id} on host {host.name}")
+            sidecar_scan_result = await AgentClient.get(host, f"/scan/{scan_id}", timeout=10.0)
+            
+            new_status = ModelScanStatus[sidecar_scan_result["status"].upper()]
+            
+            if new_status == ModelScanStatus.COMPLETED:
+                ScanService.publish_progress(db, db_scan, "fetching_results")
+                db.commit()
+                
+                # Загружаем результаты один раз, только нужные для сохранения поля
+                scan_results = await AgentClient.get(
+                    host,
+                    f"/scan/{scan_id}/result",
+                    params={"fields": ",".join(INGEST_FIELDS)},
+                    timeout=60.0
+                )
                 
-                response = await client.get(url, timeout=10.0)
-                response.raise_for_status()
-                sidecar_scan_result = response.json()
+                # Уязвимости сохраняются ровно один раз: в одной транзакции со сменой статуса
+                # и под блокировкой строки сканирования
+                if not ScanService._claim_completion(db, db_scan):
+                    logger.info(f"Results of scan {scan_id} were already stored by another request")
+                    _last_progress.pop(scan_id, None)
+                    db.commit()
+                    return db_scan
                 
-                # Обновляем статус сканирования
-                new_status = ModelScanStatus[sidecar_scan_result["status"].upper()]
                 db_scan.status = new_status
+                db_scan.finished_at = datetime.now()
+                db_scan.stage_durations = ScanService.stage_durations(sidecar_scan_result)
+                with start_span("scan.process_vulnerabilities", {"scan_id": scan_id}):
+                    ScanService.process_vulnerabilities(db, db_scan.scan_id, scan_results)
+                db.commit()
                 
-                if new_status == ModelScanStatus.COMPLETED:
-                    db_scan.finished_at = datetime.now()
-                    
-                    # Обновляем статус контейнера
-                    ContainerService.update_container_status(
-                        db, 
-                        db_scan.container_id, 
-                        db_scan.host_id, 
-                        ContainerStatus.SCANNED
-                    )
-                    
-                    # Обрабатываем результаты сканирования
-                    if "results" in sidecar_scan_result and sidecar_scan_result["results"]:
-                        ScanService.process_vulnerabilities(db, db_scan.scan_id, sidecar_scan_result["results"])
+                # При ошибке сохранения транзакция откатывается, и результаты загрузятся при следующем опросе
+                db.refresh(db_scan)
+                if db_scan.status != ModelScanStatus.COMPLETED:
+                    return db_scan
                 
-                elif new_status == ModelScanStatus.ERROR:
-                    db_scan.finished_at = datetime.now()
-                    
-                    # Обновляем статус контейнера
-                    ContainerService.update_container_status(
-                        db, 
-                        db_scan.container_id, 
-                        db_scan.host_id, 
-                        ContainerStatus.ERROR
-                    )
+                # Обратный индекс CVE → контейнеры указывает на последнее сканирование контейнера
+                try:
+                    ExposureService.refresh_container(db, db_scan)
+                    db.commit()
+                except Exception as e:
+                    db.rollback()
+                    logger.error(f"Error updating CVE exposures for scan {scan_id}: {str(e)}")
                 
-                db.commit()
-                db.refresh(db_scan)
-                return db_scan
+                # Длительность сканирования образа и этапов Trivy для оценок и анализа по парку
+                try:
+                    TimingService.record_scan(db, db_scan, sidecar_scan_result.get("spans") or [])
+                    db.commit()
+                except Exception as e:
+                    db.rollback()
+                    logger.error(f"Error recording timing of scan {scan_id}: {str(e)}")
+                
+                # Обновляем статус контейнера
+                ContainerService.update_container_status(
+                    db, 
+                    db_scan.container_id, 
+                    db_scan.host_id, 
+                    ContainerStatus.SCANNED
+                )
+            
+            elif new_status == ModelScanStatus.ERROR:
+                db_scan.status = new_status
+                db_scan.finished_at = datetime.now()
+                db_scan.stage_durations = ScanService.stage_durations(sidecar_scan_result)
+                
+                # Обновляем статус контейнера
+                ContainerService.update_container_status(
+                    db, 
+                    db_scan.container_id, 
+                    db_scan.host_id, 
+                    ContainerStatus.ERROR
+                )
+            
+            else:
+                db_scan.status = new_status
+                if new_status == ModelScanStatus.RUNNING:
+                    # Агенты без отслеживания этапов Trivy сообщают только о выполнении
+                    stage = sidecar_scan_result.get("stage") or "scanning"
+                else:
+                    stage = "queued"
+                ScanService.publish_progress(
+                    db,
+                    db_scan,
+                    stage,
+                    sidecar_scan_result.get("queue_position"),
+                    sidecar_scan_result.get("stage_percent")
+                )
+            
+            db.commit()
+            db.refresh(db_scan)
+            
+            # Участки агента сохраняются вместе с участками бэкенда при завершении сканирования
+            if new_status in TERMINAL_STATUSES:
+                _last_progress.pop(scan_id, None)
+                ScanService.save_spans(db, scan_id, sidecar_scan_result.get("spans") or [], export=True)
+            
+            return db_scan
         
         except httpx.HTTPError as e:
             logger.error(f"HTTP error checking scan status on {host.name}: {str(e)}")
@@ -206,15 +697,193 @@ class ScanService:
             logger.error(f"Error checking scan status on {host.name}: {str(e)}")
             return db_scan
     
+    @staticmethod
+    async def cancel_scan(db: Session, scan_id: str) -> Optional[ScanHistory]:
+        """Отмена сканирования: агент снимает его с очереди или завершает Trivy"""
+        db_scan = ScanService.get_scan_by_id(db, scan_id)
+        if not db_scan:
+            logger.error(f"Scan not found: {scan_id}")
+            return None
+        
+        if db_scan.status in TERMINAL_STATUSES:
+            return db_scan
+        
+        host = db.query(Host).filter(Host.id == db_scan.host_id).first()
+        if host:
+            try:
+                await AgentClient.delete(host, f"/scan/{scan_id}")
+            except httpx.HTTPStatusError as e:
+                # 409: сканирование на агенте уже завершилось, статус подтянется при следующем опросе
+                if e.response.status_code == 409:
+                    return await ScanService.check_scan_status(db, scan_id)
+                if e.response.status_code != 404:
+                    raise
+        
+        logger.info(f"Scan {scan_id} cancelled")
+        db_scan.status = ModelScanStatus.ERROR
+        db_scan.finished_at = datetime.now()
+        db.commit()
+        db.refresh(db_scan)
+        
+        ContainerService.update_container_status(
+            db,
+            db_scan.container_id,
+            db_scan.host_id,
+            ContainerStatus.IDLE
+        )
+        return db_scan
+    
+    @staticmethod
+    def get_trace_root(db: Session, scan_id: str) -> Optional[ScanSpan]:
+        """Корневой участок трассировки сканирования (запуск сканирования)"""
+        return db.query(ScanSpan).filter(
+            ScanSpan.scan_id == scan_id,
+            ScanSpan.name == "scan.start"
+        ).first()
+    
+    @staticmethod
+    def save_spans(db: Session, scan_id: str, spans: List[Dict[str, Any]], export: bool = False) -> None:
+        """Сохранение участков трассировки сканирования"""
+        try:
+            for span in spans:
+                if export:
+                    exporter.export(span)
+                started_at = span["started_at"]
+                if isinstance(started_at, str):
+                    started_at = datetime.fromisoformat(started_at)
+                db.merge(ScanSpan(
+                    span_id=span["span_id"],
+                    trace_id=span["trace_id"],
+                    parent_id=span.get("parent_id"),
+                    scan_id=scan_id,
+                    service=span["service"],
+                    name=span["name"],
+                    started_at=started_at,
+                    duration_ms=span.get("duration_ms"),
+                    status=span.get("status", "ok"),
+                    attributes=span.get("attributes")
+                ))
+            db.commit()
+        except Exception as e:
+            logger.error(f"Error saving trace spans for scan {scan_id}: {str(e)}")
+            db.rollback()
+    
+    @staticmethod
+    def get_scan_timings(db: Session, scan_id: str) -> Optional[Dict[str, Any]]:
+        """Разбивка времени сканирования по участкам трассировки"""
+        scan = ScanService.get_scan_by_id(db, scan_id)
+        if not scan:
+            return None
+        
+        spans = db.query(ScanSpan).filter(ScanSpan.scan_id == scan_id).order_by(ScanSpan.started_at).all()
+        
+        breakdown: Dict[str, float] = {}
+        for span in spans:
+            breakdown[span.name] = breakdown.get(span.name, 0.0) + (span.duration_ms or 0.0)
+        
+        total_ms = None
+        if spans:
+            started = min(span.started_at for span in spans)
+            finished = max(span.started_at.timestamp() + (span.duration_ms or 0.0) / 1000 for span in spans)
+            total_ms = (finished - started.timestamp()) * 1000
+        
+        return {
+            "scan_id": scan_id,
+            "trace_id": spans[0].trace_id if spans else None,
+            "total_ms": total_ms,
+            "breakdown": breakdown,
+            "stages": scan.stage_durations or {},
+            "spans": spans
+        }
+    
+    @staticmethod
+    def extract_cvss_score(vuln_data: Dict[str, Any]) -> str:
+        """Извлечение оценки CVSS v3 из находки Trivy (оценки сгруппированы по источникам)"""
+        cvss = vuln_data.get("CVSS") or {}
+        
+        # Старый плоский формат
+        if "V3Score" in cvss:
+            return str(cvss["V3Score"])
+        
+        sources = [PREFERRED_CVSS_SOURCE] + [source for source in cvss if source != PREFERRED_CVSS_SOURCE]
+        for source in sources:
+            score = (cvss.get(source) or {}).get("V3Score")
+            if score is not None:
+                return str(score)
+        
+        return ""
+    
+    @staticmethod
+    def is_projected(details: Optional[Dict[str, Any]]) -> bool:
+        """Проверка, что в БД сохранена только проекция находки, а не полные данные Trivy"""
+        ingest_keys = {field.split(".")[0] for field in INGEST_FIELDS}
+        return not details or set(details).issubset(ingest_keys)
+    
+    @staticmethod
+    async def get_vulnerability_details(db: Session, vulnerability_id: str) -> Optional[Vulnerability]:
+        """Получение уязвимости с полными данными находки, загружаемыми с агента по требованию"""
+        vulnerability = db.query(Vulnerability).filter(Vulnerability.id == vulnerability_id).first()
+        if not vulnerability:
+            return None
+        
+        if not ScanService.is_projected(vulnerability.details):
+            return vulnerability
+        
+        scan = vulnerability.scan
+        host = db.query(Host).filter(Host.id == scan.host_id).first()
+        if not host:
+            return vulnerability
+        
+        details = vulnerability.details or {}
+        params = {
+            key: details[field]
+            for key, field in (("pkg_name", "PkgName"), ("installed_version", "InstalledVersion"))
+            if details.get(field)
+        }
+        
+        try:
+            findings = await AgentClient.get(
+                host,
+                f"/scan/{scan.scan_id}/vulnerabilities/{vulnerability.cve_id}",
+                params=params,
+                timeout=10.0
+            )
+            if findings:
+                # Сохраняем полные данные, чтобы не обращаться к агенту повторно
+                vulnerability.details = findings[0]
+                invalidate_scans(db, [scan.scan_id])
+                db.commit()
+                db.refresh(vulnerability)
+        except httpx.HTTPError as e:
+            # Агент мог быть перезапущен и больше не хранит результаты сканирования
+            logger.warning(f"Full details for {vulnerability.cve_id} are not available on {host.name}: {str(e)}")
+        except Exception as e:
+            logger.error(f"Error fetching details for vulnerability {vulnerability_id}: {str(e)}")
+        
+        return vulnerability
+    
     @staticmethod
     def process_vulnerabilities(db: Session, scan_id: str, scan_results: Dict[str, Any]) -> None:
         """Обработка результатов сканирования и сохранение уязвимостей в БД"""
         try:
+            # Сводка по критичности для подписчиков: находки не перечитываются из БД после сохранения
+            counts = {level: 0 for level in SEVERITY_LEVELS}
+            counts["unknown"] = 0
+            # Находки хранятся в секции сканирования: время сканирования копируется в каждую строку
+            scanned_at, host_id = db.query(ScanHistory.started_at, ScanHistory.host_id).filter(
+                ScanHistory.scan_id == scan_id
+            ).one()
+            
             # Проверяем, существуют ли результаты сканирования
             if not scan_results or "Results" not in scan_results:
                 logger.warning(f"No vulnerability results for scan {scan_id}")
+                event_bus.publish(db, "ingestion_completed", {
+                    "scan_id": scan_id, "host_id": host_id, "rows": 0, "severity": {**counts, "total": 0}
+                })
                 return
             
+            started = time.perf_counter()
+            rows = 0
             results = scan_results.get("Results", [])
             for result in results:
                 if "Vulnerabilities" not in result:
@@ -246,16 +915,36 @@ class ScanService:
                     vulnerability = Vulnerability(
                         scan_id=scan_id,
                         cve_id=vuln_data.get("VulnerabilityID", "Unknown"),
-                        cvss=vuln_data.get("CVSS", {}).get("V3Score", ""),
+                        cvss=ScanService.extract_cvss_score(vuln_data),
                         severity=vuln_data.get("Severity", ""),
                         description=description,
                         recommendation=recommendation,
+                        pkg_name=vuln_data.get("PkgName") or None,
+                        pkg_version=vuln_data.get("InstalledVersion") or None,
+                        fixed_version=fixed_version or None,
+                        scanned_at=scanned_at,
                         details=vuln_data
                     )
                     db.add(vulnerability)
+                    rows += 1
+                    level = (vulnerability.severity or "").lower()
+                    counts[level if level in SEVERITY_LEVELS else "unknown"] += 1
             
+            counts["total"] = rows
+            event_bus.publish(db, "ingestion_completed", {
+                "scan_id": scan_id, "host_id": host_id, "rows": rows, "severity": counts
+            })
             db.commit()
-            logger.info(f"Processed vulnerabilities for scan {scan_id}")
+            
+            elapsed = time.perf_counter() - started
+            span = current_span()
+            if span is not None:
+                span.set_attribute("rows", rows)
+            INGESTED_VULNERABILITIES.inc(rows)
+            INGESTION_DURATION_SECONDS.observe(elapsed)
+            if elapsed > 0:
+                INGESTION_ROWS_PER_SECOND.set(rows / elapsed)
+            logger.info(f"Processed {rows} vulnerabilities for scan {scan_id} in {elapsed:.2f}s")
         
         except Exception as e:
             logger.error(f"Error processing vulnerabilities for scan {scan_id}: {str(e)}")
@@ -272,8 +961,11 @@ class ScanService:
                 logger.error(f"Scan not found: {scan_id}")
                 return None
                 
-            # Получаем все уязвимости для этого сканирования
-            vulnerabilities = ScanService.get_vulnerabilities(db, scan_id=scan_id)
+            # Получаем все уязвимости для этого сканирования; полные находки нужны только в JSON
+            fields = VULNERABILITY_FIELDS if format == 'json' else VULNERABILITY_FIELDS[:-1]
+            vulnerabilities = ScanService.get_vulnerabilities(
+                db, scan_id=scan_id, limit=None, fields=fields, scanned_at=scan.started_at
+            )
             
             # Формируем отчет
             report = {
@@ -286,6 +978,13 @@ class ScanService:
                 "vulnerabilities": []
             }
             
+            # Находки старых сканирований удалены политикой хранения, осталась только сводка
+            if scan.summary is not None:
+                report["summary"] = {
+                    level: getattr(scan.summary, level)
+                    for level in ("critical", "high", "medium", "low", "unknown", "total")
+                }
+            
             # Добавляем уязвимости в отчет
             for vuln in vulnerabilities:
                 vulnerability_data = {
@@ -0,0 +1,212 @@
+import math
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.models import Container, ScanHistory, TimingBucket
+
+# Корзины гистограмм (мс): корзина 0 — до 100 мс, дальше границы растут на 25%
+# (погрешность процентиля не больше шага), последняя корзина — все, что длиннее ~18 часов
+BUCKET_BASE_MS = 100.0
+BUCKET_GROWTH = 1.25
+OVERFLOW_BUCKET = 61
+
+# Вид операции и ключ гистограммы для сканирований
+SCAN_KIND = "scan"
+SCAN_KEY = "trivy"
+# Вид операции для этапов работы Trivy (ключ — этап: db, image_fetch, layer_analysis, detection)
+SCAN_STAGE_KIND = "scan_stage"
+# Вид операции для исправлений: простой контейнера (от остановки до запуска нового), а не время всего шага
+REMEDIATION_KIND = "remediation_downtime"
+
+# Гистограмма: корзина → [число измерений, сумма длительностей в мс]
+Histogram = Dict[int, List[float]]
+
+def bucket_for(duration_ms: float) -> int:
+    if duration_ms <= BUCKET_BASE_MS:
+        return 0
+    return min(math.ceil(math.log(duration_ms / BUCKET_BASE_MS, BUCKET_GROWTH)), OVERFLOW_BUCKET)
+
+def bucket_bounds(bucket: int) -> Tuple[float, float]:
+    if bucket == 0:
+        return 0.0, BUCKET_BASE_MS
+    return BUCKET_BASE_MS * BUCKET_GROWTH ** (bucket - 1), BUCKET_BASE_MS * BUCKET_GROWTH ** bucket
+
+def percentile(histogram: Histogram, q: float) -> float:
+    """Процентиль по гистограмме: линейная интерполяция внутри корзины"""
+    target = q * sum(count for count, _ in histogram.values())
+    seen = 0.0
+    for bucket in sorted(histogram):
+        count, total_ms = histogram[bucket]
+        if count and seen + count >= target:
+            if bucket == OVERFLOW_BUCKET:
+                # У последней корзины нет верхней границы: берем среднее ее измерений
+                return total_ms / count
+            lower, upper = bucket_bounds(bucket)
+            return lower + (upper - lower) * (target - seen) / count
+        seen += count
+    return 0.0
+
+def merge(histograms: Iterable[Histogram]) -> Histogram:
+    merged: Histogram = {}
+    for histogram in histograms:
+        for bucket, (count, total_ms) in histogram.items():
+            values = merged.setdefault(bucket, [0, 0.0])
+            values[0] += count
+            values[1] += total_ms
+    return merged
+
+class TimingService:
+    """Сервис длительностей сканирований и исправлений
+    
+    Измерения накапливаются в гистограммах (app.models.TimingBucket) по виду операции, ключу,
+    образу и хосту, оценки строятся по их процентилям.
+    """
+    
+    @staticmethod
+    def record(db: Session, kind: str, key: str, image: str, host_id: str, duration_ms: float) -> None:
+        """Добавление измерения в гистограмму (без commit)"""
+        bucket = bucket_for(duration_ms)
+        if db.get_bind().dialect.name == "postgresql":
+            # Одна строка на корзину: параллельные измерения не конфликтуют дольше одного UPDATE
+            statement = pg_insert(TimingBucket).values(
+                kind=kind, key=key, image=image, host_id=host_id, bucket=bucket, count=1, total_ms=duration_ms
+            )
+            statement = statement.on_conflict_do_update(
+                index_elements=["kind", "key", "image", "host_id", "bucket"],
+                set_={
+                    "count": TimingBucket.count + 1,
+                    "total_ms": TimingBucket.total_ms + duration_ms,
+                    "updated_at": func.now()
+                }
+            )
+            db.execute(statement)
+            return
+        
+        row = db.get(TimingBucket, (kind, key, image, host_id, bucket))
+        if row is None:
+            db.add(TimingBucket(
+                kind=kind, key=key, image=image, host_id=host_id, bucket=bucket, count=1, total_ms=duration_ms
+            ))
+        else:
+            row.count += 1
+            row.total_ms += duration_ms
+    
+    @staticmethod
+    def record_scan(db: Session, db_scan: ScanHistory, spans: List[Dict[str, Any]]) -> None:
+        """Длительность сканирования образа: работа Trivy по трассе агента, иначе все сканирование
+        
+        Длительности этапов Trivy (ScanHistory.stage_durations) записываются отдельно, с ключом этапа.
+        """
+        duration_ms = next((span["duration_ms"] for span in spans if span.get("name") == "trivy.run"), None)
+        if duration_ms is None and db_scan.started_at and db_scan.finished_at:
+            duration_ms = (db_scan.finished_at - db_scan.started_at).total_seconds() * 1000
+        container = db.query(Container.image).filter(
+            Container.container_id == db_scan.container_id,
+            Container.host_id == db_scan.host_id
+        ).first()
+        if container is None:
+            return
+        if duration_ms is not None:
+            TimingService.record(db, SCAN_KIND, SCAN_KEY, container.image, db_scan.host_id, duration_ms)
+        for stage, stage_ms in (db_scan.stage_durations or {}).items():
+            TimingService.record(db, SCAN_STAGE_KIND, stage, container.image, db_scan.host_id, stage_ms)
+    
+    @staticmethod
+    def summarize(histogram: Histogram) -> Dict[str, Any]:
+        count = int(sum(count for count, _ in histogram.values()))
+        total_ms = sum(total_ms for _, total_ms in histogram.values())
+        return {
+            "count": count,
+            "mean_ms": total_ms / count if count else None,
+            "p50_ms": percentile(histogram, 0.5) if count else None,
+            "p95_ms": percentile(histogram, 0.95) if count else None,
+        }
+    
+    @staticmethod
+    def get_histograms(db: Session, kind: str, key: str, images: Iterable[str]) -> Dict[str, Any]:
+        """Гистограммы для оценки: по образу и хосту, по образу и по всему парку"""
+        by_host: Dict[Tuple[str, str], Histogram] = {}
+        rows = db.query(
+            TimingBucket.image, TimingBucket.host_id, TimingBucket.bucket, TimingBucket.count, TimingBucket.total_ms
+        ).filter(
+            TimingBucket.kind == kind,
+            TimingBucket.key == key,
+            TimingBucket.image.in_(list(images))
+        )
+        for image, host_id, bucket, count, total_ms in rows:
+            by_host.setdefault((image, host_id), {})[bucket] = [count, total_ms]
+        
+        by_image: Dict[str, Histogram] = {}
+        for (image, _), histogram in by_host.items():
+            by_image[image] = merge([by_image.get(image, {}), histogram])
+        
+        fleet = db.query(TimingBucket.bucket, func.sum(TimingBucket.count), func.sum(TimingBucket.total_ms)).filter(
+            TimingBucket.kind == kind,
+            TimingBucket.key == key
+        ).group_by(TimingBucket.bucket)
+        return {
+            "by_host": by_host,
+            "by_image": by_image,
+            "fleet": {bucket: [count, total_ms] for bucket, count, total_ms in fleet},
+        }
+    
+    @staticmethod
+    def estimate(histograms: Dict[str, Any], image: str, host_id: str) -> Tuple[Optional[Dict[str, Any]], str]:
+        """Процентили для контейнера по самой точной гистограмме с TIMING_MIN_SAMPLES измерениями
+        
+        Возвращает сводку и уровень (host, image, fleet) или (None, "default") при нехватке данных.
+        """
+        candidates = (
+            ("host", histograms["by_host"].get((image, host_id))),
+            ("image", histograms["by_image"].get(image)),
+            ("fleet", histograms["fleet"]),
+        )
+        for level, histogram in candidates:
+            if histogram and sum(count for count, _ in histogram.values()) >= settings.TIMING_MIN_SAMPLES:
+                return TimingService.summarize(histogram), level
+        return None, "default"
+    
+    @staticmethod
+    def get_stats(
+        db: Session,
+        kind: Optional[str] = None,
+        key: Optional[str] = None,
+        image: Optional[str] = None,
+        skip: int = 0,
+        limit: int = 100
+    ) -> List[Dict[str, Any]]:
+        """Процентили по виду операции, ключу и образу (все хосты вместе)"""
+        query = db.query(
+            TimingBucket.kind,
+            TimingBucket.key,
+            TimingBucket.image,
+            TimingBucket.bucket,
+            func.sum(TimingBucket.count),
+            func.sum(TimingBucket.total_ms),
+            func.max(TimingBucket.updated_at)
+        )
+        if kind:
+            query = query.filter(TimingBucket.kind == kind)
+        if key:
+            query = query.filter(TimingBucket.key == key)
+        if image:
+            query = query.filter(TimingBucket.image == image)
+        query = query.group_by(TimingBucket.kind, TimingBucket.key, TimingBucket.image, TimingBucket.bucket)
+        
+        groups: Dict[Tuple[str, str, str], Histogram] = {}
+        updated: Dict[Tuple[str, str, str], datetime] = {}
+        for row_kind, row_key, row_image, bucket, count, total_ms, updated_at in query:
+            group = (row_kind, row_key, row_image)
+            groups.setdefault(group, {})[bucket] = [count, total_ms]
+            if updated_at and (group not in updated or updated_at > updated[group]):
+                updated[group] = updated_at
+        
+        stats = [
+            {"kind": group[0], "key": group[1], "image": group[2], "updated_at": updated.get(group), **TimingService.summarize(histogram)}
+            for group, histogram in sorted(groups.items())
+        ]
+        return stats[skip:skip + limit]
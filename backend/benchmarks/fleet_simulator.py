@@ -0,0 +1,248 @@
+"""Имитация парка sidecar-агентов в одном процессе для нагрузочного тестирования бэкенда.
+
+Реализует API агента (/containers, /scan, /scan/{id} и его отмену, /scan/{id}/result,
+/scan/{id}/vulnerabilities/{vulnerability_id}). Виртуальный хост определяется по заголовку
+Host: все адреса 127.0.0.0/8 ведут на loopback, поэтому хосты регистрируются
+в бэкенде как 127.0.X.Y с одним и тем же портом симулятора.
+
+    python -m benchmarks.fleet_simulator --port 5000 --containers-per-host 30 \\
+        --scan-latency 20 --failure-rate 0.02 --timeout-rate 0.01
+"""
+import argparse
+import asyncio
+import json
+import math
+import random
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.middleware.gzip import GZipMiddleware
+from pydantic import BaseModel
+
+from benchmarks.synthetic import make_containers, make_trivy_report
+
+class SimulatorConfig(BaseModel):
+    containers_per_host: int = 20
+    # Средняя длительность сканирования и разброс (логнормальное распределение)
+    scan_latency: float = 10.0
+    scan_latency_sigma: float = 0.5
+    # Среднее число находок в результате сканирования
+    findings: int = 300
+    failure_rate: float = 0.0
+    # Доля запросов, которые "зависают" дольше таймаута клиента
+    timeout_rate: float = 0.0
+    timeout_seconds: float = 60.0
+    # Задержка ответа на любой запрос, мс
+    request_latency_ms: float = 0.0
+    # Доля контейнеров хоста, заменяемых в минуту
+    churn_per_minute: float = 0.0
+    result_cache_size: int = 256
+    seed: int = 42
+
+class VirtualHost:
+    """Состояние одного имитируемого хоста"""
+
+    def __init__(self, index: int, config: SimulatorConfig):
+        self.index = index
+        self.config = config
+        self.generation = 0
+        self.generation_started = time.monotonic()
+
+    def containers(self) -> List[Dict[str, Any]]:
+        # Поколение меняется раз в минуту, при смене заменяется доля контейнеров
+        if self.config.churn_per_minute > 0 and time.monotonic() - self.generation_started >= 60:
+            self.generation += 1
+            self.generation_started = time.monotonic()
+        return make_containers(
+            self.index,
+            self.config.containers_per_host,
+            generation=self.generation,
+            churn=self.config.churn_per_minute,
+            seed=self.config.seed
+        )
+
+class SimulatedScan:
+    def __init__(self, scan_id: str, container_id: str, duration: float, fails: bool, findings: int):
+        self.scan_id = scan_id
+        self.container_id = container_id
+        self.started = time.time()
+        self.duration = duration
+        self.fails = fails
+        self.findings = findings
+        self.cancelled_at: Optional[float] = None
+
+    @property
+    def status(self) -> str:
+        if self.cancelled_at is not None:
+            return "error"
+        elapsed = time.time() - self.started
+        if elapsed < min(1.0, self.duration / 10):
+            return "pending"
+        if elapsed < self.duration:
+            return "running"
+        return "error" if self.fails else "completed"
+
+    def to_dict(self) -> Dict[str, Any]:
+        status = self.status
+        finished = status in ("completed", "error")
+        return {
+            "scan_id": self.scan_id,
+            "container_id": self.container_id,
+            "status": status,
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(self.started)),
+            "finished_at": (
+                time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(self.started + self.duration))
+                if finished else None
+            ),
+            "result_size": None,
+            "error": (
+                "Scan cancelled" if self.cancelled_at is not None
+                else "Simulated Trivy failure" if status == "error" else None
+            ),
+            "spans": [],
+        }
+
+def project(value: Any, fields: List[str]) -> Any:
+    """Упрощенная проекция находок: поддерживаются только поля верхнего уровня и CVSS.*.V3Score"""
+    top_level = {field.split(".")[0] for field in fields}
+    projected = {key: value[key] for key in value if key in top_level}
+    if "CVSS" in projected and "CVSS.*.V3Score" in fields:
+        projected["CVSS"] = {
+            source: {"V3Score": scores.get("V3Score")} for source, scores in projected["CVSS"].items()
+        }
+    return projected
+
+def create_app(config: SimulatorConfig) -> FastAPI:
+    app = FastAPI(title="Aegis Agent Fleet Simulator")
+    app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+    hosts: Dict[str, VirtualHost] = {}
+    scans: Dict[str, SimulatedScan] = {}
+    results: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+    rng = random.Random(config.seed)
+    stats = {"requests": 0, "timeouts": 0, "scans": 0}
+
+    def virtual_host(request: Request) -> VirtualHost:
+        key = request.headers.get("host", "default")
+        if key not in hosts:
+            hosts[key] = VirtualHost(len(hosts), config)
+        return hosts[key]
+
+    async def simulate_latency() -> None:
+        stats["requests"] += 1
+        if config.timeout_rate and rng.random() < config.timeout_rate:
+            stats["timeouts"] += 1
+            await asyncio.sleep(config.timeout_seconds)
+        elif config.request_latency_ms:
+            await asyncio.sleep(rng.expovariate(1000 / config.request_latency_ms))
+
+    def get_result(scan: SimulatedScan) -> Dict[str, Any]:
+        if scan.scan_id not in results:
+            results[scan.scan_id] = make_trivy_report(scan.findings, seed=zlib.crc32(scan.scan_id.encode()))
+            while len(results) > config.result_cache_size:
+                results.popitem(last=False)
+        results.move_to_end(scan.scan_id)
+        return results[scan.scan_id]
+
+    def get_scan(scan_id: str) -> SimulatedScan:
+        if scan_id not in scans:
+            raise HTTPException(status_code=404, detail=f"Scan {scan_id} not found")
+        return scans[scan_id]
+
+    @app.get("/")
+    async def read_root():
+        return {"status": "ok", "service": "Aegis Agent Fleet Simulator", "hosts": len(hosts), **stats}
+
+    @app.get("/containers")
+    async def list_containers(request: Request):
+        await simulate_latency()
+        return virtual_host(request).containers()
+
+    @app.post("/scan")
+    async def start_scan(request: Request):
+        await simulate_latency()
+        body = await request.json()
+        duration = config.scan_latency * math.exp(rng.gauss(0, config.scan_latency_sigma) - config.scan_latency_sigma ** 2 / 2)
+        findings = max(0, int(rng.gauss(config.findings, config.findings / 4)))
+        scan = SimulatedScan(
+            body.get("scan_id") or str(uuid.uuid4()),
+            body["container_id"],
+            duration,
+            rng.random() < config.failure_rate,
+            findings
+        )
+        scans[scan.scan_id] = scan
+        stats["scans"] += 1
+        return scan.to_dict()
+
+    @app.get("/scan/{scan_id}")
+    async def get_scan_status(scan_id: str):
+        await simulate_latency()
+        return get_scan(scan_id).to_dict()
+
+    @app.delete("/scan/{scan_id}")
+    async def cancel_scan(scan_id: str):
+        await simulate_latency()
+        scan = get_scan(scan_id)
+        if scan.status in ("completed", "error"):
+            raise HTTPException(status_code=409, detail=f"Scan {scan_id} is already finished")
+        scan.cancelled_at = time.time()
+        return scan.to_dict()
+
+    @app.get("/scan/{scan_id}/result")
+    async def get_scan_result(scan_id: str, fields: Optional[str] = None):
+        await simulate_latency()
+        scan = get_scan(scan_id)
+        if scan.status != "completed":
+            raise HTTPException(status_code=409, detail=f"Scan {scan_id} is not completed")
+
+        report = get_result(scan)
+        if fields:
+            field_list = [field.strip() for field in fields.split(",") if field.strip()]
+            report = {
+                **{key: report[key] for key in ("SchemaVersion", "ArtifactName", "ArtifactType")},
+                "Results": [
+                    {
+                        **{key: result[key] for key in ("Target", "Class", "Type")},
+                        "Vulnerabilities": [project(vuln, field_list) for vuln in result["Vulnerabilities"]],
+                    }
+                    for result in report["Results"]
+                ],
+            }
+        return Response(content=json.dumps(report, separators=(",", ":")), media_type="application/json")
+
+    @app.get("/scan/{scan_id}/vulnerabilities/{vulnerability_id}")
+    async def get_scan_vulnerability(scan_id: str, vulnerability_id: str):
+        await simulate_latency()
+        report = get_result(get_scan(scan_id))
+        findings = [
+            vuln
+            for result in report["Results"]
+            for vuln in result["Vulnerabilities"]
+            if vuln["VulnerabilityID"] == vulnerability_id
+        ]
+        if not findings:
+            raise HTTPException(status_code=404, detail=f"Vulnerability {vulnerability_id} not found")
+        return findings
+
+    return app
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Simulated fleet of Aegis sidecar agents")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    defaults = SimulatorConfig()
+    for name, field in SimulatorConfig.model_fields.items():
+        parser.add_argument(f"--{name.replace('_', '-')}", type=type(field.default), default=getattr(defaults, name))
+    args = parser.parse_args(argv)
+
+    config = SimulatorConfig(**{name: getattr(args, name) for name in SimulatorConfig.model_fields})
+    uvicorn.run(create_app(config), host=args.host, port=args.port, log_level="warning")
+
+if __name__ == "__main__":
+    main()
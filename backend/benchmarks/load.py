@@ -0,0 +1,260 @@
+"""Нагрузочный прогон бэкенда против имитации парка агентов (benchmarks.fleet_simulator).
+
+Регистрирует N хостов с адресами 127.0.X.Y (все указывают на симулятор), синхронизирует
+контейнеры, держит открытыми SSE-потоки, запускает сканирования и опрашивает их статус
+до завершения. Итог — латентности по фазам и счетчики из /metrics бэкенда.
+
+    python -m benchmarks.fleet_simulator --port 5000 --scan-latency 15 &
+    python -m benchmarks.load --backend-url http://127.0.0.1:8000/v1 --hosts 500 \\
+        --scans 1000 --scan-rate 20 --sse-clients 10 --output load.json
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from benchmarks.run import percentile
+
+TERMINAL_STATUSES = {"completed", "error"}
+
+def host_address(index: int) -> str:
+    """Адрес виртуального хоста в 127.0.0.0/8; симулятор различает хосты по заголовку Host"""
+    return f"127.0.{index // 250}.{index % 250 + 1}"
+
+def summarize(latencies: List[float]) -> Dict[str, Any]:
+    if not latencies:
+        return {"count": 0}
+    return {
+        "count": len(latencies),
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": max(latencies) * 1000,
+    }
+
+class LoadRun:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.client = httpx.AsyncClient(
+            base_url=args.backend_url.rstrip("/"),
+            timeout=args.timeout,
+            limits=httpx.Limits(max_connections=args.concurrency + args.sse_clients)
+        )
+        self.limit = asyncio.Semaphore(args.concurrency)
+        self.rng = random.Random(args.seed)
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+        self.outcomes: Dict[str, int] = {}
+        self.sse: Dict[str, Any] = {"events": 0, "cycles": []}
+
+    async def call(self, phase: str, method: str, path: str, **kwargs) -> Optional[httpx.Response]:
+        """Запрос к бэкенду с учетом латентности и ошибок по фазе"""
+        async with self.limit:
+            started = time.perf_counter()
+            try:
+                response = await self.client.request(method, path, **kwargs)
+                response.raise_for_status()
+                return response
+            except Exception as e:
+                key = f"{phase}: {type(e).__name__}"
+                self.errors[key] = self.errors.get(key, 0) + 1
+                return None
+            finally:
+                self.latencies.setdefault(phase, []).append(time.perf_counter() - started)
+
+    async def register_hosts(self) -> List[str]:
+        async def register(index: int) -> Optional[str]:
+            response = await self.call("register_host", "POST", "/hosts/", json={
+                "name": f"load-{self.args.run_id}-{index}",
+                "address": host_address(index),
+                "port": self.args.agent_port,
+            })
+            return response.json()["id"] if response else None
+
+        host_ids = await asyncio.gather(*(register(i) for i in range(self.args.hosts)))
+        return [host_id for host_id in host_ids if host_id]
+
+    async def refresh_containers(self, host_ids: List[str]) -> List[Dict[str, str]]:
+        async def refresh(host_id: str) -> List[Dict[str, Any]]:
+            response = await self.call("refresh_containers", "GET", f"/hosts/{host_id}/containers", params={"refresh": "true"})
+            return response.json() if response else []
+
+        containers = await asyncio.gather(*(refresh(host_id) for host_id in host_ids))
+        return [
+            {"host_id": container["host_id"], "container_id": container["container_id"]}
+            for host_containers in containers
+            for container in host_containers
+        ]
+
+    async def watch_stream(self, stop: asyncio.Event) -> None:
+        """Подписчик SSE: число событий и время полного обхода хостов"""
+        last_seen: Dict[str, float] = {}
+        try:
+            async with self.client.stream("GET", "/hosts/stream", timeout=None) as response:
+                async for line in response.aiter_lines():
+                    if stop.is_set():
+                        break
+                    if not line.startswith("id:"):
+                        continue
+                    now = time.perf_counter()
+                    host_id = line[3:].strip()
+                    self.sse["events"] += 1
+                    if host_id in last_seen:
+                        self.sse["cycles"].append(now - last_seen[host_id])
+                    last_seen[host_id] = now
+        except Exception as e:
+            key = f"sse: {type(e).__name__}"
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+    async def run_scan(self, target: Dict[str, str]) -> None:
+        started = time.perf_counter()
+        response = await self.call("start_scan", "POST", "/scan/", json=target)
+        if response is None:
+            self.outcomes["not_started"] = self.outcomes.get("not_started", 0) + 1
+            return
+
+        scan_id = response.json()["scan_id"]
+        deadline = started + self.args.scan_deadline
+        status = "pending"
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(self.args.poll_interval)
+            response = await self.call("poll_scan", "GET", f"/scan/{scan_id}")
+            if response is None:
+                continue
+            status = response.json()["status"]
+            if status in TERMINAL_STATUSES:
+                self.latencies.setdefault(f"scan_{status}", []).append(time.perf_counter() - started)
+                break
+        else:
+            status = "deadline_exceeded"
+
+        self.outcomes[status] = self.outcomes.get(status, 0) + 1
+
+    async def run_scans(self, containers: List[Dict[str, str]]) -> None:
+        tasks = []
+        for _ in range(self.args.scans):
+            tasks.append(asyncio.create_task(self.run_scan(self.rng.choice(containers))))
+            await asyncio.sleep(1 / self.args.scan_rate)
+        await asyncio.gather(*tasks)
+
+    async def backend_metrics(self) -> Dict[str, float]:
+        """Счетчики бэкенда, относящиеся к сохранению результатов"""
+        try:
+            response = await self.client.get(self.args.backend_url.rstrip("/").rsplit("/", 1)[0] + "/metrics")
+        except Exception:
+            return {}
+        wanted = (
+            "aegis_ingested_vulnerabilities_total",
+            "aegis_ingestion_duration_seconds_sum",
+            "aegis_ingestion_duration_seconds_count",
+            "aegis_sse_subscribers",
+        )
+        values = {}
+        for line in response.text.splitlines():
+            name, _, value = line.partition(" ")
+            if name in wanted:
+                values[name] = float(value)
+        return values
+
+    async def execute(self) -> Dict[str, Any]:
+        metrics_before = await self.backend_metrics()
+
+        started = time.perf_counter()
+        host_ids = await self.register_hosts()
+        containers = await self.refresh_containers(host_ids)
+        print(f"Registered {len(host_ids)} hosts with {len(containers)} containers in {time.perf_counter() - started:.1f} s")
+        if not containers:
+            raise RuntimeError("no containers were synchronized, is the simulator running?")
+
+        stop = asyncio.Event()
+        watchers = [asyncio.create_task(self.watch_stream(stop)) for _ in range(self.args.sse_clients)]
+
+        scans_started = time.perf_counter()
+        await self.run_scans(containers)
+        scans_elapsed = time.perf_counter() - scans_started
+
+        metrics_after = await self.backend_metrics()
+        stop.set()
+        for watcher in watchers:
+            watcher.cancel()
+        await asyncio.gather(*watchers, return_exceptions=True)
+        await self.client.aclose()
+
+        ingested = metrics_after.get("aegis_ingested_vulnerabilities_total", 0) - metrics_before.get("aegis_ingested_vulnerabilities_total", 0)
+        ingestion_seconds = (
+            metrics_after.get("aegis_ingestion_duration_seconds_sum", 0)
+            - metrics_before.get("aegis_ingestion_duration_seconds_sum", 0)
+        )
+        return {
+            "meta": {
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "hosts": len(host_ids),
+                "containers": len(containers),
+                "scans": self.args.scans,
+                "scan_rate": self.args.scan_rate,
+                "sse_clients": self.args.sse_clients,
+                "poll_interval": self.args.poll_interval,
+            },
+            "phases": {phase: summarize(values) for phase, values in sorted(self.latencies.items())},
+            "scan_outcomes": self.outcomes,
+            "scans_per_second": self.args.scans / scans_elapsed if scans_elapsed else 0.0,
+            "sse": {
+                "events": self.sse["events"],
+                "refresh_cycle": summarize(self.sse["cycles"]),
+            },
+            "ingestion": {
+                "rows": ingested,
+                "rows_per_second": ingested / ingestion_seconds if ingestion_seconds else 0.0,
+            },
+            "errors": self.errors,
+        }
+
+def print_summary(result: Dict[str, Any]) -> None:
+    print(f"\n{'phase':<22} {'count':>7} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10}")
+    phases = dict(result["phases"], sse_refresh_cycle=result["sse"]["refresh_cycle"])
+    for phase, stats in phases.items():
+        if not stats["count"]:
+            continue
+        print(f"{phase:<22} {stats['count']:>7} {stats['p50_ms']:>10.1f} {stats['p95_ms']:>10.1f} {stats['p99_ms']:>10.1f}")
+    print(f"\nScan outcomes: {result['scan_outcomes']}")
+    print(f"SSE events: {result['sse']['events']}")
+    print(f"Ingested rows: {result['ingestion']['rows']:.0f} ({result['ingestion']['rows_per_second']:.0f} rows/s)")
+    if result["errors"]:
+        print(f"Errors: {result['errors']}")
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Aegis backend load test against the simulated agent fleet")
+    parser.add_argument("--backend-url", default="http://127.0.0.1:8000/v1")
+    parser.add_argument("--agent-port", type=int, default=5000, help="порт симулятора агентов")
+    parser.add_argument("--hosts", type=int, default=500)
+    parser.add_argument("--scans", type=int, default=500)
+    parser.add_argument("--scan-rate", type=float, default=10.0, help="запусков сканирования в секунду")
+    parser.add_argument("--poll-interval", type=float, default=2.0)
+    parser.add_argument("--scan-deadline", type=float, default=600.0, help="максимальное время ожидания сканирования")
+    parser.add_argument("--sse-clients", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=100, help="одновременных запросов к бэкенду")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--run-id", default=datetime.now().strftime("%Y%m%d%H%M%S"),
+                        help="суффикс имен хостов, чтобы прогоны не пересекались")
+    parser.add_argument("--output", help="файл для сохранения результатов (JSON)")
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(LoadRun(args).execute())
+    print_summary(result)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, sort_keys=True)
+        print(f"Results written to {args.output}")
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+"""Генераторы синтетических данных для бенчмарков: отчеты Trivy и парки хостов"""
+import random
+from typing import Any, Dict, List
+
+SEVERITIES = ["CRITICAL", "HIGH", "MEDIUM", "LOW", "UNKNOWN"]
+SEVERITY_WEIGHTS = [5, 20, 40, 30, 5]
+
+OS_PACKAGES = [
+    "openssl", "libssl3", "libcrypto3", "zlib1g", "libc6", "libexpat1", "curl", "libcurl4",
+    "libxml2", "libsqlite3-0", "bash", "coreutils", "tar", "gzip", "perl-base", "libpcre2-8-0",
+    "libgnutls30", "libsystemd0", "libudev1", "ncurses-base", "libtinfo6", "apt", "dpkg", "login",
+]
+LANGUAGE_PACKAGES = [
+    "log4j-core", "jackson-databind", "spring-core", "netty-codec", "requests", "urllib3",
+    "django", "flask", "jinja2", "lodash", "express", "minimist", "axios", "golang.org/x/net",
+    "golang.org/x/crypto", "github.com/gin-gonic/gin", "rack", "nokogiri", "pyyaml", "pillow",
+]
+WORDS = (
+    "a flaw was found in the handling of crafted input that allows remote attackers to cause "
+    "denial of service or possibly execute arbitrary code via buffer overflow in the parser when "
+    "processing malformed certificates headers archives or compressed streams leading to memory "
+    "corruption use after free integer overflow out of bounds read information disclosure"
+).split()
+
+def _version(rng: random.Random) -> str:
+    return f"{rng.randint(0, 3)}.{rng.randint(0, 20)}.{rng.randint(0, 40)}"
+
+def _description(rng: random.Random) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(rng.randint(25, 60))).capitalize() + "."
+
+def make_finding(rng: random.Random, index: int, package: str) -> Dict[str, Any]:
+    """Одна находка Trivy со всеми полями, которые встречаются в реальных отчетах"""
+    cve_id = f"CVE-{rng.randint(2014, 2024)}-{10000 + index}"
+    installed = _version(rng)
+    severity = rng.choices(SEVERITIES, SEVERITY_WEIGHTS)[0]
+    score = round(rng.uniform(1.0, 10.0), 1)
+    finding = {
+        "VulnerabilityID": cve_id,
+        "PkgID": f"{package}@{installed}",
+        "PkgName": package,
+        "InstalledVersion": installed,
+        "Status": "fixed",
+        "Layer": {
+            "Digest": "sha256:" + "%064x" % rng.getrandbits(256),
+            "DiffID": "sha256:" + "%064x" % rng.getrandbits(256),
+        },
+        "SeveritySource": rng.choice(["nvd", "debian", "redhat", "ghsa"]),
+        "PrimaryURL": f"https://avd.aquasec.com/nvd/{cve_id.lower()}",
+        "DataSource": {
+            "ID": "debian",
+            "Name": "Debian Security Tracker",
+            "URL": "https://salsa.debian.org/security-tracker-team/security-tracker",
+        },
+        "Title": " ".join(rng.choice(WORDS) for _ in range(8)),
+        "Description": _description(rng),
+        "Severity": severity,
+        "CweIDs": [f"CWE-{rng.randint(20, 900)}"],
+        "CVSS": {
+            "nvd": {
+                "V2Vector": "AV:N/AC:L/Au:N/C:P/I:P/A:P",
+                "V3Vector": "CVSS:3.1/AV:N/AC:L/PR:N/UI:N/S:U/C:H/I:H/A:H",
+                "V2Score": round(score * 0.9, 1),
+                "V3Score": score,
+            },
+            "redhat": {
+                "V3Vector": "CVSS:3.1/AV:N/AC:H/PR:N/UI:N/S:U/C:H/I:N/A:N",
+                "V3Score": round(max(score - 1, 0.1), 1),
+            },
+        },
+        "References": [
+            f"https://nvd.nist.gov/vuln/detail/{cve_id}",
+            f"https://security-tracker.debian.org/tracker/{cve_id}",
+            f"https://access.redhat.com/security/cve/{cve_id}",
+        ],
+        "PublishedDate": "2023-03-14T18:15:00Z",
+        "LastModifiedDate": "2023-11-07T04:09:00Z",
+    }
+    if rng.random() < 0.7:
+        finding["FixedVersion"] = _version(rng)
+    return finding
+
+def make_trivy_report(findings: int, seed: int = 0, image: str = "registry.local/app:latest") -> Dict[str, Any]:
+    """Отчет Trivy с заданным числом находок, распределенных по ОС-пакетам и зависимостям"""
+    rng = random.Random(seed)
+    os_findings = int(findings * 0.6)
+
+    results = [
+        {
+            "Target": f"{image} (debian 12.4)",
+            "Class": "os-pkgs",
+            "Type": "debian",
+            "Vulnerabilities": [
+                make_finding(rng, i, rng.choice(OS_PACKAGES)) for i in range(os_findings)
+            ],
+        },
+        {
+            "Target": "app/requirements.txt",
+            "Class": "lang-pkgs",
+            "Type": "pip",
+            "Vulnerabilities": [
+                make_finding(rng, i, rng.choice(LANGUAGE_PACKAGES)) for i in range(os_findings, findings)
+            ],
+        },
+    ]
+
+    return {
+        "SchemaVersion": 2,
+        "ArtifactName": image,
+        "ArtifactType": "container_image",
+        "Metadata": {
+            "OS": {"Family": "debian", "Name": "12.4"},
+            "ImageID": "sha256:" + "%064x" % rng.getrandbits(256),
+            "RepoTags": [image],
+            "ImageConfig": {"architecture": "amd64", "os": "linux"},
+        },
+        "Results": results,
+    }
+
+def make_containers(host_index: int, count: int, generation: int = 0, churn: float = 0.0, seed: int = 0) -> List[Dict[str, Any]]:
+    """Список контейнеров хоста в формате агента; доля churn заменяется в каждом поколении"""
+    rng = random.Random(seed * 1000003 + host_index)
+    containers = []
+    for i in range(count):
+        # Замененные контейнеры получают новый ID в каждом поколении
+        replaced = generation > 0 and rng.random() < churn
+        suffix = f"{generation}" if replaced else "0"
+        containers.append({
+            "id": "%064x" % (host_index * 1_000_000 + i) + suffix,
+            "name": f"host{host_index}-svc{i}",
+            "image": f"registry.local/svc{i % 50}:{generation if replaced else 1}",
+            "status": "running",
+        })
+    return containers
@@ -0,0 +1,43 @@
+"""Окружение Alembic: подключение и метаданные моделей берутся из приложения"""
+from logging.config import fileConfig
+
+from alembic import context
+
+from app.core.config import settings
+from app.db.base import Base, engine
+import app.models.models  # noqa: F401 - регистрация моделей в метаданных
+
+config = context.config
+target_metadata = Base.metadata
+
+def run_migrations_offline() -> None:
+    """Генерация SQL без подключения к базе (alembic upgrade --sql)"""
+    context.configure(
+        url=settings.SQLALCHEMY_DATABASE_URI,
+        target_metadata=target_metadata,
+        literal_binds=True,
+        dialect_opts={"paramstyle": "named"},
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+def run_migrations_online() -> None:
+    # При запуске из бэкенда соединение (уже под блокировкой миграций) передается через attributes
+    connection = config.attributes.get("connection")
+    if connection is not None:
+        context.configure(connection=connection, target_metadata=target_metadata)
+        with context.begin_transaction():
+            context.run_migrations()
+        return
+
+    if config.config_file_name is not None:
+        fileConfig(config.config_file_name)
+    with engine.connect() as connection:
+        context.configure(connection=connection, target_metadata=target_metadata)
+        with context.begin_transaction():
+            context.run_migrations()
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
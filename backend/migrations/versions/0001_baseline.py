@@ -0,0 +1,244 @@
+"""Базовая схема: таблицы, которые до перехода на миграции создавались через create_all
+
+DDL зафиксирован в ревизии и не зависит от текущих моделей. Базы, созданные прежними версиями,
+не пересоздаются: существующие таблицы пропускаются, недостающие таблицы и колонки добавляются.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19 08:25:38.192053
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.core.config import settings
+
+# revision identifiers, used by Alembic.
+revision: str = "0001"
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Секционированные по месяцам scan_history и vulnerabilities (PARTITIONING_ENABLED, app.db.partitioning):
+# первичные ключи включают ключ секционирования, находки ссылаются на сканирование составным ключом
+PARTITIONED_TABLES = (
+    """CREATE TABLE scan_history (
+    scan_id VARCHAR(36) NOT NULL,
+    host_id VARCHAR(36) NOT NULL,
+    container_id VARCHAR(100) NOT NULL,
+    started_at TIMESTAMP WITHOUT TIME ZONE DEFAULT now(),
+    finished_at TIMESTAMP WITHOUT TIME ZONE,
+    status scanstatus NOT NULL,
+    PRIMARY KEY (scan_id, started_at),
+    FOREIGN KEY (host_id) REFERENCES hosts (id),
+    FOREIGN KEY (container_id, host_id) REFERENCES containers (container_id, host_id)
+) PARTITION BY RANGE (started_at)""",
+    """CREATE TABLE vulnerabilities (
+    id VARCHAR(36) NOT NULL,
+    scan_id VARCHAR(36) NOT NULL,
+    cve_id VARCHAR(50) NOT NULL,
+    cvss VARCHAR(10),
+    severity VARCHAR(20),
+    description TEXT,
+    recommendation TEXT,
+    pkg_name TEXT,
+    pkg_version TEXT,
+    fixed_version TEXT,
+    scanned_at TIMESTAMP WITHOUT TIME ZONE,
+    details JSON,
+    PRIMARY KEY (id, scanned_at),
+    FOREIGN KEY (scan_id, scanned_at) REFERENCES scan_history (scan_id, started_at)
+) PARTITION BY RANGE (scanned_at)""",
+)
+
+# Колонки находок, добавленные до перехода на миграции: в базах прежних версий их может не быть
+ADDED_VULNERABILITY_COLUMNS = (
+    "scanned_at TIMESTAMP WITHOUT TIME ZONE",
+    "pkg_name TEXT",
+    "pkg_version TEXT",
+    "fixed_version TEXT",
+)
+
+def create_scans_tables(postgresql: bool) -> None:
+    if settings.PARTITIONING_ENABLED:
+        if not postgresql:
+            raise RuntimeError("PARTITIONING_ENABLED requires PostgreSQL")
+        sa.Enum("PENDING", "RUNNING", "COMPLETED", "ERROR", name="scanstatus").create(op.get_bind(), checkfirst=True)
+        for statement in PARTITIONED_TABLES:
+            op.execute(statement)
+    else:
+        op.create_table("scan_history",
+            sa.Column("scan_id", sa.String(length=36), nullable=False),
+            sa.Column("host_id", sa.String(length=36), nullable=False),
+            sa.Column("container_id", sa.String(length=100), nullable=False),
+            sa.Column("started_at", sa.DateTime(), server_default=sa.text("now()"), nullable=True),
+            sa.Column("finished_at", sa.DateTime(), nullable=True),
+            sa.Column("status", sa.Enum("PENDING", "RUNNING", "COMPLETED", "ERROR", name="scanstatus"), nullable=False),
+            sa.ForeignKeyConstraint(["container_id", "host_id"], ["containers.container_id", "containers.host_id"], ),
+            sa.ForeignKeyConstraint(["host_id"], ["hosts.id"], ),
+            sa.PrimaryKeyConstraint("scan_id")
+        )
+        op.create_table("vulnerabilities",
+            sa.Column("id", sa.String(length=36), nullable=False),
+            sa.Column("scan_id", sa.String(length=36), nullable=False),
+            sa.Column("cve_id", sa.String(length=50), nullable=False),
+            sa.Column("cvss", sa.String(length=10), nullable=True),
+            sa.Column("severity", sa.String(length=20), nullable=True),
+            sa.Column("description", sa.Text(), nullable=True),
+            sa.Column("recommendation", sa.Text(), nullable=True),
+            sa.Column("pkg_name", sa.Text(), nullable=True),
+            sa.Column("pkg_version", sa.Text(), nullable=True),
+            sa.Column("fixed_version", sa.Text(), nullable=True),
+            sa.Column("scanned_at", sa.DateTime(), nullable=True),
+            sa.Column("details", sa.JSON(), nullable=True),
+            sa.ForeignKeyConstraint(["scan_id"], ["scan_history.scan_id"], ),
+            sa.PrimaryKeyConstraint("id")
+        )
+    op.create_index("ix_vulnerabilities_cve_id", "vulnerabilities", ["cve_id"], unique=False)
+    op.create_index("ix_vulnerabilities_pkg", "vulnerabilities", ["pkg_name", "pkg_version"], unique=False)
+    op.create_index("ix_vulnerabilities_scan_id", "vulnerabilities", ["scan_id"], unique=False)
+
+def upgrade() -> None:
+    conn = op.get_bind()
+    postgresql = conn.dialect.name == "postgresql"
+    # Без подключения (alembic upgrade --sql) схема считается пустой
+    existing = set() if op.get_context().as_sql else set(sa.inspect(conn).get_table_names())
+    if "hosts" not in existing:
+        op.create_table("hosts",
+            sa.Column("id", sa.String(length=36), nullable=False),
+            sa.Column("name", sa.String(length=100), nullable=False),
+            sa.Column("address", sa.String(length=255), nullable=False),
+            sa.Column("port", sa.Integer(), nullable=False),
+            sa.Column("description", sa.Text(), nullable=True),
+            sa.PrimaryKeyConstraint("id")
+        )
+    if "containers" not in existing:
+        op.create_table("containers",
+            sa.Column("container_id", sa.String(length=100), nullable=False),
+            sa.Column("host_id", sa.String(length=36), nullable=False),
+            sa.Column("name", sa.String(length=255), nullable=False),
+            sa.Column("image", sa.String(length=255), nullable=False),
+            sa.Column("status", sa.Enum("IDLE", "SCANNING", "SCANNED", "ERROR", name="containerstatus"), nullable=False),
+            sa.ForeignKeyConstraint(["host_id"], ["hosts.id"], ),
+            sa.PrimaryKeyConstraint("container_id", "host_id")
+        )
+    if "scan_history" not in existing:
+        create_scans_tables(postgresql)
+    elif postgresql:
+        if settings.PARTITIONING_ENABLED and conn.execute(
+            sa.text("SELECT relkind FROM pg_class WHERE oid = to_regclass('scan_history')")
+        ).scalar() != "p":
+            # Перенос сотен миллионов строк не делается автоматически при запуске
+            raise RuntimeError(
+                "Table scan_history exists and is not partitioned; "
+                "migrate it to a partitioned table before enabling PARTITIONING_ENABLED"
+            )
+        for column in ADDED_VULNERABILITY_COLUMNS:
+            op.execute(f"ALTER TABLE vulnerabilities ADD COLUMN IF NOT EXISTS {column}")
+        op.execute("CREATE INDEX IF NOT EXISTS ix_vulnerabilities_pkg ON vulnerabilities (pkg_name, pkg_version)")
+    if "scan_spans" not in existing:
+        op.create_table("scan_spans",
+            sa.Column("span_id", sa.String(length=16), nullable=False),
+            sa.Column("trace_id", sa.String(length=32), nullable=False),
+            sa.Column("parent_id", sa.String(length=16), nullable=True),
+            sa.Column("scan_id", sa.String(length=36), nullable=False),
+            sa.Column("service", sa.String(length=50), nullable=False),
+            sa.Column("name", sa.String(length=100), nullable=False),
+            sa.Column("started_at", sa.DateTime(timezone=True), nullable=False),
+            sa.Column("duration_ms", sa.Float(), nullable=True),
+            sa.Column("status", sa.String(length=20), nullable=False),
+            sa.Column("attributes", sa.JSON(), nullable=True),
+            sa.PrimaryKeyConstraint("span_id")
+        )
+        op.create_index("ix_scan_spans_scan_id", "scan_spans", ["scan_id"], unique=False)
+        op.create_index("ix_scan_spans_trace_id", "scan_spans", ["trace_id"], unique=False)
+    if "scan_summaries" not in existing:
+        op.create_table("scan_summaries",
+            sa.Column("scan_id", sa.String(length=36), nullable=False),
+            sa.Column("critical", sa.Integer(), nullable=False),
+            sa.Column("high", sa.Integer(), nullable=False),
+            sa.Column("medium", sa.Integer(), nullable=False),
+            sa.Column("low", sa.Integer(), nullable=False),
+            sa.Column("unknown", sa.Integer(), nullable=False),
+            sa.Column("total", sa.Integer(), nullable=False),
+            sa.Column("compacted_at", sa.DateTime(), server_default=sa.text("now()"), nullable=True),
+            sa.PrimaryKeyConstraint("scan_id")
+        )
+    if "cve_exposures" not in existing:
+        op.create_table("cve_exposures",
+            sa.Column("host_id", sa.String(length=36), nullable=False),
+            sa.Column("container_id", sa.String(length=100), nullable=False),
+            sa.Column("cve_id", sa.String(length=50), nullable=False),
+            sa.Column("pkg_name", sa.Text(), nullable=False),
+            sa.Column("image", sa.String(length=255), nullable=False),
+            sa.Column("pkg_version", sa.Text(), nullable=True),
+            sa.Column("fixed_version", sa.Text(), nullable=True),
+            sa.Column("severity", sa.String(length=20), nullable=True),
+            sa.Column("scan_id", sa.String(length=36), nullable=False),
+            sa.Column("scanned_at", sa.DateTime(), nullable=True),
+            sa.ForeignKeyConstraint(["container_id", "host_id"], ["containers.container_id", "containers.host_id"], ondelete="CASCADE"),
+            sa.PrimaryKeyConstraint("host_id", "container_id", "cve_id", "pkg_name")
+        )
+        op.create_index("ix_cve_exposures_cve", "cve_exposures", ["cve_id", "pkg_name"], unique=False)
+        op.create_index("ix_cve_exposures_pkg", "cve_exposures", ["pkg_name"], unique=False)
+    if "remediation_executions" not in existing:
+        op.create_table("remediation_executions",
+            sa.Column("id", sa.String(length=36), nullable=False),
+            sa.Column("strategy", sa.String(length=50), nullable=False),
+            sa.Column("scan_id", sa.String(length=36), nullable=True),
+            sa.Column("vulnerability_id", sa.String(length=36), nullable=True),
+            sa.Column("cve_id", sa.String(length=50), nullable=True),
+            sa.Column("parallelism", sa.Integer(), nullable=False),
+            sa.Column("status", sa.Enum("PENDING", "RUNNING", "COMPLETED", "FAILED", "ABORTED", "SKIPPED", name="remediationstatus"), nullable=False),
+            sa.Column("total", sa.Integer(), nullable=False),
+            sa.Column("abort_requested", sa.Boolean(), nullable=False),
+            sa.Column("created_at", sa.DateTime(), server_default=sa.text("now()"), nullable=True),
+            sa.Column("started_at", sa.DateTime(), nullable=True),
+            sa.Column("finished_at", sa.DateTime(), nullable=True),
+            sa.Column("error", sa.Text(), nullable=True),
+            sa.PrimaryKeyConstraint("id")
+        )
+    if "remediation_steps" not in existing:
+        op.create_table("remediation_steps",
+            sa.Column("id", sa.String(length=36), nullable=False),
+            sa.Column("execution_id", sa.String(length=36), nullable=False),
+            sa.Column("batch", sa.Integer(), nullable=False),
+            sa.Column("host_id", sa.String(length=36), nullable=False),
+            sa.Column("container_id", sa.String(length=100), nullable=False),
+            sa.Column("container_name", sa.String(length=255), nullable=True),
+            sa.Column("image", sa.String(length=255), nullable=True),
+            sa.Column("action", sa.String(length=20), nullable=False),
+            sa.Column("packages", sa.JSON(), nullable=True),
+            sa.Column("status", sa.Enum("PENDING", "RUNNING", "COMPLETED", "FAILED", "ABORTED", "SKIPPED", name="remediationstatus"), nullable=False),
+            sa.Column("started_at", sa.DateTime(), nullable=True),
+            sa.Column("finished_at", sa.DateTime(), nullable=True),
+            sa.Column("duration_ms", sa.Float(), nullable=True),
+            sa.Column("new_container_id", sa.String(length=100), nullable=True),
+            sa.Column("message", sa.Text(), nullable=True),
+            sa.Column("timings", sa.JSON(), nullable=True),
+            sa.ForeignKeyConstraint(["execution_id"], ["remediation_executions.id"], ondelete="CASCADE"),
+            sa.PrimaryKeyConstraint("id")
+        )
+        op.create_index("ix_remediation_steps_execution_id", "remediation_steps", ["execution_id"], unique=False)
+    if "timing_buckets" not in existing:
+        op.create_table("timing_buckets",
+            sa.Column("kind", sa.String(length=20), nullable=False),
+            sa.Column("key", sa.String(length=50), nullable=False),
+            sa.Column("image", sa.String(length=255), nullable=False),
+            sa.Column("host_id", sa.String(length=36), nullable=False),
+            sa.Column("bucket", sa.Integer(), nullable=False),
+            sa.Column("count", sa.Integer(), nullable=False),
+            sa.Column("total_ms", sa.Float(), nullable=False),
+            sa.Column("updated_at", sa.DateTime(), server_default=sa.text("now()"), nullable=True),
+            sa.PrimaryKeyConstraint("kind", "key", "image", "host_id", "bucket")
+        )
+
+def downgrade() -> None:
+    for table in (
+        "timing_buckets", "remediation_steps", "remediation_executions", "cve_exposures",
+        "scan_summaries", "scan_spans", "vulnerabilities", "scan_history", "containers", "hosts"
+    ):
+        op.drop_table(table)
+    for enum in ("remediationstatus", "scanstatus", "containerstatus"):
+        sa.Enum(name=enum).drop(op.get_bind(), checkfirst=True)
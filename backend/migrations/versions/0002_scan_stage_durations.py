@@ -0,0 +1,24 @@
+"""Длительность этапов работы Trivy в истории сканирований
+
+У секционированной таблицы scan_history колонка добавляется сразу во все секции.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 09:05:12.418306
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "0002"
+down_revision: Union[str, None] = "0001"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+def upgrade() -> None:
+    op.add_column("scan_history", sa.Column("stage_durations", sa.JSON(), nullable=True))
+
+def downgrade() -> None:
+    op.drop_column("scan_history", "stage_durations")
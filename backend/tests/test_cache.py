@@ -0,0 +1,151 @@
+import asyncio
+import json
+
+import pytest
+from starlette.requests import Request
+
+from app.core import cache
+from app.core.cache import (
+    CACHE_INVALIDATE,
+    REVALIDATE_CACHE_CONTROL,
+    CachedResponse,
+    ResponseCache,
+    cached_response,
+    etag_matches,
+    invalidate_scans,
+    make_etag,
+    run_invalidation_listener,
+)
+from app.core.events import RESYNC, event_bus, make_event
+
+def entry(body: bytes) -> CachedResponse:
+    return CachedResponse(body, "application/json", make_etag(body), {})
+
+def request(headers=None) -> Request:
+    raw = [(key.lower().encode(), value.encode()) for key, value in (headers or {}).items()]
+    return Request({"type": "http", "method": "GET", "path": "/", "headers": raw, "query_string": b""})
+
+@pytest.fixture
+def response_cache(monkeypatch):
+    response_cache = ResponseCache(max_bytes=100, max_entry_bytes=60)
+    monkeypatch.setattr(cache, "response_cache", response_cache)
+    return response_cache
+
+def test_lru_evicts_least_recently_used_over_size_limit():
+    response_cache = ResponseCache(max_bytes=100, max_entry_bytes=60)
+    response_cache.put(("a", "result"), entry(b"x" * 40))
+    response_cache.put(("b", "result"), entry(b"x" * 40))
+    response_cache.get(("a", "result"))
+    response_cache.put(("c", "result"), entry(b"x" * 40))
+
+    assert response_cache.get(("b", "result")) is None
+    assert response_cache.get(("a", "result")) is not None
+    assert response_cache.size == 80
+
+def test_oversized_entries_are_not_cached():
+    response_cache = ResponseCache(max_bytes=100, max_entry_bytes=60)
+    response_cache.put(("a", "result"), entry(b"x" * 61))
+    assert response_cache.get(("a", "result")) is None
+    assert response_cache.size == 0
+
+def test_replacing_entry_keeps_size_accurate():
+    response_cache = ResponseCache(max_bytes=100, max_entry_bytes=60)
+    response_cache.put(("a", "result"), entry(b"x" * 40))
+    response_cache.put(("a", "result"), entry(b"x" * 10))
+    assert response_cache.size == 10
+
+def test_invalidate_drops_all_responses_of_scan():
+    response_cache = ResponseCache(max_bytes=100, max_entry_bytes=60)
+    response_cache.put(("a", "result", ""), entry(b"1"))
+    response_cache.put(("a", "report", "csv"), entry(b"22"))
+    response_cache.put(("b", "result", ""), entry(b"333"))
+
+    response_cache.invalidate("a")
+    assert response_cache.get(("a", "result", "")) is None
+    assert response_cache.get(("a", "report", "csv")) is None
+    assert response_cache.size == 3
+
+    response_cache.clear()
+    assert response_cache.get(("b", "result", "")) is None
+    assert response_cache.size == 0
+
+@pytest.mark.parametrize("header, matches", [
+    (None, False),
+    ('"abc"', True),
+    ('W/"abc"', True),
+    ('"other", "abc"', True),
+    ("*", True),
+    ('"other"', False),
+])
+def test_etag_matches(header, matches):
+    assert etag_matches(header, '"abc"') is matches
+
+def test_cached_response_builds_once_and_answers_304(response_cache):
+    builds = []
+
+    def build():
+        builds.append(1)
+        return b'{"status":"completed"}', "application/json", {"X-Scan": "a"}
+
+    first = cached_response(request(), "scan", ("a", "result"), build)
+    assert first.status_code == 200
+    assert first.body == b'{"status":"completed"}'
+    assert first.headers["Cache-Control"] == REVALIDATE_CACHE_CONTROL
+    assert first.headers["X-Scan"] == "a"
+    etag = first.headers["ETag"]
+
+    second = cached_response(request({"If-None-Match": etag}), "scan", ("a", "result"), build)
+    assert second.status_code == 304
+    assert second.body == b""
+    assert second.headers["ETag"] == etag
+    assert second.headers["Cache-Control"] == REVALIDATE_CACHE_CONTROL
+
+    third = cached_response(request({"If-None-Match": '"stale"'}), "scan", ("a", "result"), build)
+    assert third.status_code == 200
+    assert len(builds) == 1
+
+def test_changed_response_gets_new_etag_after_invalidation(response_cache):
+    body = {"value": b"old"}
+
+    def build():
+        return body["value"], "application/json", {}
+
+    etag = cached_response(request(), "scan", ("a", "result"), build).headers["ETag"]
+    body["value"] = b"new"
+    response_cache.invalidate("a")
+
+    response = cached_response(request({"If-None-Match": etag}), "scan", ("a", "result"), build)
+    assert response.status_code == 200
+    assert response.body == b"new"
+    assert response.headers["ETag"] != etag
+
+def test_invalidate_scans_publishes_in_batches(response_cache, monkeypatch):
+    published = []
+    monkeypatch.setattr(event_bus, "publish", lambda db, event_type, data: published.append((db, event_type, data)))
+    response_cache.put(("scan-0", "result"), entry(b"1"))
+    scan_ids = [f"scan-{i}" for i in range(cache.INVALIDATE_BATCH_SIZE + 1)]
+
+    invalidate_scans("db", scan_ids)
+    assert response_cache.get(("scan-0", "result")) is None
+    assert [(db, event_type) for db, event_type, _ in published] == [("db", CACHE_INVALIDATE)] * 2
+    assert [data["scan_ids"] for _, _, data in published] == [scan_ids[:-1], scan_ids[-1:]]
+
+def test_listener_applies_invalidations_from_other_processes(response_cache):
+    async def scenario():
+        listener = asyncio.create_task(run_invalidation_listener())
+        await asyncio.sleep(0)
+        response_cache.put(("a", "result"), entry(b"1"))
+        response_cache.put(("b", "result"), entry(b"2"))
+        response_cache.put(("c", "result"), entry(b"3"))
+
+        event_bus._dispatch(json.dumps(make_event(CACHE_INVALIDATE, {"scan_ids": ["a"]})))
+        await asyncio.sleep(0)
+        after_invalidate = [response_cache.get((scan_id, "result")) is not None for scan_id in "abc"]
+
+        # Пропущенные события не восстановить: кэш очищается целиком
+        event_bus._dispatch(json.dumps(make_event(RESYNC, {"reason": "reconnect"})))
+        await asyncio.sleep(0)
+        listener.cancel()
+        return after_invalidate, response_cache.size
+
+    assert asyncio.run(scenario()) == ([False, True, True], 0)
@@ -0,0 +1,158 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+import pytest
+
+from app.core import host_health
+from app.core.config import settings
+from app.core.host_health import CLOSED, HALF_OPEN, OPEN, AgentUnavailableError, HostHealth
+from app.services import agent_client
+from app.services.agent_client import AgentClient
+from app.services.host_health_service import HostHealthService
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(host_health.time, "monotonic", clock)
+    return clock
+
+@pytest.fixture(autouse=True)
+def circuit_settings(monkeypatch):
+    monkeypatch.setattr(settings, "HOST_FAILURE_THRESHOLD", 3)
+    monkeypatch.setattr(settings, "HOST_CIRCUIT_BACKOFF_SECONDS", 5.0)
+    monkeypatch.setattr(settings, "HOST_CIRCUIT_BACKOFF_MAX_SECONDS", 30.0)
+    yield
+    host_health._registry.clear()
+
+def test_circuit_opens_after_threshold(clock):
+    health = HostHealth("h1")
+    health.record_failure("refused")
+    health.record_failure("refused")
+    assert health.state == CLOSED
+    assert health.allow()
+    assert health.to_dict()["status"] == "degraded"
+
+    health.record_failure("refused")
+    assert health.state == OPEN
+    assert not health.allow()
+    assert health.to_dict()["status"] == "unhealthy"
+    assert health.to_dict()["retry_in_seconds"] == 5.0
+
+def test_open_circuit_lets_one_trial_request_per_backoff(clock):
+    health = HostHealth("h1")
+    for _ in range(3):
+        health.record_failure("refused")
+
+    clock.now += 5.0
+    assert health.allow()
+    assert health.state == HALF_OPEN
+    # Пока пробный запрос не завершился, остальные не пропускаются
+    assert not health.allow()
+    clock.now += 5.0
+    assert health.allow()
+
+def test_backoff_doubles_up_to_maximum(clock):
+    health = HostHealth("h1")
+    backoffs = []
+    for _ in range(7):
+        health.record_failure("refused")
+        backoffs.append(health.backoff)
+    assert backoffs == [0.0, 0.0, 5.0, 10.0, 20.0, 30.0, 30.0]
+
+def test_success_closes_circuit(clock):
+    health = HostHealth("h1")
+    for _ in range(4):
+        health.record_failure("refused")
+    clock.now += 10.0
+    assert health.allow()
+
+    health.record_success(12.5)
+    assert health.state == CLOSED
+    assert health.failures == 0
+    assert health.to_dict()["status"] == "healthy"
+    assert health.to_dict()["latency_ms"] == 12.5
+    assert health.to_dict()["retry_in_seconds"] is None
+
+def test_unchecked_host_is_unknown():
+    assert HostHealth("h1").to_dict()["status"] == "unknown"
+
+def test_due_only_after_backoff(clock):
+    health = HostHealth("h1")
+    assert health.due()
+    for _ in range(3):
+        health.record_failure("refused")
+    assert not health.due()
+    clock.now += 5.0
+    assert health.due()
+
+def test_probe_events_drive_circuit(clock):
+    for _ in range(3):
+        HostHealthService.apply({"host_id": "h1", "ok": False, "latency_ms": None, "error": "timeout"})
+    assert host_health.health_of("h1").state == OPEN
+    with pytest.raises(AgentUnavailableError):
+        host_health.ensure_available("h1")
+
+    HostHealthService.apply({"host_id": "h1", "ok": True, "latency_ms": 3.0, "error": None})
+    assert host_health.health_of("h1").state == CLOSED
+    host_health.ensure_available("h1")
+
+HOST = SimpleNamespace(id="h1", name="host-1", address="agent.invalid", port=5000)
+
+@pytest.fixture
+def agent(monkeypatch):
+    """Ответы агента задаются функцией handler(request) -> httpx.Response или исключением"""
+    state = {"handler": None}
+    client_class = httpx.AsyncClient
+
+    def handler(request):
+        return state["handler"](request)
+
+    monkeypatch.setattr(agent_client.httpx, "AsyncClient", lambda: client_class(transport=httpx.MockTransport(handler)))
+    return state
+
+def refuse(request):
+    raise httpx.ConnectError("Connection refused", request=request)
+
+def test_requests_do_not_count_failures_when_probes_enabled(agent, monkeypatch):
+    monkeypatch.setattr(settings, "HOST_PROBE_ENABLED", True)
+    agent["handler"] = refuse
+    for _ in range(5):
+        with pytest.raises(httpx.ConnectError):
+            asyncio.run(AgentClient.get(HOST, "/scan/1"))
+    assert host_health.health_of("h1").failures == 0
+    assert host_health.health_of("h1").state == CLOSED
+
+def test_requests_drive_circuit_without_probes(agent, monkeypatch):
+    monkeypatch.setattr(settings, "HOST_PROBE_ENABLED", False)
+    agent["handler"] = refuse
+    for _ in range(3):
+        with pytest.raises(httpx.ConnectError):
+            asyncio.run(AgentClient.get(HOST, "/scan/1"))
+    assert host_health.health_of("h1").state == OPEN
+    with pytest.raises(AgentUnavailableError):
+        asyncio.run(AgentClient.get(HOST, "/scan/1"))
+
+def test_server_error_is_not_a_success(agent, monkeypatch):
+    monkeypatch.setattr(settings, "HOST_PROBE_ENABLED", False)
+    agent["handler"] = refuse
+    for _ in range(2):
+        with pytest.raises(httpx.ConnectError):
+            asyncio.run(AgentClient.get(HOST, "/scan/1"))
+
+    agent["handler"] = lambda request: httpx.Response(500, json={"detail": "boom"})
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(AgentClient.get(HOST, "/scan/1"))
+    assert host_health.health_of("h1").failures == 2
+
+    agent["handler"] = lambda request: httpx.Response(404, json={"detail": "Scan 1 not found"})
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(AgentClient.get(HOST, "/scan/1"))
+    assert host_health.health_of("h1").failures == 0